@@ -0,0 +1,124 @@
+"""
+Reconhecimento em lote (batch.recognize_batch) vs. um 'recognize' por arquivo.
+
+Catálogo de músicas procedurais (synthetic.synthetic_music) cadastrado em um
+banco temporário e clipes curtos (trechos com início aleatório e músicas de
+fora do catálogo) gravados em WAV. Os clipes não levam ruído branco: ele
+multiplica os hashes por ~40 (picos de ruído em todo o espectro), bem acima
+de uma gravação real. Compara, em clipes por segundo:
+- laço por arquivo, como 'main.py recognize --full' em sequência: abre o
+  backend, lê, gera os fingerprints e faz uma busca por clipe (no mesmo
+  processo; o custo de iniciar o Python e importar os módulos, medido à parte
+  em um subprocesso, é somado na estimativa do laço de comandos);
+- recognize_batch: pool de processos, espectrogramas em lote e uma busca
+  para cada lote de clipes.
+Confere que as duas formas dão a mesma resposta para cada clipe.
+
+Uso: python benchmarks/bench_batch.py [n_clipes] [n_músicas] [workers] [sqlite|index]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import soundfile as sf
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import audio_processing as audio
+import batch
+import database as db
+import index
+import ingest
+import matcher
+import synthetic
+
+SONG_SECONDS = 60
+CLIP_SECONDS = (3, 5, 8)
+OUTSIDE_FRACTION = 0.1
+
+def make_clips(tmp, songs, n_clips, seed=0):
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(n_clips):
+        n = int(CLIP_SECONDS[i % len(CLIP_SECONDS)] * audio.SAMPLE_RATE)
+        if rng.random() < OUTSIDE_FRACTION:
+            x = synthetic.synthetic_music(n / audio.SAMPLE_RATE, seed=100_000 + i)
+        else:
+            song = songs[rng.integers(len(songs))]
+            start = int(rng.integers(0, len(song) - n))
+            x = song[start:start + n]
+        path = os.path.join(tmp, 'clips', f'clip_{i:05d}.wav')
+        sf.write(path, x, audio.SAMPLE_RATE, subtype='PCM_16')
+        paths.append(path)
+    return paths
+
+def per_file(paths, kind):
+    """Um reconhecimento completo por arquivo: backend aberto, fingerprints e busca por clipe."""
+    answers = []
+    for path in paths:
+        backend = index.open_backend(kind)
+        result = ingest.analyze_file(path)
+        candidates, _ = matcher.match_fingerprints(result.hashes, result.offsets, backend, top_k=2)
+        answers.append(answer(candidates))
+    return answers
+
+def answer(candidates):
+    return (candidates[0].song_id, candidates[0].count) if matcher.is_confident(candidates) else None
+
+def startup_seconds(repeat=3):
+    """Iniciar o Python e importar main.py (com os módulos de src), como cada chamada do laço de comandos."""
+    repo = os.path.join(os.path.dirname(__file__), '..')
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'import main'], cwd=repo, check=True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    n_clips = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    n_songs = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    kind = sys.argv[4] if len(sys.argv) > 4 else 'index'
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, 'db', 'shazam.db')
+        os.makedirs(os.path.join(tmp, 'songs'))
+        os.makedirs(os.path.join(tmp, 'clips'))
+        print(f"Catálogo sintético: {n_songs} músicas de {SONG_SECONDS}s...")
+        songs = []
+        for i in range(n_songs):
+            samples = synthetic.synthetic_music(SONG_SECONDS, seed=i + 1)
+            sf.write(os.path.join(tmp, 'songs', f'song_{i:04d}.wav'), samples, audio.SAMPLE_RATE, subtype='PCM_16')
+            songs.append(samples)
+        ingest.ingest(ingest.find_audio_files(os.path.join(tmp, 'songs')), workers=workers)
+        paths = make_clips(tmp, songs, n_clips)
+        index.open_backend(kind)   # Constrói o índice antes de medir
+
+        print(f"\n{n_clips} clipes ({', '.join(f'{s}s' for s in CLIP_SECONDS)}), backend '{kind}':")
+        start = time.perf_counter()
+        expected = per_file(paths, kind)
+        loop_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        answers = [answer(r.candidates) for r in batch.recognize_batch(paths, index.open_backend(kind),
+                                                                         workers=workers)]
+        batch_seconds = time.perf_counter() - start
+
+    startup = startup_seconds()
+    commands = loop_seconds + startup * n_clips
+    print(f"  {'laço de comandos (estimado)':<30}{n_clips / commands:>9.1f} clipes/s  "
+          f"(+{startup * 1000:.0f} ms de início por arquivo)")
+    print(f"  {'laço por arquivo':<30}{n_clips / loop_seconds:>9.1f} clipes/s")
+    print(f"  {'recognize_batch':<30}{n_clips / batch_seconds:>9.1f} clipes/s  "
+          f"({loop_seconds / batch_seconds:.1f}x o laço, {commands / batch_seconds:.1f}x os comandos)")
+    same = sum(a == b for a, b in zip(answers, expected))
+    print(f"\nMesma resposta: {same}/{n_clips} ({sum(a is not None for a in answers)} reconhecidos)")
+    if same != n_clips:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
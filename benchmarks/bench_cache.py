@@ -0,0 +1,83 @@
+"""
+Cache de fingerprints (cache.FingerprintCache) na ingestão.
+
+Grava um catálogo sintético em WAV e mede ingest.ingest em cada situação:
+- sem cache;
+- cache frio (processa e grava as entradas);
+- reingestão com o banco apagado (ex: mudança de schema): tudo vem do cache;
+- reingestão com o banco intacto: arquivos já vistos são pulados sem decodificar;
+- cópias dos arquivos com outro nome: decodifica, mas para antes do espectrograma.
+
+Uso: python benchmarks/bench_cache.py [n_músicas] [segundos por música] [workers]
+"""
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import soundfile as sf
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import audio_processing as audio
+import cache
+import database as db
+import ingest
+import synthetic
+
+def run(label, paths, workers, fp_cache):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # Sem o progresso por arquivo
+        stats = ingest.ingest(paths, workers=workers, fp_cache=fp_cache)
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<34}{elapsed:>9.2f}{stats['added']:>10}{stats['cached']:>8}{stats['skipped']:>9}")
+    return elapsed
+
+def reset_db(tmp):
+    db.close_connections()
+    db._initialized.clear()
+    for name in os.listdir(tmp):
+        if name.startswith('shazam.db'):
+            os.remove(os.path.join(tmp, name))
+
+def main():
+    n_songs = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 60
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, 'shazam.db')
+        songs_dir = os.path.join(tmp, 'songs')
+        os.makedirs(songs_dir)
+        print(f"Gravando {n_songs} músicas sintéticas de {seconds:.0f}s...")
+        paths = []
+        for i in range(n_songs):
+            path = os.path.join(songs_dir, f'song_{i:04d}.wav')
+            sf.write(path, synthetic.synthetic_audio(seconds, seed=i), audio.SAMPLE_RATE, subtype='PCM_16')
+            paths.append(path)
+
+        copies = []
+        for path in paths:
+            copy = path.replace('song_', 'copia_')
+            shutil.copy(path, copy)
+            copies.append(copy)
+
+        fp_cache = cache.FingerprintCache(os.path.join(tmp, 'cache'))
+        print(f"\n{workers} workers")
+        print(f"  {'':<34}{'tempo (s)':>9}{'novas':>10}{'cache':>8}{'puladas':>9}")
+        baseline = run('sem cache', paths, workers, None)
+        reset_db(tmp)
+        run('cache frio', paths, workers, fp_cache)
+        reset_db(tmp)
+        warm = run('banco apagado, cache quente', paths, workers, fp_cache)
+        run('banco intacto (mesmos arquivos)', paths, workers, fp_cache)
+        run('cópias com outro nome', copies, workers, fp_cache)
+
+        entries, size = fp_cache.size()
+        print(f"\nCache: {entries} entradas, {size / 1e6:.1f} MB; reingestão {baseline / warm:.1f}x mais rápida")
+
+if __name__ == '__main__':
+    main()
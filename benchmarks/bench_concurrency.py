@@ -0,0 +1,147 @@
+"""
+Leitores reconhecendo enquanto um escritor cadastra músicas.
+
+Compara o acesso antigo ao banco (uma conexão nova por chamada, journal padrão
+'delete') com o atual (conexão reaproveitada por thread, WAL, pragmas e
+statements preparados). Em cada modo, N processos leitores fazem
+get_matches + nome da música em laço enquanto um processo escritor insere
+músicas uma a uma, cada uma na sua transação (como 'main.py add' e a GUI).
+
+Reporta latência p50/p99 dos leitores, vazão, erros "database is locked" e
+músicas/s do escritor.
+
+Uso: python benchmarks/bench_concurrency.py [n_músicas] [leitores] [segundos]
+"""
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import database as db
+import synthetic
+
+PER_SONG = 300
+QUERY_HASHES = 2000
+WRITER_HASHES = 3000   # Fingerprints por música cadastrada durante o teste
+
+def legacy_recognize(path, hashes):
+    """get_matches + get_song_name como eram: conexão nova a cada chamada."""
+    conn = sqlite3.connect(path)
+    results = []
+    hashes = np.unique(hashes).tolist()
+    for i in range(0, len(hashes), 900):
+        chunk = hashes[i:i + 900]
+        placeholders = ','.join('?' for _ in chunk)
+        rows = conn.execute(f"SELECT song_id, offset, hash FROM fingerprints WHERE hash IN ({placeholders})", chunk)
+        results.extend(rows.fetchall())
+    conn.close()
+
+    conn = sqlite3.connect(path)
+    conn.execute("SELECT name FROM songs WHERE id = ?", (results[0][0] if results else 0,)).fetchone()
+    conn.close()
+
+def legacy_add(path, name, hashes, offsets):
+    conn = sqlite3.connect(path)
+    song_id = conn.execute('INSERT INTO songs (name) VALUES (?)', (name,)).lastrowid
+    conn.commit()
+    conn.close()
+
+    conn = sqlite3.connect(path)
+    conn.executemany('INSERT OR IGNORE INTO fingerprints (hash, song_id, offset) VALUES (?, ?, ?)',
+                     zip(hashes.tolist(), [song_id] * len(hashes), offsets.tolist()))
+    conn.commit()
+    conn.close()
+
+def pooled_recognize(path, hashes):
+    matches = db.get_matches(hashes)
+    db.get_song_name(matches[0][0] if matches else 0)
+
+def pooled_add(path, name, hashes, offsets):
+    song_id = db.insert_song(name)
+    db.insert_fingerprint_arrays(np.full(len(hashes), song_id), hashes, offsets)
+
+MODES = {
+    'conexão por chamada': (legacy_recognize, legacy_add),
+    'pool + WAL': (pooled_recognize, pooled_add),
+}
+
+def reader(mode, path, queries, stop_at, results):
+    recognize = MODES[mode][0]
+    db.DB_PATH = path
+    latencies, errors, i = [], 0, 0
+    while time.perf_counter() < stop_at:
+        start = time.perf_counter()
+        try:
+            recognize(path, queries[i % len(queries)])
+            latencies.append(time.perf_counter() - start)
+        except sqlite3.OperationalError:
+            errors += 1
+        i += 1
+    results.put(('reader', latencies, errors))
+
+def writer(mode, path, stop_at, results):
+    add = MODES[mode][1]
+    db.DB_PATH = path
+    rng = np.random.default_rng(7)
+    added, errors = 0, 0
+    while time.perf_counter() < stop_at:
+        hashes, offsets = synthetic.random_song_fingerprints(rng, WRITER_HASHES)
+        try:
+            add(path, f"nova_{added}", hashes, offsets)
+            added += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    results.put(('writer', added, errors))
+
+def run(mode, path, queries, n_readers, seconds):
+    results = multiprocessing.Queue()
+    stop_at = time.perf_counter() + seconds
+    procs = [multiprocessing.Process(target=reader, args=(mode, path, queries, stop_at, results))
+             for _ in range(n_readers)]
+    procs.append(multiprocessing.Process(target=writer, args=(mode, path, stop_at, results)))
+    for p in procs:
+        p.start()
+    outputs = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+
+    latencies = np.concatenate([np.array(o[1]) for o in outputs if o[0] == 'reader']) * 1000
+    reader_errors = sum(o[2] for o in outputs if o[0] == 'reader')
+    added, writer_errors = next((o[1], o[2]) for o in outputs if o[0] == 'writer')
+    print(f"{mode:<22}{np.percentile(latencies, 50):>9.2f}{np.percentile(latencies, 99):>10.2f}"
+          f"{len(latencies) / seconds:>9.1f}{reader_errors + writer_errors:>8}{added / seconds:>12.1f}")
+
+def main():
+    n_songs = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    n_readers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+    rng = np.random.default_rng(1)
+    queries = [synthetic.query_from_song(rng, h, o, QUERY_HASHES)[0]
+               for _, h, o in synthetic.random_catalog(min(100, n_songs), PER_SONG)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base = os.path.join(tmp, 'base.db')
+        print(f"Catálogo sintético: {n_songs} músicas x {PER_SONG} hashes...")
+        synthetic.populate_db(base, n_songs, PER_SONG, batch_songs=2000)
+        db.close_connections()
+
+        print(f"\n{n_readers} leitores + 1 escritor durante {seconds:.0f}s")
+        print(f"{'':22}{'p50 (ms)':>9}{'p99 (ms)':>10}{'QPS':>9}{'erros':>8}{'músicas/s':>12}")
+        for mode in MODES:
+            path = os.path.join(tmp, f'{len(os.listdir(tmp))}.db')
+            shutil.copy(base, path)
+            conn = sqlite3.connect(path)
+            conn.execute(f"PRAGMA journal_mode = {'delete' if mode == 'conexão por chamada' else 'wal'}")
+            conn.close()
+            run(mode, path, queries, n_readers, seconds)
+
+if __name__ == '__main__':
+    main()
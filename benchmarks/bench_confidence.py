@@ -0,0 +1,278 @@
+"""
+Ranking tolerante a time-stretch e calibração da confiança (matcher).
+
+Catálogo de músicas procedurais (synthetic.synthetic_music) em memória e
+consultas de vários tamanhos: limpas, com ruído branco, com andamento alterado
+(synthetic.time_stretch, altura preservada) e negativas: músicas que nunca
+estiveram no catálogo e músicas removidas dele (geradas junto com o catálogo e
+fora do índice, como depois de delete + compact), com clipes de até 30s.
+
+Para cada condição compara o histograma exato (MAX_STRETCH = 0) com o inclinado:
+- acerto top-1 (música certa e posição dentro de OFFSET_TOLERANCE_SECONDS);
+- respostas aceitas pelo limiar antigo da GUI (> 10 alinhados), pelo critério
+  só de contagem (MIN_ALIGNED + MIN_RATIO) e pelo critério com a confiança
+  calibrada (matcher.is_confident); nas negativas, aceitar é falso positivo;
+- taxa de falsos positivos por tamanho do clipe;
+- tempo de pontuação por consulta.
+Confere que as consultas sem andamento alterado respondem tempo == 1.0 (o
+arredondamento dos frames não pode virar um time-stretch aparente).
+
+Depois mostra a tabela de confiabilidade (confiança prevista vs. acerto
+observado) e reajusta a regressão logística de matcher.calibrated_confidence
+nesses dados, com positivas e negativas pesando o mesmo (metade das consultas
+de um serviço pode ser de músicas fora do catálogo): os coeficientes impressos
+vão em matcher.CONFIDENCE_WEIGHTS.
+
+Uso: python benchmarks/bench_confidence.py [n_músicas] [segundos por música] [consultas por condição]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import audio_processing as audio
+import fingerprinting
+import index
+import matcher
+import synthetic
+
+CLIP_SECONDS = (2, 4, 8)
+# Negativas: clipes mais longos têm mais hashes e mais alinhamentos por acaso
+NEGATIVE_CLIP_SECONDS = (2, 4, 8, 15, 30)
+# Músicas geradas com o catálogo e deixadas fora do índice ("removidas")
+N_REMOVED = 5
+OFFSET_TOLERANCE_SECONDS = 0.2
+LEGACY_GUI_THRESHOLD = 10
+
+# Condição -> (snr_db, andamento); None = fora do catálogo, 'removed' = removida do catálogo
+CONDITIONS = {
+    'limpo': (None, 1.0),
+    'snr 0dB': (0, 1.0),
+    'snr -5dB': (-5, 1.0),
+    'snr -10dB': (-10, 1.0),
+    'andamento +2%': (None, 1.02),
+    'andamento -3%': (None, 0.97),
+    'andamento +5%': (None, 1.05),
+    'andamento +3% + snr 0dB': (0, 1.03),
+    'andamento +8%': (None, 1.08),       # Além de MAX_STRETCH
+    'fora do catálogo': None,
+    'removida do catálogo': 'removed',
+}
+
+def is_negative(condition):
+    return CONDITIONS[condition] in (None, 'removed')
+
+def fingerprint(samples):
+    f, t, Sxx = audio.generate_spectrogram(samples)
+    return fingerprinting.generate_fingerprint_arrays(*fingerprinting.find_peaks(Sxx))
+
+def build_catalog(n_songs, seconds, n_removed=N_REMOVED):
+    """
+    Retorna ({song_id: amostras} do catálogo, {song_id: amostras} das removidas, ArrayIndex).
+    """
+    songs, removed, ids, hashes, offsets = {}, {}, [], [], []
+    for song_id in range(1, n_songs + n_removed + 1):
+        samples = synthetic.synthetic_music(seconds, seed=song_id)
+        if song_id > n_songs:
+            removed[song_id] = samples
+            continue
+        h, o = fingerprint(samples)
+        songs[song_id] = samples
+        ids.append(np.full(len(h), song_id))
+        hashes.append(h)
+        offsets.append(o)
+    catalog = index.ArrayIndex.from_postings(np.concatenate(hashes), np.concatenate(ids), np.concatenate(offsets))
+    return songs, removed, catalog
+
+def make_queries(rng, songs, removed, n_per_condition):
+    """
+    Retorna [(condição, hashes, offsets, song_id ou None, início em s)].
+    """
+    queries = []
+    for condition, params in CONDITIONS.items():
+        for i in range(n_per_condition):
+            seconds = CLIP_SECONDS[i % len(CLIP_SECONDS)]
+            if params is None:
+                seconds = NEGATIVE_CLIP_SECONDS[i % len(NEGATIVE_CLIP_SECONDS)]
+                x = synthetic.synthetic_music(seconds, seed=100_000 + i)
+                queries.append((condition, *fingerprint(x), None, 0.0))
+                continue
+            if params == 'removed':
+                seconds = NEGATIVE_CLIP_SECONDS[i % len(NEGATIVE_CLIP_SECONDS)]
+                samples = removed[int(rng.choice(list(removed)))]
+                n = min(int(seconds * audio.SAMPLE_RATE), len(samples))
+                start = int(rng.integers(0, len(samples) - n + 1))
+                queries.append((condition, *fingerprint(samples[start:start + n]), None, 0.0))
+                continue
+            snr_db, tempo = params
+            song_id = int(rng.choice(list(songs)))
+            # Trecho que, depois de acelerado/desacelerado, dura 'seconds'
+            n = int(seconds * tempo * audio.SAMPLE_RATE)
+            start = int(rng.integers(0, len(songs[song_id]) - n))
+            x = songs[song_id][start:start + n]
+            if tempo != 1.0:
+                x = synthetic.time_stretch(x, tempo)
+            if snr_db is not None:
+                signal = x / 32767
+                noise = rng.standard_normal(len(x)) * np.sqrt(np.mean(signal ** 2) / 10 ** (snr_db / 10))
+                x = audio.to_int16(signal + noise)
+            queries.append((condition, *fingerprint(x), song_id, start / audio.SAMPLE_RATE))
+    return queries
+
+def score_all(queries, catalog, max_stretch):
+    """
+    Pontua cada consulta com matcher.MAX_STRETCH = max_stretch.
+    Retorna (lista de candidatos por consulta, ms de pontuação por consulta).
+    """
+    saved, matcher.MAX_STRETCH = matcher.MAX_STRETCH, max_stretch
+    results, seconds = [], 0.0
+    try:
+        for _, hashes, offsets, _, _ in queries:
+            m_ids, m_offsets, m_hashes = catalog.lookup(hashes)
+            song_ids, diffs, query_offsets = matcher.align_matches(hashes, offsets, m_ids, m_offsets, m_hashes,
+                                                                   return_query_offsets=True)
+            start = time.perf_counter()
+            results.append(matcher.score_matches(song_ids, diffs, 2, query_offsets, len(hashes)))
+            seconds += time.perf_counter() - start
+    finally:
+        matcher.MAX_STRETCH = saved
+    return results, seconds / len(queries) * 1000
+
+def is_unaltered(condition):
+    return not is_negative(condition) and CONDITIONS[condition][1] == 1.0
+
+def is_correct(candidates, truth, true_start):
+    return (truth is not None and bool(candidates) and candidates[0].song_id == truth
+            and abs(candidates[0].offset_seconds - true_start) <= OFFSET_TOLERANCE_SECONDS)
+
+def decisions(candidates):
+    """Aceita pelo limiar antigo da GUI, pela contagem (alinhados + vantagem) e com a confiança calibrada."""
+    legacy = bool(candidates) and candidates[0].count > LEGACY_GUI_THRESHOLD
+    by_count = matcher.is_confident(candidates, min_confidence=0)
+    return legacy, by_count, matcher.is_confident(candidates)
+
+def features(candidates, n_query):
+    best = candidates[0].count if candidates else 0
+    runner_up = candidates[1].count if len(candidates) > 1 else 0
+    coverage = min(best / n_query, 1.0) if n_query else 0.0
+    return [1.0, np.log1p(best), np.log((best + 1) / (runner_up + 1)), coverage]
+
+def fit_logistic(X, y, l2=0.1, iterations=50, sample_weight=None):
+    """
+    Regressão logística por IRLS (Newton), com regularização L2 (dados quase
+    separáveis não explodem os pesos). Mais alinhados, vantagem ou cobertura
+    nunca devem baixar a confiança: um peso negativo (ruído do ajuste) sai do
+    modelo e o ajuste é refeito sem ele. sample_weight: peso de cada consulta.
+    """
+    sw = np.ones(len(y)) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+    active = np.ones(X.shape[1], dtype=bool)
+    while True:
+        A = X[:, active]
+        w = np.zeros(A.shape[1])
+        for _ in range(iterations):
+            p = 1 / (1 + np.exp(-A @ w))
+            grad = A.T @ (sw * (p - y)) + l2 * w
+            hess = (A * (sw * p * (1 - p))[:, None]).T @ A + l2 * np.eye(A.shape[1])
+            step = np.linalg.solve(hess, grad)
+            w -= step
+            if np.abs(step).max() < 1e-8:
+                break
+        weights = np.zeros(X.shape[1])
+        weights[active] = w
+        negative = weights[1:] < 0
+        if not negative.any():
+            return weights
+        active[1:] &= ~negative
+
+def reliability(predicted, correct, weight, bins=10):
+    """
+    Imprime acerto observado por faixa de confiança prevista (consultas ponderadas
+    por 'weight'); retorna o erro de calibração (ECE).
+    """
+    edges = np.linspace(0, 1, bins + 1)
+    which = np.clip(np.digitize(predicted, edges) - 1, 0, bins - 1)
+    ece = 0.0
+    print(f"  {'confiança':>12}{'consultas':>11}{'prevista':>10}{'observada':>11}")
+    for b in range(bins):
+        sel = which == b
+        if not sel.any():
+            continue
+        w = weight[sel]
+        observed, mean = np.average(correct[sel], weights=w), np.average(predicted[sel], weights=w)
+        ece += w.sum() / weight.sum() * abs(mean - observed)
+        print(f"  {edges[b]:>5.1f} - {edges[b + 1]:<4.1f}{int(sel.sum()):>11}{mean:>10.2f}{observed:>11.2f}")
+    return ece
+
+def main():
+    n_songs = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 60
+    n_per_condition = int(sys.argv[3]) if len(sys.argv) > 3 else 21
+
+    print(f"Catálogo sintético: {n_songs} músicas de {seconds:.0f}s...")
+    songs, removed, catalog = build_catalog(n_songs, seconds)
+    print(f"Gerando {n_per_condition} consultas por condição ({', '.join(f'{s}s' for s in CLIP_SECONDS)}; "
+          f"negativas {', '.join(f'{s}s' for s in NEGATIVE_CLIP_SECONDS)})...")
+    queries = make_queries(np.random.default_rng(0), songs, removed, n_per_condition)
+
+    exact, exact_ms = score_all(queries, catalog, 0.0)
+    sloped, sloped_ms = score_all(queries, catalog, matcher.MAX_STRETCH)
+
+    print(f"\n{'condição':<28}{'acerto exato':>13}{'inclinado':>11}{'> 10 (GUI)':>12}{'contagem':>10}"
+          f"{'calibrada':>11}")
+    for condition in CONDITIONS:
+        rows = [i for i, q in enumerate(queries) if q[0] == condition]
+        outside = is_negative(condition)
+        hits_exact = np.mean([is_correct(exact[i], *queries[i][3:]) for i in rows])
+        hits_sloped = np.mean([is_correct(sloped[i], *queries[i][3:]) for i in rows])
+        # Aceitas e certas (negativas: aceitas = falsos positivos)
+        accepted = np.array([decisions(sloped[i]) for i in rows])
+        right = np.array([is_correct(sloped[i], *queries[i][3:]) for i in rows])
+        rates = accepted.mean(axis=0) if outside else (accepted & right[:, None]).mean(axis=0)
+        label = f"{condition} (FP)" if outside else condition
+        print(f"{label:<28}{'-' if outside else f'{hits_exact:.0%}':>13}{'-' if outside else f'{hits_sloped:.0%}':>11}"
+              + ''.join(f"{r:>{w}.0%}" for r, w in zip(rates, (12, 10, 11))))
+
+    # Falsos positivos por tamanho do clipe (negativas: nunca cadastradas + removidas; em
+    # cada condição, a i-ésima consulta tem NEGATIVE_CLIP_SECONDS[i % len(...)] segundos)
+    by_length = {clip: [] for clip in NEGATIVE_CLIP_SECONDS}
+    for condition in CONDITIONS:
+        if is_negative(condition):
+            rows = [i for i, q in enumerate(queries) if q[0] == condition]
+            for k, i in enumerate(rows):
+                by_length[NEGATIVE_CLIP_SECONDS[k % len(NEGATIVE_CLIP_SECONDS)]].append(i)
+    print(f"\n{'falsos positivos (negativas)':<28}{'consultas':>13}{'> 10 (GUI)':>12}{'contagem':>10}{'calibrada':>11}")
+    for clip, rows in by_length.items():
+        rates = np.array([decisions(sloped[i]) for i in rows]).mean(axis=0)
+        print(f"{f'clipe de {clip}s':<28}{len(rows):>13}" + ''.join(f"{r:>{w}.0%}" for r, w in zip(rates, (12, 10, 11))))
+    # Sem time-stretch, a resposta não pode ter andamento
+    unaltered = [i for i, q in enumerate(queries) if is_unaltered(q[0]) and sloped[i]]
+    flat = sum(sloped[i][0].tempo == 1.0 for i in unaltered)
+    print(f"\nConsultas sem andamento alterado com tempo == 1.0: {flat}/{len(unaltered)}")
+
+    print(f"\nPontuação por consulta: {exact_ms:.2f} ms exato, {sloped_ms:.2f} ms inclinado "
+          f"(MAX_STRETCH = {matcher.MAX_STRETCH})")
+
+    predicted = np.array([matcher.confidence(c) for c in sloped])
+    correct = np.array([is_correct(c, *q[3:]) for c, q in zip(sloped, queries)], dtype=np.float64)
+    # Negativas e positivas pesam o mesmo no total
+    negative = np.array([is_negative(q[0]) for q in queries])
+    weight = np.where(negative, (~negative).sum() / max(negative.sum(), 1), 1.0)
+    print(f"\nConfiabilidade com CONFIDENCE_WEIGHTS = {matcher.CONFIDENCE_WEIGHTS} (negativas com peso {weight.max():.1f}):")
+    ece = reliability(predicted, correct, weight)
+    print(f"  ECE: {ece:.3f}")
+
+    X = np.array([features(c, len(q[1])) for c, q in zip(sloped, queries)])
+    w = fit_logistic(X, correct, sample_weight=weight)
+    refit = 1 / (1 + np.exp(-X @ w))
+    print("\nReajuste nestes dados:")
+    ece = reliability(refit, correct, weight)
+    print(f"  ECE: {ece:.3f}")
+    print(f"  CONFIDENCE_WEIGHTS = ({', '.join(f'{v:.2f}' for v in w)})")
+    if flat < len(unaltered):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Compara o schema antigo (hash TEXT + índice) com o schema v2
+(hash INTEGER, WITHOUT ROWID) em um catálogo sintético.
+
+Reporta tamanho do arquivo e latência de get_matches.
+
+Uso: python benchmarks/bench_database.py [n_músicas] [hashes_por_música] [n_consultas]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import database as db
+import fingerprinting
+import synthetic
+
+LEGACY_SCHEMA = '''
+    CREATE TABLE songs (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, file_hash TEXT UNIQUE);
+    CREATE TABLE fingerprints (hash TEXT NOT NULL, song_id INTEGER NOT NULL, offset INTEGER NOT NULL,
+                               FOREIGN KEY (song_id) REFERENCES songs (id));
+    CREATE INDEX idx_fingerprints_hash ON fingerprints (hash);
+'''
+
+QUERY_HASHES = 2000  # Aproximadamente uma amostra de 5s
+
+def build_legacy(path, n_songs, per_song):
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_SCHEMA)
+    for song_id, hashes, offsets in synthetic.random_catalog(n_songs, per_song):
+        conn.execute('INSERT INTO songs (name) VALUES (?)', (f"song_{song_id}",))
+        data = [(fingerprinting.format_hash(h), song_id, int(o)) for h, o in zip(hashes, offsets)]
+        conn.executemany('INSERT INTO fingerprints (hash, song_id, offset) VALUES (?, ?, ?)', data)
+    conn.commit()
+    conn.close()
+
+def legacy_get_matches(path, hashes):
+    """Mesma lógica do get_matches original, sobre o schema TEXT."""
+    conn = sqlite3.connect(path)
+    results = []
+    for i in range(0, len(hashes), 900):
+        chunk = hashes[i:i + 900]
+        placeholders = ','.join('?' for _ in chunk)
+        rows = conn.execute(f"SELECT song_id, offset, hash FROM fingerprints WHERE hash IN ({placeholders})", chunk)
+        results.extend(rows.fetchall())
+    conn.close()
+    return results
+
+def make_queries(n_songs, per_song, n_queries):
+    rng = np.random.default_rng(1)
+    catalog = {song_id: (h, o) for song_id, h, o in synthetic.random_catalog(n_songs, per_song)
+               if song_id <= n_queries}
+    queries = []
+    for song_id in range(1, min(n_queries, n_songs) + 1):
+        hashes, offsets = catalog[song_id]
+        q_hashes, _ = synthetic.query_from_song(rng, hashes, offsets, min(QUERY_HASHES, per_song))
+        queries.append(q_hashes)
+    return queries
+
+def time_lookups(func, queries):
+    latencies = []
+    total = 0
+    for q in queries:
+        start = time.perf_counter()
+        total += len(func(q))
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies) * 1000, total
+
+def main():
+    n_songs = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    per_song = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    n_queries = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+
+    print(f"Catálogo sintético: {n_songs} músicas x {per_song} hashes")
+    queries = make_queries(n_songs, per_song, n_queries)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, 'legacy.db')
+        v2_path = os.path.join(tmp, 'v2.db')
+
+        start = time.perf_counter()
+        build_legacy(legacy_path, n_songs, per_song)
+        legacy_build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        synthetic.populate_db(v2_path, n_songs, per_song)
+        v2_build = time.perf_counter() - start
+
+        legacy_lat, legacy_rows = time_lookups(
+            lambda q: legacy_get_matches(legacy_path, [fingerprinting.format_hash(h) for h in q]), queries)
+        v2_lat, v2_rows = time_lookups(lambda q: db.get_matches(q), queries)
+
+        if legacy_rows != v2_rows:
+            print(f"AVISO: número de linhas difere ({legacy_rows} vs {v2_rows})")
+
+        legacy_size = os.path.getsize(legacy_path) / 2**20
+        v2_size = os.path.getsize(v2_path) / 2**20
+
+    print(f"\n{'':22}{'TEXT (v1)':>14}{'INTEGER (v2)':>14}")
+    print(f"{'Tamanho do DB (MiB)':22}{legacy_size:14.1f}{v2_size:14.1f}")
+    print(f"{'Construção (s)':22}{legacy_build:14.1f}{v2_build:14.1f}")
+    print(f"{'Lookup p50 (ms)':22}{np.percentile(legacy_lat, 50):14.2f}{np.percentile(v2_lat, 50):14.2f}")
+    print(f"{'Lookup p99 (ms)':22}{np.percentile(legacy_lat, 99):14.2f}{np.percentile(v2_lat, 99):14.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Compara o backend SQLite com o índice invertido em arrays (index.ArrayIndex).
+
+Verifica que ambos retornam os mesmos matches e mede latência de busca,
+tempo de construção do índice e tempo de carga (memory-map).
+
+Uso: python benchmarks/bench_index.py [n_músicas] [hashes_por_música] [n_consultas]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import index
+import synthetic
+
+QUERY_HASHES = 2000
+
+def time_lookups(backend, queries):
+    latencies = []
+    results = []
+    for q in queries:
+        start = time.perf_counter()
+        results.append(backend.get_matches(q))
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies) * 1000, results
+
+def main():
+    n_songs = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    per_song = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    n_queries = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+
+    rng = np.random.default_rng(1)
+    queries = []
+    for song_id, hashes, offsets in synthetic.random_catalog(min(n_queries, n_songs), per_song):
+        queries.append(synthetic.query_from_song(rng, hashes, offsets, min(QUERY_HASHES, per_song))[0])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"Catálogo sintético: {n_songs} músicas x {per_song} hashes")
+        synthetic.populate_db(os.path.join(tmp, 'shazam.db'), n_songs, per_song)
+        index_dir = os.path.join(tmp, 'index')
+
+        start = time.perf_counter()
+        index.build_index(index_dir)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        array_index = index.open_backend('index', index_dir)
+        load_time = time.perf_counter() - start
+
+        sqlite_lat, sqlite_results = time_lookups(index.SQLiteBackend(), queries)
+        index_lat, index_results = time_lookups(array_index, queries)
+
+    if sqlite_results != index_results:
+        print("ERRO: o índice retornou matches diferentes do SQLite!")
+        sys.exit(1)
+
+    print(f"Matches idênticos nos dois backends ({sum(len(r) for r in index_results)} linhas)")
+    print(f"Construção do índice: {build_time:.2f}s | carga (mmap): {load_time * 1000:.1f} ms")
+    print(f"\n{'':18}{'SQLite':>10}{'Índice':>10}")
+    print(f"{'Lookup p50 (ms)':18}{np.percentile(sqlite_lat, 50):10.2f}{np.percentile(index_lat, 50):10.2f}")
+    print(f"{'Lookup p99 (ms)':18}{np.percentile(sqlite_lat, 99):10.2f}{np.percentile(index_lat, 99):10.2f}")
+
+if __name__ == '__main__':
+    main()
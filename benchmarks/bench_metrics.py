@@ -0,0 +1,117 @@
+"""
+Custo da instrumentação (metrics): reconhecimento de clipes curtos em um
+catálogo sintético em memória com as métricas desligadas (padrão), ligadas
+e ligadas com um Trace por consulta (como o --profile).
+
+Mede também o custo de uma chamada instrumentada isolada (decorador timed
+sobre uma função vazia), que é o pior caso.
+
+Uso: python benchmarks/bench_metrics.py [n_músicas] [segundos por música] [n_consultas]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import audio_processing as audio
+import fingerprinting
+import index
+import matcher
+import metrics
+import synthetic
+
+CLIP_SECONDS = 5
+REPEAT = 5
+
+def build_catalog(n_songs, seconds):
+    songs, all_ids, all_hashes, all_offsets = [], [], [], []
+    for song_id in range(1, n_songs + 1):
+        samples = synthetic.synthetic_music(seconds, seed=song_id)
+        f, t, Sxx = audio.generate_spectrogram(samples)
+        hashes, offsets = fingerprinting.generate_fingerprint_arrays(*fingerprinting.find_peaks(Sxx))
+        songs.append(samples)
+        all_ids.append(np.full(len(hashes), song_id))
+        all_hashes.append(hashes)
+        all_offsets.append(offsets)
+    catalog = index.ArrayIndex.from_postings(np.concatenate(all_hashes), np.concatenate(all_ids),
+                                             np.concatenate(all_offsets))
+    return catalog, songs
+
+def recognize(clip, backend):
+    f, t, Sxx = audio.generate_spectrogram(clip)
+    hashes, offsets = fingerprinting.generate_fingerprint_arrays(*fingerprinting.find_peaks(Sxx))
+    return matcher.match_fingerprints(hashes, offsets, backend, top_k=2)[0]
+
+def run_queries(clips, backend, traced=False):
+    start = time.perf_counter()
+    results = []
+    for clip in clips:
+        if traced:
+            with metrics.Trace() as trace:
+                results.append(recognize(clip, backend))
+            metrics.record_query(trace)
+        else:
+            results.append(recognize(clip, backend))
+    return time.perf_counter() - start, results
+
+def per_call_ns(func, n=200000):
+    start = time.perf_counter()
+    for _ in range(n):
+        func()
+    return (time.perf_counter() - start) / n * 1e9
+
+def main():
+    n_songs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 60
+    n_queries = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+
+    print(f"Catálogo sintético: {n_songs} músicas de {seconds:.0f}s...")
+    catalog, songs = build_catalog(n_songs, seconds)
+    rng = np.random.default_rng(0)
+    clip_len = CLIP_SECONDS * audio.SAMPLE_RATE
+    clips = []
+    for _ in range(n_queries):
+        song = songs[rng.integers(len(songs))]
+        start = rng.integers(0, len(song) - clip_len)
+        clips.append(song[start:start + clip_len])
+
+    # Modos intercalados a cada repetição (o ruído da máquina afeta todos igualmente)
+    modes = {'desligadas (padrão)': (False, False), 'ligadas': (True, False),
+             'ligadas + Trace por consulta': (True, True)}
+    best = dict.fromkeys(modes, float('inf'))
+    expected = None
+    for _ in range(REPEAT):
+        for label, (enabled, traced) in modes.items():
+            metrics.enable(enabled)
+            seconds, results = run_queries(clips, catalog, traced)
+            best[label] = min(best[label], seconds)
+            if expected is None:
+                expected = results
+            elif results != expected:
+                print(f"ERRO: resultados diferem ({label})!")
+                sys.exit(1)
+    metrics.enable(False)
+    t_off = best['desligadas (padrão)']
+
+    print(f"\n{n_queries} consultas de {CLIP_SECONDS}s (melhor de {REPEAT}):")
+    for label, t in best.items():
+        print(f"  {label:<30}{t / n_queries * 1000:>8.3f} ms/consulta  ({(t / t_off - 1) * 100:+.1f}%)")
+
+    noop = lambda: None
+    wrapped = metrics.timed('noop')(noop)
+    base = per_call_ns(noop)
+    off = per_call_ns(wrapped)
+    metrics.enable(True)
+    on = per_call_ns(wrapped)
+    with metrics.Trace() as trace:
+        recognize(clips[0], catalog)
+    metrics.enable(False)
+    calls = sum(n for _, n in trace.stages.values())
+    print(f"\nChamada instrumentada (função vazia): +{off - base:.0f} ns desligada, +{on - base:.0f} ns ligada "
+          f"(~{calls:.0f} chamadas por consulta)")
+
+if __name__ == '__main__':
+    main()
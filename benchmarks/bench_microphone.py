@@ -0,0 +1,141 @@
+"""
+Captura do microfone: gravação em arquivo vs. buffer circular em memória.
+
+Sem placa de som: o "microfone" é um recorder.ArrayInputStream tocando
+trechos de um catálogo sintético na velocidade real (o mesmo callback do
+sounddevice.InputStream). Compara, do clique até a resposta:
+- gravação antiga: grava LISTEN_SECONDS inteiros, salva um WAV PCM_16,
+  relê o arquivo (load_audio_file) e reconhece;
+- recorder.stream_microphone: o callback escreve em um RingBuffer
+  pré-alocado e o reconhecimento progressivo consome as views enquanto
+  grava, parando no primeiro resultado confiável.
+
+Confere também que as views entregues reproduzem o áudio capturado amostra
+por amostra (e que, com o buffer cheio, o excesso é descartado e contado) e mede o custo do callback (cópia para o buffer, sem alocação).
+
+Uso: python benchmarks/bench_microphone.py [n_clipes]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import soundfile as sf
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import audio_processing as audio
+import fingerprinting
+import index
+import matcher
+import progressive
+import recorder
+import synthetic
+
+N_SONGS = 20
+SONG_SECONDS = 60
+LISTEN_SECONDS = 5      # Gravação fixa da GUI antiga (recorder.record_audio)
+MAX_SECONDS = 10        # Limite da escuta progressiva (gui.LISTEN_MAX_SECONDS)
+
+def build_catalog():
+    songs, ids, hashes, offsets = {}, [], [], []
+    for song_id in range(1, N_SONGS + 1):
+        samples = synthetic.synthetic_music(SONG_SECONDS, seed=song_id)
+        f, t, Sxx = audio.generate_spectrogram(samples)
+        h, o = fingerprinting.generate_fingerprint_arrays(*fingerprinting.find_peaks(Sxx))
+        songs[song_id] = samples
+        ids.append(np.full(len(h), song_id))
+        hashes.append(h)
+        offsets.append(o)
+    catalog = index.ArrayIndex.from_postings(np.concatenate(hashes), np.concatenate(ids), np.concatenate(offsets))
+    return songs, catalog
+
+def listen_to_file(samples, catalog, path):
+    """Fluxo antigo: grava tudo, salva o WAV, relê e reconhece."""
+    start = time.perf_counter()
+    factory = recorder.ArrayInputStream.factory(samples)
+    recording = np.concatenate([b.copy() for b in recorder.stream_microphone(LISTEN_SECONDS,
+                                                                             stream_factory=factory)])
+    sf.write(path, recording, audio.SAMPLE_RATE, subtype='PCM_16')
+    clip = audio.load_audio_file(path)
+    f, t, Sxx = audio.generate_spectrogram(clip)
+    hashes, offsets = fingerprinting.generate_fingerprint_arrays(*fingerprinting.find_peaks(Sxx))
+    candidates, _ = matcher.match_fingerprints(hashes, offsets, catalog, top_k=2)
+    return candidates, time.perf_counter() - start
+
+def listen_progressive(samples, catalog):
+    """Buffer circular + reconhecimento enquanto grava."""
+    start = time.perf_counter()
+    factory = recorder.ArrayInputStream.factory(samples)
+    chunks = recorder.stream_microphone(MAX_SECONDS, stream_factory=factory)
+    result = progressive.recognize_progressive(chunks, catalog, top_k=2)
+    chunks.close()
+    return result.candidates, time.perf_counter() - start
+
+def capture_all(samples, speed):
+    """Captura 'samples' com um RingBuffer de 2s (várias voltas) e um consumidor lento."""
+    factory = recorder.ArrayInputStream.factory(samples, speed)
+    with recorder.MicrophoneCapture(buffer_seconds=2, stream_factory=factory) as capture:
+        received = []
+        for block in capture.blocks():
+            received.append(block.copy())
+            time.sleep(0.001)
+        dropped = capture.buffer.dropped
+    return np.concatenate(received), dropped
+
+def callback_cost(n_blocks=2000):
+    capture = recorder.MicrophoneCapture(buffer_seconds=5)
+    indata = np.zeros((capture.blocksize, 1), dtype=np.int16)
+    tracemalloc.start()
+    start = time.perf_counter()
+    for i in range(n_blocks):
+        capture._callback(indata, capture.blocksize, None, None)
+        capture.buffer.released = capture.buffer.handed = capture.buffer.written   # Leitor em dia
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed / n_blocks * 1e6, peak
+
+def main():
+    n_clips = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+
+    print(f"Catálogo sintético: {N_SONGS} músicas de {SONG_SECONDS}s...")
+    songs, catalog = build_catalog()
+    rng = np.random.default_rng(0)
+    clips = []
+    for _ in range(n_clips):
+        song_id = int(rng.integers(1, N_SONGS + 1))
+        start = int(rng.integers(0, len(songs[song_id]) - MAX_SECONDS * audio.SAMPLE_RATE))
+        clips.append((song_id, songs[song_id][start:start + MAX_SECONDS * audio.SAMPLE_RATE]))
+
+    print(f"\n{n_clips} escutas em tempo real (microfone simulado):")
+    print(f"  {'modo':<32}{'acerto':>8}{'clique -> resposta':>20}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'temp_mic.wav')
+        for label, listen in (('arquivo (gravar 5s e reler)', lambda s: listen_to_file(s, catalog, path)),
+                              ('buffer circular + progressivo', lambda s: listen_progressive(s, catalog))):
+            hits, seconds = 0, []
+            for truth, samples in clips:
+                candidates, elapsed = listen(samples)
+                hits += matcher.is_confident(candidates) and candidates[0].song_id == truth
+                seconds.append(elapsed)
+            print(f"  {label:<32}{f'{hits}/{n_clips}':>8}{np.mean(seconds):>17.2f} s")
+
+    # 20x o tempo real: o buffer dá várias voltas sem encher; sem ritmo: enche e descarta o excesso
+    samples = clips[0][1]
+    received, dropped = capture_all(samples, speed=20)
+    ok = dropped == 0 and np.array_equal(received, samples)
+    print(f"\nViews do buffer == áudio capturado (20x tempo real): {'sim' if ok else 'NÃO'}")
+    received, dropped = capture_all(samples, speed=None)
+    ok &= len(received) + dropped == len(samples) and np.array_equal(received, samples[:len(received)])
+    print(f"Sem ritmo (buffer cheio): {len(received)} recebidas + {dropped} descartadas = {len(samples)} amostras")
+    us, peak = callback_cost()
+    print(f"Callback: {us:.1f} µs por bloco de {recorder.BLOCK_SECONDS}s, pico de alocação {peak} bytes "
+          f"(a fila antiga alocava {int(recorder.BLOCK_SECONDS * recorder.SAMPLE_RATE) * 2} bytes por bloco)")
+    if not ok:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
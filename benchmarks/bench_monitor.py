@@ -0,0 +1,100 @@
+"""
+Monitoramento de vários streams simultâneos (main.py monitor).
+
+Monta um catálogo sintético em memória, grava N streams (arquivos WAV que
+encadeiam trechos de músicas do catálogo com intervalos de ruído) e roda
+monitor.run_monitors sobre todos em paralelo. Reporta a velocidade de cada
+stream em relação ao tempo real e confere o play log com o gabarito.
+
+Uso: python benchmarks/bench_monitor.py [streams] [minutos por stream] [--realtime]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import soundfile as sf
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import audio_processing as audio
+import monitor
+import synthetic
+
+N_SONGS = 30
+SONG_SECONDS = 60
+SEGMENT_SECONDS = (20, 40)
+GAP_SECONDS = 5
+
+def write_stream(path, songs, rng, seconds):
+    """Trechos aleatórios de músicas separados por ruído. Retorna o gabarito [(song_id, início, fim)]."""
+    parts, truth, position = [], [], 0.0
+    while position < seconds:
+        gap = (0.002 * rng.standard_normal(GAP_SECONDS * audio.SAMPLE_RATE) * 32767).astype(np.int16)
+        parts.append(gap)
+        position += GAP_SECONDS
+
+        song_id = int(rng.integers(1, N_SONGS + 1))
+        length = int(rng.integers(*SEGMENT_SECONDS))
+        start = int(rng.integers(0, SONG_SECONDS - length))
+        parts.append(songs[song_id][start * audio.SAMPLE_RATE:(start + length) * audio.SAMPLE_RATE])
+        truth.append((song_id, position, position + length))
+        position += length
+    sf.write(path, np.concatenate(parts), audio.SAMPLE_RATE, subtype='PCM_16')
+    return truth
+
+def check(truth, plays):
+    """Uma execução do gabarito conta como detectada se houver entrada da mesma música sobreposta."""
+    found = sum(any(p['song_id'] == song_id and p['start'] < end and p['end'] > start for p in plays)
+                for song_id, start, end in truth)
+    wrong = sum(not any(p['song_id'] == song_id and p['start'] < end and p['end'] > start
+                        for song_id, start, end in truth)
+                for p in plays)
+    return found, wrong
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    n_streams = int(args[0]) if args else 10
+    minutes = float(args[1]) if len(args) > 1 else 3
+    realtime = '--realtime' in sys.argv
+
+    print(f"Catálogo sintético: {N_SONGS} músicas de {SONG_SECONDS}s...")
+    songs, catalog = synthetic.audio_catalog(N_SONGS, SONG_SECONDS)
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths, truths = [], {}
+        for i in range(n_streams):
+            path = os.path.join(tmp, f"stream_{i:02d}.wav")
+            truths[path] = write_stream(path, songs, rng, minutes * 60)
+            paths.append(path)
+
+        log = os.path.join(tmp, 'plays.jsonl')
+        print(f"Monitorando {n_streams} streams de {minutes:.1f} min{' em tempo real' if realtime else ''}...")
+        start = time.perf_counter()
+        stats = monitor.run_monitors(paths, catalog, log_file=log, source_options={'realtime': realtime})
+        elapsed = time.perf_counter() - start
+
+        with open(log, encoding='utf-8') as f:
+            plays = [json.loads(line) for line in f]
+
+    total_found = total_truth = total_wrong = 0
+    print(f"\n{'stream':<14}{'áudio (s)':>10}{'x tempo real':>14}{'detectadas':>12}{'erradas':>9}")
+    for s in sorted(stats, key=lambda s: s['stream']):
+        truth = truths[s['stream']]
+        found, wrong = check(truth, [p for p in plays if p['stream'] == s['stream']])
+        total_found += found
+        total_truth += len(truth)
+        total_wrong += wrong
+        print(f"{os.path.basename(s['stream']):<14}{s['audio_seconds']:>10.1f}"
+              f"{s['audio_seconds'] / s['cpu_seconds']:>14.1f}{f'{found}/{len(truth)}':>12}{wrong:>9}")
+
+    audio_total = sum(s['audio_seconds'] for s in stats)
+    print(f"\nTotal: {audio_total:.0f}s de áudio em {elapsed:.1f}s de parede "
+          f"({audio_total / elapsed:.1f}x tempo real agregado, {os.cpu_count()} CPUs)")
+    print(f"Execuções detectadas: {total_found}/{total_truth}, entradas erradas: {total_wrong}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Detecção de picos: implementação original de get_2d_peaks vs. find_peaks.
+
+A original usa maximum_filter com footprint denso, várias máscaras do tamanho
+do espectrograma e uma lista de tuplas ordenada em Python. find_peaks usa o
+filtro de máximo separável em float32 e devolve arrays já ordenados.
+
+Confere que os picos são idênticos (sinais limpos, ruidosos, ruído puro e
+espectrogramas com empates), inclusive pelo caminho em streaming (PeakStream),
+e mede a vazão em frames de espectrograma por segundo. Mostra também o efeito
+do controle de densidade (max_per_frame / max_per_band).
+
+Uso: python benchmarks/bench_peaks.py [segundos de áudio]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+from scipy.ndimage import maximum_filter
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import audio_processing as audio
+import fingerprinting
+import synthetic
+
+def legacy_get_2d_peaks(arr2d):
+    """get_2d_peaks como era antes (referência)."""
+    neighborhood = np.ones((fingerprinting.PEAK_NEIGHBORHOOD_SIZE, fingerprinting.PEAK_NEIGHBORHOOD_SIZE))
+    local_max = maximum_filter(arr2d, footprint=neighborhood) == arr2d
+    background = (arr2d > fingerprinting.MIN_AMPLITUDE)
+    eroded_background = background & local_max
+    detected_peaks = np.where(eroded_background)
+    peaks = list(zip(detected_peaks[1], detected_peaks[0]))
+    peaks.sort()
+    return peaks
+
+def streamed(Sxx, block=37, **options):
+    stream = fingerprinting.PeakStream(**options)
+    parts = [stream.push(Sxx[:, i:i + block]) for i in range(0, Sxx.shape[1], block)]
+    parts.append(stream.flush())
+    return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+def best_of(func, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def spectrograms(seconds):
+    rng = np.random.default_rng(0)
+    clean = synthetic.synthetic_audio(seconds, seed=1)
+    n = len(clean)
+    signals = {
+        'música limpa': clean,
+        'música + ruído': audio.to_int16(clean / 32767 + 0.1 * rng.standard_normal(n)),
+        'ruído branco': audio.to_int16(0.3 * rng.standard_normal(n)),
+    }
+    result = {name: audio.generate_spectrogram(x)[2] for name, x in signals.items()}
+    # Valores quantizados: muitos empates entre vizinhos (todos devem virar picos, como antes)
+    result['empates'] = np.round(result['música + ruído'] / 50).astype(np.float32) * 50
+    return result
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 300
+
+    print(f"Espectrogramas de {seconds:.0f}s de áudio...")
+    print(f"\n{'sinal':<16}{'picos':>9}{'original (fr/s)':>17}{'find_peaks (fr/s)':>19}{'ganho':>8}")
+    for name, Sxx in spectrograms(seconds).items():
+        frames = Sxx.shape[1]
+        t_legacy, legacy = best_of(lambda: legacy_get_2d_peaks(Sxx), repeat=1)
+        t_new, (times, freqs) = best_of(lambda: fingerprinting.find_peaks(Sxx))
+
+        expected_times, expected_freqs = fingerprinting.peaks_to_arrays(legacy)
+        if not (np.array_equal(times, expected_times) and np.array_equal(freqs, expected_freqs)):
+            print(f"ERRO: find_peaks difere da implementação original ({name})!")
+            sys.exit(1)
+        if fingerprinting.get_2d_peaks(Sxx) != [(int(t), int(f)) for t, f in legacy]:
+            print(f"ERRO: get_2d_peaks difere da implementação original ({name})!")
+            sys.exit(1)
+        stream_times, stream_freqs = streamed(Sxx)
+        if not (np.array_equal(stream_times, times) and np.array_equal(stream_freqs, freqs)):
+            print(f"ERRO: PeakStream difere do batch ({name})!")
+            sys.exit(1)
+
+        print(f"{name:<16}{len(times):>9}{frames / t_legacy:>17.0f}{frames / t_new:>19.0f}"
+              f"{t_legacy / t_new:>7.1f}x")
+    print("Picos idênticos à implementação original (batch e streaming).")
+
+    Sxx = spectrograms(min(seconds, 60))['música + ruído']
+    total = len(fingerprinting.find_peaks(Sxx)[0])
+    frame_seconds = (audio.WINDOW_SIZE * (1 - audio.OVERLAP_RATIO)) / audio.SAMPLE_RATE
+    duration = Sxx.shape[1] * frame_seconds
+    print(f"\nControle de densidade (música + ruído, {duration:.0f}s, {total / duration:.0f} picos/s sem limite):")
+    for options in ({'max_per_frame': 5}, {'max_per_frame': 2}, {'max_per_band': 1}, {'max_per_band': 1, 'max_per_frame': 3}):
+        times, freqs = fingerprinting.find_peaks(Sxx, **options)
+        stream_times, stream_freqs = streamed(Sxx, **options)
+        same = np.array_equal(times, stream_times) and np.array_equal(freqs, stream_freqs)
+        hashes, _ = fingerprinting.generate_fingerprint_arrays(times, freqs)
+        label = ', '.join(f'{k}={v}' for k, v in options.items())
+        print(f"  {label:<32}{len(times) / duration:>7.0f} picos/s{len(hashes) / duration:>9.0f} hashes/s"
+              f"  {'streaming == batch' if same else 'ERRO: streaming difere'}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,364 @@
+"""
+Benchmark reprodutível do sistema inteiro, com saída em JSON.
+
+1. Gera um catálogo de músicas procedurais (synthetic.synthetic_music) em WAV.
+2. Cadastra cada uma pelo mesmo pipeline do 'main.py add' (digest + leitura,
+   espectrograma, picos, hashes e escrita no banco), medindo cada etapa.
+3. Cria consultas degradadas a partir de trechos com início aleatório:
+   ruído branco em vários SNRs, ganho (com saturação), resample para outra taxa,
+   andamento alterado (time-stretch),
+   além de músicas fora do catálogo (falsos positivos).
+4. Reconhece cada consulta medindo leitura, espectrograma, picos, hashes,
+   busca no backend e pontuação, e confere a resposta com o gabarito.
+
+O JSON traz tempos por etapa, acerto por degradação, tamanho do banco, pico
+de memória e o tempo de início da CLI (bench_startup.py). Termina com código 1
+se um comando leve da CLI passou do orçamento de imports e, com --baseline, se
+alguma etapa ficou mais lenta que a tolerância ou algum acerto caiu.
+
+Uso: python benchmarks/bench_pipeline.py [--songs 20] [--seconds 30] [--queries 10]
+         [--backend sqlite|index] [--output resultado.json] [--baseline anterior.json]
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+import scipy
+import soundfile as sf
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import audio_processing as audio
+import bench_startup
+import cache
+import database as db
+import fingerprinting
+import index
+import matcher
+import synthetic
+
+# Degradações das consultas: nome -> parâmetros de degrade()
+CONDITIONS = {
+    'limpo': {},
+    'snr 20dB': {'snr_db': 20},
+    'snr 10dB': {'snr_db': 10},
+    'snr 5dB': {'snr_db': 5},
+    'snr 0dB': {'snr_db': 0},
+    'ganho -20dB': {'gain_db': -20},
+    'ganho +12dB': {'gain_db': 12},     # Satura (clipping) nos picos
+    'resample 22.05kHz': {'rate': 22050},
+    'resample 48kHz + snr 10dB': {'rate': 48000, 'snr_db': 10},
+    'andamento +3%': {'tempo': 1.03},    # Time-stretch sem mudar a altura (rádio, mixagem)
+}
+OUTSIDE = 'fora do catálogo'
+
+# Erro máximo da posição estimada na música para contar como acerto
+OFFSET_TOLERANCE_SECONDS = 0.2
+
+INGEST_STAGES = ('load', 'digest', 'spectrogram', 'peaks', 'hashing', 'db_insert')
+QUERY_STAGES = ('load', 'spectrogram', 'peaks', 'hashing', 'lookup', 'scoring')
+
+class StageTimer:
+    """Acumula o tempo de cada etapa (with timer('etapa'): ...)."""
+    def __init__(self):
+        self.seconds = defaultdict(float)
+
+    @contextmanager
+    def __call__(self, stage):
+        start = time.perf_counter()
+        yield
+        self.seconds[stage] += time.perf_counter() - start
+
+    def report(self, stages, n_items):
+        return {stage: {'total_ms': self.seconds[stage] * 1000,
+                        'mean_ms': self.seconds[stage] * 1000 / max(n_items, 1)}
+                for stage in stages}
+
+def degrade(rng, samples, snr_db=None, gain_db=None, rate=None, tempo=None):
+    """
+    Aplica as degradações a um trecho (int16 a 44.1kHz).
+    Retorna (amostras float em [-1, 1], taxa de amostragem do arquivo a gravar).
+    """
+    if tempo is not None:
+        samples = synthetic.time_stretch(samples, tempo)
+    x = samples / 32767
+    if gain_db is not None:
+        x = np.clip(x * 10 ** (gain_db / 20), -1, 1)
+    if snr_db is not None:
+        power = np.mean(x ** 2)
+        x = x + rng.standard_normal(len(x)) * np.sqrt(power / 10 ** (snr_db / 10))
+    if rate is not None and rate != audio.SAMPLE_RATE:
+        from math import gcd
+        from scipy.signal import resample_poly
+        g = gcd(rate, audio.SAMPLE_RATE)
+        x = resample_poly(x, rate // g, audio.SAMPLE_RATE // g)
+    return np.clip(x, -1, 1), rate or audio.SAMPLE_RATE
+
+def db_size_bytes():
+    base = os.path.dirname(db.DB_PATH)
+    total = 0
+    for root, _, files in os.walk(base):
+        for name in files:
+            if name.startswith(os.path.basename(db.DB_PATH)) or root != base:
+                total += os.path.getsize(os.path.join(root, name))
+    return total
+
+def peak_rss_mb():
+    # ru_maxrss é em KiB no Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'scipy': scipy.__version__,
+            'platform': platform.platform(), 'cpus': os.cpu_count(), 'commit': commit}
+
+def ingest_catalog(paths, timer):
+    """Pipeline do 'main.py add', etapa por etapa. Retorna {song_id: caminho}, nº de fingerprints."""
+    song_ids, n_fingerprints = {}, 0
+    for path in paths:
+        with timer('load'):
+            samples = audio.load_audio_file(path)
+        with timer('digest'):
+            file_hash = cache.audio_digest(samples)
+            if db.find_song_by_file_hash(file_hash) is not None:
+                continue
+        with timer('spectrogram'):
+            f, t, Sxx = audio.generate_spectrogram(samples)
+        with timer('peaks'):
+            peak_times, peak_freqs = fingerprinting.find_peaks(Sxx)
+        with timer('hashing'):
+            hashes, offsets = fingerprinting.generate_fingerprint_arrays(peak_times, peak_freqs)
+        with timer('db_insert'):
+            with db.connection() as conn:
+                song_id = db.insert_song(os.path.basename(path), file_hash, conn=conn)
+                db.insert_fingerprint_arrays(np.full(len(hashes), song_id, dtype=np.int64),
+                                             hashes, offsets, conn=conn)
+        song_ids[song_id] = path
+        n_fingerprints += len(hashes)
+    return song_ids, n_fingerprints
+
+def make_queries(tmp, songs, n_per_condition, clip_seconds, seed):
+    """
+    Grava as consultas em WAV. Retorna [(condição, caminho, song_id ou None, início em s)].
+    """
+    rng = np.random.default_rng(seed)
+    clip = int(clip_seconds * audio.SAMPLE_RATE)
+    queries = []
+    for condition, params in CONDITIONS.items():
+        for i in range(n_per_condition):
+            song_id = int(rng.choice(list(songs)))
+            samples = songs[song_id]
+            start = int(rng.integers(0, len(samples) - clip))   # Não alinhado aos frames
+            x, rate = degrade(rng, samples[start:start + clip], **params)
+            path = os.path.join(tmp, f'query_{len(queries):04d}.wav')
+            sf.write(path, x, rate, subtype='PCM_16')
+            queries.append((condition, path, song_id, start / audio.SAMPLE_RATE))
+
+    for i in range(n_per_condition):
+        x = synthetic.synthetic_music(clip_seconds, seed=seed + 100_000 + i)
+        path = os.path.join(tmp, f'query_{len(queries):04d}.wav')
+        sf.write(path, x, audio.SAMPLE_RATE, subtype='PCM_16')
+        queries.append((OUTSIDE, path, None, 0.0))
+    return queries
+
+def recognize(path, backend, timer):
+    with timer('load'):
+        samples = audio.load_audio_file(path)
+    with timer('spectrogram'):
+        f, t, Sxx = audio.generate_spectrogram(samples)
+    with timer('peaks'):
+        peak_times, peak_freqs = fingerprinting.find_peaks(Sxx)
+    with timer('hashing'):
+        hashes, offsets = fingerprinting.generate_fingerprint_arrays(peak_times, peak_freqs)
+    with timer('lookup'):
+        m_ids, m_offsets, m_hashes = backend.lookup(hashes)
+    with timer('scoring'):
+        song_ids, diffs, query_offsets = matcher.align_matches(hashes, offsets, m_ids, m_offsets, m_hashes,
+                                                               return_query_offsets=True)
+        candidates = matcher.score_matches(song_ids, diffs, 2, query_offsets, len(hashes))
+    return candidates
+
+def run(args):
+    timer_ingest, timer_query = StageTimer(), StageTimer()
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, 'db', 'shazam.db')
+
+        print(f"Gerando {args.songs} músicas de {args.seconds:.0f}s...", file=sys.stderr)
+        paths, songs_by_path = [], {}
+        for i in range(args.songs):
+            samples = synthetic.synthetic_music(args.seconds, seed=args.seed + i)
+            path = os.path.join(tmp, f'song_{i:04d}.wav')
+            sf.write(path, samples, audio.SAMPLE_RATE, subtype='PCM_16')
+            paths.append(path)
+            songs_by_path[path] = samples
+
+        print("Cadastrando...", file=sys.stderr)
+        start = time.perf_counter()
+        song_ids, n_fingerprints = ingest_catalog(paths, timer_ingest)
+        ingest_seconds = time.perf_counter() - start
+        rss_after_ingest = peak_rss_mb()
+
+        start = time.perf_counter()
+        backend = index.ArrayIndex.build_from_db() if args.backend == 'index' else index.SQLiteBackend()
+        backend_seconds = time.perf_counter() - start
+
+        songs = {song_id: songs_by_path[path] for song_id, path in song_ids.items()}
+        queries = make_queries(tmp, songs, args.queries, args.clip_seconds, args.seed)
+
+        print(f"Reconhecendo {len(queries)} consultas...", file=sys.stderr)
+        outcomes = defaultdict(lambda: {'n': 0, 'correct': 0, 'wrong': 0, 'missed': 0})
+        latencies = []
+        for condition, path, truth, true_start in queries:
+            start = time.perf_counter()
+            candidates = recognize(path, backend, timer_query)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+            answer = candidates[0] if matcher.is_confident(candidates) else None
+            result = outcomes[condition]
+            result['n'] += 1
+            if answer is None:
+                result['missed'] += truth is not None
+            elif answer.song_id == truth and abs(answer.offset_seconds - true_start) <= OFFSET_TOLERANCE_SECONDS:
+                result['correct'] += 1
+            else:
+                result['wrong'] += 1
+        for result in outcomes.values():
+            known = result['n'] if result is not outcomes.get(OUTSIDE) else 0
+            result['accuracy'] = result['correct'] / known if known else None
+
+        db_bytes = db_size_bytes()
+
+        print("Medindo o início da CLI...", file=sys.stderr)
+        startup = bench_startup.measure(args.startup_repeat, db.DB_PATH, queries[0][1])
+
+    audio_seconds = args.songs * args.seconds
+    return {
+        'config': vars(args),
+        'environment': environment(),
+        'ingest': {
+            'songs': len(song_ids),
+            'audio_seconds': audio_seconds,
+            'fingerprints': n_fingerprints,
+            'wall_seconds': ingest_seconds,
+            'realtime_factor': audio_seconds / ingest_seconds,
+            'stages': timer_ingest.report(INGEST_STAGES, len(paths)),
+        },
+        'backend': {'kind': args.backend, 'open_seconds': backend_seconds},
+        'query': {
+            'queries': len(queries),
+            'latency_ms': {'p50': float(np.percentile(latencies, 50)), 'p95': float(np.percentile(latencies, 95)),
+                           'max': float(np.max(latencies))},
+            'stages': timer_query.report(QUERY_STAGES, len(queries)),
+        },
+        'accuracy': dict(outcomes),
+        'db': {'bytes': db_bytes, 'bytes_per_fingerprint': db_bytes / max(n_fingerprints, 1)},
+        'memory': {'peak_rss_mb_after_ingest': rss_after_ingest, 'peak_rss_mb': peak_rss_mb()},
+        'startup': startup,
+    }
+
+def compare(result, baseline, tolerance):
+    """
+    Lista as regressões em relação a um resultado anterior: etapas com tempo médio
+    acima de (1 + tolerance) vezes o anterior e condições com acerto menor.
+    """
+    regressions = []
+    for phase in ('ingest', 'query'):
+        for stage, now in result[phase]['stages'].items():
+            before = baseline.get(phase, {}).get('stages', {}).get(stage)
+            if before and before['mean_ms'] > 0:
+                ratio = now['mean_ms'] / before['mean_ms']
+                line = f"{phase}.{stage}: {before['mean_ms']:.2f} -> {now['mean_ms']:.2f} ms ({ratio:.2f}x)"
+                print(f"  {line}", file=sys.stderr)
+                if ratio > 1 + tolerance:
+                    regressions.append(line)
+    for condition, now in result['accuracy'].items():
+        before = baseline.get('accuracy', {}).get(condition)
+        if before is None:
+            continue
+        if now['accuracy'] is not None and before['accuracy'] is not None and now['accuracy'] < before['accuracy']:
+            regressions.append(f"acerto '{condition}': {before['accuracy']:.2f} -> {now['accuracy']:.2f}")
+        if condition == OUTSIDE and now['wrong'] > before['wrong']:
+            regressions.append(f"falsos positivos: {before['wrong']} -> {now['wrong']}")
+    return regressions
+
+def print_summary(result):
+    out = sys.stderr
+    ing, q = result['ingest'], result['query']
+    print(f"\nCadastro: {ing['songs']} músicas, {ing['fingerprints']} fingerprints, "
+          f"{ing['realtime_factor']:.1f}x tempo real", file=out)
+    for stage, s in ing['stages'].items():
+        print(f"  {stage:<12}{s['mean_ms']:>9.1f} ms/música", file=out)
+    print(f"Consultas: {q['queries']}, latência p50 {q['latency_ms']['p50']:.1f} ms, "
+          f"p95 {q['latency_ms']['p95']:.1f} ms", file=out)
+    for stage, s in q['stages'].items():
+        print(f"  {stage:<12}{s['mean_ms']:>9.2f} ms/consulta", file=out)
+    print(f"{'condição':<28}{'acertos':>9}{'errados':>9}{'perdidos':>10}", file=out)
+    for condition, r in result['accuracy'].items():
+        hits = f"{r['correct']}/{r['n']}" if condition != OUTSIDE else '-'
+        print(f"  {condition:<26}{hits:>9}{r['wrong']:>9}{r['missed']:>10}", file=out)
+    print(f"Banco: {result['db']['bytes'] / 1e6:.1f} MB ({result['db']['bytes_per_fingerprint']:.1f} B/fingerprint), "
+          f"pico de memória {result['memory']['peak_rss_mb']:.0f} MB", file=out)
+    print("Início da CLI:", file=out)
+    bench_startup.print_results(result['startup'], out)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de ponta a ponta (cadastro + reconhecimento) em JSON')
+    parser.add_argument('--songs', type=int, default=20, help='Músicas no catálogo sintético')
+    parser.add_argument('--seconds', type=float, default=30, help='Duração de cada música')
+    parser.add_argument('--queries', type=int, default=10, help='Consultas por degradação')
+    parser.add_argument('--clip-seconds', type=float, default=8, help='Duração de cada consulta')
+    parser.add_argument('--backend', choices=index.BACKENDS, default='sqlite')
+    parser.add_argument('--seed', type=int, default=1, help='Semente (mesma semente = mesmo catálogo e consultas)')
+    parser.add_argument('--output', default=None, help='Arquivo JSON de saída (padrão: stdout)')
+    parser.add_argument('--baseline', default=None, help='JSON de uma execução anterior para comparar')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Aumento relativo de tempo por etapa aceito antes de acusar regressão')
+    parser.add_argument('--startup-repeat', type=int, default=3, help='Execuções de cada comando no início da CLI')
+    parser.add_argument('--startup-budget', type=float, default=bench_startup.IMPORT_BUDGET_MS,
+                        help='Orçamento (ms) dos imports de um comando leve da CLI')
+    args = parser.parse_args()
+
+    result = run(args)
+    print_summary(result)
+
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    problems = bench_startup.check_budget(result['startup'], args.startup_budget)
+    if problems:
+        print("\nINÍCIO DA CLI FORA DO ORÇAMENTO:", file=sys.stderr)
+        for line in problems:
+            print(f"  {line}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"\nComparação com {args.baseline}:", file=sys.stderr)
+        regressions = compare(result, baseline, args.tolerance)
+        if regressions:
+            print("REGRESSÕES:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            sys.exit(1)
+        print("Sem regressões.", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
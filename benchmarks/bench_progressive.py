@@ -0,0 +1,175 @@
+"""
+Reconhecimento progressivo (saída antecipada) vs. amostra inteira.
+
+Clipes de um catálogo sintético com níveis de ruído crescentes, mais clipes
+que não estão no catálogo. Para cada modo reporta acerto, falsos positivos e
+o tempo até a resposta (segundos de áudio consumidos e ms de processamento).
+Músicas com um refrão repetido (mesmo áudio em duas posições) medem as
+respostas antecipadas na posição errada: a saída só pode sair quando a
+posição deixa de ser ambígua (matcher.MIN_OFFSET_RATIO).
+Confere também que recognize_file com o cache de fingerprints quente (replay)
+decide igual ao streaming do arquivo (mesma resposta, posição e instante).
+
+Uso: python benchmarks/bench_progressive.py [clipes por nível] [duração do clipe]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import audio_processing as audio
+import cache
+import fingerprinting
+import index
+import ingest
+import matcher
+import progressive
+import synthetic
+
+N_SONGS = 50
+SONG_SECONDS = 60
+# Taxas de amostragem dos arquivos do teste de cache (o replay depende do número de amostras)
+CACHE_SAMPLE_RATES = (audio.SAMPLE_RATE, 48000)
+# Música com refrão repetido: (trecho, segundos); o refrão está em 10s e em 20s
+REPEATED_LAYOUT = (('a', 10), ('refrão', 6), ('b', 4), ('refrão', 6), ('c', 10))
+REPEATED_CLIP_SECONDS = 9
+# Desvio padrão do ruído branco somado ao clipe (o sinal tem notas de amplitude 0.2)
+NOISE_LEVELS = {'limpo': 0.0, 'ruído 0.1': 0.1, 'ruído 0.3': 0.3, 'ruído 0.6': 0.6}
+
+def make_clip(rng, songs, seconds, noise):
+    song_id = int(rng.integers(1, len(songs) + 1))
+    n = int(seconds * audio.SAMPLE_RATE)
+    start = int(rng.integers(0, len(songs[song_id]) - n))
+    clip = songs[song_id][start:start + n] / 32767 + noise * rng.standard_normal(n)
+    return song_id, audio.to_int16(clip)
+
+def recognize_full(clip, catalog):
+    start = time.perf_counter()
+    f, t, Sxx = audio.generate_spectrogram(clip)
+    peak_times, peak_freqs = fingerprinting.find_peaks(Sxx)
+    hashes, offsets = fingerprinting.generate_fingerprint_arrays(peak_times, peak_freqs)
+    candidates, _ = matcher.match_fingerprints(hashes, offsets, catalog, top_k=2)
+    elapsed = (time.perf_counter() - start) * 1000
+    # Mesmo critério de decisão do modo progressivo, aplicado no fim
+    answer = candidates[0].song_id if matcher.is_confident(candidates) else None
+    return answer, len(clip) / audio.SAMPLE_RATE, elapsed
+
+def recognize_progressive(clip, catalog):
+    # Simula a chegada do áudio em blocos pequenos (como o microfone)
+    chunks = np.array_split(clip, max(len(clip) // 4096, 1))
+    result = progressive.recognize_progressive(iter(chunks), catalog, top_k=2)
+    answer = result.candidates[0].song_id if matcher.is_confident(result.candidates) else None
+    return answer, result.seconds, result.elapsed_ms
+
+def report(label, recognize, clips, catalog):
+    rows = [(*recognize(clip, catalog), truth) for truth, clip in clips]
+    answers, seconds, ms, truths = zip(*rows)
+    known = [t is not None for t in truths]
+    correct = sum(a == t for a, t, k in zip(answers, truths, known) if k)
+    wrong = sum(a is not None and a != t for a, t in zip(answers, truths))
+    print(f"  {label:<12}{f'{correct}/{sum(known)}':>9}{wrong:>8}"
+          f"{np.median(seconds):>12.2f}{np.percentile(seconds, 90):>10.2f}{np.median(ms):>10.1f}")
+
+def repeated_song(seed):
+    parts = {}
+    for k, (name, seconds) in enumerate(REPEATED_LAYOUT):
+        if name not in parts:
+            parts[name] = synthetic.synthetic_audio(seconds, seed=seed * 100 + k)
+    return np.concatenate([parts[name] for name, _ in REPEATED_LAYOUT])
+
+def check_repeated(n_songs):
+    """
+    Clipes que começam em cada refrão de músicas com refrão repetido.
+    Retorna (respostas antecipadas, antecipadas na posição errada, s de áudio p50).
+    """
+    songs = {song_id: repeated_song(song_id) for song_id in range(1, n_songs + 1)}
+    hashes, ids, offsets = [], [], []
+    for song_id, samples in songs.items():
+        f, t, Sxx = audio.generate_spectrogram(samples)
+        h, o = fingerprinting.generate_fingerprint_arrays(*fingerprinting.find_peaks(Sxx))
+        hashes.append(h)
+        ids.append(np.full(len(h), song_id))
+        offsets.append(o)
+    catalog = index.ArrayIndex.from_postings(np.concatenate(hashes), np.concatenate(ids), np.concatenate(offsets))
+
+    starts = np.cumsum([0] + [seconds for _, seconds in REPEATED_LAYOUT])
+    chorus = [int(starts[k]) for k, (name, _) in enumerate(REPEATED_LAYOUT) if name == 'refrão']
+    early = wrong = 0
+    seconds = []
+    for song_id, samples in songs.items():
+        for start in chorus:
+            clip = samples[start * audio.SAMPLE_RATE:(start + REPEATED_CLIP_SECONDS) * audio.SAMPLE_RATE]
+            chunks = np.array_split(clip, max(len(clip) // 4096, 1))
+            result = progressive.recognize_progressive(iter(chunks), catalog, top_k=2)
+            best = result.candidates[0] if result.candidates else None
+            early += result.early
+            wrong += result.early and (best.song_id != song_id or abs(best.offset_seconds - start) > 0.2)
+            seconds.append(result.seconds)
+    return early, wrong, float(np.median(seconds))
+
+def same_decision(a, b):
+    return (a.early == b.early and a.seconds == b.seconds
+            and [(c.song_id, c.count, c.offset_frames) for c in a.candidates]
+            == [(c.song_id, c.count, c.offset_frames) for c in b.candidates])
+
+def check_cache_replay(rng, songs, catalog, n_clips, clip_seconds):
+    """
+    Grava clipes em arquivos, aquece um cache de fingerprints (como o 'add') e compara
+    progressive.recognize_file com e sem o cache. Retorna (iguais, total).
+    """
+    import soundfile as sf
+    from scipy.signal import resample_poly
+
+    same = total = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        fp_cache = cache.FingerprintCache(os.path.join(tmp, 'cache'))
+        for i in range(n_clips):
+            _, clip = make_clip(rng, songs, clip_seconds, NOISE_LEVELS['ruído 0.3'] * (i % 2))
+            for fs in CACHE_SAMPLE_RATES:
+                data = clip / 32767 if fs == audio.SAMPLE_RATE else resample_poly(clip / 32767, fs, audio.SAMPLE_RATE)
+                path = os.path.join(tmp, f'clip_{i}_{fs}.wav')
+                sf.write(path, data, fs, subtype='FLOAT')
+                cold = progressive.recognize_file(path, catalog, top_k=2)
+                ingest.analyze_file(path, fp_cache)
+                warm = progressive.recognize_file(path, catalog, top_k=2, fp_cache=fp_cache)
+                same += same_decision(cold, warm)
+                total += 1
+    return same, total
+
+def main():
+    n_clips = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    clip_seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    print(f"Catálogo sintético: {N_SONGS} músicas de {SONG_SECONDS}s...")
+    songs, catalog = synthetic.audio_catalog(N_SONGS, SONG_SECONDS)
+    rng = np.random.default_rng(1)
+
+    print(f"\n{n_clips} clipes de {clip_seconds:.0f}s por nível")
+    print(f"  {'modo':<12}{'acertos':>9}{'errados':>8}{'s áudio p50':>12}{'p90':>10}{'ms p50':>10}")
+    for label, noise in NOISE_LEVELS.items():
+        clips = [make_clip(rng, songs, clip_seconds, noise) for _ in range(n_clips)]
+        print(f"{label}:")
+        report('inteira', recognize_full, clips, catalog)
+        report('progressiva', recognize_progressive, clips, catalog)
+
+    # Músicas fora do catálogo: nenhuma resposta deveria sair
+    outside = [(None, synthetic.synthetic_audio(clip_seconds, seed=10_000 + i)) for i in range(n_clips)]
+    print("fora do catálogo:")
+    report('inteira', recognize_full, outside, catalog)
+    report('progressiva', recognize_progressive, outside, catalog)
+
+    early, wrong, seconds = check_repeated(max(n_clips // 2, 1))
+    print(f"\nRefrão repetido: {early} respostas antecipadas, {wrong} na posição errada "
+          f"(s áudio p50 {seconds:.2f})")
+
+    same, total = check_cache_replay(rng, songs, catalog, max(n_clips // 3, 1), clip_seconds)
+    print(f"\nCache quente (replay) decide igual ao streaming: {same}/{total}")
+    if same < total:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
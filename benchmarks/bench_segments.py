@@ -0,0 +1,146 @@
+"""
+Catálogo mutável em segmentos (index.SegmentedIndex) vs. reconstruir o índice.
+
+Catálogo sintético (synthetic.populate_db) com o índice já construído. Mede:
+- cadastrar lotes de músicas e incorporá-las (refresh) vs. a reconstrução
+  completa (build_index), que era o único jeito de atualizar o índice;
+- remover músicas (database.delete_song + refresh) e conferir que elas
+  somem das respostas na hora;
+- latência de busca com um segmento, com vários (durante a ingestão e as
+  fusões em segundo plano) e depois de compact().
+Confere que o índice segmentado responde o mesmo que o SQLite (sem as
+removidas) e que um índice reconstruído do zero.
+
+Uso: python benchmarks/bench_segments.py [n_músicas] [hashes_por_música] [lotes] [músicas_por_lote]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import database as db
+import index
+import synthetic
+
+QUERY_HASHES = 300
+N_QUERIES = 50
+N_DELETE = 50
+
+def add_songs(n, per_song, seed):
+    """Cadastra n músicas aleatórias (como a ingestão: uma transação). Retorna {song_id: (hashes, offsets)}."""
+    added = {}
+    with db.connection() as conn:
+        for i, hashes, offsets in synthetic.random_catalog(n, per_song, seed):
+            song_id = db.insert_song(f"new_{seed}_{i}", conn=conn)
+            db.insert_fingerprint_arrays(np.full(len(hashes), song_id), hashes, offsets, conn=conn)
+            added[song_id] = (hashes, offsets)
+    return added
+
+def make_queries(rng, songs):
+    ids = rng.choice(list(songs), min(N_QUERIES, len(songs)), replace=False)
+    return [synthetic.query_from_song(rng, *songs[int(i)], QUERY_HASHES)[0] for i in ids]
+
+def latencies(backend, queries):
+    times = []
+    for q in queries:
+        start = time.perf_counter()
+        backend.lookup(q)
+        times.append(time.perf_counter() - start)
+    return np.array(times) * 1000
+
+def same_answers(a, b, queries):
+    return all(a.get_matches(q) == b.get_matches(q) for q in queries)
+
+def main():
+    n_songs = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    per_song = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    n_batches = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    batch_songs = int(sys.argv[4]) if len(sys.argv) > 4 else 100
+
+    rng = np.random.default_rng(1)
+    songs = {song_id: (h, o) for song_id, h, o in synthetic.random_catalog(n_songs, per_song)}
+    queries = make_queries(rng, songs)
+    ok = True
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"Catálogo sintético: {n_songs} músicas x {per_song} hashes")
+        synthetic.populate_db(os.path.join(tmp, 'shazam.db'), n_songs, per_song)
+        index_dir = os.path.join(tmp, 'index')
+        # max_df=None: mesmas respostas que o SQLite (a frequência do SQLite só é recalculada em compact)
+        segmented = index.open_backend('index', index_dir, max_df=None)
+        sqlite = index.SQLiteBackend(max_df=None)
+        single_ms = latencies(segmented, queries)
+
+        start = time.perf_counter()
+        index.build_index(os.path.join(tmp, 'rebuild'))
+        rebuild_seconds = time.perf_counter() - start
+
+        # Ingestão em lotes: cada lote vira um segmento; as fusões rodam em segundo plano
+        print(f"\n{n_batches} lotes de {batch_songs} músicas:")
+        write_s, refresh_s, during_ms = [], [], []
+        for b in range(n_batches):
+            start = time.perf_counter()
+            new = add_songs(batch_songs, per_song, seed=1000 + b)
+            write_s.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            segmented.refresh()
+            refresh_s.append(time.perf_counter() - start)
+            during_ms.extend(latencies(segmented, queries))
+            songs.update(new)
+        segments_during = len(segmented.segments)
+        segmented.wait_merges()
+        print(f"  {'gravar no banco':<28}{np.mean(write_s) * 1000:>9.1f} ms/lote")
+        print(f"  {'refresh (segmento novo)':<28}{np.mean(refresh_s) * 1000:>9.1f} ms/lote")
+        print(f"  {'build_index (tudo de novo)':<28}{rebuild_seconds * 1000:>9.1f} ms "
+              f"({rebuild_seconds / np.mean(refresh_s):.0f}x o refresh)")
+
+        new_queries = make_queries(rng, new)
+        ok &= same_answers(segmented, sqlite, queries + new_queries)
+
+        # Remoções: somem das respostas no próximo refresh, antes de qualquer compactação
+        deleted = [int(i) for i in rng.choice(list(songs), N_DELETE, replace=False)]
+        start = time.perf_counter()
+        for song_id in deleted:
+            db.delete_song(song_id)
+        delete_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        segmented.refresh()
+        refresh_delete = time.perf_counter() - start
+        sqlite = index.SQLiteBackend(max_df=None)
+        deleted_queries = [synthetic.query_from_song(rng, *songs[i], QUERY_HASHES)[0] for i in deleted]
+        leaked = sum(np.isin(segmented.lookup(q)[0], deleted).sum() for q in deleted_queries)
+        ok &= leaked == 0 and same_answers(segmented, sqlite, queries + deleted_queries)
+        print(f"\n{N_DELETE} remoções: {delete_seconds * 1000:.1f} ms no banco + {refresh_delete * 1000:.1f} ms "
+              f"de refresh; postings das removidas nas respostas: {leaked}")
+
+        multi_ms = latencies(segmented, queries)
+        segments_before = len(segmented.segments)
+        start = time.perf_counter()
+        db.compact()
+        segmented.compact()
+        compact_seconds = time.perf_counter() - start
+        compact_ms = latencies(segmented, queries)
+
+        fresh = index.build_index(os.path.join(tmp, 'check'))
+        fresh.max_df = None
+        ok &= same_answers(segmented, fresh, queries + new_queries + deleted_queries)
+        ok &= same_answers(segmented, index.SQLiteBackend(max_df=None), queries + deleted_queries)
+        print(f"compact (banco + índice): {compact_seconds:.2f}s")
+
+        print(f"\n{'busca de ' + str(QUERY_HASHES) + ' hashes':<34}{'p50 (ms)':>10}{'p99 (ms)':>10}")
+        for label, ms in ((f'1 segmento', single_ms),
+                          (f'durante a ingestão (até {segments_during} seg.)', np.array(during_ms)),
+                          (f'{segments_before} segmentos + tombstones', multi_ms),
+                          (f'depois de compact ({len(segmented.segments)} seg.)', compact_ms)):
+            print(f"{label:<34}{np.percentile(ms, 50):>10.2f}{np.percentile(ms, 99):>10.2f}")
+
+    print(f"\nMesmas respostas que o SQLite e que um índice reconstruído: {'sim' if ok else 'NÃO'}")
+    if not ok:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+Gerador de carga para o servidor de reconhecimento (main.py serve).
+
+Abre N conexões keep-alive concorrentes contra localhost e reporta
+latência p50/p99 e vazão (QPS).
+
+Exemplos:
+  # Contra um servidor já rodando (python main.py serve), enviando um clipe de áudio:
+  python benchmarks/bench_server.py --mode audio --clip data/amostra.wav --requests 200
+
+  # Autocontido: sobe um servidor com catálogo sintético e envia fingerprints pré-calculados:
+  python benchmarks/bench_server.py --synthetic 5000 --concurrency 32 --requests 5000
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import synthetic
+
+QUERY_HASHES = 2000
+SYNTHETIC_PER_SONG = 2000
+
+class HttpClient:
+    """Cliente HTTP/1.1 mínimo com conexão persistente."""
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, body=b'', content_type='application/octet-stream'):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        head = (f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                f"Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n\r\n")
+        self.writer.write(head.encode('latin-1') + body)
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.lower() == 'content-length':
+                length = int(value)
+        return status, json.loads(await self.reader.readexactly(length))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+def make_payloads(args):
+    """Corpos das requisições: clipes de áudio ou fingerprints binários (hash, offset)."""
+    if args.mode == 'audio':
+        if not args.clip:
+            sys.exit("--mode audio requer --clip")
+        payloads = []
+        for path in args.clip:
+            with open(path, 'rb') as f:
+                payloads.append(f.read())
+        return '/recognize', payloads
+
+    rng = np.random.default_rng(2)
+    n_songs = args.synthetic or args.catalog_songs
+    payloads = []
+    for song_id, hashes, offsets in synthetic.random_catalog(min(n_songs, 200), SYNTHETIC_PER_SONG):
+        q_hashes, q_offsets = synthetic.query_from_song(rng, hashes, offsets, QUERY_HASHES)
+        payloads.append(np.column_stack([q_hashes, q_offsets]).astype('<i8').tobytes())
+    return '/recognize/fingerprints', payloads
+
+async def run_load(host, port, path, payloads, concurrency, total_requests):
+    latencies = []
+    errors = 0
+    counter = iter(range(total_requests))
+
+    async def worker(worker_id):
+        nonlocal errors
+        client = HttpClient(host, port)
+        try:
+            for i in counter:
+                body = payloads[(i + worker_id) % len(payloads)]
+                start = time.perf_counter()
+                status, _ = await client.request('POST', path, body)
+                latencies.append(time.perf_counter() - start)
+                errors += status != 200
+        finally:
+            client.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return np.array(latencies) * 1000, errors, elapsed
+
+async def wait_until_ready(host, port, timeout=120):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            client = HttpClient(host, port)
+            status, health = await client.request('GET', '/health')
+            client.close()
+            if status == 200:
+                return health
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("Servidor não respondeu a tempo")
+
+def serve_synthetic(n_songs, port, batch_window_ms):
+    """Modo interno: servidor com catálogo sintético em memória (sem banco)."""
+    import index
+    import server
+
+    ids, hashes, offsets = [], [], []
+    for song_id, h, o in synthetic.random_catalog(n_songs, SYNTHETIC_PER_SONG):
+        ids.append(np.full(len(h), song_id))
+        hashes.append(h)
+        offsets.append(o)
+    catalog = index.ArrayIndex.from_postings(np.concatenate(hashes), np.concatenate(ids), np.concatenate(offsets))
+    names = {i: f"song_{i}" for i in range(1, n_songs + 1)}
+
+    app = server.RecognitionServer(catalog, names, batch_window_ms=batch_window_ms)
+    asyncio.run(app.serve_forever('127.0.0.1', port))
+
+def main():
+    parser = argparse.ArgumentParser(description='Gerador de carga para main.py serve')
+    parser.add_argument('--url', default='http://127.0.0.1:8765')
+    parser.add_argument('--mode', choices=('fingerprints', 'audio'), default='fingerprints')
+    parser.add_argument('--clip', nargs='*', help='Clipes de áudio para o modo audio')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--synthetic', type=int, default=0,
+                        help='Sobe um servidor próprio com N músicas sintéticas')
+    parser.add_argument('--catalog-songs', type=int, default=200,
+                        help='Tamanho do catálogo sintético usado nas consultas (modo fingerprints)')
+    parser.add_argument('--batch-window-ms', type=float, default=2.0)
+    parser.add_argument('--serve-synthetic', type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    url = urlsplit(args.url)
+    if args.serve_synthetic:
+        serve_synthetic(args.serve_synthetic, url.port, args.batch_window_ms)
+        return
+
+    server_proc = None
+    if args.synthetic:
+        server_proc = subprocess.Popen([sys.executable, __file__, '--serve-synthetic', str(args.synthetic),
+                                        '--url', args.url, '--batch-window-ms', str(args.batch_window_ms)])
+    try:
+        health = asyncio.run(wait_until_ready(url.hostname, url.port))
+        print(f"Servidor: {health['songs']} músicas")
+
+        path, payloads = make_payloads(args)
+        latencies, errors, elapsed = asyncio.run(
+            run_load(url.hostname, url.port, path, payloads, args.concurrency, args.requests))
+
+        health = asyncio.run(wait_until_ready(url.hostname, url.port))
+    finally:
+        if server_proc is not None:
+            server_proc.terminate()
+            server_proc.wait()
+
+    print(f"{len(latencies)} requisições ({args.mode}), concorrência {args.concurrency}, {errors} erros")
+    print(f"  QPS ........ {len(latencies) / elapsed:10.1f}")
+    print(f"  p50 ........ {np.percentile(latencies, 50):10.2f} ms")
+    print(f"  p99 ........ {np.percentile(latencies, 99):10.2f} ms")
+    if health.get('batches'):
+        print(f"  lote médio . {health['requests'] / health['batches']:10.1f} requisições por busca")
+
+if __name__ == '__main__':
+    main()
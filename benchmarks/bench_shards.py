@@ -0,0 +1,86 @@
+"""
+Banco único vs. fingerprints particionados em shards (database.reshard).
+
+Gera um catálogo sintético, redistribui em 1, 2, 4 e 8 shards e mede, para cada
+layout, a latência de uma consulta isolada (fan-out em threads) e a vazão com
+vários processos clientes consultando ao mesmo tempo.
+
+Uso: python benchmarks/bench_shards.py [n_músicas] [hashes_por_música] [clientes]
+  (ex: 1000000 100 para o catálogo de um milhão de músicas)
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import database as db
+import synthetic
+
+QUERY_HASHES = 2000
+QUERIES_PER_CLIENT = 40
+SHARD_COUNTS = (1, 2, 4, 8)
+
+def make_queries(n_songs, per_song, n):
+    rng = np.random.default_rng(1)
+    queries = []
+    for song_id, hashes, offsets in synthetic.random_catalog(min(n, n_songs), per_song):
+        # Consultas reais misturam hashes da música com ruído (hashes que não existem)
+        noise = rng.integers(0, 1 << 32, QUERY_HASHES // 2)
+        queries.append(np.concatenate([hashes[:QUERY_HASHES // 2], noise]))
+    return queries
+
+def client(args):
+    path, queries = args
+    db.DB_PATH = path
+    start = time.perf_counter()
+    rows = sum(len(db.get_matches(q)) for q in queries)
+    return rows, time.perf_counter() - start
+
+def main():
+    n_songs = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    per_song = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    clients = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count()
+
+    queries = make_queries(n_songs, per_song, 200)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'shazam.db')
+        print(f"Catálogo sintético: {n_songs} músicas x {per_song} hashes...")
+        start = time.perf_counter()
+        synthetic.populate_db(path, n_songs, per_song, batch_songs=2000)
+        print(f"  populado em {time.perf_counter() - start:.1f}s")
+
+        expected = [db.get_matches(q) for q in queries[:5]]
+        print(f"\n{clients} processos clientes, {QUERIES_PER_CLIENT} consultas de {QUERY_HASHES} hashes cada")
+        print(f"{'shards':>7}{'reshard (s)':>13}{'p50 (ms)':>10}{'p99 (ms)':>10}{'QPS':>9}")
+        for n_shards in SHARD_COUNTS:
+            start = time.perf_counter()
+            db.reshard(n_shards)
+            reshard_time = time.perf_counter() - start
+
+            if [db.get_matches(q) for q in queries[:5]] != expected:
+                print("ERRO: resultados diferentes após reshard!")
+                sys.exit(1)
+
+            latencies = []
+            for q in queries[:50]:
+                start = time.perf_counter()
+                db.get_matches(q)
+                latencies.append((time.perf_counter() - start) * 1000)
+
+            work = [(path, [queries[(c * QUERIES_PER_CLIENT + i) % len(queries)] for i in range(QUERIES_PER_CLIENT)])
+                    for c in range(clients)]
+            start = time.perf_counter()
+            with multiprocessing.Pool(clients) as pool:
+                pool.map(client, work)
+            qps = clients * QUERIES_PER_CLIENT / (time.perf_counter() - start)
+
+            print(f"{n_shards:>7}{reshard_time:>13.1f}{np.percentile(latencies, 50):>10.2f}"
+                  f"{np.percentile(latencies, 99):>10.2f}{qps:>9.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""
+Snapshot do catálogo (snapshot.py) vs. replicar o arquivo SQLite.
+
+Catálogo sintético (synthetic.populate_db) com stop-list e algumas músicas
+removidas (ainda não compactadas). Mede:
+- tamanho do snapshot vs. shazam.db (+ shards) e o tempo de export_snapshot;
+- "nó novo": copiar o arquivo e responder a primeira busca, com o snapshot
+  aberto por memory-map (backend 'snapshot'), com o SQLite copiado e com o
+  índice em memória reconstruído a partir do banco copiado;
+- load_snapshot completo em um banco vazio (banco + índice), por etapa;
+- latência de busca do snapshot vs. o índice em memória.
+Confere que o snapshot responde o mesmo que o SQLite e o índice (com e sem
+max_df), que músicas e postings voltam idênticas e que o banco restaurado
+responde o mesmo que o original.
+
+Uso: python benchmarks/bench_snapshot.py [n_músicas] [hashes_por_música]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import database as db
+import index
+import snapshot
+import synthetic
+
+QUERY_HASHES = 300
+N_QUERIES = 50
+N_DELETE = 20
+
+def db_size(path):
+    """Bytes do banco e dos shards (e do WAL, se houver)."""
+    files = [path + suffix for suffix in ('', '-wal')]
+    shards = os.path.join(os.path.dirname(path), db.SHARDS_DIR)
+    if os.path.isdir(shards):
+        files += [os.path.join(shards, name) for name in os.listdir(shards)]
+    return sum(os.path.getsize(f) for f in files if os.path.exists(f))
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+def first_query(open_fn, query):
+    """Abre o backend e faz uma busca. Retorna (backend, segundos)."""
+    start = time.perf_counter()
+    backend = open_fn()
+    backend.lookup(query)
+    return backend, time.perf_counter() - start
+
+def latencies(backend, queries):
+    times = []
+    for q in queries:
+        start = time.perf_counter()
+        backend.lookup(q)
+        times.append(time.perf_counter() - start)
+    return np.array(times) * 1000
+
+def same_answers(a, b, queries):
+    return all(a.get_matches(q) == b.get_matches(q) for q in queries)
+
+def main():
+    n_songs = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    per_song = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+
+    rng = np.random.default_rng(1)
+    songs = {song_id: (h, o) for song_id, h, o in synthetic.random_catalog(n_songs, per_song)}
+    queries = [synthetic.query_from_song(rng, *songs[int(i)], QUERY_HASHES)[0]
+               for i in rng.choice(list(songs), N_QUERIES, replace=False)]
+    ok = True
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"Catálogo sintético: {n_songs} músicas x {per_song} hashes")
+        origin = os.path.join(tmp, 'origin', 'shazam.db')
+        os.makedirs(os.path.dirname(origin))
+        synthetic.populate_db(origin, n_songs, per_song)
+        db.build_stoplist()
+        deleted = [int(i) for i in rng.choice(list(songs), N_DELETE, replace=False)]
+        for song_id in deleted:
+            db.delete_song(song_id)
+        queries += [synthetic.query_from_song(rng, *songs[i], QUERY_HASHES)[0] for i in deleted[:10]]
+
+        path = os.path.join(tmp, 'catalog.shzs')
+        meta, export_seconds = timed(lambda: snapshot.export_snapshot(path))
+        _, verify_seconds = timed(lambda: snapshot.verify_snapshot(path))
+        sqlite_bytes, snapshot_bytes = db_size(origin), os.path.getsize(path)
+        print(f"\n{'':<26}{'MB':>9}{'bytes/posting':>15}")
+        for label, size in (('shazam.db (+ shards)', sqlite_bytes), ('snapshot', snapshot_bytes)):
+            print(f"{label:<26}{size / 1e6:>9.1f}{size / meta['postings']:>15.2f}")
+        print(f"Snapshot {sqlite_bytes / snapshot_bytes:.1f}x menor; export {export_seconds:.2f}s, "
+              f"verificação dos checksums {verify_seconds:.2f}s")
+
+        # Referências no banco de origem (max_df=None: o SQLite só recalcula a frequência em compact)
+        sqlite = index.SQLiteBackend(max_df=None)
+        array_index = index.ArrayIndex.build_from_db()
+        reader = snapshot.SnapshotIndex(path, max_df=None)
+        ok &= same_answers(reader, sqlite, queries)
+        leaked = sum(np.isin(reader.lookup(q)[0], deleted).sum() for q in queries)
+        ok &= leaked == 0
+
+        # Round-trip: as mesmas músicas e postings (menos as das removidas) da origem
+        ids, names, file_hashes = reader.songs()
+        rows = db.connection().execute('SELECT id, name, file_hash FROM songs ORDER BY id').fetchall()
+        ok &= ids.tolist() == [r[0] for r in rows] and names == [r[1] for r in rows] \
+            and file_hashes == [r[2] for r in rows]
+        hashes, p_songs, p_offsets = array_index.postings()
+        live = ~np.isin(p_songs, deleted)
+        decoded = reader.postings()
+        ok &= all(np.array_equal(a, b) for a, b in zip(decoded, (hashes[live], p_songs[live], p_offsets[live])))
+
+        # Nó novo: copiar o arquivo (a "transferência") e responder a primeira busca
+        print(f"\nNó novo: copiar + abrir + 1ª busca{'':<4}{'s':>8}")
+        replica = os.path.join(tmp, 'replica')
+        os.makedirs(replica)
+
+        def open_snapshot():
+            shutil.copyfile(path, os.path.join(replica, 'catalog.shzs'))
+            return snapshot.SnapshotIndex(os.path.join(replica, 'catalog.shzs'))
+
+        def open_sqlite():
+            shutil.copyfile(origin, os.path.join(replica, 'shazam.db'))
+            db.DB_PATH = os.path.join(replica, 'shazam.db')
+            return index.SQLiteBackend()
+
+        def open_rebuilt():
+            # Banco já copiado por open_sqlite
+            return index.open_backend('index', os.path.join(replica, 'index'))
+
+        cold = {}
+        for label, fn in (('snapshot (memory-map)', open_snapshot), ('SQLite', open_sqlite),
+                          ('SQLite + índice reconstruído', open_rebuilt)):
+            backend, cold[label] = first_query(fn, queries[0])
+            print(f"  {label:<36}{cold[label]:>8.2f}")
+        print(f"  (o índice ainda soma a cópia do SQLite: "
+              f"{cold['SQLite'] + cold['SQLite + índice reconstruído']:.2f}s)")
+
+        # load_snapshot completo em um banco vazio
+        db.DB_PATH = os.path.join(tmp, 'loaded', 'shazam.db')
+        os.makedirs(os.path.dirname(db.DB_PATH))
+        loaded_dir = os.path.dirname(db.DB_PATH)
+        times, load_seconds = timed(lambda: snapshot.load_snapshot(
+            path, os.path.join(loaded_dir, 'index'), os.path.join(loaded_dir, 'catalog.shzs')))
+        ok &= times is not None
+        print(f"\nload_snapshot (banco + índice): {load_seconds:.2f}s  "
+              + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in (times or {}).items()))
+        print(f"  (reconstruir só o índice a partir do banco: {cold['SQLite + índice reconstruído']:.2f}s)")
+
+        # Banco e índice restaurados respondem o mesmo que a origem; o snapshot instalado, com o max_df padrão,
+        # o mesmo que o índice
+        ok &= same_answers(index.SQLiteBackend(max_df=None), reader, queries)
+        restored = index.open_backend('index', os.path.join(loaded_dir, 'index'))
+        installed = index.open_backend('snapshot', os.path.join(loaded_dir, 'catalog.shzs'))
+        ok &= same_answers(installed, restored, queries)
+        ok &= db.last_song_id() == meta['last_song_id']
+
+        print(f"\n{'busca de ' + str(QUERY_HASHES) + ' hashes':<26}{'p50 (ms)':>10}{'p99 (ms)':>10}")
+        for label, backend in (('índice em memória', restored), ('snapshot (memory-map)', installed)):
+            ms = latencies(backend, queries)
+            print(f"{label:<26}{np.percentile(ms, 50):>10.2f}{np.percentile(ms, 99):>10.2f}")
+
+    print(f"\nMesmas respostas, músicas e postings que a origem: {'sim' if ok else 'NÃO'}")
+    if not ok:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
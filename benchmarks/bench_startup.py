@@ -0,0 +1,163 @@
+"""
+Tempo de início da CLI (main.py), medido com 'python -X importtime'.
+
+Cada comando roda em um processo novo, como em scripts que chamam a CLI
+milhares de vezes, contra um banco temporário já no schema atual. Para cada
+comando: soma dos imports (importtime), tempo total do processo e os imports
+mais caros. Os comandos leves (que não leem áudio) não podem importar
+HEAVY_MODULES e têm um orçamento de IMPORT_BUDGET_MS de imports; o script
+termina com código 1 se algum passar (bench_pipeline.py faz a mesma verificação).
+
+Mede também a verificação do schema no primeiro acesso ao banco: só a leitura
+de user_version (database.schema_version) vs. o DDL + commit de init_db.
+
+Uso: python benchmarks/bench_startup.py [repetições] [orçamento_ms]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import soundfile as sf
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import audio_processing as audio
+import database as db
+import synthetic
+
+REPO = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Orçamento dos imports de um comando leve (numpy sozinho leva ~0.1s)
+IMPORT_BUDGET_MS = 300
+# Dependências que só os comandos que leem áudio ou abrem a GUI podem carregar
+HEAVY_MODULES = ('scipy', 'soundfile', 'matplotlib', 'sounddevice', 'customtkinter')
+
+# Comando -> (argumentos, leve?)
+COMMANDS = {
+    '--help': (['--help'], True),
+    'delete (ID inexistente)': (['delete', '999999'], True),
+    'stoplist': (['stoplist'], True),
+    'recognize --full (sqlite)': (['recognize', '{clip}', '--full', '--no-cache'], False),
+}
+
+def parse_importtime(stderr):
+    """
+    Saída de -X importtime -> ({import de topo: ms cumulativos}, nomes de todos os módulos importados).
+    """
+    top, modules = {}, set()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules.add(name.strip())
+        if not name[1:].startswith(' '):   # Imports de topo: sem indentação
+            top[name.strip()] = int(cumulative) / 1000
+    return top, modules
+
+def run_command(argv, db_path):
+    """
+    Roda main.py com 'argv' em um processo novo (banco em db_path).
+    Retorna (ms de imports, ms do processo, {import de topo: ms}, módulos importados).
+    """
+    code = (f"import sys; sys.path.insert(0, {REPO!r}); sys.argv = ['main.py'] + {argv!r}; "
+            f"import main; main.db.DB_PATH = {db_path!r}; main.main()")
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=REPO,
+                          capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if proc.returncode not in (0, 1):
+        raise RuntimeError(f"main.py {' '.join(argv)} falhou:\n{proc.stderr[-2000:]}")
+    top, modules = parse_importtime(proc.stderr)
+    return sum(top.values()), wall * 1000, top, modules
+
+def measure(repeat=5, db_path=None, clip=None):
+    """
+    Mediana de 'repeat' execuções de cada comando. Retorna {comando: dict com
+    import_ms, wall_ms, light, heavy (módulos pesados carregados) e slowest}.
+    """
+    results = {}
+    for label, (argv, light) in COMMANDS.items():
+        argv = [a.format(clip=clip) for a in argv]
+        runs = [run_command(argv, db_path) for _ in range(repeat)]
+        top, modules = runs[-1][2], runs[-1][3]
+        results[label] = {
+            'import_ms': float(np.median([r[0] for r in runs])),
+            'wall_ms': float(np.median([r[1] for r in runs])),
+            'light': light,
+            'heavy': sorted({m.split('.')[0] for m in modules} & set(HEAVY_MODULES)),
+            'slowest': sorted(top.items(), key=lambda kv: -kv[1])[:4],
+        }
+    return results
+
+def check_budget(results, budget_ms=IMPORT_BUDGET_MS):
+    """
+    Violações do orçamento nos comandos leves (lista de mensagens; vazia = ok).
+    """
+    problems = []
+    for label, r in results.items():
+        if not r['light']:
+            continue
+        if r['heavy']:
+            problems.append(f"{label}: importa {', '.join(r['heavy'])}")
+        if r['import_ms'] > budget_ms:
+            problems.append(f"{label}: {r['import_ms']:.0f} ms de imports (orçamento {budget_ms} ms)")
+    return problems
+
+def prepare(tmp):
+    """Banco temporário no schema atual e um clipe curto. Retorna (db_path, clip)."""
+    db_path = os.path.join(tmp, 'db', 'shazam.db')
+    os.makedirs(os.path.dirname(db_path))
+    db.DB_PATH = db_path
+    db.init_db()
+    clip = os.path.join(tmp, 'clip.wav')
+    sf.write(clip, synthetic.synthetic_music(5, seed=1), audio.SAMPLE_RATE, subtype='PCM_16')
+    return db_path, clip
+
+def schema_check_ms(db_path, repeat=20):
+    """Primeiro acesso ao banco em um processo: leitura de user_version vs. init_db (DDL + commit)."""
+    db.DB_PATH = db_path
+    start = time.perf_counter()
+    for _ in range(repeat):
+        db.schema_version()
+    read = (time.perf_counter() - start) / repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        db.init_db()
+    ddl = (time.perf_counter() - start) / repeat
+    return read * 1000, ddl * 1000
+
+def print_results(results, out=sys.stdout):
+    print(f"{'comando':<28}{'imports (ms)':>14}{'processo (ms)':>15}  imports mais caros", file=out)
+    for label, r in results.items():
+        slowest = ', '.join(f"{name} {ms:.0f}" for name, ms in r['slowest'])
+        print(f"{label:<28}{r['import_ms']:>14.0f}{r['wall_ms']:>15.0f}  {slowest}", file=out)
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    budget = float(sys.argv[2]) if len(sys.argv) > 2 else IMPORT_BUDGET_MS
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path, clip = prepare(tmp)
+        results = measure(repeat, db_path, clip)
+        read_ms, ddl_ms = schema_check_ms(db_path)
+
+    print_results(results)
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import scipy.signal, soundfile'],
+                          capture_output=True, text=True)
+    scipy_ms = sum(parse_importtime(proc.stderr)[0].values())
+    print(f"\nscipy.signal + soundfile (importados por todo comando antes): {scipy_ms:.0f} ms")
+    print(f"Schema no primeiro acesso: {read_ms:.2f} ms (user_version) vs. {ddl_ms:.2f} ms (init_db: DDL + commit)")
+
+    problems = check_budget(results, budget)
+    if problems:
+        print("\nFORA DO ORÇAMENTO:")
+        for line in problems:
+            print(f"  {line}")
+        sys.exit(1)
+    print(f"\nComandos leves dentro do orçamento ({budget:.0f} ms de imports, sem {', '.join(HEAVY_MODULES)}).")
+
+if __name__ == '__main__':
+    main()
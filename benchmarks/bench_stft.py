@@ -0,0 +1,91 @@
+"""
+Espectrograma: scipy.signal.spectrogram (como era) vs. motor STFT em float32
+(audio_processing.STFT).
+
+Reporta tempo e pico de memória (tracemalloc) por minuto de áudio, o efeito do
+corte de frequência (max_freq) e do processamento de vários clipes em lote,
+e confere a compatibilidade dos picos com os do scipy.
+
+Uso: python benchmarks/bench_stft.py [minutos] [clipes no lote]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from scipy.signal import spectrogram
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import audio_processing as audio
+import fingerprinting
+import synthetic
+
+CLIP_SECONDS = 5
+
+def scipy_spectrogram(samples):
+    """generate_spectrogram como era antes (referência)."""
+    nperseg = audio.WINDOW_SIZE
+    noverlap = int(audio.WINDOW_SIZE * audio.OVERLAP_RATIO)
+    return spectrogram(samples, fs=audio.SAMPLE_RATE, nperseg=nperseg, noverlap=noverlap)
+
+def measure(func, repeat=3):
+    """Retorna (melhor tempo em s, pico de memória alocada em bytes, resultado)."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+        del result
+    tracemalloc.start()
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, result
+
+def main():
+    minutes = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    n_clips = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    rng = np.random.default_rng(0)
+    clean = synthetic.synthetic_audio(minutes * 60, seed=1)
+    samples = audio.to_int16(clean / 32767 + 0.05 * rng.standard_normal(len(clean)))
+    print(f"{minutes:.0f} min de áudio ({len(samples)} amostras int16)")
+
+    print(f"\n{'':<26}{'ms/min':>9}{'MB/min':>9}{'dtype':>9}{'bins':>7}")
+    rows = [
+        ('scipy.signal.spectrogram', lambda: scipy_spectrogram(samples)),
+        ('STFT float32', lambda: audio.generate_spectrogram(samples)),
+        ('STFT float32 até 8 kHz', lambda: audio.generate_spectrogram(samples, max_freq=8000)),
+    ]
+    results = {}
+    for label, func in rows:
+        seconds, peak, (f, t, Sxx) = measure(func)
+        results[label] = Sxx
+        print(f"{label:<26}{seconds * 1000 / minutes:>9.1f}{peak / 1e6 / minutes:>9.1f}"
+              f"{str(Sxx.dtype):>9}{Sxx.shape[0]:>7}")
+
+    reference, current = results['scipy.signal.spectrogram'], results['STFT float32']
+    error = np.abs(current - reference).max() / reference.max()
+    expected = set(zip(*fingerprinting.find_peaks(reference)))
+    found = set(zip(*fingerprinting.find_peaks(current)))
+    print(f"\nErro relativo máximo vs. scipy: {error:.1e}")
+    print(f"Picos: {len(expected)} no scipy, {len(expected & found)} iguais, "
+          f"{len(expected ^ found)} diferentes")
+
+    # Muitos clipes curtos (ex: amostras de reconhecimento): um por vez vs. em lote
+    starts = rng.integers(0, len(samples) - CLIP_SECONDS * audio.SAMPLE_RATE, n_clips)
+    clips = [samples[s:s + CLIP_SECONDS * audio.SAMPLE_RATE] for s in starts]
+    t_scipy, _, _ = measure(lambda: [scipy_spectrogram(c) for c in clips], repeat=1)
+    t_single, _, single = measure(lambda: [audio.generate_spectrogram(c)[2] for c in clips])
+    t_batch, _, batch = measure(lambda: [s for _, _, s in audio.generate_spectrograms(clips)])
+    same = all(np.array_equal(a, b) for a, b in zip(single, batch))
+    print(f"\n{n_clips} clipes de {CLIP_SECONDS}s:")
+    print(f"  scipy, um por vez ..... {t_scipy * 1000:8.1f} ms")
+    print(f"  STFT, um por vez ...... {t_single * 1000:8.1f} ms  ({t_scipy / t_single:.1f}x)")
+    print(f"  STFT, em lote ......... {t_batch * 1000:8.1f} ms  ({t_scipy / t_batch:.1f}x)"
+          f"  {'idêntico' if same else 'ERRO: difere do um por vez'}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Stop-list e limite de frequência de documento (max_df) vs. tamanho do catálogo.
+
+Catálogo sintético (synthetic.random_catalog) com uma fração dos hashes vinda de
+um vocabulário de hashes "populares" (graves, silêncio) com frequências de Zipf:
+alguns aparecem em quase todas as músicas, muitos em algumas dezenas; as postings
+crescem junto com o catálogo. Consultas = trecho de uma música com parte dos
+hashes trocada por ruído (metade dele também do vocabulário popular).
+
+Para cada tamanho de catálogo mede, no índice em memória (o backend SQLite
+aplica a mesma regra), o tempo por consulta (busca + alinhamento + pontuação),
+as coincidências brutas por consulta, a taxa de acerto (top-1) e a de acertos
+confiáveis (matcher.is_confident: hashes alinhados suficientes) com:
+- sem filtro;
+- stop-list (database.stoplist_threshold);
+- max_df (index.MAX_DOCUMENT_FREQUENCY ou o valor passado);
+- os dois.
+No maior catálogo, varre max_df até valores em que hashes legítimos também
+são cortados: menos hashes alinhados, menos respostas confiáveis.
+
+Uso: python benchmarks/bench_stoplist.py [tamanhos separados por vírgula] [hashes_por_música] [n_consultas] [max_df]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import database as db
+import index
+import matcher
+import synthetic
+
+POPULAR_FRACTION = 0.5
+VOCABULARY = 50000
+ZIPF = 1.3
+QUERY_HASHES = 100
+NOISE_FRACTION = 0.5
+
+def make_queries(rng, songs, n_songs, n_queries):
+    queries = []
+    for _ in range(n_queries):
+        song_id = int(rng.integers(1, n_songs + 1))
+        hashes, offsets = synthetic.query_from_song(rng, *songs[song_id], QUERY_HASHES)
+        hashes = hashes.copy()
+        noisy = rng.random(len(hashes)) < NOISE_FRACTION
+        popular = rng.random(len(hashes)) < 0.5
+        hashes[noisy & popular] = synthetic.popular_hashes(rng, int((noisy & popular).sum()), VOCABULARY, ZIPF)
+        hashes[noisy & ~popular] = rng.integers(0, 1 << 32, int((noisy & ~popular).sum()))
+        queries.append((song_id, hashes, offsets))
+    return queries
+
+def run(catalog, queries):
+    hits, confident, raw = 0, 0, 0
+    start = time.perf_counter()
+    for song_id, hashes, offsets in queries:
+        candidates, n_raw = matcher.match_fingerprints(hashes, offsets, catalog, top_k=2)
+        hit = bool(candidates) and candidates[0].song_id == song_id
+        hits += hit
+        confident += hit and matcher.is_confident(candidates)
+        raw += n_raw
+    elapsed = time.perf_counter() - start
+    n = len(queries)
+    return elapsed / n * 1000, raw / n, hits / n, confident / n
+
+def main():
+    sizes = [int(n) for n in sys.argv[1].split(',')] if len(sys.argv) > 1 else [500, 1000, 2000, 4000]
+    per_song = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    n_queries = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    max_df = int(sys.argv[4]) if len(sys.argv) > 4 else index.MAX_DOCUMENT_FREQUENCY
+
+    print(f"Gerando catálogo sintético de até {max(sizes)} músicas ({per_song} hashes cada)...")
+    songs = {song_id: (h, o) for song_id, h, o in
+             synthetic.random_catalog(max(sizes), per_song, popular_fraction=POPULAR_FRACTION,
+                                      vocabulary=VOCABULARY, zipf=ZIPF)}
+    all_ids = np.concatenate([np.full(len(h), song_id) for song_id, (h, _) in songs.items()])
+    all_hashes = np.concatenate([h for h, _ in songs.values()])
+    all_offsets = np.concatenate([o for _, o in songs.values()])
+
+    configs = ('sem filtro', 'stop-list', f'max_df={max_df}', 'stop-list + max_df')
+    print(f"\n{'músicas':>8}  {'configuração':<22}{'ms/consulta':>12}{'brutas/consulta':>17}{'acerto':>9}"
+          f"{'confiável':>11}{'stop-list':>11}")
+    for n_songs in sizes:
+        keep = all_ids <= n_songs
+        catalog = index.ArrayIndex.from_postings(all_hashes[keep], all_ids[keep], all_offsets[keep])
+        stopped = catalog.df > db.stoplist_threshold(n_songs)
+        queries = make_queries(np.random.default_rng(n_songs), songs, n_songs, n_queries)
+
+        for label in configs:
+            catalog.stopped = stopped if 'stop-list' in label else np.zeros_like(stopped)
+            catalog.max_df = max_df if 'max_df' in label else None
+            ms, raw, accuracy, confident = run(catalog, queries)
+            print(f"{n_songs:>8}  {label:<22}{ms:>12.2f}{raw:>17.0f}{accuracy:>9.0%}{confident:>11.0%}"
+                  f"{int(stopped.sum()):>11}")
+        print()
+
+    df = catalog.df[~stopped]
+    print(f"{n_songs} músicas, stop-list ligada: hashes fora da stop-list aparecem em até {df.max()} músicas "
+          f"(mediana {np.median(df):.0f})")
+    print(f"  {'max_df':>8}{'ms/consulta':>12}{'brutas/consulta':>17}{'acerto':>9}{'confiável':>11}")
+    catalog.stopped = stopped
+    for limit in (None, 50, 20, 10, 5, 2, 1):
+        catalog.max_df = limit
+        ms, raw, accuracy, confident = run(catalog, queries)
+        print(f"  {str(limit):>8}{ms:>12.2f}{raw:>17.0f}{accuracy:>9.0%}{confident:>11.0%}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+StreamingFingerprinter: equivalência com o caminho batch e custo por segundo de áudio.
+
+1. Compara os fingerprints do streaming (blocos de tamanho aleatório) com
+   generate_spectrogram -> find_peaks -> generate_fingerprint_arrays no sinal inteiro.
+2. Mede o tempo de CPU por segundo de áudio para durações crescentes
+   (deve ficar constante: o estado guardado não cresce com o stream).
+
+Uso: python benchmarks/bench_stream_fingerprinter.py [segundos_equivalência]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import audio_processing as audio
+import fingerprinting
+import streaming
+import synthetic
+
+def random_chunks(samples, rng, max_chunk=20000):
+    i = 0
+    while i < len(samples):
+        n = int(rng.integers(1, max_chunk))
+        yield samples[i:i + n]
+        i += n
+
+def check_equivalence(seconds):
+    samples = synthetic.synthetic_audio(seconds)
+    f, t, Sxx = audio.generate_spectrogram(samples)
+    peak_times, peak_freqs = fingerprinting.find_peaks(Sxx)
+    ref_hashes, ref_offsets = fingerprinting.generate_fingerprint_arrays(peak_times, peak_freqs)
+
+    rng = np.random.default_rng(1)
+    parts = list(streaming.fingerprint_stream(random_chunks(samples, rng)))
+    hashes = np.concatenate([p[0] for p in parts])
+    offsets = np.concatenate([p[1] for p in parts])
+
+    same = np.array_equal(hashes, ref_hashes) and np.array_equal(offsets, ref_offsets)
+    print(f"Equivalência ({seconds:.0f}s, {len(ref_hashes)} fingerprints): {'OK' if same else 'DIFERENTE'}")
+    return same
+
+def cpu_per_second(seconds, chunk=4096):
+    samples = synthetic.synthetic_audio(seconds, seed=2)
+    fingerprinter = streaming.StreamingFingerprinter()
+    start = time.process_time()
+    for i in range(0, len(samples), chunk):
+        fingerprinter.push(samples[i:i + chunk])
+    fingerprinter.flush()
+    return (time.process_time() - start) / seconds
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 60
+    ok = check_equivalence(seconds)
+
+    print(f"\n{'Duração':>10}{'CPU por segundo de áudio':>28}")
+    for duration in (30, 120, 480):
+        print(f"{duration:>9}s{cpu_per_second(duration) * 1000:>24.2f} ms")
+
+    if not ok:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
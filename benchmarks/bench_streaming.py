@@ -0,0 +1,68 @@
+"""
+Memória e tempo: carregamento completo (load_audio_file + espectrograma + picos)
+vs. caminho em streaming (stream_audio_file -> stream_spectrogram -> stream_peaks).
+
+Gera um arquivo longo sintético (48kHz estéreo, exige resample) e mede cada modo
+em um subprocesso separado (pico de RSS via getrusage).
+
+Uso: python benchmarks/bench_streaming.py [minutos]
+"""
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import soundfile as sf
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import audio_processing as audio
+import fingerprinting
+import ingest
+
+SOURCE_RATE = 48000
+
+def write_long_file(path, minutes):
+    rng = np.random.default_rng(0)
+    block = SOURCE_RATE * 10
+    with sf.SoundFile(path, 'w', SOURCE_RATE, 2, subtype='PCM_16') as f:
+        for i in range(int(minutes * 6)):
+            t = (np.arange(block) + i * block) / SOURCE_RATE
+            tone = 0.2 * np.sin(2 * np.pi * (300 + 200 * np.sin(t / 7)) * t)
+            noise = 0.002 * rng.standard_normal(block)
+            f.write(np.column_stack([tone + noise, tone - noise]))
+
+def run_mode(mode, path):
+    start = time.perf_counter()
+    if mode == 'batch':
+        samples = audio.load_audio_file(path)
+        f, t, Sxx = audio.generate_spectrogram(samples)
+        times, freqs = fingerprinting.find_peaks(Sxx)
+    else:
+        times, freqs = ingest.stream_file_peaks(path)
+    elapsed = time.perf_counter() - start
+    peak_mib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{mode} {elapsed:.2f} {peak_mib:.0f} {len(times)}")
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == '--run':
+        run_mode(sys.argv[2], sys.argv[3])
+        return
+
+    minutes = float(sys.argv[1]) if len(sys.argv) > 1 else 30
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'long.wav')
+        print(f"Gerando {minutes:.0f} min de áudio sintético ({SOURCE_RATE} Hz, estéreo)...")
+        write_long_file(path, minutes)
+
+        print(f"\n{'Modo':10}{'Tempo (s)':>12}{'Pico RSS (MiB)':>16}{'Picos':>10}")
+        for mode in ('batch', 'streaming'):
+            out = subprocess.run([sys.executable, __file__, '--run', mode, path],
+                                 capture_output=True, text=True, check=True).stdout.split()
+            print(f"{out[0]:10}{float(out[1]):12.2f}{float(out[2]):16.0f}{int(out[3]):10}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Visualizador do fingerprinting: renderização antiga vs. visualize_fingerprinting.render_file.
+
+A antiga carregava o áudio inteiro, desenhava o espectrograma completo
+(2049 bins em float64 no log) com pcolormesh(shading='gouraud') duas vezes e
+montava as listas de picos em laços Python; por isso cortava a música nos
+primeiros segundos. A nova calcula o espectrograma em streaming, corta na
+faixa exibida, reduz por max-pooling à grade de pixels do gráfico e desenha
+com imshow. Mede tempo e pico de memória (tracemalloc, que também deixa as
+duas mais lentas) para trechos curtos e a música inteira (só a nova: a antiga
+passa de 10 GB em 3 minutos), e confere que:
+- a imagem do streaming é igual ao max-pooling do espectrograma inteiro;
+- os picos são os mesmos de find_peaks sobre o arquivo carregado.
+
+Depois, relatórios de um diretório (render_directory): 1 processo vs. o pool,
+uma segunda rodada (imagens atualizadas são puladas) e --force (dados do
+gráfico reaproveitados, sem ler o áudio).
+
+Uso: python benchmarks/bench_visualize.py [segundos_da_música] [n_arquivos] [workers]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import soundfile as sf
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import audio_processing as audio
+import fingerprinting
+import synthetic
+import visualize_fingerprinting as vf
+
+import matplotlib.pyplot as plt
+
+def render_old(path, output_file, seconds):
+    """Renderização antiga (até o commit anterior), sem o cache de fingerprints."""
+    samples = audio.load_audio_file(path)[:int(audio.SAMPLE_RATE * seconds)]
+    f, t, Sxx = audio.generate_spectrogram(samples)
+    peak_times, peak_freqs = fingerprinting.find_peaks(Sxx)
+    hashes, offsets = fingerprinting.generate_fingerprint_arrays(peak_times, peak_freqs)
+    peaks = list(zip(peak_times.tolist(), peak_freqs.tolist()))
+
+    fig, axes = plt.subplots(2, 1, figsize=(14, 10))
+    ax1 = axes[0]
+    Sxx_log = 10 * np.log10(Sxx.astype(np.float64) + 1e-10)
+    im = ax1.pcolormesh(t, f, Sxx_log, shading='gouraud', cmap='viridis')
+    ax1.set_ylim([0, vf.MAX_PLOT_FREQ])
+    plt.colorbar(im, ax=ax1, label='Magnitude (dB)')
+    ax2 = axes[1]
+    ax2.pcolormesh(t, f, Sxx_log, shading='gouraud', cmap='gray', alpha=0.3)
+    ax2.scatter([t[p[0]] for p in peaks], [f[p[1]] for p in peaks], c='red', s=10, alpha=0.7)
+    anchor_idx = len(peaks) // 4
+    t_anchor, f_anchor = peaks[anchor_idx]
+    for count, (t_target, f_target) in enumerate(peaks[anchor_idx + 1:anchor_idx + 11]):
+        if t_target - t_anchor > fingerprinting.MAX_HASH_TIME_DELTA:
+            break
+        ax2.plot([t[t_anchor], t[t_target]], [f[f_anchor], f[f_target]], 'cyan', alpha=0.6, linewidth=1.5)
+    ax2.set_ylim([0, vf.MAX_PLOT_FREQ])
+    plt.tight_layout()
+    plt.savefig(output_file, dpi=150, bbox_inches='tight')
+    plt.close()
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1e6
+
+def check_equivalence(path):
+    """Imagem do streaming == max-pooling do espectrograma inteiro; picos == find_peaks."""
+    fig, axes, grid = vf.new_figure()
+    plt.close(fig)
+    data = vf.analyze_for_plot(path, grid)
+    f, t, Sxx = audio.generate_spectrogram(audio.load_audio_file(path))
+    peak_times, peak_freqs = fingerprinting.find_peaks(Sxx)
+
+    pooler = vf.SpectrogramPooler(audio.stft_engine(vf.MAX_PLOT_FREQ).n_bins, Sxx.shape[1], *grid)
+    pooler.push(Sxx)
+    in_band = peak_freqs < pooler.n_bins
+    same_image = np.array_equal(data.image, 10 * np.log10(pooler.result() + 1e-10))
+    same_peaks = (data.n_peaks == len(peak_times)
+                  and np.array_equal(data.peak_times, t[peak_times[in_band]])
+                  and np.array_equal(data.peak_freqs, f[peak_freqs[in_band]]))
+    return same_image, same_peaks, data.image.shape, Sxx.shape
+
+def main():
+    song_seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 180
+    n_files = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    ok = True
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'song.wav')
+        sf.write(path, synthetic.synthetic_music(song_seconds, seed=1), audio.SAMPLE_RATE, subtype='PCM_16')
+
+        print(f"{'trecho':<12}{'antiga (s)':>12}{'MB':>8}{'nova (s)':>12}{'MB':>8}")
+        for seconds in (10, 30, song_seconds):
+            # A antiga não cabe na memória com a música inteira (~60 MB por segundo de áudio)
+            old = measure(lambda: render_old(path, os.path.join(tmp, 'old.png'), seconds)) if seconds <= 30 else None
+            # Sem os dados salvos ao lado da imagem: sempre recalcula
+            new = measure(lambda: vf.render_file(path, os.path.join(tmp, f'new_{seconds}.png'),
+                                                 None if seconds == song_seconds else seconds))
+            os.remove(os.path.join(tmp, f'new_{seconds}.png.npz'))
+            old = f"{old[0]:>12.2f}{old[1]:>8.0f}" if old else f"{'-':>12}{'-':>8}"
+            print(f"{f'{seconds:.0f}s':<12}{old}{new[0]:>12.2f}{new[1]:>8.0f}")
+
+        same_image, same_peaks, image_shape, sxx_shape = check_equivalence(path)
+        ok &= same_image and same_peaks
+        print(f"\nEspectrograma {sxx_shape[0]}x{sxx_shape[1]} -> imagem {image_shape[0]}x{image_shape[1]} "
+              f"(max-pooling). Igual ao do espectrograma inteiro: {'sim' if same_image else 'NÃO'}; "
+              f"mesmos picos de find_peaks: {'sim' if same_peaks else 'NÃO'}")
+
+        songs = os.path.join(tmp, 'songs')
+        os.makedirs(songs)
+        for i in range(n_files):
+            sf.write(os.path.join(songs, f'song_{i:03d}.wav'), synthetic.synthetic_music(60, seed=10 + i),
+                     audio.SAMPLE_RATE, subtype='PCM_16')
+
+        print(f"\nRelatórios de {n_files} músicas de 60s:")
+        runs = (('1 processo', 1, False), (f'pool ({workers or os.cpu_count()} processos)', workers, False),
+                ('de novo (atualizados)', workers, False), ('--force (dados salvos)', workers, True))
+        for i, (label, n_workers, force) in enumerate(runs):
+            out = os.path.join(tmp, 'reports' if i else 'reports_single')
+            start = time.perf_counter()
+            stats = vf.render_directory(songs, out, n_workers, force=force)
+            elapsed = time.perf_counter() - start
+            ok &= stats['failed'] == 0
+            print(f"  {label:<28}{elapsed:>8.2f} s  {stats}")
+
+    if not ok:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
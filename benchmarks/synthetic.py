@@ -0,0 +1,191 @@
+"""
+Geradores de dados sintéticos compartilhados pelos benchmarks.
+"""
+import numpy as np
+
+import audio_processing as audio
+import database as db
+import fingerprinting
+import index
+
+# Vocabulário pequeno de hashes "populares" (graves/silêncio), presentes em muitas músicas
+POPULAR_VOCABULARY = 500
+
+def synthetic_audio(seconds, seed=0):
+    """Notas senoidais aleatórias + ruído leve, em int16 a 44.1kHz."""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * audio.SAMPLE_RATE)
+    x = 0.002 * rng.standard_normal(n)
+    note = audio.SAMPLE_RATE // 4
+    t = np.arange(note) / audio.SAMPLE_RATE
+    for start in range(0, n - note, note):
+        x[start:start + note] += 0.2 * np.sin(2 * np.pi * rng.uniform(100, 4000) * t)
+    return (x * 32767).astype(np.int16)
+
+# Escalas (semitons a partir da tônica) usadas por synthetic_music
+SCALES = {'maior': (0, 2, 4, 5, 7, 9, 11), 'menor': (0, 2, 3, 5, 7, 8, 10)}
+
+def _note(freq, n, rng, partials=4, decay=6.0):
+    """Nota com harmônicos e envelope (ataque curto, decaimento exponencial)."""
+    t = np.arange(n) / audio.SAMPLE_RATE
+    wave = sum(np.sin(2 * np.pi * freq * k * t + rng.uniform(0, 2 * np.pi)) / k ** 1.5
+               for k in range(1, partials + 1) if freq * k < audio.SAMPLE_RATE / 2)
+    envelope = np.minimum(t / 0.01, 1.0) * np.exp(-decay * t)
+    return wave * envelope
+
+def synthetic_music(seconds, seed=0):
+    """
+    Música procedural: andamento, tonalidade e escala sorteados; acordes com
+    harmônicos a cada compasso, baixo e melodia em colcheias, chimbal (ruído
+    curto) e glissandos (chirps) ocasionais. Mais parecida com música real
+    (harmônicos, transientes, repetição) que synthetic_audio. int16 a 44.1kHz.
+    """
+    rng = np.random.default_rng(seed)
+    n = int(seconds * audio.SAMPLE_RATE)
+
+    beat = int(audio.SAMPLE_RATE * 60 / rng.uniform(80, 150))
+    x = np.zeros(n + 4 * beat)   # Folga para o último compasso
+    tonic = 110 * 2 ** (rng.integers(0, 12) / 12)
+    scale = SCALES[rng.choice(list(SCALES))]
+    def pitch(degree, octave):
+        return tonic * 2 ** (octave + (scale[degree % 7] + 12 * (degree // 7)) / 12)
+
+    # Progressão de acordes (graus da escala) repetida ao longo da música
+    progression = rng.integers(0, 7, 4)
+    for bar, start in enumerate(range(0, n, 4 * beat)):
+        root = int(progression[bar % 4])
+        for degree in (root, root + 2, root + 4):
+            x[start:start + 4 * beat] += 0.08 * _note(pitch(degree, 1), 4 * beat, rng, decay=1.5)
+        for b in range(4):
+            pos = start + b * beat
+            x[pos:pos + beat] += 0.15 * _note(pitch(root, 0), beat, rng, partials=3, decay=4.0)
+            hat = int(0.03 * audio.SAMPLE_RATE)
+            x[pos + beat // 2:pos + beat // 2 + hat] += 0.008 * rng.standard_normal(hat) * np.linspace(1, 0, hat)
+            for half in range(2):
+                if rng.random() < 0.8:
+                    p = pos + half * beat // 2
+                    x[p:p + beat // 2] += 0.12 * _note(pitch(int(rng.integers(0, 14)), 2), beat // 2, rng)
+        if rng.random() < 0.25:
+            # Glissando de um tempo
+            t = np.arange(beat) / audio.SAMPLE_RATE
+            f0, f1 = rng.uniform(300, 3000, 2)
+            phase = 2 * np.pi * (f0 * t + (f1 - f0) * t ** 2 / (2 * t[-1]))
+            x[start:start + beat] += 0.05 * np.sin(phase) * np.hanning(beat)
+
+    x = x[:n] + 0.001 * rng.standard_normal(n)
+    return audio.to_int16(0.7 * x / max(np.abs(x).max(), 1e-9))
+
+def time_stretch(samples, tempo, n_fft=2048, hop=512):
+    """
+    Muda o andamento sem mudar a altura (phase vocoder): tempo=1.03 toca 3% mais
+    rápido, como rádios e mixagens que aceleram a música. int16 a 44.1kHz.
+    """
+    x = np.asarray(samples, dtype=np.float64)
+    window = np.hanning(n_fft)
+    frames = np.lib.stride_tricks.sliding_window_view(x, n_fft)[::hop] * window
+    S = np.fft.rfft(frames, axis=1)
+
+    # Quadros de análise (fracionários) lidos a cada quadro de síntese
+    steps = np.arange(0, len(S) - 1, tempo)
+    k = steps.astype(np.int64)
+    frac = (steps - k)[:, None]
+    magnitude = (1 - frac) * np.abs(S[k]) + frac * np.abs(S[k + 1])
+
+    # Fase: avanço esperado por bin + desvio medido entre quadros vizinhos, acumulados
+    omega = 2 * np.pi * hop * np.arange(S.shape[1]) / n_fft
+    delta = np.angle(S[k + 1]) - np.angle(S[k]) - omega
+    delta -= 2 * np.pi * np.round(delta / (2 * np.pi))
+    phase = np.angle(S[0]) + np.vstack([np.zeros(S.shape[1]), np.cumsum(omega + delta, axis=0)[:-1]])
+
+    out_frames = np.fft.irfft(magnitude * np.exp(1j * phase), n_fft, axis=1) * window
+    out = np.zeros(len(steps) * hop + n_fft)
+    for i, frame in enumerate(out_frames):
+        out[i * hop:i * hop + n_fft] += frame
+    out *= hop / np.sum(window ** 2)
+    return audio.to_int16(out / 32767)
+
+def audio_catalog(n_songs, seconds):
+    """
+    Catálogo de músicas sintéticas (synthetic_audio, seeds 1..n) indexado em memória.
+    Retorna ({song_id: amostras}, ArrayIndex).
+    """
+    songs, ids, hashes, offsets = {}, [], [], []
+    for song_id in range(1, n_songs + 1):
+        samples = synthetic_audio(seconds, seed=song_id)
+        f, t, Sxx = audio.generate_spectrogram(samples)
+        peak_times, peak_freqs = fingerprinting.find_peaks(Sxx)
+        h, o = fingerprinting.generate_fingerprint_arrays(peak_times, peak_freqs)
+        songs[song_id] = samples
+        ids.append(np.full(len(h), song_id))
+        hashes.append(h)
+        offsets.append(o)
+    catalog = index.ArrayIndex.from_postings(np.concatenate(hashes), np.concatenate(ids), np.concatenate(offsets))
+    return songs, catalog
+
+def popular_hashes(rng, n, vocabulary=POPULAR_VOCABULARY, zipf=None):
+    """
+    n hashes do vocabulário popular: uniformes, ou com frequências de Zipf
+    (poucos hashes muito comuns e uma cauda longa de hashes medianos).
+    """
+    if zipf is None:
+        return rng.integers(0, vocabulary, n)
+    return (rng.zipf(zipf, n) - 1) % vocabulary
+
+def random_song_fingerprints(rng, hashes_per_song, n_frames=5000, popular_fraction=0.0,
+                             vocabulary=POPULAR_VOCABULARY, zipf=None):
+    """
+    Fingerprints aleatórios com distribuição parecida com a real:
+    frequências concentradas nos graves, dt uniforme na Target Zone.
+    popular_fraction dos hashes vem de um vocabulário pequeno (postings longas),
+    sorteados por popular_hashes.
+    Retorna (hashes, offsets) como arrays int64.
+    """
+    n_bins = audio.WINDOW_SIZE // 2 + 1
+    f1 = np.minimum(rng.exponential(300, hashes_per_song).astype(np.int64), n_bins - 1)
+    f2 = np.minimum(rng.exponential(300, hashes_per_song).astype(np.int64), n_bins - 1)
+    dt = rng.integers(0, fingerprinting.MAX_HASH_TIME_DELTA + 1, hashes_per_song)
+    offsets = np.sort(rng.integers(0, n_frames, hashes_per_song))
+    hashes = fingerprinting.pack_hashes(f1, f2, dt)
+
+    popular = rng.random(hashes_per_song) < popular_fraction
+    hashes[popular] = popular_hashes(rng, int(popular.sum()), vocabulary, zipf)
+    return hashes, offsets
+
+def random_catalog(n_songs, hashes_per_song, seed=0, popular_fraction=0.0, **options):
+    """
+    Itera sobre um catálogo sintético: gera (song_id, hashes, offsets) para cada música.
+    options: vocabulary / zipf de random_song_fingerprints.
+    """
+    rng = np.random.default_rng(seed)
+    for song_id in range(1, n_songs + 1):
+        hashes, offsets = random_song_fingerprints(rng, hashes_per_song, popular_fraction=popular_fraction,
+                                                   **options)
+        yield song_id, hashes, offsets
+
+def query_from_song(rng, hashes, offsets, n_hashes):
+    """
+    Simula uma amostra: um trecho contíguo dos fingerprints de uma música,
+    com offsets relativos ao início do trecho.
+    """
+    start = int(rng.integers(0, max(1, len(hashes) - n_hashes)))
+    q_hashes = hashes[start:start + n_hashes]
+    q_offsets = offsets[start:start + n_hashes] - offsets[start]
+    return q_hashes, q_offsets
+
+def populate_db(path, n_songs, hashes_per_song, seed=0, batch_songs=200):
+    """
+    Cria (em 'path') um banco no schema atual com um catálogo sintético.
+    Aponta database.DB_PATH para o novo arquivo.
+    """
+    db.DB_PATH = path
+    db.init_db()
+    conn = db.get_db_connection()
+    batch = []
+    for song_id, hashes, offsets in random_catalog(n_songs, hashes_per_song, seed):
+        db.insert_song(f"song_{song_id}", conn=conn)
+        batch.append((np.full(len(hashes), song_id), hashes, offsets))
+        if len(batch) >= batch_songs or song_id == n_songs:
+            db.insert_fingerprint_arrays(*(np.concatenate(cols) for cols in zip(*batch)), conn=conn)
+            conn.commit()
+            batch = []
+    conn.close()
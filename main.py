@@ -1,129 +1,413 @@
 import argparse
 import os
 import sys
-from collections import defaultdict
+import time
 
-# Adiciona o diretório atual ao path para importar modulos
-sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+import numpy as np
 
-import src.audio_processing as audio
-import src.fingerprinting as fingerprinting
-import src.database as db
+# Os módulos de src importam uns aos outros pelo nome curto (import database as db):
+# main.py usa os mesmos nomes, então cada módulo é carregado uma única vez.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+# Só módulos leves aqui (scipy e soundfile são importados no primeiro uso, em audio_processing);
+# os de um único comando (batch, server, monitor, progressive) são importados no próprio comando
+import audio_processing as audio
+import cache
+import database as db
+import ingest
+import index
+import matcher
+import metrics
+
+def open_cache(args):
+    # Cache de picos/fingerprints por conteúdo do áudio (desligado com --no-cache)
+    return None if args.no_cache else cache.FingerprintCache()
 
 def cmd_add(args):
     filename = args.path
     print(f"--> Processando: {filename}")
     
-    # 1. Carregar Audio
-    samples = audio.load_audio_file(filename)
-    if samples is None:
-        return
-        
-    print(f"    Leitura concluída. {len(samples)} amostras.")
+    if audio.get_duration(filename) > audio.STREAMING_MIN_SECONDS:
+        # Arquivos longos: leitura, espectrograma e picos em streaming (memória limitada)
+        print("    Arquivo longo: processando em streaming.")
     
-    # 2. Gerar Espectrograma
-    f, t, Sxx = audio.generate_spectrogram(samples)
+    # Digest do áudio decodificado: se já estiver no banco, para antes do espectrograma
+    existing = {}
+    def is_known(file_hash):
+        existing['id'] = db.find_song_by_file_hash(file_hash)
+        return existing['id'] is not None
     
-    # 3. Encontrar Picos
-    peaks = fingerprinting.get_2d_peaks(Sxx)
-    print(f"    {len(peaks)} picos encontrados.")
+    result = ingest.analyze_file(filename, open_cache(args), is_known, db.has_legacy_file_hashes())
+    if result is None:
+        return
+    if result.source == 'known':
+        print(f"--> Áudio já cadastrado (ID {existing['id']}). Nada a fazer.")
+        return
     
-    # 4. Gerar Fingerprints
-    fingerprints = fingerprinting.generate_fingerprints(peaks)
-    print(f"    {len(fingerprints)} fingerprints gerados.")
+    origin = " (do cache)" if result.source == 'cache' else ""
+    print(f"    {len(result.peak_times)} picos encontrados{origin}.")
+    print(f"    {len(result.hashes)} fingerprints gerados.")
     
-    # 5. Salvar no DB
+    # Salvar no DB (música + fingerprints na mesma transação)
     song_name = os.path.basename(filename)
-    song_id = db.insert_song(song_name)
-    db.insert_fingerprints(song_id, fingerprints)
+    with db.connection() as conn:
+        if args.replace:
+            # Versões anteriores com o mesmo nome saem do catálogo (tombstones) na mesma transação
+            for old_id in db.find_songs_by_name(song_name):
+                db.delete_song(old_id, conn)
+                print(f"    Substituindo a versão anterior (ID {old_id}).")
+        song_id = db.insert_song(song_name, result.file_hash, conn=conn)
+        db.insert_fingerprint_arrays(np.full(len(result.hashes), song_id, dtype=np.int64),
+                                     result.hashes, result.offsets, conn=conn)
+    # Só os hashes desta música podem ter passado do limite da stop-list
+    db.build_stoplist(hashes=result.hashes)
     
     print(f"--> Sucesso! Música '{song_name}' adicionada com ID {song_id}.")
 
+def cmd_ingest(args):
+    paths = ingest.find_audio_files(args.source)
+    print(f"--> {len(paths)} arquivos encontrados em {args.source}")
+    if not paths:
+        return
+    
+    stats = ingest.ingest(paths, workers=args.workers, batch_songs=args.batch_size, fp_cache=open_cache(args))
+    
+    rate = stats['added'] / stats['seconds'] if stats['seconds'] > 0 else 0
+    print(f"--> Concluído em {stats['seconds']:.1f}s: {stats['added']} adicionadas "
+          f"({stats['cached']} do cache), {stats['skipped']} já cadastradas, {stats['failed']} com erro "
+          f"({stats['fingerprints']} fingerprints, {rate:.2f} músicas/s).")
+    if 'stoplist' in stats:
+        print(f"    Stop-list: {stats['stoplist']} hashes comuns demais ignorados nas buscas.")
+
 def cmd_recognize(args):
     filename = args.path
     print(f"--> Analisando amostra: {filename}")
     
-    samples = audio.load_audio_file(filename)
-    if samples is None: return
-
-    # Processamento igual ao cadastro
-    f, t, Sxx = audio.generate_spectrogram(samples)
-    peaks = fingerprinting.get_2d_peaks(Sxx)
-    fingerprints = fingerprinting.generate_fingerprints(peaks) # Lista de (hash, sample_offset)
+    if not args.full:
+        cmd_recognize_progressive(args)
+        return
     
-    print(f"    {len(fingerprints)} fingerprints na amostra.")
+    # Processamento igual ao cadastro (uma amostra repetida vem do cache)
+    result = ingest.analyze_file(filename, open_cache(args))
+    if result is None: return
+    hashes, offsets = result.hashes, result.offsets
     
-    if len(fingerprints) == 0:
+    print(f"    {len(hashes)} fingerprints na amostra.")
+    
+    if len(hashes) == 0:
         print("Nenhum detalhe relevante encontrado na amostra. Tente uma gravação maior ou com menos ruído.")
         return
 
-    # Buscar matches no DB
-    # Extrair apenas os hashes para busca
-    hashes_to_search = [fp[0] for fp in fingerprints]
-    
-    # matches_db é lista de (song_id, db_offset, hash)
-    # Mas como enviar muitos hashes pode quebrar o limite do SQLite, idealmente faríamos em lotes.
-    # Para teste simples, vai tudo de uma vez.
-    matches_db = db.get_matches(hashes_to_search)
-    
-    print(f"    {len(matches_db)} coincidências brutas encontradas no banco.")
-    
-    # ALINHAMENTO TEMPORAL
-    # Precisamos mapear hash -> sample_offset para calcular o delta
-    # Como um hash pode aparecer varias vezes na amostra, criamos um mapa list
-    sample_hash_offsets = defaultdict(list)
-    for h, offset in fingerprints:
-        sample_hash_offsets[h].append(offset)
-        
-    # Contabilizar os "Time Offsets" reais
-    # Para cada match, calculamos: real_start_time = db_offset - sample_offset
-    # Se a música é a mesma, esse 'real_start_time' deve se repetir muitas vezes.
-    
-    song_scores = defaultdict(lambda: defaultdict(int)) # song_id -> { time_diff -> count }
-    
-    for song_id, db_offset, h in matches_db:
-        if h in sample_hash_offsets:
-            for sample_offset in sample_hash_offsets[h]:
-                diff = db_offset - sample_offset
-                song_scores[song_id][diff] += 1
-                
-    # Analisar o melhor candidato
-    best_song_id = None
-    best_count = 0
-    confidence = 0
-    
-    for song_id, diffs_histogram in song_scores.items():
-        # Pega o offset que teve mais matches para essa música
-        most_frequent_diff_count = max(diffs_histogram.values())
-        
-        if most_frequent_diff_count > best_count:
-            best_count = most_frequent_diff_count
-            best_song_id = song_id
-            
-    if best_song_id:
-        # Recuperar nome da música (query simples, não implementada no db.py mas fácil de fazer ou inferir)
-        # Vamos adicionar uma query rápida aqui ou assumir ID
-        print(f"\nRESULTADO: Música detectada! (ID: {best_song_id})")
-        print(f"Score de Confiança: {best_count} matches alinhados.")
+    # Busca no backend + alinhamento temporal (histograma de db_offset - sample_offset por música)
+    backend = index.open_backend(args.backend, max_df=args.max_df or None)
+    candidates, n_raw = matcher.match_fingerprints(hashes, offsets, backend, top_k=max(args.top_k, 2))
+    
+    print(f"    {n_raw} coincidências brutas encontradas no banco.")
+    print_candidates(candidates, args.top_k)
+
+def cmd_recognize_progressive(args):
+    import progressive
+    
+    # Fatias de 0.5s; para assim que o melhor candidato vence o 2º com folga
+    backend = index.open_backend(args.backend, max_df=args.max_df or None)
+    result = progressive.recognize_file(args.path, backend, top_k=max(args.top_k, 2), slice_seconds=args.slice,
+                                        fp_cache=open_cache(args))
+    if result is None: return
+    
+    print(f"    {result.fingerprints} fingerprints, {result.raw_matches} coincidências brutas no banco.")
+    if result.early:
+        print(f"    Decisão após {result.seconds:.1f}s de áudio ({result.elapsed_ms:.0f} ms).")
+    else:
+        print(f"    Amostra inteira analisada ({result.seconds:.1f}s, {result.elapsed_ms:.0f} ms).")
+    print_candidates(result.candidates, args.top_k)
+
+def cmd_recognize_batch(args):
+    import batch
+    
+    paths = ingest.find_audio_files(args.source)
+    print(f"--> {len(paths)} clipes encontrados em {args.source}", file=sys.stderr)
+    if not paths:
+        return
+    
+    # Uma busca no backend a cada --batch-size clipes (hashes deduplicados entre eles)
+    backend = index.open_backend(args.backend, max_df=args.max_df or None)
+    song_names = db.get_song_names()
+    writer = batch.ResultWriter(args.output)
+    counts = {'confident': 0, 'failed': 0}
+    start = time.perf_counter()
+    try:
+        for result in batch.recognize_batch(paths, backend, workers=args.workers, batch_clips=args.batch_size):
+            row = batch.result_row(result, song_names)
+            counts['confident'] += row['confident']
+            counts['failed'] += result.error is not None
+            writer.write(row)
+    finally:
+        writer.close()
+    
+    seconds = time.perf_counter() - start
+    print(f"--> {len(paths)} clipes em {seconds:.1f}s ({len(paths) / seconds:.1f} clipes/s): "
+          f"{counts['confident']} reconhecidos, {counts['failed']} com erro.", file=sys.stderr)
+
+def print_candidates(candidates, top_k=1):
+    # Decisão pela confiança calibrada (hashes alinhados, cobertura e vantagem sobre o 2º)
+    confident = matcher.is_confident(candidates)
+    if confident:
+        best = candidates[0]
+        print(f"\nRESULTADO: Música detectada! (ID: {best.song_id})")
+        print(f"Score de Confiança: {best.confidence:.0%} ({best.count} matches alinhados, "
+              f"{best.coverage:.0%} dos hashes da amostra).")
+        print(f"Posição da amostra na música: {best.offset_seconds:.1f}s")
+        if abs(best.tempo - 1) >= 0.005:
+            print(f"Andamento da amostra: {(best.tempo - 1) * 100:+.1f}% em relação à música")
     else:
         print("\nResultado: Nenhuma correspondência forte encontrada.")
+    
+    # Demais candidatos pedidos com --top-k (sem decisão, a lista começa do 1º)
+    first = 2 if confident else 1
+    for rank, c in enumerate(candidates[first - 1:top_k] if top_k > 1 else [], first):
+        print(f"    {rank}. ID {c.song_id}: {c.count} matches alinhados, confiança {c.confidence:.0%} "
+              f"({c.offset_seconds:.1f}s)")
+
+def cmd_serve(args):
+    import asyncio
+    import server
+    
+    backend = index.open_backend(args.backend, max_df=args.max_df or None)
+    song_names = db.get_song_names()
+    app = server.RecognitionServer(backend, song_names, workers=args.workers,
+                                   batch_window_ms=args.batch_window_ms, max_batch=args.max_batch)
+    
+    where = args.unix or f"http://{args.host}:{args.port}"
+    print(f"--> Servidor pronto em {where} ({len(song_names)} músicas, backend '{args.backend}')")
+    try:
+        asyncio.run(app.serve_forever(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        print("\n--> Servidor encerrado.")
+
+def cmd_monitor(args):
+    import monitor
+    
+    backend = index.open_backend(args.backend, max_df=args.max_df or None)
+    source_options = {'realtime': args.realtime, 'follow': args.follow,
+                      'pcm_rate': args.pcm_rate, 'pcm_channels': args.pcm_channels}
+    print(f"--> Monitorando {len(args.sources)} stream(s) (janela {args.window}s, passo {args.hop}s)...",
+          file=sys.stderr)
+    stats = monitor.run_monitors(args.sources, backend, log_file=args.log, song_names=db.get_song_names(),
+                                 source_options=source_options, window_seconds=args.window,
+                                 hop_seconds=args.hop, min_aligned=args.min_aligned)
+    for s in stats:
+        if 'error' in s:
+            continue
+        speed = s['audio_seconds'] / s['cpu_seconds'] if s['cpu_seconds'] else float('inf')
+        print(f"--> {s['stream']}: {s['audio_seconds']:.1f}s de áudio, {speed:.1f}x tempo real", file=sys.stderr)
+
+def cmd_reshard(args):
+    before = len(db.get_shards()) or 1
+    print(f"--> Redistribuindo fingerprints: {before} -> {args.shards} shard(s)...")
+    try:
+        sizes = db.reshard(args.shards)
+    except ValueError as e:
+        print(f"Erro: {e}")
+        return
+    for i, size in enumerate(sizes):
+        print(f"    shard {i}: {size} fingerprints")
+    print(f"--> Concluído: {sum(sizes)} fingerprints em {len(sizes)} arquivo(s).")
+
+def cmd_stoplist(args):
+    n_stopped, threshold = db.build_stoplist(args.fraction, args.min_songs)
+    print(f"--> Stop-list refeita: {n_stopped} hashes presentes em mais de {threshold} músicas.")
+
+def cmd_build_index(args):
+    print("--> Construindo índice de fingerprints...")
+    idx = index.build_index()
+    print(f"--> Índice salvo em {index.INDEX_DIR}: {sum(len(s.keys) for s in idx.segments)} hashes distintos, "
+          f"{len(idx)} postings.")
+
+def cmd_delete(args):
+    if args.song.isdigit():
+        song_ids = [int(args.song)]
+    else:
+        song_ids = db.find_songs_by_name(args.song)
+    removed = [song_id for song_id in song_ids if db.delete_song(song_id)]
+    if not removed:
+        print(f"Erro: música '{args.song}' não encontrada.")
+        return
+    print(f"--> Removida(s): {', '.join(f'ID {song_id}' for song_id in removed)}. "
+          f"Os fingerprints saem das buscas já e do disco no próximo 'compact'.")
+
+def cmd_compact(args):
+    start = time.perf_counter()
+    songs, rows = db.compact()
+    print(f"--> Banco: {rows} fingerprints de {songs} música(s) removida(s) apagados.")
+    if os.path.exists(os.path.join(index.INDEX_DIR, index.MANIFEST_FILE)):
+        idx = index.open_backend('index')
+        idx.compact()
+        print(f"--> Índice: {len(idx.segments)} segmento(s), {len(idx)} postings.")
+    else:
+        # Sem índice em disco, ninguém vai ler fingerprints_recent
+        db.trim_recent(db.last_song_id())
+    print(f"--> Compactação concluída em {time.perf_counter() - start:.1f}s.")
+
+def cmd_export_snapshot(args):
+    import snapshot
+    start = time.perf_counter()
+    meta = snapshot.export_snapshot(args.output)
+    size = os.path.getsize(args.output)
+    print(f"--> Snapshot salvo em {args.output}: {meta['songs']} músicas, {meta['keys']} hashes distintos, "
+          f"{meta['postings']} postings.")
+    per_posting = f" ({size / meta['postings']:.2f} bytes/posting)" if meta['postings'] else ""
+    print(f"    {size / 1e6:.1f} MB{per_posting} em {time.perf_counter() - start:.1f}s.")
+
+def cmd_load_snapshot(args):
+    import snapshot
+    times = snapshot.load_snapshot(args.path)
+    if times is None:
+        return
+    print(f"--> Snapshot instalado em {snapshot.SNAPSHOT_PATH} (já pode ser usado com --backend snapshot).")
+    print("    " + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in times.items()))
+    print(f"--> Banco e índice restaurados em {sum(times.values()):.1f}s.")
+
+def run_profiled(args):
+    # --profile: tempo por estágio e contadores do comando; --profile-out: cProfile ou flamegraph
+    with metrics.Trace() as trace, metrics.profile(args.profile_out):
+        args.func(args)
+    if args.profile:
+        metrics.record_query(trace)
+        print(trace.report(f"Perfil ({args.command})"), file=sys.stderr)
 
 def main():
     parser = argparse.ArgumentParser(description='Shazam-like Audio Recognizer')
     subparsers = parser.add_subparsers(dest='command', required=True)
     
+    # Opções de perfil, aceitas por todos os comandos
+    profiling = argparse.ArgumentParser(add_help=False)
+    profiling.add_argument('--profile', action='store_true',
+                           help='Imprimir o tempo de cada estágio e os contadores (picos, hashes, matches...)')
+    profiling.add_argument('--profile-out', default=None,
+                           help='Gravar perfil: .prof (cProfile) ou outra extensão (pilhas para flamegraph)')
+    
     # Comando ADD
-    parser_add = subparsers.add_parser('add', help='Adicionar música ao banco de dados')
+    parser_add = subparsers.add_parser('add', parents=[profiling], help='Adicionar música ao banco de dados')
     parser_add.add_argument('path', help='Caminho para o arquivo de áudio')
+    parser_add.add_argument('--no-cache', action='store_true', help='Não usar o cache de fingerprints')
+    parser_add.add_argument('--replace', action='store_true',
+                            help='Remover as músicas já cadastradas com o mesmo nome de arquivo')
     parser_add.set_defaults(func=cmd_add)
     
+    # Comando INGEST (catálogo inteiro)
+    parser_ingest = subparsers.add_parser('ingest', aliases=['add-dir'], parents=[profiling],
+                                          help='Adicionar todas as músicas de um diretório ou manifesto')
+    parser_ingest.add_argument('source', help='Diretório com áudios ou arquivo de manifesto (um caminho por linha)')
+    parser_ingest.add_argument('--workers', type=int, default=None, help='Processos de fingerprinting (padrão: nº de CPUs)')
+    parser_ingest.add_argument('--batch-size', type=int, default=ingest.DEFAULT_BATCH_SONGS,
+                               help='Músicas por transação no banco')
+    parser_ingest.add_argument('--no-cache', action='store_true', help='Não usar o cache de fingerprints')
+    parser_ingest.set_defaults(func=cmd_ingest)
+    
     # Comando RECOGNIZE
-    parser_rec = subparsers.add_parser('recognize', help='Reconhecer música de uma gravação')
+    parser_rec = subparsers.add_parser('recognize', parents=[profiling], help='Reconhecer música de uma gravação')
     parser_rec.add_argument('path', help='Caminho para o arquivo de amostra')
+    parser_rec.add_argument('--backend', choices=index.BACKENDS, default='sqlite',
+                            help='Busca no SQLite, no índice em memória (arrays .npy) ou no snapshot instalado')
+    parser_rec.add_argument('--top-k', type=int, default=1, help='Quantos candidatos listar')
+    parser_rec.add_argument('--full', action='store_true',
+                            help='Analisar a amostra inteira (sem parada antecipada)')
+    parser_rec.add_argument('--slice', type=float, default=0.5,
+                            help='Fatia de áudio (s) entre decisões no modo progressivo')
+    parser_rec.add_argument('--no-cache', action='store_true', help='Não usar o cache de fingerprints')
+    parser_rec.add_argument('--max-df', type=int, default=index.MAX_DOCUMENT_FREQUENCY,
+                            help='Ignorar hashes presentes em mais músicas que isso (0 = sem limite)')
     parser_rec.set_defaults(func=cmd_recognize)
     
+    # Comando RECOGNIZE-BATCH (muitos clipes)
+    parser_batch = subparsers.add_parser('recognize-batch', parents=[profiling],
+                                         help='Reconhecer todos os clipes de um diretório ou manifesto')
+    parser_batch.add_argument('source', help='Diretório com áudios ou arquivo de manifesto (um caminho por linha)')
+    parser_batch.add_argument('--output', '-o', default=None,
+                              help='Arquivo de saída: .csv ou JSONL (padrão: JSONL no stdout)')
+    parser_batch.add_argument('--backend', choices=index.BACKENDS, default='index',
+                              help='Busca no SQLite, no índice em memória (arrays .npy) ou no snapshot instalado')
+    parser_batch.add_argument('--workers', type=int, default=None, help='Processos de fingerprinting (padrão: nº de CPUs)')
+    parser_batch.add_argument('--batch-size', type=int, default=256, help='Clipes por busca no backend')
+    parser_batch.add_argument('--max-df', type=int, default=index.MAX_DOCUMENT_FREQUENCY,
+                              help='Ignorar hashes presentes em mais músicas que isso (0 = sem limite)')
+    parser_batch.set_defaults(func=cmd_recognize_batch)
+    
+    # Comando SERVE
+    parser_serve = subparsers.add_parser('serve', parents=[profiling], help='Servidor HTTP de reconhecimento com índice residente')
+    parser_serve.add_argument('--host', default='127.0.0.1')
+    parser_serve.add_argument('--port', type=int, default=8765)
+    parser_serve.add_argument('--unix', default=None, help='Escutar em um Unix socket em vez de TCP')
+    parser_serve.add_argument('--backend', choices=index.BACKENDS, default='index')
+    parser_serve.add_argument('--workers', type=int, default=None, help='Processos para fingerprinting de áudio')
+    parser_serve.add_argument('--batch-window-ms', type=float, default=2.0,
+                              help='Janela de micro-batching das buscas no índice')
+    parser_serve.add_argument('--max-batch', type=int, default=64, help='Máximo de requisições por lote')
+    parser_serve.add_argument('--max-df', type=int, default=index.MAX_DOCUMENT_FREQUENCY,
+                              help='Ignorar hashes presentes em mais músicas que isso (0 = sem limite)')
+    parser_serve.add_argument('--no-metrics', action='store_true', help='Desligar as métricas (rota /metrics)')
+    parser_serve.set_defaults(func=cmd_serve)
+    
+    # Comando MONITOR
+    parser_mon = subparsers.add_parser('monitor', parents=[profiling], help='Reconhecimento contínuo de streams (play log em JSONL)')
+    parser_mon.add_argument('sources', nargs='+',
+                            help="Fontes: '-' (PCM s16le no stdin), 'mic', arquivo .raw/.pcm ou arquivo de áudio")
+    parser_mon.add_argument('--backend', choices=index.BACKENDS, default='index')
+    parser_mon.add_argument('--window', type=float, default=10.0, help='Janela de reconhecimento em segundos')
+    parser_mon.add_argument('--hop', type=float, default=2.0, help='Intervalo entre avaliações da janela')
+    parser_mon.add_argument('--max-df', type=int, default=index.MAX_DOCUMENT_FREQUENCY,
+                            help='Ignorar hashes presentes em mais músicas que isso (0 = sem limite)')
+    parser_mon.add_argument('--min-aligned', type=int, default=20, help='Hashes alinhados mínimos para detecção')
+    parser_mon.add_argument('--log', default=None, help='Arquivo JSONL do play log (padrão: stdout)')
+    parser_mon.add_argument('--realtime', action='store_true', help='Ler arquivos na velocidade real')
+    parser_mon.add_argument('--follow', action='store_true', help='Acompanhar arquivos .raw/.pcm crescendo')
+    parser_mon.add_argument('--pcm-rate', type=int, default=44100, help='Taxa de amostragem do PCM cru')
+    parser_mon.add_argument('--pcm-channels', type=int, default=1, help='Canais do PCM cru')
+    parser_mon.set_defaults(func=cmd_monitor)
+    
+    # Comando RESHARD
+    parser_shard = subparsers.add_parser('reshard', parents=[profiling], help='Particionar os fingerprints em N arquivos por faixa de hash')
+    parser_shard.add_argument('shards', type=int, help='Número de shards (1 = banco único)')
+    parser_shard.set_defaults(func=cmd_reshard)
+    
+    # Comando STOPLIST
+    parser_stop = subparsers.add_parser('stoplist', parents=[profiling],
+                                        help='Refazer a stop-list de hashes comuns demais')
+    parser_stop.add_argument('--fraction', type=float, default=db.STOPLIST_FRACTION,
+                             help='Fração máxima do catálogo em que um hash pode aparecer')
+    parser_stop.add_argument('--min-songs', type=int, default=db.STOPLIST_MIN_SONGS,
+                             help='Nunca cortar hashes presentes em até este número de músicas')
+    parser_stop.set_defaults(func=cmd_stoplist)
+    
+    # Comando BUILD-INDEX
+    parser_idx = subparsers.add_parser('build-index', parents=[profiling], help='(Re)construir o índice em memória a partir do banco')
+    parser_idx.set_defaults(func=cmd_build_index)
+    
+    # Comando DELETE
+    parser_del = subparsers.add_parser('delete', parents=[profiling], help='Remover uma música do catálogo')
+    parser_del.add_argument('song', help='ID da música ou nome do arquivo cadastrado')
+    parser_del.set_defaults(func=cmd_delete)
+    
+    # Comando COMPACT
+    parser_compact = subparsers.add_parser('compact', parents=[profiling],
+                                           help='Apagar os fingerprints das músicas removidas e fundir os segmentos do índice')
+    parser_compact.set_defaults(func=cmd_compact)
+    
+    # Comandos EXPORT-SNAPSHOT / LOAD-SNAPSHOT (replicação do catálogo)
+    parser_export = subparsers.add_parser('export-snapshot', parents=[profiling],
+                                          help='Gravar o catálogo em um snapshot binário compacto')
+    parser_export.add_argument('output', help='Arquivo de saída (ex: catalog.shzs)')
+    parser_export.set_defaults(func=cmd_export_snapshot)
+
+    parser_load = subparsers.add_parser('load-snapshot', parents=[profiling],
+                                        help='Carregar um snapshot em um banco vazio (banco, índice e backend snapshot)')
+    parser_load.add_argument('path', help='Arquivo gerado por export-snapshot')
+    parser_load.set_defaults(func=cmd_load_snapshot)
+    
     args = parser.parse_args()
-    args.func(args)
+    # Instrumentação desligada por padrão (custo desprezível); o servidor exporta em /metrics
+    metrics.enable(args.profile or (args.command == 'serve' and not args.no_metrics))
+    run_profiled(args)
 
 if __name__ == '__main__':
     main()
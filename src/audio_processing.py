@@ -1,12 +1,28 @@
+from functools import lru_cache
+from math import gcd
+
 import numpy as np
-import soundfile as sf
-from scipy.signal import spectrogram, resample
+
+import metrics
+
+# soundfile e scipy são importados só nas funções que os usam (scipy.signal sozinho
+# leva ~0.8s): comandos que não leem áudio iniciam sem eles (ver benchmarks/bench_startup.py)
 
 # Configurações Padrão
 SAMPLE_RATE = 44100
 WINDOW_SIZE = 4096
 OVERLAP_RATIO = 0.5
 
+# Leitura em streaming
+STREAM_BLOCK_SIZE = 65536        # Amostras lidas por bloco do arquivo
+STREAMING_MIN_SECONDS = 600      # Arquivos mais longos que isso são processados em streaming
+
+# Espectrograma (STFT)
+STFT_WINDOW = ('tukey', 0.25)    # Mesma janela padrão do scipy.signal.spectrogram
+STFT_DTYPE = np.float32
+STFT_BLOCK_FRAMES = 256          # Frames por chamada de rfft (limita a memória temporária)
+
+@metrics.timed('decode')
 def load_audio_file(file_path):
     """
     Carrega um arquivo de áudio, converte para Mono e 44.1kHz, 
@@ -14,6 +30,7 @@ def load_audio_file(file_path):
     Substituindo pydub por soundfile devido a problemas com Python 3.13
     """
     try:
+        import soundfile as sf
         # soundfile lê como float entre -1 e 1 por padrão
         data, fs = sf.read(file_path)
         
@@ -21,18 +38,17 @@ def load_audio_file(file_path):
         if len(data.shape) > 1:
             data = np.mean(data, axis=1)
             
-        # Resample se necessário
+        # Resample se necessário (filtro polifásico, o mesmo usado no streaming)
         if fs != SAMPLE_RATE:
-            # Calcula novo número de amostras
-            number_of_samples = int(len(data) * float(SAMPLE_RATE) / fs)
-            data = resample(data, number_of_samples)
+            from scipy.signal import resample_poly
+            g = gcd(SAMPLE_RATE, fs)
+            data = resample_poly(data, SAMPLE_RATE // g, fs // g)
             
         # Importante: Nosso algoritmo de fingerprinting (constantes de amplitude)
         # espera valores na escala de 16-bit inteiro (ex: amplitude > 10).
         # Como soundfile retorna float (-1.0 a 1.0), precisamos normalizar para int16 (-32768 a 32767).
         if data.dtype == np.float32 or data.dtype == np.float64:
-             data = data * 32767
-             data = data.astype(np.int16)
+             data = to_int16(data)
              
         return data
         
@@ -40,13 +56,301 @@ def load_audio_file(file_path):
         print(f"Erro ao carregar {file_path}: {e}")
         return None
 
-def generate_spectrogram(samples):
+def tukey_window(n, alpha):
+    """
+    Janela Tukey periódica de n pontos, idêntica a scipy.signal.get_window(('tukey', alpha), n),
+    sem importar scipy.signal.
+    """
+    m = n + 1   # Periódica: a simétrica de n + 1 pontos sem o último
+    k = np.arange(m)
+    width = int(np.floor(alpha * (m - 1) / 2.0))
+    w = np.ones(m)
+    w[:width + 1] = 0.5 * (1 + np.cos(np.pi * (-1 + 2.0 * k[:width + 1] / alpha / (m - 1))))
+    w[m - width - 1:] = 0.5 * (1 + np.cos(np.pi * (-2.0 / alpha + 1 + 2.0 * k[m - width - 1:] / alpha / (m - 1))))
+    return w[:n]
+
+class STFT:
+    """
+    Espectrograma de potência em float32, equivalente ao scipy.signal.spectrogram
+    usado antes (janela Tukey 0.25, média de cada frame removida, escala 'density'),
+    mas sem as conversões para float64 e sem cópias das amostras:
+
+    - os frames são uma view com strides sobre as amostras (nada é duplicado);
+    - a janela e a escala são calculadas uma vez por configuração (stft_engine);
+    - a rfft roda em lotes de STFT_BLOCK_FRAMES frames;
+    - max_freq (Hz) descarta os bins acima dessa frequência (ex: 8000 no visualizador).
+
+    Os valores diferem do scipy só no arredondamento de float32 (erro relativo ~1e-7).
+    """
+    def __init__(self, nperseg=WINDOW_SIZE, noverlap=None, fs=SAMPLE_RATE, max_freq=None):
+        self.nperseg = nperseg
+        self.noverlap = int(nperseg * OVERLAP_RATIO) if noverlap is None else noverlap
+        self.hop = nperseg - self.noverlap
+        self.fs = fs
+
+        if STFT_WINDOW[0] == 'tukey':
+            window = tukey_window(nperseg, STFT_WINDOW[1])
+        else:
+            from scipy.signal import get_window
+            window = get_window(STFT_WINDOW, nperseg)
+        self.window = window.astype(STFT_DTYPE)
+        scale = np.full(nperseg // 2 + 1, 1.0 / (fs * np.sum(window ** 2)))
+        # Espectro de um lado: energia das frequências negativas somada (exceto DC e Nyquist)
+        scale[1:nperseg // 2 + (nperseg % 2)] *= 2
+
+        n_bins = len(scale)
+        if max_freq is not None:
+            n_bins = min(int(max_freq * nperseg / fs) + 1, n_bins)
+        self.scale = scale[:n_bins].astype(STFT_DTYPE)
+        self.freqs = np.fft.rfftfreq(nperseg, 1 / fs)[:n_bins]
+        # rfft do scipy (não a do NumPy, que arredonda diferente em float32 e mudaria os hashes)
+        from scipy import fft as sp_fft
+        self._rfft = sp_fft.rfft
+
+    @property
+    def n_bins(self):
+        return len(self.freqs)
+
+    def n_frames(self, n_samples):
+        return 0 if n_samples < self.nperseg else 1 + (n_samples - self.nperseg) // self.hop
+
+    def times(self, n_frames):
+        """Centro de cada frame, em segundos (como o 't' do scipy)."""
+        return (np.arange(n_frames) * self.hop + self.nperseg / 2) / self.fs
+
+    def frames(self, samples):
+        """View (n_frames, nperseg) sobre as amostras, sem cópia."""
+        samples = np.asarray(samples)
+        n = self.n_frames(len(samples))
+        return np.lib.stride_tricks.as_strided(samples, (n, self.nperseg),
+                                               (samples.strides[0] * self.hop, samples.strides[0]),
+                                               writeable=False)
+
+    @metrics.timed('spectrogram')
+    def power(self, samples):
+        """
+        Espectrograma (n_bins, n_frames) das amostras, em float32.
+        """
+        frames = self.frames(samples)
+        out = np.empty((self.n_bins, len(frames)), dtype=STFT_DTYPE)
+        for start in range(0, len(frames), STFT_BLOCK_FRAMES):
+            block = frames[start:start + STFT_BLOCK_FRAMES]
+            out[:, start:start + len(block)] = self._block(block).T
+        return out
+
+    @metrics.timed('spectrogram')
+    def power_batch(self, clips):
+        """
+        Espectrogramas de vários clipes: os frames de todos entram nos mesmos
+        lotes de rfft (útil para muitos clipes curtos). Retorna uma lista de Sxx.
+        """
+        views = [self.frames(c) for c in clips]
+        outs = [np.empty((self.n_bins, len(v)), dtype=STFT_DTYPE) for v in views]
+        # (clipe, primeiro frame) de cada pedaço, agrupados até STFT_BLOCK_FRAMES frames por rfft
+        pending, size = [], 0
+        for i, view in enumerate(views):
+            for start in range(0, len(view), STFT_BLOCK_FRAMES):
+                n = min(STFT_BLOCK_FRAMES, len(view) - start)
+                pending.append((i, start, n))
+                size += n
+                if size >= STFT_BLOCK_FRAMES:
+                    self._scatter(views, outs, pending)
+                    pending, size = [], 0
+        if pending:
+            self._scatter(views, outs, pending)
+        return outs
+
+    def _scatter(self, views, outs, pieces):
+        block = np.concatenate([views[i][start:start + n] for i, start, n in pieces])
+        power = self._block(block)
+        pos = 0
+        for i, start, n in pieces:
+            outs[i][:, start:start + n] = power[pos:pos + n].T
+            pos += n
+
+    def _block(self, frames):
+        # Cópia em float32 do lote: a única conversão das amostras
+        block = frames.astype(STFT_DTYPE)
+        block -= block.mean(axis=1, keepdims=True, dtype=STFT_DTYPE)
+        block *= self.window
+        spectrum = self._rfft(block, axis=1)[:, :self.n_bins]
+        power = np.square(spectrum.real)
+        power += np.square(spectrum.imag)
+        power *= self.scale
+        return power
+
+@lru_cache(maxsize=None)
+def stft_engine(max_freq=None):
+    """
+    STFT com os parâmetros padrão (WINDOW_SIZE, OVERLAP_RATIO), criado uma vez por max_freq.
+    """
+    return STFT(max_freq=max_freq)
+
+def generate_spectrogram(samples, max_freq=None):
     """
     Gera o espectrograma a partir das amostras de áudio.
+    Retorna (f, t, Sxx) como scipy.signal.spectrogram, com Sxx (n_freqs, n_frames) em float32.
+    max_freq corta as frequências acima desse valor (Hz).
+    """
+    engine = stft_engine(max_freq)
+    Sxx = engine.power(samples)
+    return engine.freqs, engine.times(Sxx.shape[1]), Sxx
+
+def generate_spectrograms(clips, max_freq=None):
+    """
+    Espectrogramas de vários clipes em uma chamada (rfft em lote sobre todos os frames).
+    Retorna uma lista de (f, t, Sxx), na ordem de 'clips'.
+    """
+    engine = stft_engine(max_freq)
+    return [(engine.freqs, engine.times(Sxx.shape[1]), Sxx) for Sxx in engine.power_batch(clips)]
+
+def to_int16(data):
+    # Satura em vez de deixar o overflow "dar a volta" (o resample pode passar de 1.0)
+    return np.clip(data * 32767, -32768, 32767).astype(np.int16)
+
+def get_duration(file_path):
+    """
+    Duração do arquivo em segundos, lida só do cabeçalho (0 se não for possível ler).
+    """
+    try:
+        import soundfile as sf
+        return sf.info(file_path).duration
+    except Exception:
+        return 0.0
+
+def stream_length(file_path):
+    """
+    Amostras (mono, 44.1kHz) que stream_audio_file gera para o arquivo, lidas só do cabeçalho.
+    """
+    import soundfile as sf
+    info = sf.info(file_path)
+    if info.samplerate == SAMPLE_RATE:
+        return info.frames
+    # resample_poly gera ceil(n * up / down) amostras
+    return -(-info.frames * SAMPLE_RATE // info.samplerate)
+
+class PolyphaseResampler:
+    """
+    Resample incremental com filtro polifásico.
+    Produz a mesma saída que scipy.signal.resample_poly(x, up, down) sobre o
+    sinal inteiro, mas processando bloco a bloco com memória constante.
+
+    A amostra de saída n é y[n] = sum_j x[j] * h[n*down + half_len - j*up];
+    cada bloco de saídas é calculado com upfirdn só sobre as entradas que ele usa.
+    """
+    def __init__(self, up, down):
+        from scipy.signal import firwin, upfirdn
+        self._upfirdn = upfirdn
+        g = gcd(up, down)
+        self.up, self.down = up // g, down // g
+
+        max_rate = max(self.up, self.down)
+        self.half_len = 10 * max_rate
+        self.h = firwin(2 * self.half_len + 1, 1.0 / max_rate, window=('kaiser', 5.0)) * self.up
+        self.n_taps = -(-len(self.h) // self.up)   # Entradas que contribuem para cada saída
+
+        self.buffer = np.empty(0)
+        self.base = 0        # Índice global de buffer[0]
+        self.n_in = 0        # Total de amostras recebidas
+        self.n_next = 0      # Próxima amostra de saída
+
+    def process(self, block):
+        block = np.asarray(block, dtype=np.float64)
+        self.buffer = np.concatenate([self.buffer, block])
+        self.n_in += len(block)
+        # Só emite saídas cujas amostras de entrada já chegaram
+        n_end = (self.n_in * self.up - 1 - self.half_len) // self.down + 1
+        return self._emit(n_end)
+
+    def flush(self):
+        n_out = -(-self.n_in * self.up // self.down)
+        return self._emit(n_out)
+
+    def _first_input(self, n):
+        # Primeira amostra de entrada usada pela saída n
+        return max((n * self.down + self.half_len) // self.up - (self.n_taps - 1), 0)
+
+    def _emit(self, n_end):
+        if n_end <= self.n_next:
+            return np.empty(0)
+
+        n_count = n_end - self.n_next
+        j_lo = self._first_input(self.n_next)
+        segment = self.buffer[j_lo - self.base:]
+
+        # Desloca o filtro para que a saída m do upfirdn caia exatamente na saída n
+        c = self.half_len - j_lo * self.up
+        pre = (-c) % self.down
+        m0 = self.n_next + (c + pre) // self.down
+        y = self._upfirdn(np.concatenate([np.zeros(pre), self.h]), segment, self.up, self.down)[m0:m0 + n_count]
+        if len(y) < n_count:
+            y = np.concatenate([y, np.zeros(n_count - len(y))])
+        self.n_next = n_end
+
+        # Descarta entrada que nenhuma saída futura vai usar
+        drop = min(self._first_input(self.n_next) - self.base, len(self.buffer))
+        self.buffer = self.buffer[drop:]
+        self.base += drop
+        return y
+
+def stream_audio_file(file_path, block_size=STREAM_BLOCK_SIZE):
+    """
+    Versão em streaming de load_audio_file: lê o arquivo em blocos (soundfile.blocks),
+    converte para mono, faz o resample incremental para 44.1kHz e gera blocos int16.
+    A memória usada não depende da duração do arquivo.
+
+    Diferente de load_audio_file, erros de leitura são propagados: um stream
+    interrompido no meio não deve parecer um arquivo mais curto.
+    """
+    import soundfile as sf
+    fs = sf.info(file_path).samplerate
+    resampler = PolyphaseResampler(SAMPLE_RATE, fs) if fs != SAMPLE_RATE else None
+
+    for block in sf.blocks(file_path, blocksize=block_size, dtype='float64', always_2d=True):
+        data = block.mean(axis=1)
+        if resampler is not None:
+            data = resampler.process(data)
+        if len(data):
+            yield to_int16(data)
+
+    if resampler is not None:
+        tail = resampler.flush()
+        if len(tail):
+            yield to_int16(tail)
+
+class SpectrogramStream:
+    """
+    Espectrograma incremental: recebe blocos de amostras e devolve só os frames
+    completos, guardando o resto (sobreposição entre janelas) para o próximo bloco.
+    Os frames são idênticos aos de generate_spectrogram sobre o sinal inteiro.
+    """
+    def __init__(self):
+        self.engine = stft_engine()
+        self.nperseg = self.engine.nperseg
+        self.noverlap = self.engine.noverlap
+        self.hop = self.engine.hop
+        self.buffer = np.empty(0, dtype=np.int16)
+        self.frames = 0      # Frames já emitidos (índice global do próximo)
+
+    def push(self, samples):
+        buf = np.concatenate([self.buffer, samples])
+        n_frames = self.engine.n_frames(len(buf))
+        if n_frames == 0:
+            self.buffer = buf
+            return np.empty((self.engine.n_bins, 0), dtype=STFT_DTYPE)
+
+        Sxx = self.engine.power(buf)
+        self.buffer = buf[n_frames * self.hop:]
+        self.frames += n_frames
+        return Sxx
+
+def stream_spectrogram(chunks):
+    """
+    Consome blocos de amostras (ex: stream_audio_file) e gera blocos do espectrograma
+    (n_freqs, n_frames_novos), na ordem do tempo.
     """
-    nperseg = WINDOW_SIZE
-    noverlap = int(WINDOW_SIZE * OVERLAP_RATIO)
-    
-    f, t, Sxx = spectrogram(samples, fs=SAMPLE_RATE, nperseg=nperseg, noverlap=noverlap)
-    
-    return f, t, Sxx
+    stream = SpectrogramStream()
+    for chunk in chunks:
+        Sxx = stream.push(chunk)
+        if Sxx.shape[1]:
+            yield Sxx
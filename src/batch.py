@@ -0,0 +1,185 @@
+import csv
+import json
+import multiprocessing
+import sys
+import time
+from collections import namedtuple
+
+import audio_processing as audio
+import fingerprinting
+import ingest
+import matcher
+import metrics
+
+# Clipes por tarefa do pool: os espectrogramas do grupo saem de um rfft em lote
+DEFAULT_GROUP_CLIPS = 16
+# Clipes acumulados antes de cada busca no backend (hashes deduplicados entre eles)
+DEFAULT_BATCH_CLIPS = 256
+# Limite de áudio por chamada de generate_spectrograms (memória dos Sxx do grupo)
+SPECTROGRAM_BATCH_SECONDS = 120
+
+# Fingerprints de um clipe, vindos do pool (hashes/offsets são None se o arquivo falhou)
+ClipFingerprints = namedtuple('ClipFingerprints', ['path', 'hashes', 'offsets', 'audio_seconds', 'fingerprint_ms'])
+
+# Resultado por clipe. match_ms = parte da busca do lote (proporcional aos hashes) + pontuação
+ClipResult = namedtuple('ClipResult', ['path', 'candidates', 'fingerprints', 'raw_matches', 'audio_seconds',
+                                       'fingerprint_ms', 'match_ms', 'error'])
+
+CSV_FIELDS = ('path', 'song_id', 'name', 'confident', 'confidence', 'count', 'offset_seconds', 'tempo',
+              'fingerprints', 'raw_matches', 'audio_seconds', 'fingerprint_ms', 'match_ms', 'error')
+
+def _fingerprint_loaded(loaded, results):
+    """
+    Espectrogramas dos clipes carregados em uma chamada, depois picos e hashes de cada um.
+    O tempo do rfft em lote é dividido entre os clipes pelo número de amostras.
+    """
+    start = time.perf_counter()
+    spectrograms = audio.generate_spectrograms([samples for _, samples, _ in loaded])
+    stft_seconds = time.perf_counter() - start
+    total = sum(len(samples) for _, samples, _ in loaded) or 1
+
+    for (path, samples, seconds), (f, t, Sxx) in zip(loaded, spectrograms):
+        start = time.perf_counter()
+        hashes, offsets = fingerprinting.generate_fingerprint_arrays(*fingerprinting.find_peaks(Sxx))
+        seconds += time.perf_counter() - start + stft_seconds * len(samples) / total
+        results.append(ClipFingerprints(path, hashes, offsets, len(samples) / audio.SAMPLE_RATE, seconds * 1000))
+
+def _fingerprint_group(paths):
+    """
+    Fingerprints de um grupo de clipes, na ordem de 'paths'.
+    Arquivos longos (STREAMING_MIN_SECONDS) vão pelo caminho de streaming.
+    """
+    results, loaded, batch_samples = [], [], 0
+    for path in paths:
+        start = time.perf_counter()
+        if audio.get_duration(path) > audio.STREAMING_MIN_SECONDS:
+            try:
+                peak_times, peak_freqs = ingest.stream_file_peaks(path)
+            except Exception as e:
+                print(f"Erro ao carregar {path}: {e}")
+                results.append(ClipFingerprints(path, None, None, 0.0, 0.0))
+                continue
+            hashes, offsets = fingerprinting.generate_fingerprint_arrays(peak_times, peak_freqs)
+            seconds = audio.get_duration(path)
+            results.append(ClipFingerprints(path, hashes, offsets, seconds, (time.perf_counter() - start) * 1000))
+            continue
+
+        samples = audio.load_audio_file(path)
+        if samples is None:
+            results.append(ClipFingerprints(path, None, None, 0.0, 0.0))
+            continue
+        loaded.append((path, samples, time.perf_counter() - start))
+        batch_samples += len(samples)
+        if batch_samples >= SPECTROGRAM_BATCH_SECONDS * audio.SAMPLE_RATE:
+            _fingerprint_loaded(loaded, results)
+            loaded, batch_samples = [], 0
+    if loaded:
+        _fingerprint_loaded(loaded, results)
+
+    # Resultados na ordem de entrada (os longos e os com erro saíram antes do lote)
+    order = {path: i for i, path in enumerate(paths)}
+    results.sort(key=lambda r: order[r.path])
+    return results
+
+def fingerprint_clips(paths):
+    """
+    Executado nos processos do pool. Retorna (lista de ClipFingerprints, métricas);
+    as métricas (Trace.to_dict) são None se a instrumentação estiver desligada.
+    """
+    if not metrics.ENABLED:
+        return _fingerprint_group(paths), None
+    with metrics.Trace() as trace:
+        results = _fingerprint_group(paths)
+    return results, trace.to_dict()
+
+def _match_pending(pending, backend, top_k):
+    """
+    Uma busca no backend para todos os clipes pendentes + pontuação de cada um.
+    """
+    valid = [clip for clip in pending if clip.hashes is not None and len(clip.hashes)]
+    postings, lookup_seconds = None, 0.0
+    if valid:
+        start = time.perf_counter()
+        postings = matcher.lookup_batch(backend, [clip.hashes for clip in valid])
+        lookup_seconds = time.perf_counter() - start
+    total_hashes = sum(len(clip.hashes) for clip in valid) or 1
+
+    for clip in pending:
+        if clip.hashes is None:
+            yield ClipResult(clip.path, [], 0, 0, 0.0, clip.fingerprint_ms, 0.0, 'não foi possível ler o arquivo')
+            continue
+        if len(clip.hashes) == 0:
+            yield ClipResult(clip.path, [], 0, 0, clip.audio_seconds, clip.fingerprint_ms, 0.0, None)
+            continue
+        start = time.perf_counter()
+        candidates, n_raw = matcher.match_postings(clip.hashes, clip.offsets, postings, top_k)
+        seconds = time.perf_counter() - start + lookup_seconds * len(clip.hashes) / total_hashes
+        yield ClipResult(clip.path, candidates, len(clip.hashes), n_raw, clip.audio_seconds,
+                         clip.fingerprint_ms, seconds * 1000, None)
+
+def recognize_batch(paths, backend, workers=None, top_k=2, group_clips=DEFAULT_GROUP_CLIPS,
+                    batch_clips=DEFAULT_BATCH_CLIPS):
+    """
+    Reconhece muitos clipes: o fingerprinting roda em um pool de processos
+    (grupos de group_clips com espectrogramas em lote) e, a cada batch_clips
+    clipes, os hashes de todos são deduplicados e resolvidos em uma única
+    busca no backend; cada clipe é pontuado só com as suas postings.
+
+    Gera um ClipResult por clipe, na ordem de 'paths'.
+    """
+    groups = [paths[i:i + group_clips] for i in range(0, len(paths), group_clips)]
+    with multiprocessing.Pool(workers, initializer=metrics.enable, initargs=(metrics.ENABLED,)) as pool:
+        pending = []
+        for clips, trace in pool.imap(fingerprint_clips, groups):
+            metrics.merge(trace)
+            pending.extend(clips)
+            if len(pending) >= batch_clips:
+                yield from _match_pending(pending, backend, top_k)
+                pending = []
+        yield from _match_pending(pending, backend, top_k)
+
+def result_row(result, song_names=None):
+    """
+    Linha de saída (dicionário com CSV_FIELDS) de um ClipResult.
+    """
+    best = result.candidates[0] if result.candidates else None
+    return {
+        'path': result.path,
+        'song_id': best.song_id if best else None,
+        'name': (song_names or {}).get(best.song_id) if best else None,
+        'confident': matcher.is_confident(result.candidates),
+        'confidence': round(best.confidence, 4) if best else 0.0,
+        'count': best.count if best else 0,
+        'offset_seconds': round(best.offset_seconds, 3) if best else None,
+        'tempo': round(best.tempo, 3) if best else None,
+        'fingerprints': result.fingerprints,
+        'raw_matches': result.raw_matches,
+        'audio_seconds': round(result.audio_seconds, 3),
+        'fingerprint_ms': round(result.fingerprint_ms, 3),
+        'match_ms': round(result.match_ms, 3),
+        'error': result.error,
+    }
+
+class ResultWriter:
+    """
+    Escreve as linhas em JSONL (padrão, ou stdout sem arquivo) ou CSV (extensão .csv).
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.out = open(path, 'w', encoding='utf-8', newline='') if path else sys.stdout
+        self.csv = None
+        if path and path.lower().endswith('.csv'):
+            self.csv = csv.DictWriter(self.out, fieldnames=CSV_FIELDS)
+            self.csv.writeheader()
+
+    def write(self, row):
+        if self.csv is not None:
+            self.csv.writerow({k: '' if v is None else v for k, v in row.items()})
+        else:
+            self.out.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+    def close(self):
+        if self.path:
+            self.out.close()
+        else:
+            self.out.flush()
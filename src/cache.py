@@ -0,0 +1,222 @@
+import hashlib
+import os
+import struct
+import time
+
+import numpy as np
+
+import audio_processing as audio
+import database as db
+import fingerprinting
+import metrics
+
+# Diretório padrão do cache (ao lado do shazam.db, como o índice)
+CACHE_DIR = os.path.join(os.path.dirname(db.DB_PATH), 'cache')
+CACHE_MAX_BYTES = 1 << 30   # Acima disso as entradas usadas há mais tempo são removidas (LRU)
+
+# Formato de uma entrada (.fpc), little-endian:
+#   cabeçalho: magic, versão, nº de picos, nº de fingerprints
+#   peak_times int32 | hashes uint32 | offsets int32 | peak_freqs uint16
+# O hash empacotado cabe em 32 bits (12 + 12 + 8), metade do int64 usado no banco.
+MAGIC = b'SHZC'
+FORMAT_VERSION = 1
+_HEADER = struct.Struct('<4sHxxII')
+HASH_BITS = 2 * fingerprinting.HASH_FREQ_BITS + fingerprinting.HASH_DELTA_BITS
+HASH_DTYPE = np.dtype('<u4') if HASH_BITS <= 32 else np.dtype('<i8')
+
+def audio_digest(samples):
+    """
+    SHA-1 das amostras decodificadas (mono, 44.1kHz, int16), gravado em songs.file_hash.
+    Não depende do container nem das tags, só do áudio.
+    """
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(samples, dtype='<i2').tobytes())
+    return digest.hexdigest()
+
+def file_digest(path, block_size=1 << 20):
+    """
+    SHA-1 dos bytes do arquivo: o songs.file_hash das músicas cadastradas antes do
+    schema v5 (ver database.has_legacy_file_hashes).
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def hashing_blocks(chunks, digest):
+    """
+    Repassa os blocos (ex: stream_audio_file) atualizando 'digest' (hashlib.sha1()):
+    no fim, digest.hexdigest() é igual a audio_digest do áudio inteiro.
+    """
+    for block in chunks:
+        digest.update(np.ascontiguousarray(block, dtype='<i2').tobytes())
+        yield block
+
+def params_tag():
+    """
+    Identifica os parâmetros de fingerprinting: mudar qualquer um invalida o cache.
+    """
+    params = (audio.SAMPLE_RATE, audio.WINDOW_SIZE, audio.OVERLAP_RATIO,
+              audio.STFT_WINDOW, np.dtype(audio.STFT_DTYPE).str,
+              fingerprinting.PEAK_NEIGHBORHOOD_SIZE, fingerprinting.MIN_AMPLITUDE,
+              fingerprinting.MIN_HASH_TIME_DELTA, fingerprinting.MAX_HASH_TIME_DELTA,
+              fingerprinting.HASH_FREQ_BITS, fingerprinting.HASH_DELTA_BITS, FORMAT_VERSION)
+    return hashlib.sha1(repr(params).encode()).hexdigest()[:12]
+
+def _encode(peak_times, peak_freqs, hashes, offsets):
+    return b''.join([
+        _HEADER.pack(MAGIC, FORMAT_VERSION, len(peak_times), len(hashes)),
+        np.asarray(peak_times, dtype='<i4').tobytes(),
+        np.asarray(hashes).astype(HASH_DTYPE).tobytes(),
+        np.asarray(offsets, dtype='<i4').tobytes(),
+        np.asarray(peak_freqs, dtype='<u2').tobytes(),
+    ])
+
+def _decode(data):
+    """
+    Retorna (peak_times, peak_freqs, hashes, offsets) em int64, ou None se a entrada estiver corrompida.
+    """
+    if len(data) < _HEADER.size:
+        return None
+    magic, version, n_peaks, n_fps = _HEADER.unpack_from(data)
+    expected = _HEADER.size + n_peaks * 6 + n_fps * (HASH_DTYPE.itemsize + 4)
+    if magic != MAGIC or version != FORMAT_VERSION or len(data) != expected:
+        return None
+
+    arrays, pos = [], _HEADER.size
+    for dtype, n in (('<i4', n_peaks), (HASH_DTYPE, n_fps), ('<i4', n_fps), ('<u2', n_peaks)):
+        dtype = np.dtype(dtype)
+        arrays.append(np.frombuffer(data, dtype=dtype, count=n, offset=pos).astype(np.int64))
+        pos += n * dtype.itemsize
+    peak_times, hashes, offsets, peak_freqs = arrays
+    return peak_times, peak_freqs, hashes, offsets
+
+class FingerprintCache:
+    """
+    Cache em disco de picos e fingerprints, indexado pelo conteúdo do áudio
+    decodificado (audio_digest) + parâmetros de fingerprinting (params_tag).
+
+    Cada entrada é um arquivo .fpc; o índice (tamanho e último uso de cada
+    entrada, e caminho -> digest) fica em um SQLite no mesmo diretório.
+    Seguro entre processos (workers da ingestão): escritas atômicas por os.replace.
+    """
+    def __init__(self, path=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.tag = params_tag()
+        self.index_path = os.path.join(path, 'index.db')
+        os.makedirs(path, exist_ok=True)
+        with self._conn() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS entries
+                            (key TEXT PRIMARY KEY, size INTEGER, last_used REAL)''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries (last_used)')
+            # Arquivos já vistos: se tamanho e mtime não mudaram, o digest é reaproveitado sem decodificar
+            conn.execute('''CREATE TABLE IF NOT EXISTS paths
+                            (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, digest TEXT)''')
+
+    def _conn(self):
+        return db.connection(self.index_path)
+
+    def _file(self, key):
+        return os.path.join(self.path, f'{key}.fpc')
+
+    def _key(self, digest):
+        return f'{digest}-{self.tag}'
+
+    def lookup_path(self, path):
+        """
+        Digest já calculado para este arquivo (mesmo tamanho e mtime), ou None.
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        row = self._conn().execute('SELECT size, mtime_ns, digest FROM paths WHERE path = ?',
+                                   (os.path.abspath(path),)).fetchone()
+        if row is None or (row['size'], row['mtime_ns']) != (st.st_size, st.st_mtime_ns):
+            return None
+        return row['digest']
+
+    def remember_path(self, path, digest):
+        st = os.stat(path)
+        with self._conn() as conn:
+            conn.execute('INSERT OR REPLACE INTO paths (path, size, mtime_ns, digest) VALUES (?, ?, ?, ?)',
+                         (os.path.abspath(path), st.st_size, st.st_mtime_ns, digest))
+
+    @metrics.timed('cache')
+    def get(self, digest):
+        """
+        Retorna (peak_times, peak_freqs, hashes, offsets) ou None se não estiver no cache.
+        """
+        key = self._key(digest)
+        try:
+            with open(self._file(key), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        entry = _decode(data)
+        with self._conn() as conn:
+            if entry is None:
+                conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+            else:
+                conn.execute('UPDATE entries SET last_used = ? WHERE key = ?', (time.time(), key))
+        if entry is None:
+            self._remove(key)
+        return entry
+
+    @metrics.timed('cache')
+    def put(self, digest, peak_times, peak_freqs, hashes, offsets):
+        key = self._key(digest)
+        data = _encode(peak_times, peak_freqs, hashes, offsets)
+        if len(data) > self.max_bytes:
+            return
+
+        # Escreve em arquivo temporário e troca: leitores nunca veem uma entrada pela metade
+        tmp = f'{self._file(key)}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, self._file(key))
+
+        with self._conn() as conn:
+            # INSERT primeiro: a transação já começa com o lock de escrita
+            conn.execute('INSERT OR REPLACE INTO entries (key, size, last_used) VALUES (?, ?, ?)',
+                         (key, len(data), time.time()))
+            evicted = self._evict(conn)
+        for old in evicted:
+            self._remove(old)
+
+    def _evict(self, conn):
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        evicted = []
+        if total <= self.max_bytes:
+            return evicted
+        for row in conn.execute('SELECT key, size FROM entries ORDER BY last_used'):
+            evicted.append(row['key'])
+            total -= row['size']
+            if total <= self.max_bytes:
+                break
+        conn.executemany('DELETE FROM entries WHERE key = ?', [(k,) for k in evicted])
+        return evicted
+
+    def _remove(self, key):
+        try:
+            os.remove(self._file(key))
+        except OSError:
+            pass
+
+    def size(self):
+        """
+        Retorna (nº de entradas, bytes ocupados).
+        """
+        row = self._conn().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        return row[0], row[1]
+
+    def clear(self):
+        with self._conn() as conn:
+            keys = [r['key'] for r in conn.execute('SELECT key FROM entries')]
+            conn.execute('DELETE FROM entries')
+            conn.execute('DELETE FROM paths')
+        for key in keys:
+            self._remove(key)
@@ -1,16 +1,301 @@
 import sqlite3
 import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import fingerprinting
+import metrics
 
 # Caminho ajustado para a nova estrutura
 DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'db', 'shazam.db')
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
+# Versão do schema (PRAGMA user_version)
+# 1: hash TEXT ("f1|f2|dt") + idx_fingerprints_hash
+# 2: hash INTEGER empacotado, tabela WITHOUT ROWID com chave (hash, song_id, offset)
+# 3: hash_stats (em quantas músicas cada hash aparece) e stoplist
+# 4: tombstones (músicas removidas), fingerprints_recent e catalog_meta
+# 5: file_hash passou a ser o digest do áudio decodificado; as músicas já cadastradas
+#    (id até catalog_meta 'legacy_file_hash') podem ter o SHA-1 dos bytes do arquivo
+SCHEMA_VERSION = 5
+
+MIGRATION_BATCH_SIZE = 100000
+
+# Shards: arquivos SQLite com a tabela fingerprints particionada por faixa de hash.
+# Ficam anexados (ATTACH) à conexão principal para que a escrita de uma música
+# (songs + fingerprints) continue atômica; o SQLite permite até 10 bancos anexados.
+# Em WAL, a atomicidade entre arquivos só vale por arquivo se o sistema cair no commit.
+SHARDS_DIR = 'shards'
+MAX_SHARDS = 10
+
+# Pragmas aplicados a cada conexão (e a cada shard anexado); ajustáveis com configure()
+PRAGMAS = {
+    'journal_mode': 'wal',          # Leitores e escritor não se bloqueiam
+    'synchronous': 'normal',        # Seguro em WAL: fsync só nos checkpoints
+    'cache_size': -65536,           # Negativo = KiB: 64 MiB de cache de páginas
+    'mmap_size': 256 * 1024 * 1024, # Leituras via memory-map
+    'temp_store': 'memory',
+}
+# Pragmas que valem para a conexão inteira (os demais são por banco anexado)
+_CONNECTION_PRAGMAS = {'temp_store'}
+
+# Stop-list: hashes presentes em mais de max(STOPLIST_MIN_SONGS, STOPLIST_FRACTION * nº de músicas)
+# músicas (graves, silêncio) quase não distinguem músicas e só aumentam o custo da busca
+STOPLIST_FRACTION = 0.01
+STOPLIST_MIN_SONGS = 50
+
+BUSY_TIMEOUT = 30.0         # Segundos esperando um lock antes de "database is locked"
+STATEMENT_CACHE_SIZE = 256  # Statements preparados reaproveitados por conexão
+
+# Pool de threads de get_matches (recriado após fork)
+_shard_executor = None
+_shard_executor_pid = None
+
+# Conexões por thread, reaproveitadas entre chamadas (ver connection())
+_local = threading.local()
+# Muda quando o layout de shards ou os pragmas mudam: as conexões abertas são refeitas
+_generation = 0
+# Bancos cujo schema já foi verificado neste processo
+_initialized = set()
+_init_lock = threading.Lock()
+
+def configure(**pragmas):
+    """
+    Ajusta os pragmas das conexões (ex: configure(cache_size=-262144, synchronous='full')).
+    Vale para as conexões abertas a partir daqui.
+    """
+    global _generation
+    PRAGMAS.update(pragmas)
+    _generation += 1
+
+def _apply_pragmas(conn, schemas=('main',)):
+    for name, value in PRAGMAS.items():
+        if name in _CONNECTION_PRAGMAS:
+            conn.execute(f'PRAGMA {name} = {value}')
+        else:
+            for schema in schemas:
+                conn.execute(f'PRAGMA {schema}.{name} = {value}')
+
+def _connect(path, attach_shards):
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, cached_statements=STATEMENT_CACHE_SIZE)
     conn.row_factory = sqlite3.Row
+    schemas = ['main']
+    if attach_shards:
+        shards = get_shards(conn)
+        _attach_shards(conn, shards)
+        schemas += [f'shard{i}' for i in range(len(shards))]
+    _apply_pragmas(conn, schemas)
     return conn
 
+def schema_version(path=None):
+    """
+    PRAGMA user_version do banco (0 se ele ainda não existir), sem criar nada.
+    """
+    path = path or DB_PATH
+    if not os.path.exists(path):
+        return 0
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+    try:
+        return conn.execute('PRAGMA user_version').fetchone()[0]
+    finally:
+        conn.close()
+
+def _ensure_schema():
+    # Verificado uma única vez por processo, no primeiro uso (não no import). Banco já na
+    # versão atual: só a leitura de user_version, sem DDL nem commit (cada comando da CLI passa aqui)
+    if DB_PATH in _initialized:
+        return
+    with _init_lock:
+        if DB_PATH not in _initialized:
+            if schema_version() != SCHEMA_VERSION:
+                os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+                init_db()
+            _initialized.add(DB_PATH)
+
+def get_db_connection():
+    """
+    Conexão nova e exclusiva do chamador (que deve fechá-la), para quem controla
+    a própria transação (ex: escritor da ingestão). Para consultas e escritas
+    simples use connection().
+    """
+    _ensure_schema()
+    return _connect(DB_PATH, attach_shards=True)
+
+def connection(path=None):
+    """
+    Conexão da thread atual com 'path' (padrão: DB_PATH, com os shards anexados).
+    Fica aberta e é reaproveitada pelas próximas chamadas da mesma thread,
+    com os statements preparados em cache. Não deve ser fechada pelo chamador.
+    """
+    if path is None:
+        _ensure_schema()
+        path = DB_PATH
+    conns = getattr(_local, 'conns', None)
+    if conns is None:
+        conns = _local.conns = {}
+
+    key = (path, os.getpid(), _generation)
+    conn = conns.get(path)
+    if conn is not None and conn[0] == key:
+        return conn[1]
+    # Conexões herdadas de um fork ou de um layout antigo são descartadas
+    new = _connect(path, attach_shards=(path == DB_PATH))
+    conns[path] = (key, new)
+    return new
+
+def close_connections():
+    """
+    Fecha as conexões da thread atual (as próximas chamadas abrem novas).
+    """
+    for _, conn in getattr(_local, 'conns', {}).values():
+        conn.close()
+    _local.conns = {}
+
+def get_shards(conn=None):
+    """
+    Layout atual: lista de (hash_min, caminho) ordenada por hash_min.
+    O shard i guarda os hashes em [hash_min[i], hash_min[i+1]).
+    Lista vazia = banco único (fingerprints em DB_PATH).
+    """
+    if conn is None:
+        conn = connection()
+    try:
+        rows = conn.execute('SELECT hash_min, path FROM main.shards ORDER BY hash_min').fetchall()
+    except sqlite3.OperationalError:
+        rows = []   # Banco ainda não inicializado
+    base = os.path.dirname(DB_PATH)
+    return [(r[0], os.path.join(base, r[1])) for r in rows]
+
+def _attach_shards(conn, shards):
+    for i, (_, path) in enumerate(shards):
+        conn.execute('ATTACH DATABASE ? AS ?', (path, f'shard{i}'))
+
+def _shard_of(shards, hashes):
+    bounds = np.array([s[0] for s in shards], dtype=np.int64)
+    return np.maximum(np.searchsorted(bounds, hashes, side='right') - 1, 0)
+
+def fingerprint_tables(conn):
+    """
+    Nomes qualificados das tabelas de fingerprints na conexão, em ordem de hash.
+    """
+    shards = get_shards(conn)
+    if not shards:
+        return ['main.fingerprints']
+    return [f'shard{i}.fingerprints' for i in range(len(shards))]
+
+def _create_fingerprints_table(c, schema='main'):
+    # A chave primária agrupa as postings de um mesmo hash na B-tree,
+    # dispensando o índice separado e o rowid.
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS {schema}.fingerprints (
+            hash INTEGER NOT NULL,
+            song_id INTEGER NOT NULL,
+            offset INTEGER NOT NULL,
+            PRIMARY KEY (hash, song_id, offset),
+            FOREIGN KEY (song_id) REFERENCES songs (id)
+        ) WITHOUT ROWID
+    ''')
+
+def _create_stats_tables(c):
+    # Frequência de documento: em quantas músicas cada hash aparece (mantida a cada inserção)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS hash_stats (
+            hash INTEGER PRIMARY KEY,
+            songs INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    # Hashes ignorados nas buscas (ver build_stoplist)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS stoplist (
+            hash INTEGER PRIMARY KEY
+        ) WITHOUT ROWID
+    ''')
+
+def _create_catalog_tables(c):
+    # Músicas removidas: os fingerprints ficam até compact() (purged = 1 depois disso).
+    # As linhas nunca são apagadas: segmentos do índice ainda podem ter as postings.
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS tombstones (
+            song_id INTEGER PRIMARY KEY,
+            purged INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    # Fingerprints das músicas ainda não incorporadas ao índice em memória, agrupados
+    # por música: o índice lê só as novas em vez da tabela inteira (ver index.SegmentedIndex)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS fingerprints_recent (
+            song_id INTEGER NOT NULL,
+            hash INTEGER NOT NULL,
+            offset INTEGER NOT NULL,
+            PRIMARY KEY (song_id, hash, offset)
+        ) WITHOUT ROWID
+    ''')
+    # recent_floor: fingerprints_recent tem todas as músicas com id acima disso
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    ''')
+
+def _fill_hash_stats(conn):
+    """
+    Recalcula hash_stats a partir dos fingerprints (banco único ou shards).
+    A chave (hash, song_id, offset) deixa o GROUP BY como uma leitura sequencial.
+    """
+    conn.execute('DELETE FROM main.hash_stats')
+    shards = [r[0] for r in conn.execute('SELECT path FROM main.shards ORDER BY hash_min')]
+    if not shards:
+        conn.execute('INSERT INTO main.hash_stats SELECT hash, COUNT(DISTINCT song_id) '
+                     'FROM main.fingerprints GROUP BY hash')
+        return
+    base = os.path.dirname(DB_PATH)
+    conn.commit()   # ATTACH não é permitido dentro de uma transação
+    for path in shards:
+        # Faixas de hash disjuntas: cada shard contribui com hashes diferentes
+        conn.execute('ATTACH DATABASE ? AS src', (os.path.join(base, path),))
+        conn.execute('INSERT INTO main.hash_stats SELECT hash, COUNT(DISTINCT song_id) '
+                     'FROM src.fingerprints GROUP BY hash')
+        conn.commit()
+        conn.execute('DETACH DATABASE src')
+
+def _table_exists(c, name):
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,))
+    return c.fetchone() is not None
+
+def _migrate_v1_to_v2(conn):
+    """
+    Converte a tabela de fingerprints com hash TEXT para o formato inteiro empacotado.
+    Roda em uma única transação; os dados antigos só são descartados no final.
+    """
+    c = conn.cursor()
+    print("Migrando banco de fingerprints para o schema v2 (hash inteiro)...")
+
+    c.execute('BEGIN')
+    c.execute('DROP INDEX IF EXISTS idx_fingerprints_hash')
+    c.execute('ALTER TABLE fingerprints RENAME TO fingerprints_v1')
+    _create_fingerprints_table(c)
+
+    reader = conn.cursor()
+    reader.execute('SELECT hash, song_id, offset FROM fingerprints_v1')
+    migrated = 0
+    while True:
+        rows = reader.fetchmany(MIGRATION_BATCH_SIZE)
+        if not rows:
+            break
+        data = [(fingerprinting.parse_legacy_hash(r[0]), r[1], r[2]) for r in rows]
+        c.executemany('INSERT OR IGNORE INTO fingerprints (hash, song_id, offset) VALUES (?, ?, ?)', data)
+        migrated += len(data)
+
+    c.execute('DROP TABLE fingerprints_v1')
+    print(f"Migração concluída: {migrated} fingerprints convertidos.")
+
 def init_db():
-    conn = get_db_connection()
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT)
+    _apply_pragmas(conn)
     c = conn.cursor()
     
     # Tabela de Músicas
@@ -22,71 +307,496 @@ def init_db():
         )
     ''')
     
-    # Tabela de Fingerprints
+    # Layout dos shards (vazio = banco único)
     c.execute('''
-        CREATE TABLE IF NOT EXISTS fingerprints (
-            hash TEXT NOT NULL,
-            song_id INTEGER NOT NULL,
-            offset INTEGER NOT NULL,
-            FOREIGN KEY (song_id) REFERENCES songs (id)
+        CREATE TABLE IF NOT EXISTS shards (
+            hash_min INTEGER PRIMARY KEY,
+            path TEXT NOT NULL
         )
     ''')
     
-    c.execute('CREATE INDEX IF NOT EXISTS idx_fingerprints_hash ON fingerprints (hash)')
+    # Tabela de Fingerprints
+    version = c.execute('PRAGMA user_version').fetchone()[0]
+    migrated = version < 2 and _table_exists(c, 'fingerprints')
+    if migrated:
+        _migrate_v1_to_v2(conn)
+    else:
+        _create_fingerprints_table(c)
+    
+    # Estatísticas por hash (v3): bancos antigos são preenchidos a partir dos fingerprints
+    _create_stats_tables(c)
+    if 0 < version < 3 or migrated:
+        print("Calculando a frequência de cada hash (schema v3)...")
+        _fill_hash_stats(conn)
+    
+    # Catálogo mutável (v4): músicas já cadastradas não estão em fingerprints_recent
+    _create_catalog_tables(c)
+    if version < 4:
+        c.execute("INSERT OR IGNORE INTO catalog_meta (key, value) SELECT 'recent_floor', COALESCE(MAX(id), 0) FROM songs")
+    
+    # Digest do áudio (v5): o arquivo original das músicas antigas não está no banco, então o
+    # hash delas não pode ser recalculado; has_legacy_file_hashes liga a comparação pelos bytes
+    if version < 5:
+        c.execute("INSERT OR IGNORE INTO catalog_meta (key, value) "
+                  "SELECT 'legacy_file_hash', COALESCE(MAX(id), 0) FROM songs WHERE file_hash IS NOT NULL")
+    
+    if version != SCHEMA_VERSION:
+        c.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
     
     conn.commit()
+    if migrated:
+        # Devolve ao sistema as páginas da tabela TEXT antiga
+        conn.execute('VACUUM')
     conn.close()
+    _initialized.add(DB_PATH)
 
-def insert_song(name, file_hash=None):
-    conn = get_db_connection()
+def insert_song(name, file_hash=None, conn=None):
+    # Com conn fornecida, a escrita entra na transação do chamador (sem commit)
+    if conn is None:
+        with connection() as own:
+            return insert_song(name, file_hash, own)
     c = conn.cursor()
     try:
         c.execute('INSERT INTO songs (name, file_hash) VALUES (?, ?)', (name, file_hash))
         song_id = c.lastrowid
     except sqlite3.IntegrityError:
-        c.execute('SELECT id FROM songs WHERE name = ?', (name,))
+        # UNIQUE só em file_hash: o mesmo áudio já cadastrado (nomes podem se repetir)
+        c.execute('SELECT id FROM songs WHERE file_hash = ?', (file_hash,))
         result = c.fetchone()
         song_id = result['id'] if result else None
-        
-    conn.commit()
-    conn.close()
     return song_id
 
-def insert_fingerprints(song_id, fingerprints):
-    conn = get_db_connection()
-    c = conn.cursor()
-    data = [(f[0], song_id, f[1]) for f in fingerprints]
-    c.executemany('INSERT INTO fingerprints (hash, song_id, offset) VALUES (?, ?, ?)', data)
+def delete_song(song_id, conn=None):
+    """
+    Remove uma música do catálogo: some de songs na hora e entra em tombstones;
+    os fingerprints são filtrados nas buscas e apagados de fato em compact().
+    Retorna False se a música não existir.
+    """
+    if conn is None:
+        with connection() as own:
+            return delete_song(song_id, own)
+    if conn.execute('DELETE FROM songs WHERE id = ?', (song_id,)).rowcount == 0:
+        return False
+    conn.execute('INSERT OR IGNORE INTO tombstones (song_id) VALUES (?)', (song_id,))
+    conn.execute('DELETE FROM fingerprints_recent WHERE song_id = ?', (song_id,))
+    return True
+
+def find_songs_by_name(name):
+    rows = connection().execute('SELECT id FROM songs WHERE name = ? ORDER BY id', (name,)).fetchall()
+    return [r['id'] for r in rows]
+
+def get_tombstones(include_purged=True):
+    """
+    IDs das músicas removidas, como array int64 ordenado. Sem include_purged,
+    só as que ainda têm fingerprints no banco (antes de compact()).
+    """
+    where = '' if include_purged else ' WHERE purged = 0'
+    rows = connection().execute(f'SELECT song_id FROM tombstones{where} ORDER BY song_id').fetchall()
+    return np.array([r[0] for r in rows], dtype=np.int64)
+
+def last_song_id(conn=None):
+    """
+    Maior id já atribuído a uma música (AUTOINCREMENT: não volta se ela for removida).
+    """
+    if conn is None:
+        conn = connection()
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'songs'").fetchone()
+    return row[0] if row else 0
+
+def recent_floor(conn=None):
+    if conn is None:
+        conn = connection()
+    row = conn.execute("SELECT value FROM catalog_meta WHERE key = 'recent_floor'").fetchone()
+    return row[0] if row else 0
+
+def has_legacy_file_hashes(conn=None):
+    """
+    Há músicas cadastradas antes do schema v5, cujo file_hash pode ser o SHA-1 dos
+    bytes do arquivo (cache.file_digest) em vez do digest do áudio?
+    """
+    if conn is None:
+        conn = connection()
+    row = conn.execute("SELECT 1 FROM songs WHERE file_hash IS NOT NULL AND id <= "
+                       "(SELECT value FROM catalog_meta WHERE key = 'legacy_file_hash') LIMIT 1").fetchone()
+    return row is not None
+
+def get_recent_fingerprints(after_song_id, upto_song_id):
+    """
+    Fingerprints das músicas com id em (after_song_id, upto_song_id], de fingerprints_recent.
+    Custo proporcional a essas músicas, não ao catálogo. Retorna (song_ids, hashes, offsets).
+    """
+    c = connection().cursor()
+    c.row_factory = None
+    rows = c.execute('SELECT song_id, hash, offset FROM fingerprints_recent WHERE song_id > ? AND song_id <= ?',
+                     (after_song_id, upto_song_id)).fetchall()
+    if not rows:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    arr = np.array(rows, dtype=np.int64)
+    return arr[:, 0], arr[:, 1], arr[:, 2]
+
+def trim_recent(upto_song_id):
+    """
+    Descarta de fingerprints_recent as músicas até upto_song_id (já incorporadas ao índice).
+    """
+    with connection() as conn:
+        conn.execute('DELETE FROM fingerprints_recent WHERE song_id <= ?', (upto_song_id,))
+        conn.execute("INSERT INTO catalog_meta (key, value) VALUES ('recent_floor', ?) "
+                     "ON CONFLICT (key) DO UPDATE SET value = MAX(value, excluded.value)", (upto_song_id,))
+
+def compact():
+    """
+    Apaga os fingerprints das músicas removidas (tombstones ainda não purgadas),
+    recalcula hash_stats e refaz a stop-list. Percorre o catálogo inteiro: é a
+    compactação periódica, não algo a fazer a cada remoção.
+    Retorna (músicas purgadas, fingerprints apagados).
+    """
+    with connection() as conn:
+        pending = [r[0] for r in conn.execute('SELECT song_id FROM tombstones WHERE purged = 0')]
+        if not pending:
+            return 0, 0
+        removed = 0
+        for table in fingerprint_tables(conn):
+            removed += conn.execute(f'DELETE FROM {table} WHERE song_id IN '
+                                    f'(SELECT song_id FROM main.tombstones WHERE purged = 0)').rowcount
+        conn.execute('UPDATE tombstones SET purged = 1 WHERE purged = 0')
+    rebuild_hash_stats()
+    build_stoplist()
+    return len(pending), removed
+
+def insert_fingerprints(song_id, fingerprints, conn=None):
+    hashes = np.fromiter((f[0] for f in fingerprints), dtype=np.int64, count=len(fingerprints))
+    offsets = np.fromiter((f[1] for f in fingerprints), dtype=np.int64, count=len(fingerprints))
+    insert_fingerprint_arrays(np.full(len(hashes), song_id, dtype=np.int64), hashes, offsets, conn)
+
+@metrics.timed('db_write')
+def insert_fingerprint_arrays(song_ids, hashes, offsets, conn=None, recent=True):
+    """
+    Insere fingerprints a partir de arrays paralelos (song_id, hash, offset).
+    Aceita várias músicas de uma vez, o que permite lotes grandes na ingestão.
+    Com shards, cada faixa de hash vai para o seu arquivo (na mesma transação).
+    recent=False: não copia para fingerprints_recent (o índice já recebe as postings por outro caminho).
+    """
+    if conn is None:
+        # "with" faz commit no fim (ou rollback em caso de erro) na conexão da thread
+        with connection() as own:
+            return insert_fingerprint_arrays(song_ids, hashes, offsets, own, recent)
+    # Inserir em ordem de hash mantém as escritas locais na B-tree agrupada
+    order = np.lexsort((offsets, song_ids, hashes))
+    hashes, song_ids, offsets = hashes[order], song_ids[order], offsets[order]
+
+    shards = get_shards(conn)
+    tables = fingerprint_tables(conn)
+    if shards:
+        # Ordenado por hash => cada shard é uma fatia contígua
+        bounds = np.searchsorted(_shard_of(shards, hashes), np.arange(len(shards) + 1))
+    else:
+        bounds = [0, len(hashes)]
+
+    # Frequência de documento, antes de inserir: só conta os pares (hash, música) que
+    # ainda não estão no banco (ex: uma música já cadastrada gravada de novo não infla hash_stats)
+    if len(hashes):
+        new_pair = np.r_[True, (hashes[1:] != hashes[:-1]) | (song_ids[1:] != song_ids[:-1])]
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS pair_batch (hash INTEGER NOT NULL, song_id INTEGER NOT NULL)')
+        conn.execute('DELETE FROM temp.pair_batch')
+        conn.executemany('INSERT INTO temp.pair_batch (hash, song_id) VALUES (?, ?)',
+                         zip(hashes[new_pair].tolist(), song_ids[new_pair].tolist()))
+        # Cada verificação é uma busca pelo prefixo (hash, song_id) da chave primária
+        missing = ' AND '.join(f'NOT EXISTS (SELECT 1 FROM {table} f WHERE f.hash = p.hash AND f.song_id = p.song_id)'
+                               for table in tables)
+        conn.execute(f'INSERT INTO main.hash_stats (hash, songs) SELECT p.hash, COUNT(*) FROM temp.pair_batch p '
+                     f'WHERE {missing} GROUP BY p.hash '
+                     f'ON CONFLICT (hash) DO UPDATE SET songs = songs + excluded.songs')
+    
+    for table, lo, hi in zip(tables, bounds[:-1], bounds[1:]):
+        data = zip(hashes[lo:hi].tolist(), song_ids[lo:hi].tolist(), offsets[lo:hi].tolist())
+        conn.executemany(f'INSERT OR IGNORE INTO {table} (hash, song_id, offset) VALUES (?, ?, ?)', data)
+    
+    # Cópia agrupada por música para o índice em memória incorporar só as novas
+    if recent:
+        order = np.lexsort((offsets, hashes, song_ids))
+        conn.executemany('INSERT OR IGNORE INTO main.fingerprints_recent (song_id, hash, offset) VALUES (?, ?, ?)',
+                         zip(song_ids[order].tolist(), hashes[order].tolist(), offsets[order].tolist()))
+
+def restore_catalog(ids, names, file_hashes, song_ids, hashes, offsets, stoplist, last_id, legacy_id=0):
+    """
+    Restaura um catálogo inteiro (ex: de um snapshot) em um banco vazio, em uma
+    transação: músicas com os mesmos ids, fingerprints, hash_stats e stop-list.
+    last_id: próximo id do AUTOINCREMENT (mesma sequência da origem).
+    legacy_id: músicas com id até este podem ter o file_hash antigo (ver has_legacy_file_hashes).
+    """
+    with connection() as conn:
+        conn.executemany('INSERT INTO songs (id, name, file_hash) VALUES (?, ?, ?)',
+                         zip(np.asarray(ids).tolist(), names, file_hashes))
+        if conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'songs'", (int(last_id),)).rowcount == 0:
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('songs', ?)", (int(last_id),))
+        insert_fingerprint_arrays(np.asarray(song_ids, dtype=np.int64), np.asarray(hashes, dtype=np.int64),
+                                  np.asarray(offsets, dtype=np.int64), conn, recent=False)
+        conn.executemany('INSERT OR IGNORE INTO stoplist (hash) VALUES (?)',
+                         ((h,) for h in np.asarray(stoplist).tolist()))
+        conn.execute("INSERT INTO catalog_meta (key, value) VALUES ('legacy_file_hash', ?) "
+                     "ON CONFLICT (key) DO UPDATE SET value = MAX(value, excluded.value)", (int(legacy_id),))
+
+def stoplist_threshold(n_songs, fraction=STOPLIST_FRACTION, min_songs=STOPLIST_MIN_SONGS):
+    """
+    Hashes presentes em mais músicas que isso entram na stop-list.
+    """
+    return max(min_songs, int(np.ceil(fraction * n_songs)))
+
+def build_stoplist(fraction=STOPLIST_FRACTION, min_songs=STOPLIST_MIN_SONGS, hashes=None):
+    """
+    Refaz a stop-list a partir de hash_stats (chamado ao fim da ingestão).
+    Com 'hashes' (ex: os de uma música recém-cadastrada), só esses são verificados
+    e acrescentados, sem percorrer hash_stats inteira; nada sai da lista.
+    Retorna (nº de hashes na stop-list, limite de músicas usado).
+    """
+    with connection() as conn:
+        n_songs = conn.execute('SELECT COUNT(*) FROM songs').fetchone()[0]
+        threshold = stoplist_threshold(n_songs, fraction, min_songs)
+        if hashes is None:
+            conn.execute('DELETE FROM stoplist')
+            conn.execute('INSERT INTO stoplist SELECT hash FROM hash_stats WHERE songs > ?', (threshold,))
+        else:
+            conn.executemany('INSERT OR IGNORE INTO stoplist SELECT hash FROM hash_stats WHERE hash = ? AND songs > ?',
+                             ((h, threshold) for h in fingerprinting.unique_hashes(hashes).tolist()))
+        n_stopped = conn.execute('SELECT COUNT(*) FROM stoplist').fetchone()[0]
+    return n_stopped, threshold
+
+def get_stoplist():
+    """
+    Hashes da stop-list, como array int64 ordenado.
+    """
+    rows = connection().execute('SELECT hash FROM stoplist ORDER BY hash').fetchall()
+    return np.array([r[0] for r in rows], dtype=np.int64)
+
+def get_document_frequencies(hashes):
+    """
+    Em quantas músicas cada hash aparece (0 se não estiver no catálogo), na ordem de 'hashes'.
+    """
+    hashes = np.asarray(hashes, dtype=np.int64)
+    uniq = fingerprinting.unique_hashes(hashes)
+    CHUNK_SIZE = 900
+    placeholders = ','.join('?' for _ in range(CHUNK_SIZE))
+    query = f'SELECT hash, songs FROM hash_stats WHERE hash IN ({placeholders})'
+
+    c = connection().cursor()
+    c.row_factory = None
+    rows = []
+    for i in range(0, len(uniq), CHUNK_SIZE):
+        chunk = uniq[i:i + CHUNK_SIZE].tolist()
+        rows.extend(c.execute(query, chunk + [-1] * (CHUNK_SIZE - len(chunk))).fetchall())
+
+    df = np.zeros(len(uniq), dtype=np.int64)
+    if rows:
+        found = np.array(rows, dtype=np.int64)
+        df[np.searchsorted(uniq, found[:, 0])] = found[:, 1]
+    return df[np.searchsorted(uniq, hashes)]
+
+def rebuild_hash_stats():
+    """
+    Recalcula hash_stats do zero a partir dos fingerprints (ex: após remoções).
+    """
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT)
+    _ensure_schema()
+    _fill_hash_stats(conn)
     conn.commit()
     conn.close()
 
-def get_matches(hashes):
-    conn = get_db_connection()
-    c = conn.cursor()
+def find_song_by_file_hash(file_hash):
+    row = connection().execute('SELECT id FROM songs WHERE file_hash = ?', (file_hash,)).fetchone()
+    return row['id'] if row else None
+
+def get_file_hashes():
+    """
+    Retorna o conjunto de file_hash já cadastrados (para pular arquivos repetidos).
+    """
+    rows = connection().execute('SELECT file_hash FROM songs WHERE file_hash IS NOT NULL').fetchall()
+    return {r['file_hash'] for r in rows}
+
+def get_song_names():
+    """
+    Retorna {song_id: nome} para todo o catálogo.
+    """
+    rows = connection().execute('SELECT id, name FROM songs').fetchall()
+    return {r['id']: r['name'] for r in rows}
+
+def get_song_name(song_id, default="Desconhecida"):
+    row = connection().execute('SELECT name FROM songs WHERE id = ?', (song_id,)).fetchone()
+    return row['name'] if row else default
+
+def _query_matches(conn, hashes):
     # SQLite tem limite de variaveis em uma query (geralmente 999 ou 32766)
     # Por segurança, vamos processar em chunks de 900
     CHUNK_SIZE = 900
     results = []
     
+    # Sempre CHUNK_SIZE parâmetros: o texto da query não muda e o statement
+    # preparado é reaproveitado (o último chunk é completado com -1, que não existe)
+    placeholders = ',' .join('?' for _ in range(CHUNK_SIZE))
+    query = f"""
+        SELECT song_id, offset, hash 
+        FROM fingerprints 
+        WHERE hash IN ({placeholders})
+    """
+    
+    c = conn.cursor()
+    c.row_factory = None
     for i in range(0, len(hashes), CHUNK_SIZE):
         chunk = hashes[i:i + CHUNK_SIZE]
-        placeholders = ',' .join('?' for _ in chunk)
-        
-        query = f"""
-            SELECT song_id, offset, hash 
-            FROM fingerprints 
-            WHERE hash IN ({placeholders})
-        """
-        
-        c.execute(query, chunk)
-        results.extend(c.fetchall())
+        chunk = chunk + [-1] * (CHUNK_SIZE - len(chunk))
+        results.extend(c.execute(query, chunk).fetchall())
+    return results
+
+def _query_file(path, hashes):
+    return _query_matches(connection(path), hashes)
 
+def _get_executor():
+    global _shard_executor, _shard_executor_pid
+    # Threads não sobrevivem a um fork: cada processo cria o seu pool
+    if _shard_executor is None or _shard_executor_pid != os.getpid():
+        from concurrent.futures import ThreadPoolExecutor   # Só com shards
+        _shard_executor = ThreadPoolExecutor(MAX_SHARDS, thread_name_prefix='shard')
+        _shard_executor_pid = os.getpid()
+    return _shard_executor
+
+def get_matches(hashes):
+    """
+    Retorna [(song_id, offset, hash)] para os hashes dados, em ordem de hash.
+    Com shards, cada shard recebe só os hashes da sua faixa e as consultas
+    rodam em paralelo (o SQLite libera o GIL durante a busca).
+    """
+    # Hashes repetidos na amostra retornam as mesmas linhas: buscamos cada um uma vez só
+    hashes = fingerprinting.unique_hashes(hashes)
+    
+    shards = get_shards()
+    if not shards:
+        return _query_matches(connection(), hashes.tolist())
+    
+    shard_idx = _shard_of(shards, hashes)
+    jobs = [(path, hashes[shard_idx == i].tolist()) for i, (_, path) in enumerate(shards)]
+    jobs = [job for job in jobs if job[1]]
+    if len(jobs) == 1:
+        return _query_file(*jobs[0])
+    
+    results = _get_executor().map(lambda job: _query_file(*job), jobs)
+    return [row for rows in results for row in rows]
+
+def _balanced_bounds(histogram, n_shards):
+    """
+    Início (hash_min) de cada shard, a partir de {faixa alta do hash: contagem}:
+    cortes nos quantis da distribuição atual, para shards de tamanho parecido.
+    """
+    shift = fingerprinting.HASH_FREQ_BITS + fingerprinting.HASH_DELTA_BITS
+    if not histogram:
+        # Banco vazio: faixas iguais de f1
+        step = (1 << fingerprinting.HASH_FREQ_BITS) / n_shards
+        return [int(i * step) << shift for i in range(n_shards)]
+    
+    buckets = np.array(sorted(histogram), dtype=np.int64)
+    cumulative = np.cumsum([histogram[b] for b in buckets])
+    targets = cumulative[-1] * np.arange(1, n_shards) / n_shards
+    cuts = buckets[np.minimum(np.searchsorted(cumulative, targets, side='right'), len(buckets) - 1)]
+    return [0] + sorted(set(int(b) << shift for b in cuts) - {0})
+
+def reshard(n_shards):
+    """
+    Redistribui os fingerprints em n_shards arquivos por faixa de hash
+    (n_shards = 1 volta ao banco único). Também migra um banco único existente.
+
+    Os novos shards são escritos em db/shards/<geração>/ sem tocar nos atuais;
+    a troca do layout é uma única transação no banco principal, e só depois
+    os arquivos antigos são apagados. Retorna o número de fingerprints por shard.
+    """
+    if not 1 <= n_shards <= MAX_SHARDS:
+        raise ValueError(f"Número de shards deve estar entre 1 e {MAX_SHARDS}")
+    
+    base = os.path.dirname(DB_PATH)
+    old_shards = get_shards()
+    old_files = [path for _, path in old_shards] or [DB_PATH]
+    _remove_stale_shards(base, old_shards)
+    
+    # Distribuição atual pela faixa alta do hash (f1)
+    shift = fingerprinting.HASH_FREQ_BITS + fingerprinting.HASH_DELTA_BITS
+    histogram = {}
+    for path in old_files:
+        conn = sqlite3.connect(path)
+        for bucket, count in conn.execute(f'SELECT hash >> {shift}, COUNT(*) FROM fingerprints GROUP BY 1'):
+            histogram[bucket] = histogram.get(bucket, 0) + count
+        conn.close()
+    
+    if n_shards == 1:
+        new_files = [DB_PATH]
+        bounds = [0]
+    else:
+        bounds = _balanced_bounds(histogram, n_shards)
+        root = os.path.join(base, SHARDS_DIR)
+        os.makedirs(root, exist_ok=True)
+        generation = tempfile.mkdtemp(prefix=time.strftime('%Y%m%d-%H%M%S-'), dir=root)
+        new_files = [os.path.join(generation, f'shard_{i:03d}.db') for i in range(len(bounds))]
+    
+    if new_files != old_files:
+        limits = bounds[1:] + [None]
+        for path, lo, hi in zip(new_files, bounds, limits):
+            _copy_range(path, old_files, lo, hi)
+    
+    # Troca o layout atomicamente
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT)
+    conn.execute('BEGIN')
+    conn.execute('DELETE FROM shards')
+    if n_shards > 1:
+        conn.executemany('INSERT INTO shards (hash_min, path) VALUES (?, ?)',
+                         [(lo, os.path.relpath(path, base)) for lo, path in zip(bounds, new_files)])
+        if not old_shards:
+            conn.execute('DELETE FROM fingerprints')
+    conn.commit()
+    
+    # Conexões abertas ainda apontam para o layout antigo
+    global _generation
+    _generation += 1
+    close_connections()
+    
+    if old_shards and new_files != old_files:
+        for path in old_files:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+        _remove_stale_shards(base, get_shards(conn))
+    elif not old_shards and n_shards > 1:
+        # Devolve ao sistema as páginas da tabela que saiu do banco principal
+        conn.execute('VACUUM')
     conn.close()
     
-    return [(r['song_id'], r['offset'], r['hash']) for r in results]
+    sizes = []
+    for path in new_files:
+        conn = sqlite3.connect(path)
+        sizes.append(conn.execute('SELECT COUNT(*) FROM fingerprints').fetchone()[0])
+        conn.close()
+    return sizes
+
+def _copy_range(path, sources, lo, hi):
+    """Copia os fingerprints com lo <= hash < hi de cada banco de origem para 'path'."""
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+    _apply_pragmas(conn)
+    _create_fingerprints_table(conn.cursor())
+    for source in sources:
+        if os.path.abspath(source) == os.path.abspath(path):
+            continue
+        conn.execute('ATTACH DATABASE ? AS src', (source,))
+        where = 'hash >= ?' + ('' if hi is None else ' AND hash < ?')
+        params = (lo,) if hi is None else (lo, hi)
+        conn.execute(f'INSERT OR IGNORE INTO main.fingerprints SELECT hash, song_id, offset '
+                     f'FROM src.fingerprints WHERE {where}', params)
+        conn.commit()
+        conn.execute('DETACH DATABASE src')
+    conn.close()
 
-if not os.path.exists(DB_PATH):
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    init_db()
-else:
-    init_db()
+def _remove_stale_shards(base, shards):
+    """Apaga gerações de shards que não fazem parte do layout (ex: reshard interrompido)."""
+    root = os.path.join(base, SHARDS_DIR)
+    if not os.path.isdir(root):
+        return
+    in_use = {os.path.dirname(os.path.abspath(path)) for _, path in shards}
+    for name in os.listdir(root):
+        generation = os.path.abspath(os.path.join(root, name))
+        if generation not in in_use:
+            shutil.rmtree(generation, ignore_errors=True)
@@ -1,5 +1,6 @@
 import numpy as np
-from scipy.ndimage import maximum_filter
+
+import metrics
 
 # Constantes para ajuste fino do algoritmo
 PEAK_NEIGHBORHOOD_SIZE = 20  # Tamanho da vizinhança para definir um pico local
@@ -10,67 +11,339 @@ FINGERPRINT_REDUCTION = 20   # Se tivermos muitos picos, podemos limitar (fan-ou
 MIN_HASH_TIME_DELTA = 0
 MAX_HASH_TIME_DELTA = 200    # Janela de tempo para procurar pares
 
+# Layout do hash empacotado em um inteiro: [ f1 | f2 | dt ]
+HASH_FREQ_BITS = 12          # Suporta até 4096 bins de frequência (WINDOW_SIZE 4096 -> 2049 bins)
+HASH_DELTA_BITS = 8          # Suporta MAX_HASH_TIME_DELTA até 255 frames
+
+# Faixas de frequência (em bins; ~10.8 Hz por bin com WINDOW_SIZE 4096 a 44.1kHz)
+# usadas pelo controle de densidade max_per_band: ~0-250-500-1k-2k-4k Hz-Nyquist
+PEAK_BANDS = (0, 24, 48, 96, 192, 384, 4096)
+
+def _sliding_max(arr, size, axis):
+    """
+    Máximo em janelas de 'size' ao longo de 'axis', centrado como o maximum_filter
+    do scipy ([i - size//2, i + size//2 - 1] para size par). Janelas dobram de
+    tamanho a cada passo (1, 2, 4, 8, 16) e a última junta duas sobrepostas:
+    poucas operações vetorizadas em vez do filtro genérico.
+    """
+    arr = np.moveaxis(arr, axis, 0)
+    n = arr.shape[0]
+    # Fora da borda vale -inf: dá o mesmo resultado do modo 'reflect' do scipy,
+    # porque os valores refletidos já estão dentro da janela
+    buf = np.full((n + size - 1,) + arr.shape[1:], -np.inf, dtype=arr.dtype)
+    buf[size // 2:size // 2 + n] = arr
+    width, end = 1, len(buf)
+    while width * 2 <= size:
+        np.maximum(buf[:end - width], buf[width:end], out=buf[:end - width])
+        end -= width
+        width *= 2
+    if width < size:
+        np.maximum(buf[:n], buf[size - width:size - width + n], out=buf[:n])
+    return np.moveaxis(buf[:n], 0, axis)
+
+def _local_maxima(arr2d):
+    """
+    Máscara dos picos: máximo da vizinhança PEAK_NEIGHBORHOOD_SIZE x PEAK_NEIGHBORHOOD_SIZE
+    e acima de MIN_AMPLITUDE. O filtro é separável (frequência, depois tempo).
+    """
+    size = PEAK_NEIGHBORHOOD_SIZE
+    filtered = _sliding_max(_sliding_max(arr2d, size, 0), size, 1)
+    mask = filtered == arr2d
+    mask &= arr2d > MIN_AMPLITUDE
+    return mask
+
+def _keep_strongest(groups, amplitudes, k):
+    """
+    Máscara dos k picos de maior amplitude de cada grupo (empate: ordem original).
+    """
+    order = np.lexsort((-amplitudes, groups))
+    sorted_groups = groups[order]
+    starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    keep = np.zeros(len(order), dtype=bool)
+    keep[order[rank < k]] = True
+    return keep
+
+def limit_density(times, freqs, amplitudes, max_per_frame=None, max_per_band=None, bands=PEAK_BANDS):
+    """
+    Controle de densidade da constelação: mantém só os max_per_frame picos mais
+    fortes de cada frame e/ou os max_per_band mais fortes de cada (frame, faixa de 'bands').
+    Menos picos = menos hashes por segundo (banco menor, busca mais rápida).
+    """
+    keep = np.ones(len(times), dtype=bool)
+    if max_per_frame is not None:
+        keep &= _keep_strongest(times, amplitudes, max_per_frame)
+    if max_per_band is not None:
+        band = np.searchsorted(bands, freqs, side='right') - 1
+        keep &= _keep_strongest(times * len(bands) + band, amplitudes, max_per_band)
+    return times[keep], freqs[keep]
+
+@metrics.timed('peaks')
+def find_peaks(arr2d, max_per_frame=None, max_per_band=None, bands=PEAK_BANDS):
+    """
+    Picos locais do espectrograma (n_freqs, n_frames), em float32.
+    Retorna arrays int64 (tempos, frequências) ordenados por tempo e depois frequência.
+    max_per_frame / max_per_band: controle de densidade opcional (ver limit_density).
+    """
+    arr2d = np.asarray(arr2d, dtype=np.float32)
+    freqs, times = np.nonzero(_local_maxima(arr2d))
+    # nonzero vem ordenado por frequência; a ordenação estável por tempo mantém a frequência em ordem
+    order = np.argsort(times, kind='stable')
+    times, freqs = times[order].astype(np.int64), freqs[order].astype(np.int64)
+
+    if max_per_frame is not None or max_per_band is not None:
+        times, freqs = limit_density(times, freqs, arr2d[freqs, times], max_per_frame, max_per_band, bands)
+    metrics.count('peaks', len(times))
+    return times, freqs
+
 def get_2d_peaks(arr2d, plot=False):
     """
     Encontra picos locais em um array 2D (espectrograma).
-    Retorna uma lista de tuplas (tempo_idx, frequencia_idx)
-    """
-    # 1. Filtro de máximo local
-    # Cria uma máscara onde cada ponto é True se for o maior na vizinhança
-    neighborhood = np.ones((PEAK_NEIGHBORHOOD_SIZE, PEAK_NEIGHBORHOOD_SIZE))
-    local_max = maximum_filter(arr2d, footprint=neighborhood) == arr2d
-    
-    # 2. Filtro de amplitude mínima (background noise)
-    background = (arr2d > MIN_AMPLITUDE)
-    
-    # Interseção dos dois filtros
-    eroded_background = background & local_max
-    
-    # Obtém índices onde é True
-    # time_indices corresponde ao eixo 1 (tempo) do espectrograma do scipy se Sxx for (freq, tempo)
-    # Mas scipy.signal.spectrogram retorna Sxx como (n_freqs, n_times).
-    # Então indices[0] é freq, indices[1] é tempo.
-    detected_peaks = np.where(eroded_background)
-    
-    freq_indices = detected_peaks[0]
-    time_indices = detected_peaks[1]
-    
-    # Retorna lista de (t, f)
-    # Importante manter a ordem para iterar no tempo
-    peaks = list(zip(time_indices, freq_indices))
-    peaks.sort() # Ordena pelo tempo
-    
-    return peaks
-
-def generate_fingerprints(peaks):
+    Retorna uma lista de tuplas (tempo_idx, frequencia_idx), ordenada pelo tempo.
+    Use find_peaks para obter arrays direto, sem a lista.
+    """
+    times, freqs = find_peaks(arr2d)
+    return list(zip(times.tolist(), freqs.tolist()))
+
+class PeakStream:
+    """
+    Detecção de picos incremental sobre blocos de colunas do espectrograma.
+
+    Um frame só é analisado quando os vizinhos à direita (metade da vizinhança
+    de PEAK_NEIGHBORHOOD_SIZE) já chegaram; os frames à esquerda necessários
+    ficam guardados. O resultado é idêntico ao de find_peaks no espectrograma inteiro
+    (inclusive com max_per_frame / max_per_band, que só dependem do próprio frame).
+    """
+    # Janela do filtro de máximo de tamanho par: cobre [i - size//2, i + size//2 - 1]
+    LEFT = PEAK_NEIGHBORHOOD_SIZE // 2
+    RIGHT = PEAK_NEIGHBORHOOD_SIZE - PEAK_NEIGHBORHOOD_SIZE // 2 - 1
+
+    def __init__(self, max_per_frame=None, max_per_band=None):
+        self.max_per_frame = max_per_frame
+        self.max_per_band = max_per_band
+        self.columns = None
+        self.base = 0        # Índice global da primeira coluna guardada
+        self.done = 0        # Próximo frame ainda não analisado
+        self.total = 0       # Frames recebidos
+
+    def push(self, Sxx_block):
+        """
+        Recebe novas colunas (n_freqs, n_frames) e retorna os picos já definitivos
+        como arrays (tempos, frequências), ordenados por tempo.
+        """
+        if self.columns is None:
+            self.columns = Sxx_block
+        else:
+            self.columns = np.concatenate([self.columns, Sxx_block], axis=1)
+        self.total += Sxx_block.shape[1]
+        return self._emit(self.total - self.RIGHT)
+
+    def flush(self):
+        """
+        Fim do sinal: analisa os frames restantes (borda direita igual ao modo batch).
+        """
+        return self._emit(self.total)
+
+    @metrics.timed('peaks')
+    def _emit(self, end):
+        if self.columns is None or end <= self.done:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        arr2d = np.asarray(self.columns, dtype=np.float32)
+        detected = _local_maxima(arr2d)
+
+        # Só as colunas [done, end) ficam definitivas nesta chamada
+        window = detected[:, self.done - self.base:end - self.base]
+        freqs, times = np.nonzero(window)
+        order = np.argsort(times, kind='stable')
+        local_times, freqs = times[order], freqs[order].astype(np.int64)
+        times = (local_times + self.done).astype(np.int64)
+        if self.max_per_frame is not None or self.max_per_band is not None:
+            amplitudes = arr2d[freqs, local_times + (self.done - self.base)]
+            times, freqs = limit_density(times, freqs, amplitudes, self.max_per_frame, self.max_per_band)
+
+        self.done = end
+        keep_from = max(end - self.LEFT, self.base)
+        self.columns = self.columns[:, keep_from - self.base:]
+        self.base = keep_from
+        metrics.count('peaks', len(times))
+        return times, freqs
+
+def stream_peaks(sxx_blocks):
+    """
+    Consome blocos do espectrograma (ex: audio_processing.stream_spectrogram)
+    e gera arrays (tempos, frequências) de picos com o índice de frame absoluto.
+    """
+    stream = PeakStream()
+    for block in sxx_blocks:
+        times, freqs = stream.push(block)
+        if len(times):
+            yield times, freqs
+    times, freqs = stream.flush()
+    if len(times):
+        yield times, freqs
+
+def peaks_to_arrays(peaks):
+    """
+    Converte a lista de picos (t, f) em dois arrays contíguos (tempos, frequências).
+    A lista já vem ordenada por tempo de get_2d_peaks.
+    """
+    if len(peaks) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    arr = np.asarray(peaks, dtype=np.int64).reshape(-1, 2)
+    return np.ascontiguousarray(arr[:, 0]), np.ascontiguousarray(arr[:, 1])
+
+def pack_hashes(f1, f2, dt):
+    """
+    Empacota (f1, f2, dt) em um único inteiro: f1 | f2 | dt em campos de bits.
+    Aceita escalares ou arrays NumPy.
+    """
+    f1 = np.asarray(f1, dtype=np.int64)
+    f2 = np.asarray(f2, dtype=np.int64)
+    dt = np.asarray(dt, dtype=np.int64)
+
+    max_freq = (1 << HASH_FREQ_BITS) - 1
+    max_delta = (1 << HASH_DELTA_BITS) - 1
+    if f1.size and (f1.max() > max_freq or f2.max() > max_freq or dt.max() > max_delta):
+        raise ValueError("Valores de hash excedem os campos de bits configurados")
+
+    return (f1 << (HASH_FREQ_BITS + HASH_DELTA_BITS)) | (f2 << HASH_DELTA_BITS) | dt
+
+def unpack_hashes(hashes):
+    """
+    Operação inversa de pack_hashes. Retorna (f1, f2, dt).
+    """
+    hashes = np.asarray(hashes, dtype=np.int64)
+    dt = hashes & ((1 << HASH_DELTA_BITS) - 1)
+    f2 = (hashes >> HASH_DELTA_BITS) & ((1 << HASH_FREQ_BITS) - 1)
+    f1 = hashes >> (HASH_FREQ_BITS + HASH_DELTA_BITS)
+    return f1, f2, dt
+
+def unique_hashes(hashes):
+    """
+    Hashes distintos em ordem crescente (int64), como np.unique(hashes).
+    Ordenar e comparar vizinhos é muito mais rápido que o np.unique do NumPy 2.x
+    (tabela hash) para muitos hashes espalhados em 32 bits: 0.4s vs. 20s para 16M.
+    """
+    hashes = np.sort(np.asarray(hashes, dtype=np.int64), axis=None)
+    if len(hashes) < 2:
+        return hashes
+    keep = np.empty(len(hashes), dtype=bool)
+    keep[0] = True
+    np.not_equal(hashes[1:], hashes[:-1], out=keep[1:])
+    return hashes[keep]
+
+def generate_pairs(peak_times, peak_freqs, fan_out=None, n_anchors=None):
+    """
+    Gera todos os pares (âncora, alvo) da Target Zone de forma vetorizada.
+
+    peak_times / peak_freqs devem estar ordenados por tempo (como em get_2d_peaks).
+    Para cada âncora i, os alvos são os picos j > i com
+    MIN_HASH_TIME_DELTA <= t[j] - t[i] <= MAX_HASH_TIME_DELTA, encontrados com searchsorted.
+    fan_out limita o número de alvos por âncora (None = sem limite).
+    n_anchors restringe as âncoras aos primeiros n picos (os demais só servem de alvo).
+
+    Retorna (anchor_idx, target_idx) na mesma ordem do laço aninhado original.
+    """
+    peak_times = np.asarray(peak_times, dtype=np.int64)
+    n = len(peak_times)
+    if n == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+
+    # Janela [start, end) de alvos para cada âncora
+    anchor_times = peak_times if n_anchors is None else peak_times[:n_anchors]
+    idx = np.arange(len(anchor_times), dtype=np.int64)
+    start = np.searchsorted(peak_times, anchor_times + MIN_HASH_TIME_DELTA, side='left')
+    start = np.maximum(start, idx + 1)
+    end = np.searchsorted(peak_times, anchor_times + MAX_HASH_TIME_DELTA, side='right')
+
+    counts = np.maximum(end - start, 0)
+    if fan_out is not None:
+        counts = np.minimum(counts, fan_out)
+
+    total = int(counts.sum())
+    anchor_idx = np.repeat(idx, counts)
+    # Posição de cada par dentro do bloco da sua âncora
+    block_starts = np.cumsum(counts) - counts
+    within = np.arange(total, dtype=np.int64) - np.repeat(block_starts, counts)
+    target_idx = np.repeat(start, counts) + within
+
+    return anchor_idx, target_idx
+
+def generate_pairs_by_target(peak_times, first_target):
+    """
+    Os mesmos pares de generate_pairs (sem fan_out), mas agrupados pelo alvo:
+    só os pares cujo alvo é um dos picos a partir de first_target.
+    Permite emitir um par assim que o alvo é conhecido, sem esperar a Target Zone
+    inteira da âncora.
+
+    Retorna (anchor_idx, target_idx).
+    """
+    peak_times = np.asarray(peak_times, dtype=np.int64)
+    idx = np.arange(first_target, len(peak_times), dtype=np.int64)
+    target_times = peak_times[first_target:]
+
+    # Âncoras [start, end) de cada alvo: i < j e MIN <= t[j] - t[i] <= MAX
+    start = np.searchsorted(peak_times, target_times - MAX_HASH_TIME_DELTA, side='left')
+    end = np.searchsorted(peak_times, target_times - MIN_HASH_TIME_DELTA, side='right')
+    end = np.minimum(end, idx)
+
+    counts = np.maximum(end - start, 0)
+    total = int(counts.sum())
+    target_idx = np.repeat(idx, counts)
+    block_starts = np.cumsum(counts) - counts
+    within = np.arange(total, dtype=np.int64) - np.repeat(block_starts, counts)
+    anchor_idx = np.repeat(start, counts) + within
+
+    return anchor_idx, target_idx
+
+@metrics.timed('hashing')
+def generate_fingerprint_arrays(peak_times, peak_freqs, fan_out=None, n_anchors=None, first_target=None):
+    """
+    Versão em lote de generate_fingerprints.
+    Retorna (hashes, offsets): hashes empacotados (int64, ver pack_hashes)
+    e o tempo da âncora de cada par, como arrays contíguos.
+    Com first_target, gera só os pares cujo alvo é >= first_target (ver generate_pairs_by_target).
+    """
+    peak_times = np.asarray(peak_times, dtype=np.int64)
+    peak_freqs = np.asarray(peak_freqs, dtype=np.int64)
+
+    if first_target is not None:
+        anchor_idx, target_idx = generate_pairs_by_target(peak_times, first_target)
+    else:
+        anchor_idx, target_idx = generate_pairs(peak_times, peak_freqs, fan_out, n_anchors)
+
+    t1 = peak_times[anchor_idx]
+    hashes = pack_hashes(peak_freqs[anchor_idx], peak_freqs[target_idx], peak_times[target_idx] - t1)
+    metrics.count('hashes', len(hashes))
+
+    return hashes, t1
+
+def format_hash(h):
+    """
+    Representação legível de um hash empacotado: "f1|f2|dt" (útil para debug).
+    """
+    f1, f2, dt = unpack_hashes(h)
+    return f"{int(f1)}|{int(f2)}|{int(dt)}"
+
+def parse_legacy_hash(text):
+    """
+    Converte um hash no formato antigo em string ("f1|f2|dt") para o inteiro empacotado.
+    """
+    f1, f2, dt = (int(v) for v in text.split('|'))
+    return int(pack_hashes(f1, f2, dt))
+
+def generate_fingerprints(peaks, fan_out=None):
     """
     Gera hashes a partir da lista de picos (constellation map).
     Usa a estratégia de 'Anchor Point' e 'Target Zone'.
-    
-    Retorna lista de (hash_string, time_offset_anchor)
-    """
-    fingerprints = []
-    
-    # Itera sobre todos os picos para usá-los como âncora
-    for i in range(len(peaks)):
-        t1, f1 = peaks[i]
-        
-        # Procura picos alvo na "Target Zone" (janela à frente no tempo)
-        for j in range(i + 1, len(peaks)):
-            t2, f2 = peaks[j]
-            t_delta = t2 - t1
-            
-            if t_delta < MIN_HASH_TIME_DELTA:
-                continue
-            if t_delta > MAX_HASH_TIME_DELTA:
-                break # Como está ordenado, se passou do max, todos os próximos também passarão
-            
-            # Gera o Hash
-            # O hash combina: Frequência Âncora | Frequência Alvo | Delta Tempo
-            # Formato simples de string ou bytes. Usar string é mais fácil para debug e SQLite.
-            # Ex: "f1|f2|dt" -> "102|500|25"
-            h = f"{f1}|{f2}|{t_delta}"
-            
-            fingerprints.append((h, int(t1)))
-            
-    return fingerprints
+    fan_out limita os alvos por âncora (ex: FINGERPRINT_REDUCTION); None = sem limite.
+
+    Retorna lista de (hash, time_offset_anchor), com o hash empacotado
+    em um inteiro (f1 | f2 | dt, ver pack_hashes).
+    """
+    peak_times, peak_freqs = peaks_to_arrays(peaks)
+    hashes, offsets = generate_fingerprint_arrays(peak_times, peak_freqs, fan_out)
+
+    return list(zip(hashes.tolist(), offsets.tolist()))
@@ -1,25 +1,38 @@
 import customtkinter as ctk
 from tkinter import filedialog, messagebox
 import threading
+import argparse
 import os
 import sys
 
+import numpy as np
+
 # Adiciona diretório src
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 import database as db
-import audio_processing as audio
-import fingerprinting
+import cache
 import recorder
-from collections import defaultdict
+import ingest
+import index
+import matcher
+import metrics
+import progressive
+
+# Gravação do microfone termina assim que a música é reconhecida (no máximo este tempo)
+LISTEN_MAX_SECONDS = 10
 
 ctk.set_appearance_mode("Dark")
 ctk.set_default_color_theme("blue")
 
 class ShazamApp(ctk.CTk):
-    def __init__(self):
+    def __init__(self, backend='sqlite', profile=False):
         super().__init__()
 
+        self.profile = profile
+        self.backend_kind = backend
+        self.backend = None # Aberto na primeira busca (o índice pode levar um tempo para construir)
+
         self.title("Shazam-Like Project")
         self.geometry("400x500")
         
@@ -58,89 +71,74 @@ class ShazamApp(ctk.CTk):
         self.btn_add.pack(pady=10, side="bottom")
 
     def start_listening_thread(self):
-        self.label_status.configure(text="Gravando (5s)...", text_color="orange")
+        self.label_status.configure(text="Ouvindo...", text_color="orange")
         self.label_result.configure(text="---")
         self.btn_listen.configure(state="disabled")
         
         # Roda em thread para não travar a GUI
-        threading.Thread(target=self.run_listening_process).start()
+        threading.Thread(target=self.profiled, args=("ouvir", self.run_listening_process)).start()
 
     def run_listening_process(self):
-        temp_file = "data/temp_mic.wav"
-        success = recorder.record_audio(temp_file, duration=5)
-        
-        if success:
-            self.run_recognition(temp_file)
-        else:
-            self.label_status.configure(text="Erro na gravação!", text_color="red")
-            self.btn_listen.configure(state="normal")
+        # Reconhece enquanto grava: para no primeiro resultado confiável
+        try:
+            chunks = recorder.stream_microphone(max_seconds=LISTEN_MAX_SECONDS)
+            result = progressive.recognize_progressive(chunks, self.get_backend())
+            self.show_result(result)
+        except Exception as e:
+            print(f"Erro na gravação: {e}")
+            self.update_ui_result("Erro na gravação!", None)
 
     def recognize_file_dialog(self):
         filename = filedialog.askopenfilename(filetypes=[("Audio", "*.wav *.mp3")])
         if filename:
             self.label_status.configure(text="Processando arquivo...", text_color="yellow")
-            threading.Thread(target=self.run_recognition, args=(filename,)).start()
+            threading.Thread(target=self.profiled, args=("arquivo", self.run_recognition, filename)).start()
 
     def run_recognition(self, filepath):
         # Chama a lógica de backend (similar ao main.py)
         # Atenção: Isso roda na Thread secundária
         
         try:
-            samples = audio.load_audio_file(filepath)
-            if samples is None: raise Exception("Falha ao ler áudio")
-
-            f, t, Sxx = audio.generate_spectrogram(samples)
-            peaks = fingerprinting.get_2d_peaks(Sxx)
-            fingerprints = fingerprinting.generate_fingerprints(peaks)
-
-            if not fingerprints:
-                self.update_ui_result("Sem detalhes suficientes.", None)
-                return
-
-            hashes_to_search = [fp[0] for fp in fingerprints]
-            matches_db = db.get_matches(hashes_to_search)
-
-            # Lógica de Alinhamento
-            sample_hash_offsets = defaultdict(list)
-            for h, offset in fingerprints:
-                sample_hash_offsets[h].append(offset)
-            
-            song_scores = defaultdict(lambda: defaultdict(int))
-            for song_id, db_offset, h in matches_db:
-                if h in sample_hash_offsets:
-                    for sample_offset in sample_hash_offsets[h]:
-                        diff = db_offset - sample_offset
-                        song_scores[song_id][diff] += 1
-            
-            best_song_id = None
-            best_count = 0
-            
-            for song_id, diffs_histogram in song_scores.items():
-                most_frequent_diff_count = max(diffs_histogram.values())
-                if most_frequent_diff_count > best_count:
-                    best_count = most_frequent_diff_count
-                    best_song_id = song_id
-            
-            # Limiar básico de confiança
-            if best_count > 10: # Valor arbitrário baixo para teste
-                # Buscar nome da musica (precisaria de query no DB, vamos adicionar rapidinho)
-                song_name = self.get_song_name(best_song_id)
-                self.update_ui_result(f"{song_name}", f"ID: {best_song_id}")
-            else:
-                self.update_ui_result("Não reconhecida.", None)
+            result = progressive.recognize_file(filepath, self.get_backend())
+            if result is None: raise Exception("Falha ao ler áudio")
+            self.show_result(result)
 
         except Exception as e:
             print(e)
             self.update_ui_result(f"Erro: {str(e)}", None)
-        
-    def get_song_name(self, song_id):
-        conn = db.get_db_connection()
-        c = conn.cursor()
-        c.execute("SELECT name FROM songs WHERE id = ?", (song_id,))
-        res = c.fetchone()
-        conn.close()
-        return res['name'] if res else "Desconhecida"
 
+    def profiled(self, label, func, *args):
+        # Com --profile, cada ação imprime no terminal o tempo por estágio e os contadores
+        if not self.profile:
+            return func(*args)
+        with metrics.Trace() as trace:
+            func(*args)
+        metrics.record_query(trace)
+        print(trace.report(f"Perfil ({label})"), file=sys.stderr)
+
+    def get_backend(self):
+        if self.backend is None:
+            self.backend = index.open_backend(self.backend_kind)
+        else:
+            self.backend.maybe_refresh()   # Músicas cadastradas/removidas por outro processo
+        return self.backend
+
+    def show_result(self, result):
+        if result.fingerprints == 0:
+            self.update_ui_result("Sem detalhes suficientes.", None)
+            return
+
+        # Mesmo critério de decisão do main.py (confiança calibrada)
+        candidates = result.candidates
+        if matcher.is_confident(candidates):
+            best = candidates[0]
+            # Nome da música (consulta na conexão reaproveitada da thread)
+            song_name = db.get_song_name(best.song_id)
+            self.update_ui_result(f"{song_name}",
+                                  f"ID: {best.song_id} ({result.seconds:.1f}s, confiança {best.confidence:.0%})")
+        else:
+            self.update_ui_result("Não reconhecida.", None)
+        
     def update_ui_result(self, main_text, sub_text):
         # Tkinter não é thread-safe, usar after se for critico, mas configure as vezes funciona
         # Correto é agendar no main loop
@@ -155,23 +153,41 @@ class ShazamApp(ctk.CTk):
         filename = filedialog.askopenfilename(filetypes=[("Audio", "*.wav *.mp3")])
         if filename:
             # Roda processo de adição em thread
-            threading.Thread(target=self.run_add_process, args=(filename,)).start()
+            threading.Thread(target=self.profiled, args=("adicionar", self.run_add_process, filename)).start()
 
     def run_add_process(self, filename):
         try:
-            samples = audio.load_audio_file(filename)
-            f, t, Sxx = audio.generate_spectrogram(samples)
-            peaks = fingerprinting.get_2d_peaks(Sxx)
-            fingerprints = fingerprinting.generate_fingerprints(peaks)
+            # Digest do áudio decodificado: se já estiver no banco, para antes do espectrograma
+            existing = {}
+            def is_known(file_hash):
+                existing['id'] = db.find_song_by_file_hash(file_hash)
+                return existing['id'] is not None
+            
+            result = ingest.analyze_file(filename, cache.FingerprintCache(), is_known, db.has_legacy_file_hashes())
+            if result is None:
+                raise ValueError(f"Não foi possível ler {filename}")
             
             song_name = os.path.basename(filename)
-            song_id = db.insert_song(song_name)
-            db.insert_fingerprints(song_id, fingerprints)
+            if result.source == 'known':
+                self.after(0, lambda: messagebox.showinfo(
+                    "Já cadastrada", f"'{song_name}' já está no catálogo (ID {existing['id']})."))
+                return
+            with db.connection() as conn:
+                song_id = db.insert_song(song_name, result.file_hash, conn=conn)
+                db.insert_fingerprint_arrays(np.full(len(result.hashes), song_id, dtype=np.int64),
+                                             result.hashes, result.offsets, conn=conn)
+            db.build_stoplist(hashes=result.hashes)
+            self.backend = None # Catálogo mudou: reabrir o backend na próxima busca
             
             self.after(0, lambda: messagebox.showinfo("Sucesso", f"Música '{song_name}' adicionada!"))
         except Exception as e:
             self.after(0, lambda: messagebox.showerror("Erro", str(e)))
 
 if __name__ == "__main__":
-    app = ShazamApp()
+    parser = argparse.ArgumentParser(description='Shazam-like GUI')
+    parser.add_argument('--backend', choices=index.BACKENDS, default='sqlite')
+    parser.add_argument('--profile', action='store_true', help='Imprimir o tempo por estágio de cada ação')
+    args = parser.parse_args()
+    metrics.enable(args.profile)
+    app = ShazamApp(backend=args.backend, profile=args.profile)
     app.mainloop()
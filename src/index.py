@@ -0,0 +1,735 @@
+import contextlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import database as db
+import fingerprinting
+import metrics
+
+try:
+    import fcntl
+except ImportError:   # Windows: sem lock entre processos (um escritor do índice por vez)
+    fcntl = None
+
+# Diretório padrão do índice em memória (arquivos .npy ao lado do shazam.db)
+INDEX_DIR = os.path.join(os.path.dirname(db.DB_PATH), 'index')
+
+BACKENDS = ('sqlite', 'index', 'snapshot')
+
+BUILD_BATCH_SIZE = 1000000
+
+# Versão do formato salvo (2: frequência de documento e stop-list junto das postings;
+# 3: catálogo em segmentos, ver SegmentedIndex)
+INDEX_FORMAT = 3
+
+# Catálogo segmentado: INDEX_DIR/manifest.json lista os segmentos (um ArrayIndex cada) de SEGMENTS_DIR
+MANIFEST_FILE = 'manifest.json'
+SEGMENTS_DIR = 'segments'
+# Dois segmentos vizinhos são fundidos quando o mais antigo tem até MERGE_FACTOR vezes
+# as postings do mais novo: o nº de segmentos fica logarítmico no catálogo
+MERGE_FACTOR = 2
+# Intervalo mínimo (s) entre verificações do catálogo em maybe_refresh
+REFRESH_INTERVAL = 1.0
+
+# Hashes presentes em mais músicas que isso são ignorados na busca: limita o custo
+# de cada hash da amostra, então o custo da consulta não cresce com o catálogo.
+# None = sem limite (só a stop-list).
+MAX_DOCUMENT_FREQUENCY = 2000
+
+class SQLiteBackend:
+    """
+    Backend padrão: consulta direta à tabela fingerprints (database.get_matches).
+    Hashes da stop-list e com mais de max_df músicas não são buscados.
+    """
+    name = 'sqlite'
+
+    def __init__(self, max_df=MAX_DOCUMENT_FREQUENCY):
+        self.max_df = max_df
+        self._checked = 0.0
+        self._load()
+
+    def _load(self):
+        self.signature = catalog_signature()
+        self.n_songs = self.signature['songs']
+        self.stoplist = db.get_stoplist()
+        # Músicas removidas cujos fingerprints ainda estão no banco (até database.compact)
+        self.tombstones = set(db.get_tombstones(include_purged=False).tolist())
+
+    def maybe_refresh(self):
+        """
+        Recarrega stop-list e remoções se o catálogo mudou (no máximo a cada REFRESH_INTERVAL).
+        Retorna True se mudou.
+        """
+        now = time.monotonic()
+        if now - self._checked < REFRESH_INTERVAL:
+            return False
+        self._checked = now
+        if catalog_signature() == self.signature:
+            return False
+        self._load()
+        return True
+
+    def _select(self, hashes):
+        """
+        Hashes distintos da consulta que valem a busca.
+        """
+        query = fingerprinting.unique_hashes(hashes)
+        keep = ~np.isin(query, self.stoplist, assume_unique=True)
+        # Com menos músicas que max_df nenhum hash passa do limite: dispensa a consulta a hash_stats
+        if self.max_df is not None and self.n_songs > self.max_df:
+            keep &= db.get_document_frequencies(query) <= self.max_df
+        metrics.count('skipped_hashes', len(query) - int(keep.sum()))
+        return query[keep]
+
+    def get_matches(self, hashes):
+        matches = db.get_matches(self._select(hashes))
+        if self.tombstones:
+            matches = [m for m in matches if m[0] not in self.tombstones]
+        return matches
+
+    @metrics.timed('lookup')
+    def lookup(self, hashes):
+        """
+        Mesmo resultado de get_matches, como arrays (song_ids, offsets, hashes).
+        """
+        matches = self.get_matches(hashes)
+        metrics.count('raw_matches', len(matches))
+        if not matches:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty
+        arr = np.array(matches, dtype=np.int64)
+        return arr[:, 0], arr[:, 1], arr[:, 2]
+
+class ArrayIndex:
+    """
+    Índice invertido em arrays NumPy (postings no estilo CSR):
+    - keys:     hashes distintos, ordenados
+    - indptr:   postings do hash keys[i] estão em [indptr[i], indptr[i+1])
+    - song_ids / offsets: postings ordenadas por (hash, song_id, offset)
+    - df:       em quantas músicas keys[i] aparece
+    - stopped:  keys[i] está na stop-list (database.build_stoplist)
+
+    As consultas usam searchsorted vetorizado, sem SQL nem objetos por linha.
+    Salvo como .npy, é carregado com memory-map (startup instantâneo).
+    """
+    name = 'index'
+    ARRAYS = ('keys', 'indptr', 'song_ids', 'offsets', 'df', 'stopped')
+
+    def __init__(self, keys, indptr, song_ids, offsets, df=None, stopped=None, meta=None,
+                 max_df=MAX_DOCUMENT_FREQUENCY):
+        self.keys = keys
+        self.indptr = indptr
+        self.song_ids = song_ids
+        self.offsets = offsets
+        self.df = document_frequency(indptr, song_ids) if df is None else df
+        self.stopped = np.zeros(len(keys), dtype=bool) if stopped is None else stopped
+        self.meta = meta or {}
+        self.max_df = max_df
+
+    def __len__(self):
+        return len(self.song_ids)
+
+    @classmethod
+    def from_postings(cls, hashes, song_ids, offsets, meta=None, stoplist=None):
+        """
+        Monta o índice a partir de arrays paralelos de postings (em qualquer ordem).
+        stoplist: hashes a ignorar nas buscas (padrão: nenhum).
+        """
+        hashes = np.asarray(hashes, dtype=np.int64)
+        song_ids = np.asarray(song_ids, dtype=np.int32)
+        offsets = np.asarray(offsets, dtype=np.int32)
+
+        order = np.lexsort((offsets, song_ids, hashes))
+        hashes, song_ids, offsets = hashes[order], song_ids[order], offsets[order]
+
+        keys, starts = np.unique(hashes, return_index=True)
+        indptr = np.append(starts, len(hashes)).astype(np.int64)
+        stopped = None if stoplist is None else np.isin(keys, stoplist)
+        return cls(keys, indptr, song_ids, offsets, stopped=stopped, meta=meta)
+
+    @classmethod
+    def build_from_db(cls):
+        """
+        Lê toda a tabela fingerprints. Como ela é agrupada por (hash, song_id, offset),
+        as linhas já chegam ordenadas. meta['covered']: maior id de música já
+        atribuído no instante da leitura (as postings incluem todas até ele).
+        """
+        conn = db.get_db_connection()
+        conn.row_factory = None
+        # Uma transação de leitura: contagem, postings e meta do mesmo instante (ingestão concorrente)
+        conn.execute('BEGIN')
+        # Com shards, cada tabela cobre uma faixa de hash: lidas em ordem, continuam ordenadas
+        tables = db.fingerprint_tables(conn)
+        total = sum(conn.execute(f'SELECT COUNT(*) FROM {t}').fetchone()[0] for t in tables)
+
+        hashes = np.empty(total, dtype=np.int64)
+        song_ids = np.empty(total, dtype=np.int32)
+        offsets = np.empty(total, dtype=np.int32)
+
+        pos = 0
+        for table in tables:
+            c = conn.execute(f'SELECT hash, song_id, offset FROM {table} ORDER BY hash, song_id, offset')
+            while True:
+                rows = c.fetchmany(BUILD_BATCH_SIZE)
+                if not rows:
+                    break
+                chunk = np.array(rows, dtype=np.int64)
+                n = len(chunk)
+                hashes[pos:pos + n] = chunk[:, 0]
+                song_ids[pos:pos + n] = chunk[:, 1]
+                offsets[pos:pos + n] = chunk[:, 2]
+                pos += n
+
+        meta = catalog_signature(conn)
+        meta['covered'] = meta['last_song_id']
+        conn.close()
+
+        keys, starts = np.unique(hashes[:pos], return_index=True)
+        indptr = np.append(starts, pos).astype(np.int64)
+        stopped = np.isin(keys, db.get_stoplist())
+        return cls(keys, indptr, song_ids[:pos], offsets[:pos], stopped=stopped, meta=meta)
+
+    def save(self, path=INDEX_DIR):
+        os.makedirs(path, exist_ok=True)
+        # meta.json é escrito por último: sem ele o índice é considerado incompleto
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+
+        for name in self.ARRAYS:
+            np.save(os.path.join(path, f'{name}.npy'), getattr(self, name))
+
+        with open(meta_path, 'w') as f:
+            json.dump(self.meta, f)
+
+    @classmethod
+    def load(cls, path=INDEX_DIR, mmap=True):
+        """
+        Carrega um índice salvo. Retorna None se não existir.
+        """
+        meta_path = os.path.join(path, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+        if meta.get('format') != INDEX_FORMAT:
+            return None   # Formato antigo: open_backend reconstrói
+
+        mode = 'r' if mmap else None
+        arrays = [np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mode) for name in cls.ARRAYS]
+        return cls(*arrays, meta=meta)
+
+    def _locate(self, query):
+        """
+        Posição em keys de cada hash de 'query' (distintos e ordenados) e se ele existe.
+        """
+        pos = np.minimum(np.searchsorted(self.keys, query), len(self.keys) - 1)
+        return pos, self.keys[pos] == query
+
+    def _expand(self, pos):
+        """
+        Postings das chaves keys[pos], concatenadas. Retorna (song_ids, offsets, nº de postings por chave).
+        """
+        starts = self.indptr[pos]
+        counts = self.indptr[pos + 1] - starts
+
+        # Expande os intervalos [start, start + count) em um único array de posições
+        total = int(counts.sum())
+        block_starts = np.cumsum(counts) - counts
+        idx = np.repeat(starts - block_starts, counts) + np.arange(total, dtype=np.int64)
+        return self.song_ids[idx].astype(np.int64), self.offsets[idx].astype(np.int64), counts
+
+    def postings(self):
+        """
+        Todas as postings como arrays paralelos (hashes, song_ids, offsets), em ordem de hash.
+        """
+        return np.repeat(self.keys, np.diff(self.indptr)), self.song_ids, self.offsets
+
+    @metrics.timed('lookup')
+    def lookup(self, hashes):
+        """
+        Busca as postings de todos os hashes de uma vez.
+        Retorna (song_ids, offsets, hashes) na mesma ordem do SQLite (hash, song_id, offset).
+        """
+        query = fingerprinting.unique_hashes(hashes)
+        if len(self.keys) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty
+
+        pos, found = self._locate(query)
+        # Stop-list e hashes comuns demais (mais de max_df músicas) ficam de fora
+        skip = self.stopped[pos]
+        if self.max_df is not None:
+            skip |= self.df[pos] > self.max_df
+        metrics.count('skipped_hashes', int(np.count_nonzero(found & skip)))
+        found &= ~skip
+
+        song_ids, offsets, counts = self._expand(pos[found])
+        metrics.count('raw_matches', len(song_ids))
+        return song_ids, offsets, np.repeat(query[found], counts)
+
+    def maybe_refresh(self):
+        # Índice estático (ex: montado em memória): nada a recarregar
+        return False
+
+    def get_matches(self, hashes):
+        """
+        Mesma interface de database.get_matches: lista de (song_id, offset, hash).
+        """
+        song_ids, offsets, hashes = self.lookup(hashes)
+        return list(zip(song_ids.tolist(), offsets.tolist(), hashes.tolist()))
+
+def document_frequency(indptr, song_ids):
+    """
+    Nº de músicas distintas de cada hash, a partir das postings ordenadas por (hash, song_id).
+    """
+    indptr = np.asarray(indptr)
+    if len(song_ids) == 0:
+        return np.zeros(len(indptr) - 1, dtype=np.int32)
+    # Uma nova música começa onde o song_id muda ou onde começa um novo hash
+    new_song = np.ones(len(song_ids), dtype=np.int32)
+    new_song[1:] = song_ids[1:] != song_ids[:-1]
+    new_song[indptr[:-1]] = 1
+    return np.add.reduceat(new_song, indptr[:-1]).astype(np.int32)
+
+def catalog_signature(conn=None):
+    """
+    Resumo barato do estado do catálogo, usado para detectar índice desatualizado.
+    last_song_id só cresce (AUTOINCREMENT) e tombstones só aumenta: qualquer
+    inserção ou remoção muda a assinatura.
+    """
+    if conn is None:
+        conn = db.connection()
+    songs = conn.execute('SELECT COUNT(*) FROM songs').fetchone()[0]
+    stopped = conn.execute('SELECT COUNT(*) FROM stoplist').fetchone()[0]
+    deleted = conn.execute('SELECT COUNT(*) FROM tombstones').fetchone()[0]
+    return {'songs': songs, 'last_song_id': db.last_song_id(conn), 'tombstones': deleted, 'stoplist': stopped,
+            'format': INDEX_FORMAT}
+
+@contextlib.contextmanager
+def _file_lock(path):
+    """
+    Lock exclusivo entre processos para alterar o índice em 'path'.
+    """
+    os.makedirs(path, exist_ok=True)
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(path, 'lock'), 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+class SegmentedIndex:
+    """
+    Catálogo mutável no estilo LSM: segmentos imutáveis (cada um um ArrayIndex
+    com as postings de uma faixa contígua de song_ids, [lo, hi]) mais as
+    tombstones das músicas removidas.
+
+    - Músicas novas: refresh() lê só os fingerprints delas (database.
+      get_recent_fingerprints, a camada de escrita no banco) e grava um
+      segmento pequeno. O custo é proporcional às músicas novas, não ao catálogo.
+    - Músicas removidas ou substituídas (database.delete_song): filtradas das
+      respostas até que uma fusão reescreva o segmento sem elas.
+    - Fusão em segundo plano de segmentos vizinhos de tamanho parecido
+      (MERGE_FACTOR); compact() funde tudo em um segmento só.
+
+    As buscas usam um snapshot (segmentos, tombstones) trocado por inteiro,
+    então continuam rápidas durante a ingestão, as remoções e as fusões.
+    O estado fica em path/manifest.json, substituído de forma atômica; vários
+    processos podem abrir o mesmo índice (as alterações são feitas sob um lock de arquivo).
+    """
+    name = 'index'
+
+    def __init__(self, path=INDEX_DIR, max_df=MAX_DOCUMENT_FREQUENCY, background=True):
+        self.path = path
+        self.max_df = max_df
+        self.background = background     # Fusões em uma thread (False = dentro de refresh)
+        self.covered = 0                 # Músicas com id até aqui já estão nos segmentos
+        self.signature = None
+        self._manifest = None
+        self._loaded = {}                # Nome do segmento -> ArrayIndex (mmap)
+        # Snapshot das buscas: (segmentos em ordem de song_id, tombstones dentro de [lo, hi] de cada um)
+        self._view = ((), ())
+        self.stoplist = np.empty(0, dtype=np.int64)
+        self.tombstones = np.empty(0, dtype=np.int64)
+        self._checked = 0.0
+        self._lock = threading.RLock()
+        self._merger = None
+
+    def __getstate__(self):
+        # Lock e thread não vão para outro processo (ex: multiprocessing com spawn)
+        state = self.__dict__.copy()
+        state['_lock'] = None
+        state['_merger'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    @property
+    def segments(self):
+        return self._view[0]
+
+    def __len__(self):
+        return sum(len(segment) for segment in self.segments)
+
+    # Manifesto e segmentos em disco
+
+    def _manifest_path(self):
+        return os.path.join(self.path, MANIFEST_FILE)
+
+    def _read_manifest(self):
+        try:
+            with open(self._manifest_path()) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return manifest if manifest.get('format') == INDEX_FORMAT else None
+
+    def _write_manifest(self, segments, covered):
+        version = (self._manifest or {}).get('version', 0) + 1
+        manifest = {'format': INDEX_FORMAT, 'version': version, 'covered': covered, 'segments': segments}
+        tmp = self._manifest_path() + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self._manifest_path())
+        self._manifest = None   # Força _adopt a instalar o novo estado
+        self._adopt(manifest)
+
+    def _adopt(self, manifest):
+        """
+        Instala o estado de 'manifest' (reaproveitando os segmentos já abertos).
+        Retorna False se algum segmento estiver faltando.
+        """
+        if self._manifest is not None and manifest['version'] == self._manifest['version']:
+            return True
+        loaded = {}
+        for name in manifest['segments']:
+            segment = self._loaded.get(name) or ArrayIndex.load(os.path.join(self.path, SEGMENTS_DIR, name))
+            if segment is None:
+                return False
+            loaded[name] = segment
+        self._loaded = loaded
+        self._manifest = manifest
+        self.covered = manifest['covered']
+        self._install()
+        return True
+
+    def _install(self):
+        segments = tuple(self._loaded[name] for name in self._manifest['segments'])
+        dead = []
+        for segment in segments:
+            # Só as remoções da faixa do segmento que ele ainda contém (as 'dropped' saíram ao montá-lo)
+            lo, hi = np.searchsorted(self.tombstones, [segment.meta['lo'], segment.meta['hi'] + 1])
+            dropped = np.asarray(segment.meta.get('dropped', []), dtype=np.int64)
+            dead.append(np.setdiff1d(self.tombstones[lo:hi], dropped, assume_unique=True))
+        self._view = (segments, tuple(dead))
+
+    def _save_segment(self, segment):
+        """
+        Grava um segmento em um diretório novo (nome único entre processos). Retorna o nome.
+        """
+        base = os.path.join(self.path, SEGMENTS_DIR)
+        os.makedirs(base, exist_ok=True)
+        directory = tempfile.mkdtemp(prefix=f"{segment.meta['lo']:09d}-{segment.meta['hi']:09d}-", dir=base)
+        segment.save(directory)
+        return os.path.basename(directory)
+
+    def _remove_unused(self):
+        # Segmentos fora do manifesto (fundidos ou de uma escrita interrompida). Chamado sob o lock de arquivo
+        base = os.path.join(self.path, SEGMENTS_DIR)
+        if not os.path.isdir(base):
+            return
+        for name in set(os.listdir(base)) - set(self._manifest['segments']):
+            shutil.rmtree(os.path.join(base, name), ignore_errors=True)
+
+    def _segment(self, hashes, song_ids, offsets, lo, hi, dropped=None):
+        """
+        Segmento com as músicas [lo, hi]; 'dropped': tombstones da faixa cujas postings já foram retiradas.
+        """
+        meta = {'format': INDEX_FORMAT, 'lo': int(lo), 'hi': int(hi), 'dropped': [] if dropped is None else dropped.tolist()}
+        return ArrayIndex.from_postings(hashes, song_ids, offsets, meta=meta)
+
+    # Atualização
+
+    def refresh(self):
+        """
+        Incorpora as mudanças do banco: músicas novas (em um segmento só delas),
+        remoções e a stop-list. Sem índice em disco (ou se as músicas novas já não
+        estiverem em fingerprints_recent), reconstrói tudo a partir do banco.
+        Retorna True se o catálogo mudou.
+        """
+        with self._lock, _file_lock(self.path):
+            self.signature = catalog_signature()
+            before = self._manifest
+            manifest = self._read_manifest()
+            if manifest is None or not self._adopt(manifest):
+                self._rebuild()
+            else:
+                last = self.signature['last_song_id']
+                if last > self.covered and db.recent_floor() > self.covered:
+                    # Outro índice já descartou parte das músicas novas de fingerprints_recent
+                    self._rebuild()
+                elif last > self.covered:
+                    self._append(last)
+            changed = self._manifest is not before
+            changed |= self._load_deletions()
+        self._schedule_merge()
+        return changed
+
+    def _load_deletions(self):
+        stoplist, tombstones = db.get_stoplist(), db.get_tombstones()
+        if np.array_equal(stoplist, self.stoplist) and np.array_equal(tombstones, self.tombstones):
+            return False
+        self.stoplist, self.tombstones = stoplist, tombstones
+        self._install()
+        return True
+
+    def _append(self, last):
+        """
+        Segmento com as músicas em (covered, last], lidas de fingerprints_recent.
+        """
+        song_ids, hashes, offsets = db.get_recent_fingerprints(self.covered, last)
+        names = list(self._manifest['segments'])
+        if len(hashes):
+            names.append(self._save_segment(self._segment(hashes, song_ids, offsets, self.covered + 1, last)))
+        self._write_manifest(names, last)
+        db.trim_recent(last)
+
+    def _rebuild(self, full=None):
+        # Lidas antes das postings: todas essas músicas já estavam removidas no instante da leitura
+        tombstones = self.tombstones = db.get_tombstones()
+        if full is None:
+            print("Construindo índice de fingerprints a partir do banco...")
+            full = ArrayIndex.build_from_db()
+        covered = full.meta['covered']
+        dropped = tombstones[tombstones <= covered]
+        meta = {'format': INDEX_FORMAT, 'lo': 0, 'hi': covered, 'dropped': dropped.tolist()}
+        if len(dropped) and np.isin(full.song_ids, dropped).any():
+            # Removidas ainda não compactadas no banco (database.compact)
+            segment = self._merge([full], lo=0, hi=covered)
+        else:
+            segment = ArrayIndex(full.keys, full.indptr, full.song_ids, full.offsets, full.df, meta=meta)
+        names = [self._save_segment(segment)] if len(segment) else []
+        self._write_manifest(names, covered)
+        self._remove_unused()
+        # Arquivos do formato antigo (um único ArrayIndex na raiz do diretório)
+        for name in [f'{array}.npy' for array in ArrayIndex.ARRAYS] + ['meta.json']:
+            legacy = os.path.join(self.path, name)
+            if os.path.exists(legacy):
+                os.remove(legacy)
+        db.trim_recent(covered)
+
+    def rebuild(self, full=None):
+        """
+        Reconstrói o índice inteiro a partir do banco (um segmento só).
+        full: ArrayIndex já montado com todas as postings do banco (meta['covered'] =
+        maior id incluído), usado no lugar da leitura do banco (ex: snapshot.load_snapshot).
+        """
+        with self._lock, _file_lock(self.path):
+            self.signature = catalog_signature()
+            self._manifest = self._read_manifest()
+            self._rebuild(full)
+            self._load_deletions()
+            self._install()
+
+    def maybe_refresh(self):
+        """
+        refresh() se o catálogo (ou o manifesto, alterado por outro processo) mudou,
+        no máximo a cada REFRESH_INTERVAL segundos: a verificação é barata e pode
+        ser chamada antes de cada busca por servidores de longa duração.
+        """
+        now = time.monotonic()
+        if now - self._checked < REFRESH_INTERVAL:
+            return False
+        self._checked = now
+        manifest = self._read_manifest()
+        stale = manifest is None or self._manifest is None or manifest['version'] != self._manifest['version']
+        if not stale and catalog_signature() == self.signature:
+            return False
+        return self.refresh()
+
+    # Fusão de segmentos
+
+    def _merge(self, segments, lo=None, hi=None):
+        """
+        Um segmento com as postings de 'segments' (vizinhos), sem as músicas removidas.
+        """
+        parts = [segment.postings() for segment in segments]
+        hashes, song_ids, offsets = (np.concatenate(cols) for cols in zip(*parts))
+        lo = segments[0].meta['lo'] if lo is None else lo
+        hi = segments[-1].meta['hi'] if hi is None else hi
+        dead = self.tombstones[(self.tombstones >= lo) & (self.tombstones <= hi)]
+        if len(dead):
+            keep = ~np.isin(song_ids, dead)
+            hashes, song_ids, offsets = hashes[keep], song_ids[keep], offsets[keep]
+        return self._segment(hashes, song_ids, offsets, lo, hi, dead)
+
+    def _replace(self, names, merged):
+        """
+        Troca os segmentos 'names' pelo segmento fundido, se eles ainda estiverem
+        no manifesto (outro processo pode ter fundido antes). Retorna True se trocou.
+        """
+        with self._lock, _file_lock(self.path):
+            manifest = self._read_manifest()
+            if manifest is None or not self._adopt(manifest):
+                return False
+            current = manifest['segments']
+            i = current.index(names[0]) if names[0] in current else -1
+            if i < 0 or current[i:i + len(names)] != names:
+                return False
+            replacement = [self._save_segment(merged)] if len(merged) else []
+            self._write_manifest(current[:i] + replacement + current[i + len(names):], manifest['covered'])
+            self._remove_unused()
+            return True
+
+    def _next_merge(self):
+        """
+        Par de segmentos vizinhos a fundir (o mais antigo com até MERGE_FACTOR vezes as postings do mais novo).
+        """
+        names = self._manifest['segments'] if self._manifest else []
+        for i in range(len(names) - 1, 0, -1):
+            older, newer = self._loaded[names[i - 1]], self._loaded[names[i]]
+            if len(older) <= MERGE_FACTOR * len(newer):
+                return names[i - 1:i + 1]
+        return None
+
+    def merge(self):
+        """
+        Funde segmentos até a política de MERGE_FACTOR ser atendida. As buscas
+        continuam no snapshot anterior enquanto o segmento fundido é montado.
+        """
+        while True:
+            with self._lock:
+                names = self._next_merge()
+                segments = [self._loaded[name] for name in names] if names else None
+            if segments is None:
+                return
+            self._replace(names, self._merge(segments))
+
+    def _schedule_merge(self):
+        if not self.background:
+            self.merge()
+            return
+        with self._lock:
+            if self._merger is None or not self._merger.is_alive():
+                # Não é daemon: um comando curto termina a fusão antes de sair (senão o segmento fica pela metade)
+                self._merger = threading.Thread(target=self.merge, name='index-merge')
+                self._merger.start()
+
+    def wait_merges(self):
+        merger = self._merger
+        if merger is not None:
+            merger.join()
+
+    def compact(self):
+        """
+        Funde todos os segmentos em um só, sem as postings das músicas removidas.
+        Percorre o catálogo inteiro (ver database.compact).
+        """
+        self.wait_merges()
+        while True:
+            with self._lock:
+                names = list(self._manifest['segments']) if self._manifest else []
+                segments = [self._loaded[name] for name in names]
+            if len(segments) <= 1 and not any(len(dead) for dead in self._view[1]):
+                return
+            if self._replace(names, self._merge(segments)):
+                return
+
+    # Busca
+
+    @metrics.timed('lookup')
+    def lookup(self, hashes):
+        """
+        Mesma interface (e mesma ordem de resultados) de ArrayIndex.lookup, somando
+        os segmentos: a frequência de documento de cada hash é a soma entre eles.
+        """
+        segments, dead = self._view
+        stoplist = self.stoplist
+        query = fingerprinting.unique_hashes(hashes)
+        located = [(segment, *segment._locate(query), tombstones)
+                   for segment, tombstones in zip(segments, dead) if len(segment.keys)]
+
+        # Stop-list e hashes comuns demais (mais de max_df músicas no catálogo) ficam de fora
+        skip = np.isin(query, stoplist, assume_unique=True)
+        found_any = np.zeros(len(query), dtype=bool)
+        df = np.zeros(len(query), dtype=np.int64)
+        for segment, pos, found, _ in located:
+            found_any |= found
+            df += np.where(found, segment.df[pos], 0)
+        if self.max_df is not None:
+            skip |= df > self.max_df
+        metrics.count('skipped_hashes', int(np.count_nonzero(found_any & skip)))
+
+        parts = []
+        for segment, pos, found, tombstones in located:
+            found &= ~skip
+            song_ids, offsets, counts = segment._expand(pos[found])
+            hashes = np.repeat(query[found], counts)
+            if len(tombstones):
+                keep = ~np.isin(song_ids, tombstones)
+                song_ids, offsets, hashes = song_ids[keep], offsets[keep], hashes[keep]
+            parts.append((song_ids, offsets, hashes))
+        if not parts:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty
+
+        song_ids, offsets, hashes = (np.concatenate(cols) for cols in zip(*parts))
+        if len(parts) > 1:
+            # Segmentos em ordem de song_id: ordenar só por hash (estável) dá (hash, song_id, offset)
+            order = np.argsort(hashes, kind='stable')
+            song_ids, offsets, hashes = song_ids[order], offsets[order], hashes[order]
+        metrics.count('raw_matches', len(song_ids))
+        return song_ids, offsets, hashes
+
+    def get_matches(self, hashes):
+        """
+        Mesma interface de database.get_matches: lista de (song_id, offset, hash).
+        """
+        song_ids, offsets, hashes = self.lookup(hashes)
+        return list(zip(song_ids.tolist(), offsets.tolist(), hashes.tolist()))
+
+def build_index(path=INDEX_DIR, full=None):
+    """
+    Reconstrói o índice em 'path' do zero (um segmento só).
+    """
+    index = SegmentedIndex(path)
+    index.rebuild(full)
+    return index
+
+def open_backend(kind='sqlite', path=None, max_df=MAX_DOCUMENT_FREQUENCY):
+    """
+    Retorna o backend de busca escolhido ('sqlite', 'index' ou 'snapshot').
+    O índice é construído a partir do banco se não existir; se existir, só as
+    mudanças desde a última abertura são incorporadas (ver SegmentedIndex.refresh).
+    'snapshot' busca direto no arquivo instalado por load-snapshot (snapshot.SnapshotIndex).
+    path: diretório do índice ou arquivo do snapshot (padrão: INDEX_DIR / snapshot.SNAPSHOT_PATH).
+    max_df: hashes presentes em mais músicas que isso não são buscados (None = sem limite).
+    """
+    if kind == 'sqlite':
+        return SQLiteBackend(max_df)
+    if kind == 'snapshot':
+        import snapshot   # snapshot importa este módulo
+        path = path or snapshot.SNAPSHOT_PATH
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Snapshot não encontrado em {path} (use load-snapshot)")
+        return snapshot.SnapshotIndex(path, max_df)
+    if kind != 'index':
+        raise ValueError(f"Backend desconhecido: {kind}")
+
+    index = SegmentedIndex(path or INDEX_DIR, max_df)
+    index.refresh()
+    return index
@@ -0,0 +1,228 @@
+import hashlib
+import multiprocessing
+import os
+import time
+from collections import namedtuple
+
+import numpy as np
+
+import audio_processing as audio
+import cache
+import fingerprinting
+import database as db
+import metrics
+
+AUDIO_EXTENSIONS = ('.wav', '.flac', '.ogg', '.mp3', '.aiff', '.aif')
+
+# Quantas músicas acumular antes de gravar (uma transação por lote)
+DEFAULT_BATCH_SONGS = 50
+
+# Conjunto de file_hash já cadastrados e cache de fingerprints, recebidos uma vez por worker
+_known_hashes = frozenset()
+_fp_cache = None
+_legacy = False
+
+# Resultado de analyze_file. source: 'cache' (sem DSP), 'computed' ou 'known'
+# (file_hash já cadastrado: parou antes do espectrograma e os arrays são None)
+Analysis = namedtuple('Analysis', ['file_hash', 'peak_times', 'peak_freqs', 'hashes', 'offsets', 'source'])
+
+def find_audio_files(source):
+    """
+    Lista os arquivos a ingerir. 'source' pode ser:
+    - um diretório (busca recursiva por extensões de áudio), ou
+    - um manifesto de texto com um caminho por linha (relativo ao manifesto; '#' = comentário).
+    """
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            for name in files:
+                if name.lower().endswith(AUDIO_EXTENSIONS):
+                    paths.append(os.path.join(root, name))
+        return sorted(paths)
+
+    base = os.path.dirname(os.path.abspath(source))
+    paths = []
+    with open(source, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                paths.append(line if os.path.isabs(line) else os.path.join(base, line))
+    return paths
+
+def stream_file_peaks(path, digest=None):
+    """
+    Picos de um arquivo inteiro pelo caminho de streaming (memória limitada,
+    para arquivos longos). Mesmo resultado de find_peaks sobre o arquivo carregado.
+    Com 'digest' (hashlib.sha1()), as amostras são somadas a ele na mesma passada.
+    """
+    chunks = audio.stream_audio_file(path)
+    if digest is not None:
+        chunks = cache.hashing_blocks(chunks, digest)
+    blocks = list(fingerprinting.stream_peaks(audio.stream_spectrogram(chunks)))
+    if not blocks:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate([b[0] for b in blocks]), np.concatenate([b[1] for b in blocks])
+
+def analyze_file(path, fp_cache=None, is_known=None, legacy=False):
+    """
+    Picos e fingerprints de um arquivo, passando pelo cache (cache.FingerprintCache) se fornecido.
+
+    file_hash é o digest do áudio decodificado (cache.audio_digest). Se is_known(file_hash)
+    for verdadeiro, para logo após a decodificação, sem espectrograma nem picos.
+    Arquivos que o cache já viu (mesmo tamanho e mtime) nem são decodificados.
+    Arquivos longos calculam o digest na mesma passada do streaming, então só
+    descobrem que são repetidos depois do processamento.
+    legacy (database.has_legacy_file_hashes): também consulta is_known com o SHA-1
+    dos bytes do arquivo, o file_hash das músicas cadastradas antes do schema v5.
+
+    Retorna Analysis, ou None se o arquivo não puder ser lido.
+    """
+    if legacy and is_known is not None:
+        try:
+            legacy_hash = cache.file_digest(path)
+        except OSError as e:
+            print(f"Erro ao carregar {path}: {e}")
+            return None
+        if is_known(legacy_hash):
+            return Analysis(legacy_hash, None, None, None, None, 'known')
+
+    file_hash = fp_cache.lookup_path(path) if fp_cache is not None else None
+    if file_hash is not None:
+        if is_known is not None and is_known(file_hash):
+            return Analysis(file_hash, None, None, None, None, 'known')
+        cached = fp_cache.get(file_hash)
+        if cached is not None:
+            return Analysis(file_hash, *cached, 'cache')
+
+    peak_times = peak_freqs = None
+    if audio.get_duration(path) > audio.STREAMING_MIN_SECONDS:
+        digest = hashlib.sha1()
+        try:
+            peak_times, peak_freqs = stream_file_peaks(path, digest)
+        except Exception as e:
+            print(f"Erro ao carregar {path}: {e}")
+            return None
+        file_hash = digest.hexdigest()
+    else:
+        samples = audio.load_audio_file(path)
+        if samples is None:
+            return None
+        file_hash = cache.audio_digest(samples)
+
+    if fp_cache is not None:
+        fp_cache.remember_path(path, file_hash)
+    if is_known is not None and is_known(file_hash):
+        return Analysis(file_hash, None, None, None, None, 'known')
+
+    if peak_times is None:
+        # Mesmo áudio em outro arquivo (outro container, tags, nome): reaproveita do cache
+        cached = fp_cache.get(file_hash) if fp_cache is not None else None
+        if cached is not None:
+            return Analysis(file_hash, *cached, 'cache')
+
+        f, t, Sxx = audio.generate_spectrogram(samples)
+        peak_times, peak_freqs = fingerprinting.find_peaks(Sxx)
+
+    hashes, offsets = fingerprinting.generate_fingerprint_arrays(peak_times, peak_freqs)
+    if fp_cache is not None:
+        fp_cache.put(file_hash, peak_times, peak_freqs, hashes, offsets)
+    return Analysis(file_hash, peak_times, peak_freqs, hashes, offsets, 'computed')
+
+def _init_worker(known_hashes, fp_cache, profile=False, legacy=False):
+    global _known_hashes, _fp_cache, _legacy
+    _known_hashes = known_hashes
+    _fp_cache = fp_cache
+    _legacy = legacy
+    metrics.enable(profile)
+
+def fingerprint_file(path):
+    """
+    Executado nos processos do pool: digest do áudio + espectrograma + picos + hashes
+    (ou leitura do cache). Retorna (path, Analysis, métricas); Analysis é None se o arquivo
+    falhou e as métricas (Trace.to_dict) são None se a instrumentação estiver desligada.
+    """
+    if not metrics.ENABLED:
+        return path, analyze_file(path, _fp_cache, _known_hashes.__contains__, _legacy), None
+    with metrics.Trace() as trace:
+        result = analyze_file(path, _fp_cache, _known_hashes.__contains__, _legacy)
+    return path, result, trace.to_dict()
+
+class _BatchWriter:
+    """
+    Escritor único: acumula músicas e grava cada lote em uma só transação.
+    """
+    def __init__(self, batch_songs):
+        self.batch_songs = batch_songs
+        self.conn = db.get_db_connection()
+        self.pending = []
+
+    def add(self, name, file_hash, hashes, offsets):
+        self.pending.append((name, file_hash, hashes, offsets))
+        if len(self.pending) >= self.batch_songs:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        song_ids, all_hashes, all_offsets = [], [], []
+        for name, file_hash, hashes, offsets in self.pending:
+            song_id = db.insert_song(name, file_hash, conn=self.conn)
+            song_ids.append(np.full(len(hashes), song_id, dtype=np.int64))
+            all_hashes.append(hashes)
+            all_offsets.append(offsets)
+
+        db.insert_fingerprint_arrays(np.concatenate(song_ids), np.concatenate(all_hashes),
+                                     np.concatenate(all_offsets), conn=self.conn)
+        with metrics.timer('db_commit'):
+            self.conn.commit()
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+def ingest(paths, workers=None, batch_songs=DEFAULT_BATCH_SONGS, fp_cache=None):
+    """
+    Ingere muitos arquivos: o fingerprinting roda em um pool de processos
+    e os resultados são gravados por um único escritor em transações grandes.
+    Arquivos cujo file_hash já está em 'songs' são pulados (retomada após interrupção).
+    Com fp_cache, arquivos já processados antes vêm do cache, sem DSP.
+
+    Retorna um dicionário com as contagens (added, skipped, failed, cached).
+    """
+    known = frozenset(db.get_file_hashes())
+    stats = {'added': 0, 'skipped': 0, 'failed': 0, 'cached': 0, 'fingerprints': 0}
+    seen = set(known)
+    start = time.perf_counter()
+
+    writer = _BatchWriter(batch_songs)
+    try:
+        with multiprocessing.Pool(workers, initializer=_init_worker,
+                                  initargs=(known, fp_cache, metrics.ENABLED, db.has_legacy_file_hashes())) as pool:
+            results = pool.imap_unordered(fingerprint_file, paths)
+            for i, (path, result, trace) in enumerate(results, 1):
+                metrics.merge(trace)
+                name = os.path.basename(path)
+                if result is None:
+                    stats['failed'] += 1
+                    continue
+                file_hash, hashes, offsets = result.file_hash, result.hashes, result.offsets
+                if hashes is None or file_hash in seen:
+                    # Já cadastrado (ou duplicado dentro desta mesma ingestão)
+                    stats['skipped'] += 1
+                    continue
+
+                seen.add(file_hash)
+                writer.add(name, file_hash, hashes, offsets)
+                stats['added'] += 1
+                stats['cached'] += result.source == 'cache'
+                stats['fingerprints'] += len(hashes)
+                print(f"    [{i}/{len(paths)}] {name}: {len(hashes)} fingerprints")
+    finally:
+        writer.close()
+
+    # Frequências mudaram: hashes que ficaram comuns demais entram na stop-list
+    if stats['added']:
+        stats['stoplist'], _ = db.build_stoplist()
+    stats['seconds'] = time.perf_counter() - start
+    return stats
@@ -0,0 +1,394 @@
+from collections import namedtuple
+
+import numpy as np
+
+import audio_processing as audio
+import fingerprinting
+import metrics
+
+# Duração de um frame do espectrograma (hop entre janelas), em segundos
+FRAME_SECONDS = audio.WINDOW_SIZE * (1 - audio.OVERLAP_RATIO) / audio.SAMPLE_RATE
+
+# Bias aplicado ao offset_diff para empacotá-lo (pode ser negativo) em 32 bits
+_DIFF_BIAS = 1 << 31
+
+_DIFF_MASK = (1 << 32) - 1
+
+# Critério de decisão: hashes alinhados mínimos, vantagem sobre o 2º colocado
+# e confiança calibrada mínima (ver calibrated_confidence)
+MIN_ALIGNED = 20
+MIN_RATIO = 2.0
+MIN_CONFIDENCE = 0.5
+# Vantagem sobre a melhor outra posição da mesma música (refrão, notas repetidas).
+# Nas respostas certas essa posição costuma ter ~1/3 dos alinhados (a música repete
+# os próprios padrões): exigir mais que 2x faria respostas certas esperarem o fim da amostra
+MIN_OFFSET_RATIO = 2.0
+
+# Tolerância a time-stretch (rádio acelerada, mixagens): variação de andamento
+# máxima procurada pelo histograma inclinado (0 desliga)
+MAX_STRETCH = 0.05
+# Erro de alinhamento (frames, para cada lado) absorvido pelo arredondamento dos picos
+ALIGN_TOLERANCE_FRAMES = 1
+# Músicas (melhores janelas do histograma) que passam pelo histograma inclinado
+REFINE_CANDIDATES = 8
+# Limite de inclinações testadas (amostras longas usam passo maior)
+MAX_SLOPES = 33
+# Vantagem (hashes alinhados) que uma inclinação precisa ter sobre a reta sem
+# time-stretch para ser aceita: abaixo disso a diferença é arredondamento dos frames
+STRETCH_MARGIN = 1.25
+
+# Confiança calibrada: regressão logística sobre log(hashes alinhados),
+# log(vantagem sobre o 2º) e cobertura (alinhados / hashes da amostra).
+# Coeficientes (constante, alinhados, vantagem, cobertura) ajustados por benchmarks/bench_confidence.py,
+# com consultas de músicas fora do catálogo (e removidas dele) pesando o mesmo que as do catálogo:
+# com poucos alinhados, só vantagem e cobertura altas separam a resposta certa do acaso
+CONFIDENCE_WEIGHTS = (-4.27, 0.00, 4.29, 9.35)
+
+# song_id: música candidata | count: hashes alinhados no melhor offset
+# offset_frames / offset_seconds: posição do início da amostra dentro da música
+# confidence: probabilidade calibrada de a resposta estar certa (0 a 1)
+# coverage: fração dos hashes da amostra alinhados | tempo: andamento da amostra
+# em relação à música (1.02 = 2% mais rápida)
+# offset_rival: hashes alinhados na melhor outra posição da mesma música (trechos repetidos)
+Match = namedtuple('Match', ['song_id', 'count', 'offset_frames', 'offset_seconds',
+                             'confidence', 'coverage', 'tempo', 'offset_rival'], defaults=(0.0, 0.0, 1.0, 0))
+
+def frames_to_seconds(frames):
+    return float(frames) * FRAME_SECONDS
+
+def expand_ranges(starts, counts):
+    """
+    Concatena os intervalos [starts[i], starts[i] + counts[i]) em um único array de índices.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    total = int(counts.sum())
+    block_starts = np.cumsum(counts) - counts
+    return np.repeat(np.asarray(starts, dtype=np.int64) - block_starts, counts) + np.arange(total, dtype=np.int64)
+
+@metrics.timed('alignment')
+def align_matches(query_hashes, query_offsets, match_song_ids, match_offsets, match_hashes,
+                  return_query_offsets=False):
+    """
+    Junta os matches do banco com os hashes da amostra.
+    Cada (match, ocorrência do mesmo hash na amostra) gera um par com
+    offset_diff = db_offset - sample_offset.
+
+    Retorna (song_ids, offset_diffs) como arrays int64
+    (e o sample_offset de cada par, se return_query_offsets).
+    """
+    query_hashes = np.asarray(query_hashes, dtype=np.int64)
+    query_offsets = np.asarray(query_offsets, dtype=np.int64)
+    match_hashes = np.asarray(match_hashes, dtype=np.int64)
+
+    order = np.argsort(query_hashes, kind='stable')
+    sorted_hashes = query_hashes[order]
+    sorted_offsets = query_offsets[order]
+
+    # Faixa de ocorrências de cada hash do banco na amostra
+    left = np.searchsorted(sorted_hashes, match_hashes, side='left')
+    counts = np.searchsorted(sorted_hashes, match_hashes, side='right') - left
+
+    match_idx = np.repeat(np.arange(len(match_hashes)), counts)
+    query_idx = expand_ranges(left, counts)
+
+    song_ids = np.asarray(match_song_ids, dtype=np.int64)[match_idx]
+    pair_offsets = sorted_offsets[query_idx]
+    diffs = np.asarray(match_offsets, dtype=np.int64)[match_idx] - pair_offsets
+    if return_query_offsets:
+        return song_ids, diffs, pair_offsets
+    return song_ids, diffs
+
+def _histogram_keys(song_ids, diffs):
+    return (np.asarray(song_ids, dtype=np.int64) << 32) | (np.asarray(diffs, dtype=np.int64) + _DIFF_BIAS)
+
+def _best_bins(keys, counts):
+    """
+    Índice do melhor bin de cada música (chaves ordenadas => agrupadas por música;
+    no empate, o menor offset_diff). O(n): máximo por grupo com reduceat, sem ordenar.
+    """
+    songs = keys >> 32
+    starts = np.flatnonzero(np.r_[True, songs[1:] != songs[:-1]])
+    group_max = np.maximum.reduceat(counts, starts)
+    hits = np.flatnonzero(counts == np.repeat(group_max, np.diff(np.r_[starts, len(keys)])))
+    # Primeiro bin com o máximo em cada grupo
+    first = np.r_[True, songs[hits[1:]] != songs[hits[:-1]]]
+    return hits[first]
+
+def _band_sums(keys, counts, width, shift):
+    """
+    Histograma em faixas: soma as contagens das chaves (ordenadas) em faixas de
+    width bins de offset_diff, deslocadas de shift; O(n), as faixas não atravessam músicas.
+    Retorna (chave inicial de cada faixa, soma).
+    """
+    bands = (keys + shift) // width
+    starts = np.flatnonzero(np.r_[True, bands[1:] != bands[:-1]])
+    return bands[starts] * width - shift, np.add.reduceat(counts, starts)
+
+def _offset_rivals(keys, counts, songs, diffs, radius):
+    """
+    Para cada candidato (música, diff), a soma (±ALIGN_TOLERANCE_FRAMES) do melhor outro
+    offset_diff da mesma música, a mais de radius frames de diff: refrões e notas
+    repetidas alinham a amostra em mais de uma posição. Laço só pelos candidatos.
+    """
+    tol = ALIGN_TOLERANCE_FRAMES
+    rivals = np.zeros(len(songs), dtype=np.int64)
+    for i, (song, diff) in enumerate(zip(songs, diffs)):
+        lo, hi = np.searchsorted(keys, [int(song) << 32, (int(song) + 1) << 32])
+        song_diffs = (keys[lo:hi] & _DIFF_MASK) - _DIFF_BIAS
+        total = np.r_[0, np.cumsum(counts[lo:hi])]
+        window = (total[np.searchsorted(song_diffs, song_diffs + tol, side='right')]
+                  - total[np.searchsorted(song_diffs, song_diffs - tol)])
+        far = np.abs(song_diffs - diff) > radius
+        if far.any():
+            rivals[i] = window[far].max()
+    return rivals
+
+def calibrated_confidence(count, runner_up, n_query):
+    """
+    Probabilidade de o candidato estar certo, a partir dos hashes alinhados,
+    dos alinhados pelo concorrente mais forte e dos hashes da amostra.
+    Aceita escalares ou arrays; sem n_query, a cobertura conta como 0 (conservador).
+    """
+    count = np.asarray(count, dtype=np.float64)
+    runner_up = np.asarray(runner_up, dtype=np.float64)
+    coverage = np.minimum(count / n_query, 1.0) if n_query else np.zeros_like(count)
+    bias, w_count, w_ratio, w_coverage = CONFIDENCE_WEIGHTS
+    z = (bias + w_count * np.log1p(count) + w_ratio * np.log((count + 1) / (runner_up + 1))
+         + w_coverage * coverage)
+    return 1 / (1 + np.exp(-z))
+
+def _refine(keys, counts, pair_keys, query_offsets, n_songs):
+    """
+    Histograma inclinado, tolerante a time-stretch.
+
+    Numa amostra com andamento (1 + k) vezes o da música, db_offset = (1 + k) * q + c:
+    o offset_diff deriva k frames por frame da amostra e os votos se espalham por
+    bins vizinhos. Em duas etapas, sem laço por música:
+    1. histograma em faixas (soma de bins vizinhos, largura ~ 2x a deriva máxima):
+       escolhe as n_songs músicas com a melhor faixa;
+    2. só com os pares dessas faixas, conta (música, inclinação, diff - k * q)
+       para uma grade de k em [-MAX_STRETCH, MAX_STRETCH] com np.bincount,
+       tolerando ALIGN_TOLERANCE_FRAMES de cada lado. Uma inclinação só substitui
+       k = 0 se alinhar STRETCH_MARGIN vezes mais hashes; amostras curtas demais
+       para derivar além da tolerância nem testam inclinações.
+    Retorna (songs, counts, diffs, tempos) dos candidatos, diffs no ponto q = 0.
+    """
+    tol = ALIGN_TOLERANCE_FRAMES
+    span = int(np.abs(query_offsets).max()) if len(query_offsets) else 0
+    drift = int(np.ceil(MAX_STRETCH * span))
+    n_slopes = min(2 * -(-drift // (2 * tol)) + 1, MAX_SLOPES) if drift > tol else 1
+    slopes = np.linspace(-MAX_STRETCH, MAX_STRETCH, n_slopes) if n_slopes > 1 else np.zeros(1)
+
+    # 1. Melhor faixa de cada música. Faixas com o dobro da janela espalhada pela
+    #    deriva (+ tolerância), em duas grades deslocadas de meia faixa: a janela
+    #    cabe inteira numa faixa de uma delas
+    width = 2 * (drift + 1 + 2 * tol)
+    band_starts, band_sums = None, None
+    for shift in (0, width // 2):
+        starts, sums = _band_sums(keys, counts, width, shift)
+        best = _best_bins(starts, sums)
+        if band_starts is None:
+            band_starts, band_sums = starts[best], sums[best]
+        else:
+            # Mesmas músicas, na mesma ordem, nas duas grades
+            better = sums[best] > band_sums
+            band_starts = np.where(better, starts[best], band_starts)
+            band_sums = np.where(better, sums[best], band_sums)
+    metrics.value('candidate_songs', len(band_starts))
+    top = np.lexsort((band_starts >> 32, -band_sums))[:n_songs]
+    starts = np.sort(band_starts[top])
+
+    # 2. Pares dentro das faixas escolhidas (tabela densa song_id -> faixa)
+    # (músicas fora dos candidatos ficam com posição enorme; negativos viram enormes em uint64)
+    table = np.full(int(keys[-1] >> 32) + 1, -(1 << 62), dtype=np.int64)
+    table[starts >> 32] = starts
+    pos = pair_keys - table[pair_keys >> 32]
+    inside = np.flatnonzero(pos.view(np.uint64) < width)
+    pos, q = pos[inside], query_offsets[inside]
+    group = np.searchsorted(starts, pair_keys[inside], side='right') - 1
+
+    # Posição corrigida por inclinação: bins [0, n_bins) a partir de início - deriva
+    n_bins = width + 2 * drift
+    corrected = pos[None, :] + drift - np.rint(slopes[:, None] * q[None, :]).astype(np.int64)
+    cells = (group[None, :] * n_slopes + np.arange(n_slopes)[:, None]) * n_bins + corrected
+    hist = np.bincount(cells.ravel(), minlength=len(starts) * n_slopes * n_bins)
+    hist = hist.reshape(len(starts), n_slopes, n_bins)
+
+    # Soma centrada (±tol) em cada bin. O melhor (inclinação, bin) é o de mais votos no
+    # próprio bin: somas de bins vizinhos inclinariam a reta de amostras sem time-stretch;
+    # no empate, a maior soma e a menor inclinação
+    total = np.concatenate([np.zeros((len(starts), n_slopes, tol + 1), dtype=np.int64),
+                            np.cumsum(hist, axis=2),
+                            np.repeat(hist.sum(axis=2, keepdims=True), tol, axis=2)], axis=2)
+    aligned = total[:, :, 2 * tol + 1:] - total[:, :, :n_bins]
+    flatness = n_slopes - np.abs(np.arange(n_slopes) - n_slopes // 2)
+    score = (hist * (aligned.max() + 1) + aligned) * (n_slopes + 1) + flatness[None, :, None]
+    flat = score.reshape(len(starts), -1).argmax(axis=1)
+    slope_idx, bin_idx = np.divmod(flat, n_bins)
+
+    # A inclinação só vale se vencer a melhor janela de k = 0 com folga: em amostras
+    # sem time-stretch, inclinações vizinhas ganham alguns votos juntando bins que o
+    # arredondamento separou
+    rows = np.arange(len(starts))
+    zero = n_slopes // 2
+    zero_bin = score[:, zero, :].argmax(axis=1)
+    best_aligned = aligned[rows, slope_idx, bin_idx]
+    flat_aligned = aligned[rows, zero, zero_bin]
+    keep = best_aligned < STRETCH_MARGIN * flat_aligned
+    slope_idx = np.where(keep, zero, slope_idx)
+    bin_idx = np.where(keep, zero_bin, bin_idx)
+
+    diffs = (starts & _DIFF_MASK) - _DIFF_BIAS + bin_idx - drift
+    return starts >> 32, aligned[rows, slope_idx, bin_idx], diffs, 1 + slopes[slope_idx]
+
+def _rank(uniq, counts, top_k, pairs=None, n_query=None):
+    """
+    Ranking das músicas a partir do histograma (chaves ordenadas, contagens).
+    Com pairs = (chaves de cada par, offset do par na amostra), os melhores
+    candidatos são recontados pelo histograma inclinado (_refine).
+    """
+    if len(uniq) == 0:
+        metrics.value('candidate_songs', 0)
+        return []
+    n = max(top_k, 2)
+    # Votos da própria posição (tolerância + deriva do time-stretch) não contam como outra posição
+    radius = 2 * ALIGN_TOLERANCE_FRAMES
+    if pairs is not None and MAX_STRETCH > 0:
+        songs, best_counts, best_diffs, tempos = _refine(uniq, counts, *pairs, max(n, REFINE_CANDIDATES))
+        if len(pairs[1]):
+            radius += int(np.ceil(MAX_STRETCH * np.abs(pairs[1]).max()))
+    else:
+        best = _best_bins(uniq, counts)
+        metrics.value('candidate_songs', len(best))
+        songs = uniq[best] >> 32
+        best_counts = counts[best]
+        best_diffs = (uniq[best] & _DIFF_MASK) - _DIFF_BIAS
+        tempos = np.ones(len(best))
+
+    ranking = np.lexsort((songs, -best_counts))[:n]
+    ranked = best_counts[ranking]
+    # Concorrente de cada candidato: o 2º para o 1º, o 1º para os demais
+    rivals = np.where(np.arange(len(ranked)) == 0, ranked[1] if len(ranked) > 1 else 0, ranked[0])
+    confidences = calibrated_confidence(ranked, rivals, n_query)
+    coverages = np.minimum(ranked / n_query, 1.0) if n_query else np.zeros(len(ranked))
+    chosen = ranking[:top_k]
+    offset_rivals = _offset_rivals(uniq, counts, songs[chosen], best_diffs[chosen], radius)
+    return [Match(int(songs[i]), int(best_counts[i]), int(best_diffs[i]), frames_to_seconds(best_diffs[i]),
+                  float(confidences[r]), float(coverages[r]), float(tempos[i]), int(offset_rivals[r]))
+            for r, i in enumerate(chosen)]
+
+@metrics.timed('scoring')
+def score_matches(song_ids, diffs, top_k=1, query_offsets=None, n_query=None):
+    """
+    Histograma de offset_diff por música, sem laço Python:
+    cada par (song_id, diff) vira uma chave int64 e é contado com np.unique.
+
+    Com query_offsets (offset de cada par na amostra, ver align_matches), tolera
+    time-stretch de até MAX_STRETCH (histograma inclinado); n_query (hashes da
+    amostra) entra na confiança calibrada.
+
+    Retorna até top_k Match, do maior para o menor número de hashes alinhados.
+    """
+    if len(song_ids) == 0:
+        return []
+
+    keys = _histogram_keys(song_ids, diffs)
+    uniq, counts = np.unique(keys, return_counts=True)
+    pairs = (keys, np.asarray(query_offsets, dtype=np.int64)) if query_offsets is not None else None
+    return _rank(uniq, counts, top_k, pairs, n_query)
+
+class AlignmentHistogram:
+    """
+    Versão incremental de score_matches: os pares (song_id, diff) chegam aos poucos
+    e cada add() só conta os novos, mesclando-os no histograma já acumulado.
+    Com query_offsets, os pares também são guardados para o histograma inclinado.
+    """
+    def __init__(self):
+        self.keys = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.int64)
+        self.pair_keys = []
+        self.pair_offsets = []
+
+    @metrics.timed('scoring')
+    def add(self, song_ids, diffs, query_offsets=None):
+        if len(song_ids) == 0:
+            return
+        keys = _histogram_keys(song_ids, diffs)
+        if query_offsets is not None:
+            self.pair_keys.append(keys)
+            self.pair_offsets.append(np.asarray(query_offsets, dtype=np.int64))
+        new_keys, new_counts = np.unique(keys, return_counts=True)
+
+        pos = np.searchsorted(self.keys, new_keys)
+        found = pos < len(self.keys)
+        found[found] = self.keys[pos[found]] == new_keys[found]
+        self.counts[pos[found]] += new_counts[found]
+
+        missing = ~found
+        self.keys = np.insert(self.keys, pos[missing], new_keys[missing])
+        self.counts = np.insert(self.counts, pos[missing], new_counts[missing])
+
+    @metrics.timed('scoring')
+    def top(self, top_k=1, n_query=None):
+        pairs = None
+        if self.pair_keys:
+            pairs = (np.concatenate(self.pair_keys), np.concatenate(self.pair_offsets))
+        return _rank(self.keys, self.counts, top_k, pairs, n_query)
+
+def is_confident(candidates, min_aligned=MIN_ALIGNED, min_ratio=MIN_RATIO, min_confidence=MIN_CONFIDENCE,
+                 min_offset_ratio=MIN_OFFSET_RATIO):
+    """
+    O melhor candidato tem hashes alinhados suficientes, vence o 2º com folga,
+    vence a melhor outra posição da própria música por min_offset_ratio (offset_rival:
+    num trecho repetido a posição ainda é ambígua) e tem confiança calibrada suficiente?
+    (candidates como retornado por score_matches com top_k >= 2)
+    """
+    if not candidates:
+        return False
+    best = candidates[0]
+    runner_up = candidates[1].count if len(candidates) > 1 else 0
+    return (best.count >= min_aligned and best.count >= min_ratio * runner_up
+            and best.count >= min_offset_ratio * best.offset_rival
+            and best.confidence >= min_confidence)
+
+def confidence(candidates):
+    """
+    Confiança calibrada do melhor candidato (0 a 1).
+    """
+    return candidates[0].confidence if candidates else 0.0
+
+def match_fingerprints(hashes, offsets, backend, top_k=1):
+    """
+    Busca os hashes da amostra no backend (ver index.open_backend) e pontua o alinhamento.
+    Retorna (lista de Match, número de coincidências brutas no banco).
+    """
+    match_song_ids, match_offsets, match_hashes = backend.lookup(hashes)
+    song_ids, diffs, query_offsets = align_matches(hashes, offsets, match_song_ids, match_offsets,
+                                                   match_hashes, return_query_offsets=True)
+    return score_matches(song_ids, diffs, top_k, query_offsets, len(hashes)), len(match_hashes)
+
+def lookup_batch(backend, queries):
+    """
+    Busca de uma vez no backend os hashes distintos de várias consultas
+    ('queries': lista de arrays de hashes). Retorna as postings
+    (song_ids, offsets, hashes) ordenadas por hash, para match_postings.
+    """
+    all_hashes = fingerprinting.unique_hashes(np.concatenate([np.asarray(h, dtype=np.int64) for h in queries]))
+    m_ids, m_offsets, m_hashes = backend.lookup(all_hashes)
+    if len(m_hashes) > 1 and np.any(m_hashes[1:] < m_hashes[:-1]):
+        order = np.argsort(m_hashes, kind='stable')
+        m_ids, m_offsets, m_hashes = m_ids[order], m_offsets[order], m_hashes[order]
+    return m_ids, m_offsets, m_hashes
+
+def match_postings(hashes, offsets, postings, top_k=1):
+    """
+    Pontua uma consulta só com as postings (de lookup_batch) dos seus hashes.
+    Retorna (lista de Match, número de coincidências brutas), como match_fingerprints.
+    """
+    m_ids, m_offsets, m_hashes = postings
+    q = fingerprinting.unique_hashes(hashes)
+    left = np.searchsorted(m_hashes, q, side='left')
+    idx = expand_ranges(left, np.searchsorted(m_hashes, q, side='right') - left)
+    song_ids, diffs, query_offsets = align_matches(hashes, offsets, m_ids[idx], m_offsets[idx], m_hashes[idx],
+                                                   return_query_offsets=True)
+    return score_matches(song_ids, diffs, top_k, query_offsets, len(hashes)), len(idx)
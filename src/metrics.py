@@ -0,0 +1,389 @@
+import bisect
+import cProfile
+import functools
+import sys
+import threading
+import time
+from collections import defaultdict
+
+# Desligado por padrão: timer() devolve um objeto vazio e count()/value() retornam
+# na primeira linha, então a instrumentação espalhada pelo pipeline custa só
+# uma checagem de variável global por chamada.
+ENABLED = False
+
+PREFIX = 'shazam'
+
+# Limites dos histogramas (Prometheus: buckets cumulativos "le")
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000)
+
+# Intervalo do amostrador de pilhas (flamegraph)
+SAMPLE_INTERVAL = 0.005
+
+# Descrição de cada métrica exportada (linhas # HELP)
+_HELP = {
+    'stage_seconds': 'Tempo gasto em cada estágio do pipeline.',
+    'query_seconds': 'Tempo total de cada reconhecimento.',
+    'queries': 'Reconhecimentos realizados.',
+    'peaks': 'Picos detectados no espectrograma.',
+    'hashes': 'Fingerprints (hashes) gerados.',
+    'raw_matches': 'Coincidências brutas devolvidas pelas buscas no banco/índice.',
+}
+
+def enable(flag=True):
+    global ENABLED
+    ENABLED = bool(flag)
+
+class Histogram:
+    """
+    Histograma de buckets fixos, no formato do Prometheus (contagens cumulativas na exportação).
+    """
+    def __init__(self, buckets=SECONDS_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)   # Último = acima do maior limite (+Inf)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total, result = 0, []
+        for le, n in zip(self.buckets + (float('inf'),), self.counts):
+            total += n
+            result.append((le, total))
+        return result
+
+class Registry:
+    """
+    Métricas agregadas do processo (todas as consultas desde o início): tempo por
+    estágio, contadores e histogramas por consulta. Protegido por lock (o servidor
+    registra de várias threads).
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.stages = {}
+        self.counters = defaultdict(int)
+        self.per_query = {}
+        self.query_seconds = Histogram()
+
+    def observe_stage(self, stage, seconds):
+        with self.lock:
+            hist = self.stages.get(stage)
+            if hist is None:
+                hist = self.stages[stage] = Histogram()
+            hist.observe(seconds)
+
+    def add(self, name, n):
+        with self.lock:
+            self.counters[name] += n
+
+    def observe_query(self, seconds, sizes):
+        with self.lock:
+            self.counters['queries'] += 1
+            self.query_seconds.observe(seconds)
+            for name, value in sizes.items():
+                hist = self.per_query.get(name)
+                if hist is None:
+                    hist = self.per_query[name] = Histogram(SIZE_BUCKETS)
+                hist.observe(value)
+
+_registry = Registry()
+_local = threading.local()
+
+class Trace:
+    """
+    Detalhamento de uma consulta: tempo e chamadas por estágio, contadores
+    e valores (ex: músicas candidatas). Ativo na thread atual dentro do 'with';
+    pode ser serializado (to_dict) para voltar de um processo worker.
+    """
+    def __init__(self):
+        self.stages = {}       # estágio -> [segundos, chamadas]
+        self.counters = defaultdict(int)
+        self.values = {}
+        self.seconds = 0.0
+        self._start = None
+        self._parent = None
+
+    def __enter__(self):
+        self._parent = getattr(_local, 'trace', None)
+        _local.trace = self
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds += time.perf_counter() - self._start
+        _local.trace = self._parent
+
+    def add_stage(self, stage, seconds, calls=1):
+        entry = self.stages.get(stage)
+        if entry is None:
+            self.stages[stage] = [seconds, calls]
+        else:
+            entry[0] += seconds
+            entry[1] += calls
+
+    def merge(self, data):
+        """
+        Soma um detalhamento serializado (to_dict) a este.
+        """
+        for stage, (seconds, calls) in data['stages'].items():
+            self.add_stage(stage, seconds, calls)
+        for name, n in data['counters'].items():
+            self.counters[name] += n
+        self.values.update(data['values'])
+
+    def to_dict(self):
+        return {'stages': {k: list(v) for k, v in self.stages.items()},
+                'counters': dict(self.counters), 'values': dict(self.values), 'seconds': self.seconds}
+
+    def report(self, title='Perfil'):
+        """
+        Texto com o tempo de cada estágio (ordem de execução) e os contadores.
+        """
+        total = self.seconds or sum(s for s, _ in self.stages.values())
+        lines = [f"--- {title}: {total * 1000:.1f} ms ---"]
+        for stage, (seconds, calls) in self.stages.items():
+            share = seconds / total * 100 if total else 0.0
+            lines.append(f"    {stage:<14}{seconds * 1000:>10.2f} ms{share:>6.1f}%  ({calls} chamada(s))")
+        sizes = {**self.counters, **self.values}
+        if sizes:
+            lines.append("    " + ", ".join(f"{k}={v}" for k, v in sizes.items()))
+        return "\n".join(lines)
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class _Timer:
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.stage, time.perf_counter() - self.start)
+        return False
+
+def timer(stage):
+    """
+    with metrics.timer('lookup'): ...  (não mede nada se desligado)
+    """
+    return _Timer(stage) if ENABLED else _NULL_TIMER
+
+def timed(stage):
+    """
+    Decorador: mede cada chamada da função como o estágio 'stage'.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(stage, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+def record(stage, seconds):
+    _registry.observe_stage(stage, seconds)
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace.add_stage(stage, seconds)
+
+def count(name, n=1):
+    """
+    Soma n ao contador 'name' (total do processo e consulta atual).
+    """
+    if not ENABLED:
+        return
+    _registry.add(name, int(n))
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace.counters[name] += int(n)
+
+def value(name, v):
+    """
+    Valor de uma grandeza da consulta atual (o último vence), ex: músicas candidatas.
+    Entra no histograma por consulta em record_query.
+    """
+    if not ENABLED:
+        return
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace.values[name] = v
+
+def merge(data, trace=None):
+    """
+    Incorpora um detalhamento vindo de outro processo (Trace.to_dict) às métricas
+    agregadas deste processo e ao trace 'trace' (padrão: o ativo nesta thread).
+    """
+    if not ENABLED or not data:
+        return
+    if trace is None:
+        trace = current()
+    for stage, (seconds, calls) in data['stages'].items():
+        # A soma de várias chamadas entra como uma observação no histograma
+        _registry.observe_stage(stage, seconds)
+    for name, n in data['counters'].items():
+        _registry.add(name, n)
+    if trace is not None:
+        trace.merge(data)
+
+def record_query(trace, seconds=None):
+    """
+    Fecha uma consulta: tempo total e contadores/valores do trace entram nos
+    histogramas por consulta (hashes, raw_matches, candidate_songs...).
+    """
+    if not ENABLED:
+        return
+    sizes = {**trace.counters, **trace.values}
+    _registry.observe_query(trace.seconds if seconds is None else seconds, sizes)
+
+def current():
+    return getattr(_local, 'trace', None)
+
+def reset():
+    _registry.reset()
+
+def summary():
+    """
+    Trace com o total acumulado de cada estágio e contador do processo.
+    """
+    total = Trace()
+    with _registry.lock:
+        for stage, hist in _registry.stages.items():
+            total.add_stage(stage, hist.sum, hist.count)
+        total.counters.update(_registry.counters)
+    return total
+
+def _labels(**labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels.items()) + '}'
+
+def _format_le(le):
+    return '+Inf' if le == float('inf') else repr(float(le))
+
+def _histogram_lines(name, hist, **labels):
+    lines = []
+    for le, n in hist.cumulative():
+        lines.append(f"{name}_bucket{_labels(**labels, le=_format_le(le))} {n}")
+    lines.append(f"{name}_sum{_labels(**labels)} {hist.sum!r}")
+    lines.append(f"{name}_count{_labels(**labels)} {hist.count}")
+    return lines
+
+def render_prometheus():
+    """
+    Métricas agregadas no formato texto de exposição do Prometheus (versão 0.0.4).
+    """
+    lines = []
+    with _registry.lock:
+        name = f'{PREFIX}_stage_seconds'
+        lines += [f"# HELP {name} {_HELP['stage_seconds']}", f"# TYPE {name} histogram"]
+        for stage in sorted(_registry.stages):
+            lines += _histogram_lines(name, _registry.stages[stage], stage=stage)
+
+        name = f'{PREFIX}_query_seconds'
+        lines += [f"# HELP {name} {_HELP['query_seconds']}", f"# TYPE {name} histogram"]
+        lines += _histogram_lines(name, _registry.query_seconds)
+
+        for counter in sorted(_registry.counters):
+            name = f'{PREFIX}_{counter}_total'
+            lines.append(f"# HELP {name} {_HELP.get(counter, counter)}")
+            lines += [f"# TYPE {name} counter", f"{name} {_registry.counters[counter]}"]
+
+        for size in sorted(_registry.per_query):
+            name = f'{PREFIX}_query_{size}'
+            lines += [f"# HELP {name} Distribuição de {size} por consulta.", f"# TYPE {name} histogram"]
+            lines += _histogram_lines(name, _registry.per_query[size])
+    return "\n".join(lines) + "\n"
+
+class StackSampler:
+    """
+    Perfilador por amostragem: a cada SAMPLE_INTERVAL guarda a pilha da thread
+    alvo. O resultado em "folded stacks" (uma pilha por linha, funções separadas
+    por ';' e a contagem no fim) é a entrada do flamegraph.pl, speedscope etc.
+    """
+    def __init__(self, thread_id=None, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.samples = defaultdict(int)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for stack, n in sorted(self.samples.items()):
+                f.write(f"{stack} {n}\n")
+
+class profile:
+    """
+    with metrics.profile(path): ... grava o perfil do bloco em 'path':
+    - .prof: cProfile (pstats, snakeviz);
+    - outra extensão (ex: .folded): pilhas amostradas para flamegraph.
+    Sem path, não faz nada.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self._profiler = None
+
+    def __enter__(self):
+        if self.path is None:
+            return self
+        if self.path.endswith('.prof'):
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            self._profiler = StackSampler()
+            self._profiler.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._profiler is None:
+            return False
+        if isinstance(self._profiler, cProfile.Profile):
+            self._profiler.disable()
+            self._profiler.dump_stats(self.path)
+        else:
+            self._profiler.stop()
+            self._profiler.write(self.path)
+        print(f"--> Perfil gravado em {self.path}", file=sys.stderr)
+        return False
@@ -0,0 +1,303 @@
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+
+import audio_processing as audio
+import database as db
+import matcher
+import streaming
+
+# Janela deslizante de reconhecimento
+DEFAULT_WINDOW_SECONDS = 10.0
+DEFAULT_HOP_SECONDS = 2.0
+
+# Diferença de offset (frames) ainda considerada a mesma execução da música
+OFFSET_TOLERANCE_FRAMES = 3
+# Janelas seguidas sem detecção antes de encerrar a execução atual
+MAX_MISSED_WINDOWS = 2
+
+PCM_BLOCK_BYTES = 8192
+FOLLOW_POLL_SECONDS = 0.25
+
+def seconds_to_frames(seconds):
+    return int(round(seconds / matcher.FRAME_SECONDS))
+
+class StreamMonitor:
+    """
+    Reconhecimento contínuo sobre um stream de áudio.
+
+    Cada bloco passa uma única vez pelo StreamingFingerprinter e cada novo
+    fingerprint é buscado no backend uma única vez; os pares (música, offset_diff)
+    resultantes ficam guardados enquanto estiverem dentro da janela, então janelas
+    sobrepostas reaproveitam fingerprints e buscas em vez de recalculá-los.
+
+    A cada hop, a janela [fim - window, fim) é pontuada; detecções consecutivas da
+    mesma música com o mesmo alinhamento viram uma única entrada do play log.
+    """
+    def __init__(self, backend, name='stream', window_seconds=DEFAULT_WINDOW_SECONDS,
+                 hop_seconds=DEFAULT_HOP_SECONDS, min_aligned=matcher.MIN_ALIGNED, min_ratio=matcher.MIN_RATIO):
+        self.backend = backend
+        self.name = name
+        self.window_frames = seconds_to_frames(window_seconds)
+        self.hop_frames = max(seconds_to_frames(hop_seconds), 1)
+        self.min_aligned = min_aligned
+        self.min_ratio = min_ratio
+
+        self.fingerprinter = streaming.StreamingFingerprinter()
+        self.pairs = deque()       # (último offset, song_ids, diffs, stream_offsets, offsets) por bloco
+        self.next_eval = self.hop_frames
+        self.current = None        # Execução em andamento
+        self.missed = 0
+
+    def push(self, samples):
+        """
+        Processa um bloco de amostras. Retorna as entradas do play log encerradas.
+        """
+        self._add(*self.fingerprinter.push(samples))
+        events = []
+        while self.fingerprinter.final_frame >= self.next_eval:
+            events.extend(self._evaluate(self.next_eval))
+            self.next_eval += self.hop_frames
+        return events
+
+    def close(self):
+        """
+        Fim do stream: avalia o restante e encerra a execução em andamento.
+        """
+        self._add(*self.fingerprinter.flush())
+        events = []
+        last_frame = self.fingerprinter.frames
+        while self.next_eval < last_frame + self.hop_frames:
+            events.extend(self._evaluate(self.next_eval))
+            self.next_eval += self.hop_frames
+        if self.current is not None:
+            events.append(self._close_current())
+        return events
+
+    def _add(self, hashes, offsets):
+        if len(hashes) == 0:
+            return
+        # Músicas cadastradas ou removidas durante o monitoramento (verificação barata, com intervalo mínimo)
+        self.backend.maybe_refresh()
+        m_ids, m_offsets, m_hashes = self.backend.lookup(hashes)
+        song_ids, diffs, stream_offsets = matcher.align_matches(
+            hashes, offsets, m_ids, m_offsets, m_hashes, return_query_offsets=True)
+        if len(song_ids):
+            self.pairs.append((int(offsets.max()), song_ids, diffs, stream_offsets, offsets))
+
+    def _evaluate(self, end):
+        start = end - self.window_frames
+        # Blocos inteiramente antes da janela não serão mais usados
+        while self.pairs and self.pairs[0][0] < start:
+            self.pairs.popleft()
+
+        detection = None
+        if self.pairs:
+            song_ids = np.concatenate([p[1] for p in self.pairs])
+            diffs = np.concatenate([p[2] for p in self.pairs])
+            stream_offsets = np.concatenate([p[3] for p in self.pairs])
+            in_window = (stream_offsets >= start) & (stream_offsets < end)
+            # Hashes do stream na janela (cobertura da confiança calibrada)
+            n_query = sum(int(np.count_nonzero((p[4] >= start) & (p[4] < end))) for p in self.pairs)
+
+            # Offsets relativos ao início da janela: offset_frames (e a inclinação) valem a partir dele
+            candidates = matcher.score_matches(song_ids[in_window], diffs[in_window], top_k=2,
+                                               query_offsets=stream_offsets[in_window] - start, n_query=n_query)
+            if matcher.is_confident(candidates, self.min_aligned, self.min_ratio):
+                best = candidates[0]
+                second = candidates[1].count if len(candidates) > 1 else 0
+                expected = best.offset_frames + (best.tempo - 1) * (stream_offsets - start)
+                aligned = (in_window & (song_ids == best.song_id)
+                           & (np.abs(diffs - expected) <= OFFSET_TOLERANCE_FRAMES))
+                times = stream_offsets[aligned]
+                detection = (best, second, int(times.min()), int(times.max()), start)
+
+        events = []
+        if detection is None:
+            if self.current is not None:
+                self.missed += 1
+                if self.missed >= MAX_MISSED_WINDOWS:
+                    events.append(self._close_current())
+            return events
+
+        best, second, first_frame, last_frame, window_start = detection
+        self.missed = 0
+        current = self.current
+        # Com andamento diferente do original, o offset_diff deriva (tempo - 1) frames por frame
+        drift = (best.tempo - 1) * (window_start - current['window_start']) if current is not None else 0
+        if (current is not None and current['song_id'] == best.song_id
+                and abs(current['offset_frames'] + drift - best.offset_frames) <= OFFSET_TOLERANCE_FRAMES):
+            current['offset_frames'], current['window_start'] = best.offset_frames, window_start
+            current['end_frame'] = max(current['end_frame'], last_frame)
+            current['aligned'] = max(current['aligned'], best.count)
+            current['runner_up'] = max(current['runner_up'], second)
+            current['confidence'] = max(current['confidence'], best.confidence)
+            return events
+
+        if current is not None:
+            events.append(self._close_current())
+        position = first_frame + best.offset_frames + (best.tempo - 1) * (first_frame - window_start)
+        self.current = {'song_id': best.song_id, 'offset_frames': best.offset_frames,
+                        'window_start': window_start, 'song_position': position,
+                        'start_frame': first_frame, 'end_frame': last_frame,
+                        'aligned': best.count, 'runner_up': second, 'confidence': best.confidence,
+                        'tempo': best.tempo}
+        return events
+
+    def _close_current(self):
+        entry, self.current, self.missed = self.current, None, 0
+        start = matcher.frames_to_seconds(entry['start_frame'])
+        return {
+            'stream': self.name,
+            'song_id': entry['song_id'],
+            'start': round(start, 2),
+            'end': round(matcher.frames_to_seconds(entry['end_frame']), 2),
+            'song_position': round(matcher.frames_to_seconds(entry['song_position']), 2),
+            'aligned': entry['aligned'],
+            # Confiança calibrada (matcher.calibrated_confidence), a maior entre as janelas
+            'confidence': round(entry['confidence'], 3),
+            'tempo': round(entry['tempo'], 3),
+        }
+
+def _pcm_chunks(f, rate, channels, follow):
+    """
+    Lê PCM s16le cru (stdin ou arquivo). Com follow, espera o arquivo crescer (tail -f).
+    """
+    resampler = audio.PolyphaseResampler(audio.SAMPLE_RATE, rate) if rate != audio.SAMPLE_RATE else None
+    frame_bytes = 2 * channels
+    pending = b''
+    while True:
+        data = f.read(PCM_BLOCK_BYTES)
+        if not data:
+            if follow:
+                time.sleep(FOLLOW_POLL_SECONDS)
+                continue
+            break
+        data = pending + data
+        usable = len(data) - len(data) % frame_bytes
+        pending = data[usable:]
+
+        samples = np.frombuffer(data[:usable], dtype='<i2').reshape(-1, channels)
+        if channels == 1 and resampler is None:
+            yield samples[:, 0].copy()
+            continue
+        mono = samples.mean(axis=1) / 32767
+        if resampler is not None:
+            mono = resampler.process(mono)
+        yield audio.to_int16(mono)
+
+    if resampler is not None:
+        yield audio.to_int16(resampler.flush())
+
+def _paced(chunks):
+    # Simula um stream ao vivo: entrega o áudio na velocidade real
+    start = time.perf_counter()
+    sent = 0
+    for chunk in chunks:
+        sent += len(chunk)
+        delay = sent / audio.SAMPLE_RATE - (time.perf_counter() - start)
+        if delay > 0:
+            time.sleep(delay)
+        yield chunk
+
+def open_source(spec, realtime=False, follow=False, pcm_rate=audio.SAMPLE_RATE, pcm_channels=1, stdin=None):
+    """
+    Abre uma fonte de áudio como gerador de blocos int16 mono a 44.1kHz:
+    - '-'              PCM s16le cru vindo do stdin
+    - 'mic'            entrada do sounddevice (microfone / placa de captura)
+    - '*.raw' / '*.pcm' PCM s16le cru em arquivo (follow = acompanha o arquivo crescendo)
+    - outros arquivos  qualquer formato do soundfile, lido em streaming
+    """
+    if spec == '-':
+        chunks = _pcm_chunks(stdin or sys.stdin.buffer, pcm_rate, pcm_channels, follow=False)
+    elif spec == 'mic':
+        import recorder
+        return recorder.stream_microphone()
+    elif spec.lower().endswith(('.raw', '.pcm')):
+        chunks = _pcm_chunks(open(spec, 'rb'), pcm_rate, pcm_channels, follow)
+    else:
+        chunks = audio.stream_audio_file(spec)
+    return _paced(chunks) if realtime else chunks
+
+def monitor_source(name, chunks, backend, emit, **options):
+    """
+    Roda um StreamMonitor até o fim da fonte. 'emit' recebe cada entrada do play log.
+    Retorna estatísticas (segundos de áudio, tempo de CPU).
+    """
+    monitor = StreamMonitor(backend, name, **options)
+    start = time.process_time()
+    try:
+        for chunk in chunks:
+            for entry in monitor.push(chunk):
+                emit(entry)
+    except KeyboardInterrupt:
+        pass
+    for entry in monitor.close():
+        emit(entry)
+    return {'stream': name, 'audio_seconds': monitor.fingerprinter.seconds,
+            'cpu_seconds': time.process_time() - start}
+
+def _worker(spec, backend, events, stdin_fd, source_options, options):
+    # O multiprocessing fecha o stdin dos filhos: '-' usa uma cópia do descritor
+    stdin = os.fdopen(stdin_fd, 'rb') if stdin_fd is not None else None
+    try:
+        chunks = open_source(spec, stdin=stdin, **source_options)
+        stats = monitor_source(spec, chunks, backend, events.put, **options)
+    except Exception as e:
+        print(f"Erro no stream {spec}: {e}", file=sys.stderr)
+        stats = {'stream': spec, 'error': str(e)}
+    events.put({'_done': stats})
+
+def run_monitors(specs, backend, log_file=None, song_names=None, source_options=None, **options):
+    """
+    Monitora várias fontes em paralelo (um processo por fonte) e escreve o play log
+    em JSONL (stdout ou log_file), com horário de registro.
+    O backend é herdado pelos processos (o índice mmap é compartilhado pelo SO).
+    Retorna as estatísticas de cada fonte.
+    """
+    events = multiprocessing.Queue()
+    workers = []
+    for spec in specs:
+        stdin_fd = os.dup(sys.stdin.fileno()) if spec == '-' else None
+        w = multiprocessing.Process(target=_worker, daemon=True,
+                                    args=(spec, backend, events, stdin_fd, source_options or {}, options))
+        w.start()
+        if stdin_fd is not None:
+            os.close(stdin_fd)
+        workers.append(w)
+
+    out = open(log_file, 'a', encoding='utf-8') if log_file else sys.stdout
+    stats = []
+    try:
+        while len(stats) < len(workers):
+            try:
+                entry = events.get(timeout=1.0)
+            except queue.Empty:
+                if not any(w.is_alive() for w in workers):
+                    break
+                continue
+            if '_done' in entry:
+                stats.append(entry['_done'])
+                continue
+            if song_names is not None and entry['song_id'] not in song_names:
+                # Música cadastrada depois do início do monitoramento
+                song_names[entry['song_id']] = db.get_song_name(entry['song_id'], None)
+            entry['name'] = (song_names or {}).get(entry['song_id'])
+            entry['logged_at'] = datetime.now().isoformat(timespec='seconds')
+            out.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            out.flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for w in workers:
+            w.join(timeout=5)
+        if log_file:
+            out.close()
+    return stats
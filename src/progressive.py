@@ -0,0 +1,160 @@
+import time
+from collections import namedtuple
+
+import numpy as np
+
+import audio_processing as audio
+import fingerprinting
+import matcher
+import streaming
+
+# Fatia de áudio processada entre duas decisões
+DEFAULT_SLICE_SECONDS = 0.5
+
+# candidates: lista de Match | confidence: confiança calibrada do 1º (ver matcher.confidence)
+# seconds: áudio consumido até a decisão | elapsed_ms: processamento até a decisão
+# early: decidiu antes do fim da amostra | fingerprints / raw_matches: hashes e postings usados
+Recognition = namedtuple('Recognition', ['candidates', 'confidence', 'seconds', 'elapsed_ms',
+                                         'early', 'fingerprints', 'raw_matches'])
+
+class ProgressiveRecognizer:
+    """
+    Reconhecimento com saída antecipada.
+
+    A amostra é consumida em fatias de slice_seconds. Os pares de cada fatia são
+    emitidos assim que o pico alvo é conhecido (StreamingFingerprinter by_target),
+    buscados no backend e somados ao histograma de alinhamento (matcher.AlignmentHistogram).
+    Depois de cada fatia, se o melhor candidato vence o 2º com folga e tem
+    confiança calibrada suficiente (matcher.is_confident), a resposta sai sem
+    processar o resto.
+    """
+    def __init__(self, backend, top_k=1, slice_seconds=DEFAULT_SLICE_SECONDS,
+                 min_aligned=matcher.MIN_ALIGNED, min_ratio=matcher.MIN_RATIO):
+        self.backend = backend
+        self.top_k = top_k
+        self.slice_samples = max(int(slice_seconds * audio.SAMPLE_RATE), 1)
+        self.min_aligned = min_aligned
+        self.min_ratio = min_ratio
+
+        self.fingerprinter = streaming.StreamingFingerprinter(by_target=True)
+        self.histogram = matcher.AlignmentHistogram()
+        self.pending = np.empty(0, dtype=np.int16)
+        self.fingerprints = 0
+        self.raw_matches = 0
+        self.elapsed = 0.0
+
+    def push(self, samples):
+        """
+        Recebe mais áudio. Retorna um Recognition assim que houver confiança, senão None.
+        """
+        self.pending = np.concatenate([self.pending, samples])
+        while len(self.pending) >= self.slice_samples:
+            piece = self.pending[:self.slice_samples]
+            self.pending = self.pending[self.slice_samples:]
+
+            start = time.perf_counter()
+            self._add(*self.fingerprinter.push(piece))
+            candidates = self.histogram.top(max(self.top_k, 2), self.fingerprints)
+            self.elapsed += time.perf_counter() - start
+
+            if matcher.is_confident(candidates, self.min_aligned, self.min_ratio):
+                return self._result(candidates, early=True)
+        return None
+
+    def finish(self):
+        """
+        Fim da amostra sem decisão antecipada: pontua tudo o que foi recebido.
+        """
+        start = time.perf_counter()
+        if len(self.pending):
+            self._add(*self.fingerprinter.push(self.pending))
+            self.pending = self.pending[:0]
+        self._add(*self.fingerprinter.flush())
+        candidates = self.histogram.top(max(self.top_k, 2), self.fingerprints)
+        self.elapsed += time.perf_counter() - start
+        return self._result(candidates, early=False)
+
+    def replay(self, hashes, offsets, n_samples):
+        """
+        Mesma decisão de push/finish sobre fingerprints já calculados (ex: do cache),
+        sem áudio. n_samples: amostras (44.1kHz) do áudio de origem.
+
+        Repete o calendário do StreamingFingerprinter by_target: depois de k fatias
+        o espectrograma tem engine.n_frames(k * slice_samples) frames, os picos
+        antes de frames - PeakStream.RIGHT são definitivos e saem os pares com alvo
+        antes disso. O resto (fatia incompleta e flush) entra no fim.
+        """
+        start = time.perf_counter()
+        targets = offsets + fingerprinting.unpack_hashes(hashes)[2]
+        order = np.argsort(targets, kind='stable')
+        hashes, offsets, targets = hashes[order], offsets[order], targets[order]
+
+        engine = self.fingerprinter.spectrogram.engine
+        done = lo = 0
+        for k in range(1, n_samples // self.slice_samples + 1):
+            done = max(engine.n_frames(k * self.slice_samples) - fingerprinting.PeakStream.RIGHT, done)
+            hi = int(np.searchsorted(targets, done))
+            self._add(hashes[lo:hi], offsets[lo:hi])
+            lo = hi
+            candidates = self.histogram.top(max(self.top_k, 2), self.fingerprints)
+            if matcher.is_confident(candidates, self.min_aligned, self.min_ratio):
+                self.elapsed += time.perf_counter() - start
+                return self._result(candidates, early=True,
+                                    seconds=k * self.slice_samples / audio.SAMPLE_RATE)
+
+        self._add(hashes[lo:], offsets[lo:])
+        candidates = self.histogram.top(max(self.top_k, 2), self.fingerprints)
+        self.elapsed += time.perf_counter() - start
+        return self._result(candidates, early=False, seconds=n_samples / audio.SAMPLE_RATE)
+
+    def _add(self, hashes, offsets):
+        if len(hashes) == 0:
+            return
+        m_ids, m_offsets, m_hashes = self.backend.lookup(hashes)
+        self.fingerprints += len(hashes)
+        self.histogram.add(*matcher.align_matches(hashes, offsets, m_ids, m_offsets, m_hashes,
+                                                  return_query_offsets=True))
+        self.raw_matches += len(m_hashes)
+
+    def _result(self, candidates, early, seconds=None):
+        if seconds is None:
+            seconds = self.fingerprinter.seconds
+        return Recognition(candidates[:self.top_k], matcher.confidence(candidates),
+                           seconds, self.elapsed * 1000, early,
+                           self.fingerprints, self.raw_matches)
+
+def recognize_progressive(chunks, backend, top_k=1, **options):
+    """
+    Consome blocos de áudio (ex: audio_processing.stream_audio_file) até decidir.
+    Os blocos restantes não são lidos.
+    """
+    recognizer = ProgressiveRecognizer(backend, top_k, **options)
+    for chunk in chunks:
+        result = recognizer.push(chunk)
+        if result is not None:
+            return result
+    return recognizer.finish()
+
+def recognize_file(path, backend, top_k=1, fp_cache=None, **options):
+    """
+    Reconhecimento progressivo de um arquivo, decodificado aos poucos.
+    Se o arquivo já passou pelo cache (cache.FingerprintCache), os fingerprints
+    guardados são usados no lugar do áudio, com a mesma decisão do streaming.
+    O cache só é lido: a saída antecipada deixa o resto do arquivo sem
+    fingerprints, então quem grava as entradas é o cadastro (add/ingest),
+    o recognize --full e o visualize_fingerprinting.py.
+    Retorna Recognition, ou None se o arquivo não puder ser lido.
+    """
+    file_hash = fp_cache.lookup_path(path) if fp_cache is not None else None
+    cached = fp_cache.get(file_hash) if file_hash is not None else None
+    slice_seconds = options.get('slice_seconds', DEFAULT_SLICE_SECONDS)
+    try:
+        if cached is not None:
+            peak_times, peak_freqs, hashes, offsets = cached
+            return ProgressiveRecognizer(backend, top_k, **options).replay(hashes, offsets,
+                                                                           audio.stream_length(path))
+        chunks = audio.stream_audio_file(path, block_size=int(slice_seconds * audio.SAMPLE_RATE))
+        return recognize_progressive(chunks, backend, top_k, **options)
+    except Exception as e:
+        print(f"Erro ao carregar {path}: {e}")
+        return None
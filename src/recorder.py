@@ -1,24 +1,206 @@
-import sounddevice as sd
-import soundfile as sf
-import numpy as np
 import os
+import threading
+import time
+
+import numpy as np
+
+SAMPLE_RATE = 44100
+BLOCK_SECONDS = 0.25     # Bloco entregue pelo callback do sounddevice
+BUFFER_SECONDS = 30      # Capacidade do buffer circular (áudio ainda não consumido)
+
+class RingBuffer:
+    """
+    Buffer circular int16 pré-alocado entre o callback de captura (escritor)
+    e o consumidor (leitor), sem alocação por bloco.
+
+    read() devolve views do próprio buffer: a região lida só é liberada para o
+    escritor na chamada seguinte de read(), então a view continua válida
+    enquanto o consumidor a processa. Se o consumidor atrasar e o buffer
+    encher, as amostras novas são descartadas e contadas em 'dropped'.
+    """
+    def __init__(self, capacity):
+        self.data = np.zeros(capacity, dtype=np.int16)
+        self.capacity = capacity
+        self.written = 0     # Total de amostras escritas (posição = written % capacity)
+        self.released = 0    # Amostras já consumidas e liberadas para o escritor
+        self.handed = 0      # Fim da última view entregue ao leitor
+        self.dropped = 0
+        self.closed = False
+        self._cond = threading.Condition()
+
+    def write(self, samples):
+        """
+        Copia 'samples' (ex: o indata do callback, reaproveitado pelo PortAudio) para o buffer.
+        """
+        with self._cond:
+            free = self.capacity - (self.written - self.released)
+            n = min(len(samples), free)
+            self.dropped += len(samples) - n
+            pos = self.written % self.capacity
+            first = min(n, self.capacity - pos)
+            self.data[pos:pos + first] = samples[:first]
+            self.data[:n - first] = samples[first:n]
+            self.written += n
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+    def read(self, max_samples, timeout=None):
+        """
+        Libera a view anterior e espera áudio novo. Retorna uma view de até
+        max_samples amostras contíguas (menos na volta do buffer), ou None
+        quando o buffer foi fechado e esvaziado (ou no timeout).
+        """
+        with self._cond:
+            self.released = self.handed
+            if not self._cond.wait_for(lambda: self.written > self.handed or self.closed, timeout):
+                return None
+            if self.written == self.handed:
+                return None
+            pos = self.handed % self.capacity
+            n = min(self.written - self.handed, max_samples, self.capacity - pos)
+            self.handed += n
+            return self.data[pos:pos + n]
+
+def _sounddevice_stream(**kwargs):
+    # Importado só ao abrir o microfone: o resto do módulo funciona sem PortAudio
+    import sounddevice as sd
+    return sd.InputStream(**kwargs)
+
+class MicrophoneCapture:
+    """
+    Captura do microfone por callback (sounddevice.InputStream) para um RingBuffer.
+
+    stream_factory recebe os mesmos argumentos de sounddevice.InputStream
+    (samplerate, channels, dtype, blocksize, callback, finished_callback, device) e retorna um
+    context manager; trocá-lo (ex: ArrayInputStream) permite rodar sem placa de som.
+    """
+    def __init__(self, samplerate=SAMPLE_RATE, block_seconds=BLOCK_SECONDS, buffer_seconds=BUFFER_SECONDS,
+                 device=None, stream_factory=None):
+        self.samplerate = samplerate
+        self.blocksize = max(int(samplerate * block_seconds), 1)
+        self.device = device
+        self.stream_factory = stream_factory or _sounddevice_stream
+        self.buffer = RingBuffer(max(int(samplerate * buffer_seconds), self.blocksize))
+        self.status_errors = 0
+        self._stream = None
 
-def record_audio(filename, duration=10, samplerate=44100):
+    def _callback(self, indata, frames, time_info, status):
+        if status:
+            self.status_errors += 1
+        self.buffer.write(indata[:frames, 0])
+
+    def __enter__(self):
+        # finished_callback: o stream acabou (erro do dispositivo, ou o fim de um ArrayInputStream)
+        self._stream = self.stream_factory(samplerate=self.samplerate, channels=1, dtype='int16',
+                                           blocksize=self.blocksize, callback=self._callback,
+                                           finished_callback=self.buffer.close, device=self.device)
+        self._stream.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            return self._stream.__exit__(*exc)
+        finally:
+            self.buffer.close()
+
+    def blocks(self, max_seconds=None):
+        """
+        Gera views int16 do buffer à medida que o áudio chega (válidas até o próximo bloco).
+        Para depois de max_seconds (None = até o stream acabar).
+        """
+        limit = None if max_seconds is None else int(max_seconds * self.samplerate)
+        captured = 0
+        while limit is None or captured < limit:
+            wanted = self.blocksize if limit is None else min(self.blocksize, limit - captured)
+            block = self.buffer.read(wanted)
+            if block is None:
+                return
+            captured += len(block)
+            yield block
+
+class ArrayInputStream:
+    """
+    Substituto de sounddevice.InputStream que "grava" um array de amostras:
+    uma thread chama o callback bloco a bloco, 'speed' vezes a velocidade
+    real (None = o mais rápido possível). Para testes e benchmarks sem placa de som.
+    """
+    def __init__(self, samples, speed=1.0, **kwargs):
+        self.samples = np.asarray(samples, dtype=np.int16).reshape(-1, 1)
+        self.speed = speed
+        self.samplerate = kwargs['samplerate']
+        self.blocksize = kwargs['blocksize']
+        self.callback = kwargs['callback']
+        self.finished_callback = kwargs.get('finished_callback')
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @classmethod
+    def factory(cls, samples, speed=1.0):
+        """stream_factory para MicrophoneCapture / stream_microphone."""
+        return lambda **kwargs: cls(samples, speed, **kwargs)
+
+    def _run(self):
+        start = time.perf_counter()
+        # Como o PortAudio: o mesmo array de entrada é reaproveitado a cada callback
+        indata = np.zeros((self.blocksize, 1), dtype=np.int16)
+        for pos in range(0, len(self.samples), self.blocksize):
+            if self._stop.is_set():
+                return
+            n = min(self.blocksize, len(self.samples) - pos)
+            if self.speed:
+                delay = (pos + n) / (self.samplerate * self.speed) - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            indata[:n] = self.samples[pos:pos + n]
+            self.callback(indata, n, None, None)
+        self._stop.set()
+        if self.finished_callback is not None:
+            self.finished_callback()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def stream_microphone(max_seconds=None, block_seconds=BLOCK_SECONDS, samplerate=SAMPLE_RATE, device=None,
+                      stream_factory=None):
+    """
+    Gera blocos int16 do microfone padrão à medida que são capturados,
+    sem arquivo temporário (views do RingBuffer, válidas até o próximo bloco).
+    Para depois de max_seconds (None = indefinidamente) ou quando o consumidor
+    deixa de pedir blocos.
+    """
+    with MicrophoneCapture(samplerate, block_seconds, device=device, stream_factory=stream_factory) as capture:
+        yield from capture.blocks(max_seconds)
+
+def record_audio(filename, duration=10, samplerate=SAMPLE_RATE):
     """
     Grava áudio do microfone padrão por 'duration' segundos
     e salva no 'filename'.
     """
     try:
         print(f"Iniciando gravação de {duration}s...")
-        # Grava como array float32
-        recording = sd.rec(int(duration * samplerate), samplerate=samplerate, channels=1)
-        sd.wait()  # Espera terminar
+        # Os blocos são views do buffer circular: copiados para o array final antes do próximo
+        recording = np.empty(int(duration * samplerate), dtype=np.int16)
+        n = 0
+        for block in stream_microphone(duration, samplerate=samplerate):
+            recording[n:n + len(block)] = block
+            n += len(block)
+        recording = recording[:n]
         print("Gravação concluída.")
-        
+
         # Garante diretório
         os.makedirs(os.path.dirname(filename), exist_ok=True)
-        
+
         # Salva como WAV PCM 16-bit (padrão do nosso sistema)
+        import soundfile as sf
         sf.write(filename, recording, samplerate, subtype='PCM_16')
         return True
     except Exception as e:
@@ -0,0 +1,316 @@
+import asyncio
+import io
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit
+
+import numpy as np
+
+import audio_processing as audio
+import database as db
+import fingerprinting
+import matcher
+import metrics
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Janela de micro-batching: requisições que chegam dentro dela dividem uma única busca
+DEFAULT_BATCH_WINDOW_MS = 2.0
+DEFAULT_MAX_BATCH = 64
+
+MAX_BODY_BYTES = 64 * 1024 * 1024
+
+_STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+def fingerprint_audio_bytes(data):
+    """
+    Executado no pool de processos: decodifica um clipe enviado no corpo da
+    requisição (qualquer formato lido pelo soundfile) e gera os fingerprints.
+    Retorna (hashes, offsets) ou None se o áudio for inválido.
+    """
+    samples = audio.load_audio_file(io.BytesIO(data))
+    if samples is None:
+        return None
+    f, t, Sxx = audio.generate_spectrogram(samples)
+    peak_times, peak_freqs = fingerprinting.find_peaks(Sxx)
+    return fingerprinting.generate_fingerprint_arrays(peak_times, peak_freqs)
+
+def fingerprint_audio_bytes_traced(data):
+    """
+    fingerprint_audio_bytes + detalhamento por estágio do worker (Trace.to_dict),
+    incorporado às métricas do processo principal com metrics.merge.
+    """
+    with metrics.Trace() as trace:
+        result = fingerprint_audio_bytes(data)
+    return result, trace.to_dict()
+
+def parse_fingerprint_payload(body, content_type):
+    """
+    Fingerprints pré-calculados pelo cliente:
+    - application/json: {"hashes": [...], "offsets": [...]}
+    - application/octet-stream: int64 little-endian intercalados (hash, offset, hash, offset, ...)
+    """
+    if content_type.startswith('application/octet-stream'):
+        pairs = np.frombuffer(body, dtype='<i8')
+        if len(pairs) % 2:
+            raise ValueError("Corpo binário deve conter pares (hash, offset)")
+        pairs = pairs.reshape(-1, 2)
+        return pairs[:, 0].astype(np.int64), pairs[:, 1].astype(np.int64)
+
+    payload = json.loads(body)
+    if not isinstance(payload, dict):
+        raise ValueError("Corpo JSON deve ser um objeto com 'hashes' e 'offsets'")
+    try:
+        hashes = np.asarray(payload['hashes'], dtype=np.int64)
+        offsets = np.asarray(payload['offsets'], dtype=np.int64)
+    except (TypeError, OverflowError):
+        raise ValueError("'hashes' e 'offsets' devem ser listas de inteiros")
+    if hashes.ndim != 1 or hashes.shape != offsets.shape:
+        raise ValueError("'hashes' e 'offsets' devem ser listas do mesmo tamanho")
+    return hashes, offsets
+
+class LookupBatcher:
+    """
+    Agrupa consultas concorrentes: os hashes de todas as requisições da janela
+    são deduplicados e resolvidos em uma única chamada a backend.lookup;
+    depois cada requisição é pontuada só com as suas postings.
+    """
+    def __init__(self, backend, window_ms=DEFAULT_BATCH_WINDOW_MS, max_batch=DEFAULT_MAX_BATCH, top_k=5):
+        self.backend = backend
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.top_k = top_k
+        self.on_refresh = None    # Chamado quando o backend incorpora mudanças do catálogo
+        self.queue = asyncio.Queue()
+        self.batches = 0
+        self.requests = 0
+
+    async def submit(self, hashes, offsets):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((hashes, offsets, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            queries = [(hashes, offsets) for hashes, offsets, _ in batch]
+            try:
+                results = await loop.run_in_executor(None, self.process, queries)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.requests += len(batch)
+            for (_, _, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def process(self, queries):
+        """
+        Uma busca para o lote inteiro + pontuação por requisição.
+        Retorna, para cada consulta, (candidatos, coincidências brutas, métricas);
+        as métricas (Trace.to_dict, com a busca do lote inteiro) são None se desligadas.
+        """
+        # Incorpora músicas cadastradas/removidas desde a última verificação (no máximo a cada REFRESH_INTERVAL)
+        if self.backend.maybe_refresh() and self.on_refresh is not None:
+            self.on_refresh()
+        start = time.perf_counter()
+        postings = matcher.lookup_batch(self.backend, [h for h, _ in queries])
+        lookup_seconds = time.perf_counter() - start
+
+        results = []
+        for hashes, offsets in queries:
+            with metrics.Trace() as trace:
+                # Postings do lote que pertencem a esta consulta
+                candidates, n_raw = matcher.match_postings(hashes, offsets, postings, self.top_k)
+            if metrics.ENABLED:
+                trace.add_stage('lookup', lookup_seconds)
+                trace.counters['raw_matches'] = n_raw
+                results.append((candidates, n_raw, trace.to_dict()))
+            else:
+                results.append((candidates, n_raw, None))
+        return results
+
+class RecognitionServer:
+    """
+    Servidor HTTP (asyncio) que mantém o índice e os nomes das músicas em memória.
+
+    Rotas:
+      GET  /health                  -> estado e tamanho do catálogo
+      GET  /metrics                 -> métricas agregadas no formato do Prometheus
+      POST /recognize               -> corpo = arquivo de áudio (wav/flac/ogg...)
+      POST /recognize/fingerprints  -> corpo = fingerprints pré-calculados (ver parse_fingerprint_payload)
+    """
+    def __init__(self, backend, song_names, workers=None, batch_window_ms=DEFAULT_BATCH_WINDOW_MS,
+                 max_batch=DEFAULT_MAX_BATCH, top_k=5):
+        self.backend = backend
+        self.song_names = song_names
+        self.workers = workers
+        self.batcher = LookupBatcher(backend, batch_window_ms, max_batch, top_k)
+        self.batcher.on_refresh = self.reload_song_names
+        self.pool = None
+        self.server = None
+
+    def reload_song_names(self):
+        self.song_names = db.get_song_names()
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None):
+        self.pool = ProcessPoolExecutor(self.workers, initializer=metrics.enable, initargs=(metrics.ENABLED,))
+        self._batcher_task = asyncio.create_task(self.batcher.run())
+        if unix_path:
+            self.server = await asyncio.start_unix_server(self.handle_connection, path=unix_path)
+        else:
+            self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.server
+
+    async def serve_forever(self, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None):
+        await self.start(host, port, unix_path)
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            self.close()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        if getattr(self, '_batcher_task', None) is not None:
+            self._batcher_task.cancel()
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, _ = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self._respond(writer, 400, {'error': 'requisição inválida'}, keep_alive=False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    length = int(headers.get('content-length', 0) or 0)
+                    if length < 0:
+                        raise ValueError
+                except ValueError:
+                    await self._respond(writer, 400, {'error': 'Content-Length inválido'}, keep_alive=False)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {'error': 'corpo muito grande'}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                status, payload = await self.dispatch(method, urlsplit(target).path, headers, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, path, headers, body):
+        if path == '/health':
+            return 200, {'status': 'ok', 'songs': len(self.song_names),
+                         'batches': self.batcher.batches, 'requests': self.batcher.requests}
+        if path == '/metrics':
+            return 200, metrics.render_prometheus()
+
+        if path not in ('/recognize', '/recognize/fingerprints'):
+            return 404, {'error': f'rota desconhecida: {path}'}
+        if method != 'POST':
+            return 405, {'error': 'use POST'}
+
+        start = time.perf_counter()
+        trace = metrics.Trace()
+        try:
+            if path == '/recognize':
+                loop = asyncio.get_running_loop()
+                if metrics.ENABLED:
+                    fingerprints, stages = await loop.run_in_executor(self.pool, fingerprint_audio_bytes_traced, body)
+                    metrics.merge(stages, trace)
+                else:
+                    fingerprints = await loop.run_in_executor(self.pool, fingerprint_audio_bytes, body)
+                if fingerprints is None:
+                    return 400, {'error': 'não foi possível decodificar o áudio'}
+                hashes, offsets = fingerprints
+            else:
+                hashes, offsets = parse_fingerprint_payload(body, headers.get('content-type', ''))
+        except (ValueError, KeyError) as e:
+            return 400, {'error': str(e)}
+        fingerprint_ms = (time.perf_counter() - start) * 1000
+
+        if len(hashes) == 0:
+            return 200, self._result_payload([], 0, 0, fingerprint_ms, start, trace)
+
+        try:
+            candidates, n_raw, stages = await self.batcher.submit(hashes, offsets)
+        except Exception as e:
+            return 500, {'error': str(e)}
+        if stages is not None:
+            trace.merge(stages)
+        return 200, self._result_payload(candidates, len(hashes), n_raw, fingerprint_ms, start, trace)
+
+    def _result_payload(self, candidates, n_hashes, n_raw, fingerprint_ms, start, trace):
+        results = [{'song_id': c.song_id, 'name': self.song_names.get(c.song_id),
+                    'count': c.count, 'offset_seconds': round(c.offset_seconds, 3),
+                    'confidence': round(c.confidence, 4), 'coverage': round(c.coverage, 4),
+                    'tempo': round(c.tempo, 3)}
+                   for c in candidates]
+        total = time.perf_counter() - start
+        timing = {'fingerprint': round(fingerprint_ms, 3), 'total': round(total * 1000, 3)}
+        if metrics.ENABLED:
+            trace.values['hashes'] = n_hashes
+            metrics.record_query(trace, total)
+            timing['stages'] = {stage: round(seconds * 1000, 3) for stage, (seconds, _) in trace.stages.items()}
+        return {
+            'match': results[0] if results else None,
+            'confident': matcher.is_confident(candidates),
+            'candidates': results,
+            'fingerprints': n_hashes,
+            'raw_matches': n_raw,
+            'timing_ms': timing,
+        }
+
+    async def _respond(self, writer, status, payload, keep_alive=True):
+        # Texto (ex: /metrics) vai como text/plain; o resto como JSON
+        if isinstance(payload, str):
+            body, content_type = payload.encode('utf-8'), 'text/plain; version=0.0.4; charset=utf-8'
+        else:
+            body, content_type = json.dumps(payload, ensure_ascii=False).encode('utf-8'), 'application/json; charset=utf-8'
+        head = (f"HTTP/1.1 {status} {_STATUS_TEXT.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
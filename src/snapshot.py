@@ -0,0 +1,393 @@
+import json
+import os
+import shutil
+import struct
+import time
+import zlib
+
+import numpy as np
+
+import cache
+import database as db
+import fingerprinting
+import index
+import metrics
+
+# Snapshot instalado por load_snapshot (ao lado do shazam.db, como o índice); open_backend('snapshot') o abre
+SNAPSHOT_PATH = os.path.join(os.path.dirname(db.DB_PATH), 'catalog.shzs')
+
+# Formato do arquivo, little-endian:
+#   cabeçalho: magic, versão, tamanho e CRC32 do JSON de metadados
+#   metadados (JSON): catálogo, parâmetros de fingerprinting e a tabela de seções
+#   (nome -> posição, tamanho, dtype, nº de itens e CRC32)
+#   seções: arrays em colunas, cada uma alinhada em SECTION_ALIGN bytes para memory-map
+# Postings agrupadas por hash: keys (hashes distintos, ordenados) e, para cada um,
+# post_ptr[i]:post_ptr[i+1] em 'postings', uma sequência de varints (LEB128) com
+# (Δsong_id, offset) por posting: song_id em delta dentro do hash e offset em delta
+# dentro da mesma música (Δsong_id = 0), ou absoluto quando a música muda.
+MAGIC = b'SHZS'
+FORMAT_VERSION = 1
+_HEADER = struct.Struct('<4sHxxQI')
+SECTION_ALIGN = 64
+
+# Postings codificadas/decodificadas por vez (limita a memória temporária)
+CODEC_BATCH_POSTINGS = 4000000
+
+# Maior varint possível de um valor de 64 bits
+MAX_VARINT_BYTES = 10
+
+class SnapshotError(Exception):
+    """Arquivo que não é um snapshot válido (magic, versão, parâmetros ou checksum)."""
+
+def encode_varints(values):
+    """
+    Inteiros não negativos -> bytes LEB128 (7 bits por byte, bit alto = continua).
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    n_bytes = np.ones(len(values), dtype=np.int64)
+    for k in range(1, MAX_VARINT_BYTES):
+        n_bytes += values >= np.uint64(1 << (7 * k))
+    width = int(n_bytes.max()) if len(values) else 1
+    shifts = np.arange(width, dtype=np.uint64) * np.uint64(7)
+    groups = ((values[:, None] >> shifts) & np.uint64(0x7f)).astype(np.uint8)
+    # Todos os bytes de um valor, menos o último, levam o bit de continuação
+    groups[np.arange(width) < n_bytes[:, None] - 1] |= 0x80
+    return groups[np.arange(width) < n_bytes[:, None]]
+
+def decode_varints(data):
+    """
+    Bytes LEB128 (varints completos e concatenados) -> array uint64.
+    """
+    data = np.asarray(data, dtype=np.uint8)
+    ends = np.flatnonzero(data < 0x80)
+    if len(ends) == 0:
+        return np.empty(0, dtype=np.uint64)
+    starts = np.r_[0, ends[:-1] + 1]
+    # Posição de cada byte dentro do seu varint
+    position = np.arange(len(data)) - np.repeat(starts, ends - starts + 1)
+    parts = (data & 0x7f).astype(np.uint64) << (position.astype(np.uint64) * np.uint64(7))
+    return np.add.reduceat(parts, starts)
+
+def _encode_postings(indptr, song_ids, offsets):
+    """
+    Postings de um trecho de chaves (indptr relativo a song_ids/offsets) -> (bytes, tamanho em bytes de cada chave).
+    """
+    song_ids = song_ids.astype(np.int64)
+    offsets = offsets.astype(np.int64)
+    first = np.zeros(len(song_ids), dtype=bool)
+    first[indptr[:-1]] = True
+
+    song_delta = np.diff(song_ids, prepend=0)
+    song_delta[first] = song_ids[first]
+    new_song = song_delta != 0
+    offset_code = np.diff(offsets, prepend=0)
+    offset_code[new_song] = offsets[new_song]
+
+    pairs = np.empty(2 * len(song_ids), dtype=np.int64)
+    pairs[0::2], pairs[1::2] = song_delta, offset_code
+    data = encode_varints(pairs)
+    # Bytes de cada chave: varints terminados (byte < 0x80) contados até o fim de cada uma
+    value_ends = np.flatnonzero(data < 0x80) + 1
+    key_ends = value_ends[2 * indptr[1:] - 1]
+    return data, np.diff(key_ends, prepend=0)
+
+def _decode_postings(data, key_bytes):
+    """
+    Inverso de _encode_postings: bytes de várias chaves (tamanhos key_bytes) -> (song_ids, offsets, nº por chave).
+    """
+    pairs = decode_varints(data).astype(np.int64)
+    song_delta, offset_code = pairs[0::2], pairs[1::2]
+    # Postings por chave: varints terminados dentro dos bytes de cada uma, dois por posting
+    terminators = np.cumsum(data < 0x80)
+    counts = np.diff(terminators[np.cumsum(key_bytes) - 1], prepend=0) // 2
+
+    # Soma acumulada reiniciada no início de cada chave (song_id) e de cada música (offset)
+    starts = np.cumsum(counts) - counts
+    total = np.cumsum(song_delta)
+    song_ids = total - np.repeat(total[starts] - song_delta[starts], counts)
+    new_song = song_delta != 0
+    idx = np.arange(len(offset_code))
+    group = np.maximum.accumulate(np.where(new_song, idx, 0))
+    total = np.cumsum(offset_code)
+    offsets = total - total[group] + offset_code[group]
+    return song_ids, offsets, counts
+
+def _catalog(conn, covered):
+    """
+    Músicas com id até 'covered' (as das postings lidas): (ids, nomes, file_hashes).
+    """
+    rows = conn.execute('SELECT id, name, file_hash FROM songs WHERE id <= ? ORDER BY id', (covered,)).fetchall()
+    return (np.array([r[0] for r in rows], dtype=np.int64),
+            [r[1] for r in rows], [r[2] for r in rows])
+
+def _strings(values):
+    """
+    Lista de strings (ou None) -> (bytes UTF-8 concatenados, posições n+1, máscara de None).
+    """
+    encoded = [(v or '').encode('utf-8') for v in values]
+    ptr = np.zeros(len(encoded) + 1, dtype='<u8')
+    ptr[1:] = np.cumsum([len(e) for e in encoded])
+    return (np.frombuffer(b''.join(encoded), dtype=np.uint8), ptr,
+            np.array([v is None for v in values], dtype=bool))
+
+def _read_strings(blob, ptr, nulls=None):
+    data = bytes(blob)
+    nulls = [False] * (len(ptr) - 1) if nulls is None else nulls.tolist()
+    return [None if null else data[lo:hi].decode('utf-8')
+            for lo, hi, null in zip(ptr[:-1].tolist(), ptr[1:].tolist(), nulls)]
+
+def export_snapshot(path):
+    """
+    Grava o catálogo do banco (músicas, postings agrupadas por hash, frequência
+    de documento e stop-list) em um snapshot. As músicas removidas ficam de fora.
+    Retorna os metadados gravados (ver read_meta).
+    """
+    full = index.ArrayIndex.build_from_db()
+    covered = full.meta['covered']
+    conn = db.connection()
+    song_ids, names, file_hashes = _catalog(conn, covered)
+
+    # Postings de músicas removidas (tombstones ainda não compactadas) ficam de fora
+    hashes, p_songs, p_offsets = full.postings()
+    keep = np.isin(p_songs, song_ids)
+    if not keep.all():
+        hashes, p_songs, p_offsets = hashes[keep], p_songs[keep], p_offsets[keep]
+    keys, starts = np.unique(hashes, return_index=True)
+    indptr = np.append(starts, len(hashes)).astype(np.int64)
+    stoplist = keys[np.isin(keys, db.get_stoplist())]
+
+    # Postings codificadas em lotes de chaves inteiras
+    chunks, key_bytes = [], []
+    bounds = np.searchsorted(indptr, np.arange(0, len(hashes), CODEC_BATCH_POSTINGS), side='right') - 1
+    bounds = np.unique(np.r_[bounds, len(keys)])
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        data, sizes = _encode_postings(indptr[lo:hi + 1] - indptr[lo], p_songs[indptr[lo]:indptr[hi]],
+                                       p_offsets[indptr[lo]:indptr[hi]])
+        chunks.append(data)
+        key_bytes.append(sizes)
+    post_ptr = np.zeros(len(keys) + 1, dtype='<u8')
+    if len(keys):
+        post_ptr[1:] = np.cumsum(np.concatenate(key_bytes))
+
+    names_blob, names_ptr, _ = _strings(names)
+    hashes_blob, hashes_ptr, hashes_null = _strings(file_hashes)
+    sections = {
+        'song_ids': song_ids.astype('<i8'),
+        'names': names_blob, 'names_ptr': names_ptr,
+        'file_hashes': hashes_blob, 'file_hashes_ptr': hashes_ptr, 'file_hashes_null': hashes_null,
+        'keys': keys.astype(cache.HASH_DTYPE),
+        'df': index.document_frequency(indptr, p_songs).astype('<u4'),
+        'post_ptr': post_ptr,
+        'postings': np.concatenate(chunks) if chunks else np.empty(0, dtype=np.uint8),
+        'stoplist': stoplist.astype('<i8'),
+    }
+    meta = {
+        'format': FORMAT_VERSION,
+        'created': time.time(),
+        'params': cache.params_tag(),
+        'songs': len(song_ids),
+        'last_song_id': db.last_song_id(conn),
+        'legacy_file_hash': (conn.execute("SELECT value FROM catalog_meta WHERE key = 'legacy_file_hash'").fetchone()
+                             or [0])[0],
+        'keys': len(keys),
+        'postings': len(hashes),
+    }
+    _write(path, meta, sections)
+    return meta
+
+def _write(path, meta, sections):
+    """
+    Grava cabeçalho, metadados e seções (alinhadas) em path, de forma atômica.
+    """
+    table, position = {}, 0
+    for name, array in sections.items():
+        array = np.ascontiguousarray(array)
+        table[name] = {'offset': position, 'bytes': array.nbytes, 'dtype': array.dtype.str, 'count': len(array),
+                       'crc32': zlib.crc32(array)}
+        position += -(-array.nbytes // SECTION_ALIGN) * SECTION_ALIGN
+    meta = dict(meta, sections=table)
+    meta_bytes = json.dumps(meta).encode('utf-8')
+    # As seções começam alinhadas depois do cabeçalho + metadados
+    data_start = -(-(_HEADER.size + len(meta_bytes)) // SECTION_ALIGN) * SECTION_ALIGN
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(meta_bytes), zlib.crc32(meta_bytes)))
+        f.write(meta_bytes)
+        for name, array in sections.items():
+            f.seek(data_start + table[name]['offset'])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(data_start + position)
+    os.replace(tmp, path)
+
+def read_meta(path):
+    """
+    Metadados do snapshot (sem ler as seções), com 'data_start' = início das seções.
+    Levanta SnapshotError se o arquivo não for um snapshot desta versão e destes parâmetros.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            raise SnapshotError(f"{path}: arquivo curto demais")
+        magic, version, meta_len, meta_crc = _HEADER.unpack(header)
+        if magic != MAGIC:
+            raise SnapshotError(f"{path}: não é um snapshot do catálogo")
+        if version != FORMAT_VERSION:
+            raise SnapshotError(f"{path}: versão {version} do formato (esperada {FORMAT_VERSION})")
+        meta_bytes = f.read(meta_len)
+    if zlib.crc32(meta_bytes) != meta_crc:
+        raise SnapshotError(f"{path}: metadados corrompidos (checksum)")
+    meta = json.loads(meta_bytes)
+    if meta['params'] != cache.params_tag():
+        raise SnapshotError(f"{path}: gerado com outros parâmetros de fingerprinting")
+    meta['data_start'] = -(-(_HEADER.size + meta_len) // SECTION_ALIGN) * SECTION_ALIGN
+    return meta
+
+class SnapshotIndex:
+    """
+    Backend de busca direto sobre um snapshot aberto com memory-map: nada é
+    decodificado ao abrir, e cada busca decodifica só as postings dos hashes
+    da amostra (keys é buscado com searchsorted no próprio arquivo). Mesma
+    interface e mesmas respostas de index.ArrayIndex; o catálogo é o do
+    instante da exportação (maybe_refresh não faz nada).
+    """
+    name = 'snapshot'
+
+    def __init__(self, path=SNAPSHOT_PATH, max_df=index.MAX_DOCUMENT_FREQUENCY, verify=False):
+        self.path = path
+        self.max_df = max_df
+        self.meta = read_meta(path)
+        mapped = np.memmap(path, dtype=np.uint8, mode='r')
+        self.sections = {}
+        for name, info in self.meta['sections'].items():
+            start = self.meta['data_start'] + info['offset']
+            section = mapped[start:start + info['bytes']].view(np.dtype(info['dtype']))
+            if verify and zlib.crc32(section) != info['crc32']:
+                raise SnapshotError(f"{path}: seção '{name}' corrompida (checksum)")
+            self.sections[name] = section
+        self.keys = self.sections['keys']
+        self.df = self.sections['df']
+        self.post_ptr = self.sections['post_ptr']
+        self.stoplist = np.asarray(self.sections['stoplist'], dtype=np.int64)
+
+    def __len__(self):
+        return self.meta['postings']
+
+    def songs(self):
+        """Músicas do snapshot: (ids, nomes, file_hashes)."""
+        s = self.sections
+        return (np.asarray(s['song_ids'], dtype=np.int64), _read_strings(s['names'], s['names_ptr']),
+                _read_strings(s['file_hashes'], s['file_hashes_ptr'], s['file_hashes_null']))
+
+    def _postings_of(self, pos):
+        """Postings das chaves keys[pos], concatenadas: (song_ids, offsets, nº por chave)."""
+        starts = self.post_ptr[pos].astype(np.int64)
+        sizes = self.post_ptr[pos + 1].astype(np.int64) - starts
+        total = int(sizes.sum())
+        block_starts = np.cumsum(sizes) - sizes
+        idx = np.repeat(starts - block_starts, sizes) + np.arange(total, dtype=np.int64)
+        return _decode_postings(self.sections['postings'][idx], sizes)
+
+    def postings(self):
+        """
+        Todas as postings (hashes, song_ids, offsets) em ordem de hash, decodificadas em lotes.
+        """
+        parts = []
+        step = max(1, CODEC_BATCH_POSTINGS // 4)
+        for lo in range(0, len(self.keys), step):
+            pos = np.arange(lo, min(lo + step, len(self.keys)))
+            song_ids, offsets, counts = self._postings_of(pos)
+            parts.append((np.repeat(np.asarray(self.keys[pos], dtype=np.int64), counts), song_ids, offsets))
+        if not parts:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty
+        return tuple(np.concatenate(cols) for cols in zip(*parts))
+
+    @metrics.timed('lookup')
+    def lookup(self, hashes):
+        """
+        Mesma interface (e mesma ordem de resultados) de ArrayIndex.lookup.
+        """
+        query = fingerprinting.unique_hashes(hashes)
+        if len(self.keys) == 0 or len(query) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty
+
+        # No dtype do arquivo: searchsorted com tipos diferentes converteria (copiaria) keys inteiro
+        pos = np.minimum(np.searchsorted(self.keys, query.astype(self.keys.dtype)), len(self.keys) - 1)
+        found = self.keys[pos] == query
+        # Stop-list e hashes comuns demais (mais de max_df músicas) ficam de fora
+        skip = np.isin(query, self.stoplist, assume_unique=True)
+        if self.max_df is not None:
+            skip |= self.df[pos] > self.max_df
+        metrics.count('skipped_hashes', int(np.count_nonzero(found & skip)))
+        found &= ~skip
+
+        song_ids, offsets, counts = self._postings_of(pos[found])
+        metrics.count('raw_matches', len(song_ids))
+        return song_ids, offsets, np.repeat(query[found], counts)
+
+    def maybe_refresh(self):
+        # Snapshot imutável: nada a recarregar
+        return False
+
+    def get_matches(self, hashes):
+        """
+        Mesma interface de database.get_matches: lista de (song_id, offset, hash).
+        """
+        song_ids, offsets, hashes = self.lookup(hashes)
+        return list(zip(song_ids.tolist(), offsets.tolist(), hashes.tolist()))
+
+def verify_snapshot(path):
+    """
+    Confere o cabeçalho e o checksum de todas as seções. Retorna os metadados.
+    """
+    return SnapshotIndex(path, verify=True).meta
+
+def load_snapshot(path, index_path=index.INDEX_DIR, install_path=SNAPSHOT_PATH):
+    """
+    Carrega um snapshot em um banco vazio:
+    1. confere os checksums e instala o arquivo em install_path, de onde
+       open_backend('snapshot') já serve buscas (memory-map, sem decodificar);
+    2. restaura músicas (com os mesmos ids), fingerprints e stop-list no banco;
+    3. monta o índice em segmentos direto das postings do snapshot, sem reler o banco.
+
+    Retorna {etapa: segundos} ou None se não for possível carregar.
+    """
+    times = {}
+    start = time.perf_counter()
+    try:
+        snapshot = SnapshotIndex(path, verify=True)
+    except (OSError, ValueError, KeyError, SnapshotError) as e:
+        print(f"Erro: snapshot inválido: {e}")
+        return None
+    if db.last_song_id() > 0:
+        print("Erro: o banco já tem um catálogo; o snapshot só é carregado em um banco vazio.")
+        return None
+    if os.path.abspath(path) != os.path.abspath(install_path):
+        os.makedirs(os.path.dirname(os.path.abspath(install_path)), exist_ok=True)
+        tmp = f'{install_path}.{os.getpid()}.tmp'
+        shutil.copyfile(path, tmp)
+        os.replace(tmp, install_path)
+        snapshot = SnapshotIndex(install_path)
+    times['verify'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    hashes, song_ids, offsets = snapshot.postings()
+    times['decode'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ids, names, file_hashes = snapshot.songs()
+    db.restore_catalog(ids, names, file_hashes, song_ids, hashes, offsets, snapshot.stoplist,
+                       snapshot.meta['last_song_id'], snapshot.meta.get('legacy_file_hash', 0))
+    times['database'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    keys = np.asarray(snapshot.keys, dtype=np.int64)
+    indptr = np.append(np.searchsorted(hashes, keys), len(hashes)).astype(np.int64)
+    full = index.ArrayIndex(keys, indptr, song_ids.astype(np.int32), offsets.astype(np.int32),
+                            np.asarray(snapshot.df, dtype=np.int32), meta={'covered': snapshot.meta['last_song_id']})
+    index.build_index(index_path, full)
+    times['index'] = time.perf_counter() - start
+    return times
@@ -0,0 +1,133 @@
+import numpy as np
+
+import audio_processing as audio
+import fingerprinting
+
+def _empty():
+    return np.empty(0, dtype=np.int64)
+
+class StreamingFingerprinter:
+    """
+    Fingerprinting incremental para áudio contínuo (rádio, streams, microfone).
+
+    Recebe blocos de amostras int16 em push() e devolve os fingerprints que já
+    são definitivos, com offsets absolutos (frames desde o início do stream).
+    Guarda só o necessário:
+      - a sobreposição entre janelas do espectrograma (SpectrogramStream),
+      - os frames da vizinhança de PEAK_NEIGHBORHOOD_SIZE (PeakStream),
+      - os picos dentro do horizonte MAX_HASH_TIME_DELTA (alvos ainda possíveis).
+
+    A concatenação de todas as saídas (incluindo flush()) é idêntica a
+    generate_fingerprint_arrays sobre o sinal inteiro.
+
+    Com by_target=True cada par é emitido assim que o pico alvo fica definitivo
+    (latência de ~RIGHT frames em vez de MAX_HASH_TIME_DELTA); o conjunto de
+    pares é o mesmo, em outra ordem. Não suporta fan_out.
+    """
+    def __init__(self, fan_out=None, by_target=False):
+        if by_target and fan_out is not None:
+            raise ValueError("by_target não suporta fan_out")
+        self.fan_out = fan_out
+        self.by_target = by_target
+        self.spectrogram = audio.SpectrogramStream()
+        self.peak_stream = fingerprinting.PeakStream()
+        # Picos ainda pendentes como âncora
+        self.peak_times = _empty()
+        self.peak_freqs = _empty()
+        self.samples = 0
+
+    @property
+    def frames(self):
+        """Frames do espectrograma já calculados."""
+        return self.spectrogram.frames
+
+    @property
+    def final_frame(self):
+        """
+        Todos os fingerprints com âncora (ou alvo, se by_target) antes deste frame já foram emitidos.
+        """
+        if self.by_target:
+            return self.peak_stream.done
+        return max(self.peak_stream.done - fingerprinting.MAX_HASH_TIME_DELTA, 0)
+
+    @property
+    def seconds(self):
+        """Duração de áudio já recebida, em segundos."""
+        return self.samples / audio.SAMPLE_RATE
+
+    def push(self, samples):
+        """
+        Processa um bloco de amostras. Retorna (hashes, offsets) dos pares cuja
+        âncora já tem toda a Target Zone conhecida.
+        """
+        self.samples += len(samples)
+        Sxx = self.spectrogram.push(samples)
+        if Sxx.shape[1] == 0:
+            return _empty(), _empty()
+
+        times, freqs = self.peak_stream.push(Sxx)
+        # Picos com tempo < peak_stream.done são definitivos
+        return self._pair(times, freqs, final_frame=self.peak_stream.done)
+
+    def flush(self):
+        """
+        Fim do stream: emite todos os fingerprints restantes.
+        """
+        times, freqs = self.peak_stream.flush()
+        return self._pair(times, freqs, final_frame=None)
+
+    def _pair(self, times, freqs, final_frame):
+        if self.by_target:
+            return self._pair_by_target(times, freqs)
+        if len(times):
+            self.peak_times = np.concatenate([self.peak_times, times])
+            self.peak_freqs = np.concatenate([self.peak_freqs, freqs])
+
+        if final_frame is None:
+            n_anchors = len(self.peak_times)
+        else:
+            # Âncora em t precisa de todos os picos até t + MAX_HASH_TIME_DELTA
+            limit = final_frame - fingerprinting.MAX_HASH_TIME_DELTA
+            n_anchors = int(np.searchsorted(self.peak_times, limit, side='left'))
+
+        if n_anchors == 0:
+            return _empty(), _empty()
+
+        hashes, offsets = fingerprinting.generate_fingerprint_arrays(
+            self.peak_times, self.peak_freqs, self.fan_out, n_anchors)
+
+        # Âncoras emitidas nunca mais servem de alvo (alvos estão sempre à frente)
+        self.peak_times = self.peak_times[n_anchors:]
+        self.peak_freqs = self.peak_freqs[n_anchors:]
+        return hashes, offsets
+
+    def _pair_by_target(self, times, freqs):
+        if len(times) == 0:
+            return _empty(), _empty()
+        first_target = len(self.peak_times)
+        self.peak_times = np.concatenate([self.peak_times, times])
+        self.peak_freqs = np.concatenate([self.peak_freqs, freqs])
+
+        hashes, offsets = fingerprinting.generate_fingerprint_arrays(
+            self.peak_times, self.peak_freqs, first_target=first_target)
+
+        # Próximos alvos estão em t >= done: âncoras mais antigas que MAX_HASH_TIME_DELTA saem
+        keep = int(np.searchsorted(self.peak_times, self.peak_stream.done - fingerprinting.MAX_HASH_TIME_DELTA,
+                                   side='left'))
+        self.peak_times = self.peak_times[keep:]
+        self.peak_freqs = self.peak_freqs[keep:]
+        return hashes, offsets
+
+def fingerprint_stream(chunks, fan_out=None):
+    """
+    Gera (hashes, offsets) à medida que os blocos de áudio chegam
+    (ex: audio_processing.stream_audio_file).
+    """
+    fingerprinter = StreamingFingerprinter(fan_out)
+    for chunk in chunks:
+        hashes, offsets = fingerprinter.push(chunk)
+        if len(hashes):
+            yield hashes, offsets
+    hashes, offsets = fingerprinter.flush()
+    if len(hashes):
+        yield hashes, offsets
@@ -1,124 +1,366 @@
 import matplotlib
 matplotlib.use('Agg')  # Modo não-interativo
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
 import numpy as np
-import sys
+import argparse
+import hashlib
+import multiprocessing
 import os
+import sys
+from collections import namedtuple
 
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
 import audio_processing as audio
+import cache
 import fingerprinting
+import ingest
+
+# Faixa de frequências exibida
+MAX_PLOT_FREQ = 8000
+
+FIGSIZE = (14, 10)
+DPI = 150
+OUTPUT_FILE = os.path.join('data', 'fingerprint_visualization.png')
+REPORTS_DIR = os.path.join('data', 'reports')
 
-def visualize_fingerprinting(audio_file, duration_seconds=10):
+# Alvos desenhados para a âncora de exemplo
+EXAMPLE_TARGETS = 10
+
+# Dados do gráfico, já na resolução da imagem:
+# image: espectrograma em dB (linhas = frequência, colunas = tempo) após o max-pooling;
+# extent: (t0, t1, f0, f1) coberto por 'image'; picos em segundos e Hz (só os da faixa exibida);
+# source: 'cache' (picos do cache de fingerprints) ou 'computed'
+PlotData = namedtuple('PlotData', ['image', 'extent', 'peak_times', 'peak_freqs', 'n_peaks', 'n_hashes', 'seconds',
+                                   'source'])
+
+class SpectrogramPooler:
     """
-    Visualização simplificada do fingerprinting em um trecho curto da música.
+    Reduz o espectrograma à grade de pixels do gráfico enquanto ele é calculado:
+    corta as frequências acima da faixa exibida e faz max-pooling por células
+    de f_step bins x t_step frames (o maior valor de cada célula, então picos
+    isolados continuam visíveis). Só a imagem reduzida fica em memória.
     """
-    print(f"Carregando {audio_file}...")
-    samples = audio.load_audio_file(audio_file)
-    
-    if samples is None:
-        print("Erro ao carregar arquivo.")
-        return
-    
-    # Pegar apenas os primeiros X segundos
-    samples = samples[:audio.SAMPLE_RATE * duration_seconds]
-    print(f"Usando apenas primeiros {duration_seconds} segundos.")
-    
-    print("Gerando espectrograma...")
-    f, t, Sxx = audio.generate_spectrogram(samples)
-    
-    print("Detectando picos...")
-    peaks = fingerprinting.get_2d_peaks(Sxx)
-    print(f"Encontrados {len(peaks)} picos.")
-    
-    print("Gerando fingerprints...")
-    fingerprints = fingerprinting.generate_fingerprints(peaks)
-    print(f"Gerados {len(fingerprints)} fingerprints.")
-    
-    # Criar figura com subplots
-    fig, axes = plt.subplots(2, 1, figsize=(14, 10))
-    
-    # Plot 1: Espectrograma com escala log
-    ax1 = axes[0]
-    Sxx_log = 10 * np.log10(Sxx + 1e-10)
-    im = ax1.pcolormesh(t, f, Sxx_log, shading='gouraud', cmap='viridis')
+    def __init__(self, n_bins, n_frames, rows, cols):
+        self.n_bins = n_bins
+        self.f_step = max(1, -(-n_bins // rows))
+        self.t_step = max(1, -(-n_frames // cols))
+        self.rows = -(-n_bins // self.f_step)
+        self.pending = np.empty((self.rows, 0), dtype=audio.STFT_DTYPE)
+        self.columns = []
+        self.frames = 0
+
+    def push(self, Sxx):
+        block = Sxx[:self.n_bins]
+        pad = self.rows * self.f_step - self.n_bins
+        if pad:
+            block = np.concatenate([block, np.zeros((pad, block.shape[1]), dtype=block.dtype)])
+        block = block.reshape(self.rows, self.f_step, -1).max(axis=1)
+        self.frames += block.shape[1]
+
+        self.pending = np.concatenate([self.pending, block], axis=1)
+        n = self.pending.shape[1] // self.t_step * self.t_step
+        if n:
+            self.columns.append(self.pending[:, :n].reshape(self.rows, -1, self.t_step).max(axis=2))
+            self.pending = self.pending[:, n:]
+
+    def passthrough(self, sxx_blocks):
+        """Repassa os blocos (ex: para fingerprinting.stream_peaks) acumulando a imagem."""
+        for Sxx in sxx_blocks:
+            self.push(Sxx)
+            yield Sxx
+
+    def result(self):
+        """Imagem (linhas, colunas); a última coluna pode cobrir menos de t_step frames."""
+        columns = list(self.columns)
+        if self.pending.shape[1]:
+            columns.append(self.pending.max(axis=1, keepdims=True))
+        if not columns:
+            return np.empty((self.rows, 0), dtype=audio.STFT_DTYPE)
+        return np.concatenate(columns, axis=1)
+
+def _take(chunks, n_samples):
+    """Repassa os blocos até somar n_samples amostras (None = todos)."""
+    for chunk in chunks:
+        if n_samples is not None:
+            if n_samples <= 0:
+                return
+            chunk = chunk[:n_samples]
+            n_samples -= len(chunk)
+        yield chunk
+
+def new_figure():
+    """
+    Figura com os dois painéis já rotulados e diagramados.
+    Retorna (fig, (ax1, ax2), (linhas, colunas) em pixels de um painel na imagem salva).
+    """
+    fig, axes = plt.subplots(2, 1, figsize=FIGSIZE, dpi=DPI)
+    ax1, ax2 = axes
     ax1.set_ylabel('Frequência (Hz)')
     ax1.set_xlabel('Tempo (s)')
     ax1.set_title('1. Espectrograma - Representação visual do áudio no domínio frequência/tempo')
-    ax1.set_ylim([0, 8000])
-    plt.colorbar(im, ax=ax1, label='Magnitude (dB)')
-    
-    # Plot 2: Constellation Map (Picos + alguns pares)
-    ax2 = axes[1]
-    ax2.pcolormesh(t, f, Sxx_log, shading='gouraud', cmap='gray', alpha=0.3)
-    
-    # Plotar picos
-    if len(peaks) > 0:
-        peak_times = [t[p[0]] for p in peaks]
-        peak_freqs = [f[p[1]] for p in peaks]
-        ax2.scatter(peak_times, peak_freqs, c='red', s=10, alpha=0.7, label=f'{len(peaks)} Picos detectados')
-    
-    # Mostrar conexões de apenas UMA âncora como exemplo
-    if len(peaks) > 10:
-        anchor_idx = len(peaks) // 4  # Pegar âncora no meio
-        t_anchor, f_anchor = peaks[anchor_idx]
-        
-        # Marcar a âncora especial
-        ax2.scatter([t[t_anchor]], [f[f_anchor]], c='lime', s=100, marker='*', 
-                   zorder=10, label='Âncora (exemplo)', edgecolors='black', linewidths=1.5)
-        
-        # Desenhar linhas para alvos próximos no tempo
-        target_count = 0
-        for peak_target in peaks[anchor_idx+1:]:
-            t_target, f_target = peak_target
-            time_diff = t_target - t_anchor
-            
-            if time_diff > fingerprinting.MAX_HASH_TIME_DELTA:
-                break
-            
-            # Desenhar linha
-            ax2.plot([t[t_anchor], t[t_target]], 
-                    [f[f_anchor], f[f_target]], 
-                    'cyan', alpha=0.6, linewidth=1.5, zorder=5)
-            
-            # Marcar alvo
-            ax2.scatter([t[t_target]], [f[f_target]], c='yellow', s=50, 
-                       marker='o', zorder=8, edgecolors='black', linewidths=0.5)
-            
-            target_count += 1
-            if target_count >= 10:  # Limitar a 10 alvos visíveis
-                break
-        
-        # Adicionar texto explicativo
-        ax2.text(0.02, 0.98, 
-                f'Cada linha cyan = 1 Hash\n'
-                f'Hash = [freq_âncora, freq_alvo, Δtempo]\n'
-                f'Total de {len(fingerprints)} hashes criados',
-                transform=ax2.transAxes, fontsize=10,
-                verticalalignment='top', bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.8))
-    
     ax2.set_ylabel('Frequência (Hz)')
     ax2.set_xlabel('Tempo (s)')
     ax2.set_title('2. Constellation Map - Picos + Formação de Hashes (mostrando 1 âncora)')
-    ax2.set_ylim([0, 8000])
+    fig.tight_layout()
+    box = ax2.get_window_extent()
+    return fig, axes, (int(np.ceil(box.height)), int(np.ceil(box.width)))
+
+def analyze_for_plot(path, grid, max_seconds=None, fp_cache=None):
+    """
+    Espectrograma reduzido à grade 'grid' (linhas, colunas) e picos do arquivo
+    em uma única passada de streaming (memória limitada, arquivos de qualquer
+    duração). Os picos usam o espectro inteiro (iguais aos do cadastro).
+
+    Com fp_cache, picos e hashes de um arquivo já processado (pelo 'add' ou por
+    outro relatório) vêm do cache e só o espectrograma é calculado. Trechos
+    (max_seconds) não passam pelo cache, que guarda o arquivo inteiro.
+
+    Retorna PlotData, ou None se o arquivo não puder ser lido.
+    """
+    use_cache = fp_cache is not None and max_seconds is None
+    cached = None
+    if use_cache:
+        file_hash = fp_cache.lookup_path(path)
+        cached = fp_cache.get(file_hash) if file_hash is not None else None
+
+    seconds = audio.get_duration(path)
+    if max_seconds is not None:
+        seconds = min(seconds, max_seconds)
+    n_samples = None if max_seconds is None else int(max_seconds * audio.SAMPLE_RATE)
+    engine = audio.stft_engine(MAX_PLOT_FREQ)
+    pooler = SpectrogramPooler(engine.n_bins, engine.n_frames(int(seconds * audio.SAMPLE_RATE)), *grid)
+
+    digest = hashlib.sha1()
+    try:
+        chunks = cache.hashing_blocks(_take(audio.stream_audio_file(path), n_samples), digest)
+        blocks = pooler.passthrough(audio.stream_spectrogram(chunks))
+        if cached is not None:
+            for _ in blocks:
+                pass
+            peak_times, peak_freqs, hashes, _ = cached
+        else:
+            peaks = list(fingerprinting.stream_peaks(blocks))
+            peak_times = np.concatenate([p[0] for p in peaks]) if peaks else np.empty(0, dtype=np.int64)
+            peak_freqs = np.concatenate([p[1] for p in peaks]) if peaks else np.empty(0, dtype=np.int64)
+            hashes, offsets = fingerprinting.generate_fingerprint_arrays(peak_times, peak_freqs)
+    except Exception as e:
+        print(f"Erro ao carregar {path}: {e}")
+        return None
+
+    if pooler.frames == 0:
+        print(f"Erro: {path} é curto demais para o espectrograma.")
+        return None
+    if use_cache and cached is None:
+        fp_cache.remember_path(path, digest.hexdigest())
+        fp_cache.put(digest.hexdigest(), peak_times, peak_freqs, hashes, offsets)
+
+    image = pooler.result()
+    frame_seconds = engine.hop / engine.fs
+    bin_hz = engine.fs / engine.nperseg
+    t0 = engine.times(1)[0] - frame_seconds / 2
+    f0 = -bin_hz / 2
+    extent = (t0, t0 + image.shape[1] * pooler.t_step * frame_seconds,
+              f0, f0 + image.shape[0] * pooler.f_step * bin_hz)
+
+    # Picos acima da faixa exibida ficam fora do gráfico
+    in_band = peak_freqs < engine.n_bins
+    return PlotData(10 * np.log10(image + 1e-10), extent,
+                    engine.times(pooler.frames)[peak_times[in_band]], engine.freqs[peak_freqs[in_band]],
+                    len(peak_times), len(hashes), pooler.frames * frame_seconds,
+                    'computed' if cached is None else 'cache')
+
+def draw(fig, axes, data):
+    """
+    Desenha PlotData nos painéis de new_figure: espectrograma com imshow (uma
+    textura na resolução da imagem) e picos/pares com uma chamada por camada.
+    """
+    ax1, ax2 = axes
+    im = ax1.imshow(data.image, origin='lower', aspect='auto', extent=data.extent, cmap='viridis',
+                    interpolation='nearest')
+    ax1.set_ylim([0, MAX_PLOT_FREQ])
+    fig.colorbar(im, ax=ax1, label='Magnitude (dB)')
+
+    ax2.imshow(data.image, origin='lower', aspect='auto', extent=data.extent, cmap='gray', alpha=0.3,
+               interpolation='nearest')
+    peak_times, peak_freqs = data.peak_times, data.peak_freqs
+    n = len(peak_times)
+    if n > 0:
+        ax2.scatter(peak_times, peak_freqs, c='red', s=10, alpha=0.7, label=f'{n} Picos detectados')
+
+    # Conexões de apenas UMA âncora como exemplo: os alvos seguintes dentro da janela de tempo
+    if n > 10:
+        anchor = n // 4
+        # Tempos em segundos: meio frame de folga para o arredondamento
+        frame_seconds = audio.stft_engine(MAX_PLOT_FREQ).hop / audio.SAMPLE_RATE
+        end = np.searchsorted(peak_times, peak_times[anchor] + (fingerprinting.MAX_HASH_TIME_DELTA + 0.5) * frame_seconds,
+                              side='right')
+        targets = np.arange(anchor + 1, min(end, anchor + 1 + EXAMPLE_TARGETS))
+
+        ax2.scatter([peak_times[anchor]], [peak_freqs[anchor]], c='lime', s=100, marker='*',
+                    zorder=10, label='Âncora (exemplo)', edgecolors='black', linewidths=1.5)
+        if len(targets):
+            segments = np.stack([np.broadcast_to([peak_times[anchor], peak_freqs[anchor]], (len(targets), 2)),
+                                 np.column_stack([peak_times[targets], peak_freqs[targets]])], axis=1)
+            ax2.add_collection(LineCollection(segments, colors='cyan', alpha=0.6, linewidths=1.5, zorder=5))
+            ax2.scatter(peak_times[targets], peak_freqs[targets], c='yellow', s=50,
+                        marker='o', zorder=8, edgecolors='black', linewidths=0.5)
+
+        # Adicionar texto explicativo
+        ax2.text(0.02, 0.98,
+                 f'Cada linha cyan = 1 Hash\n'
+                 f'Hash = [freq_âncora, freq_alvo, Δtempo]\n'
+                 f'Total de {data.n_hashes} hashes criados',
+                 transform=ax2.transAxes, fontsize=10,
+                 verticalalignment='top', bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.8))
+
+    ax2.set_xlim(ax1.get_xlim())
+    ax2.set_ylim([0, MAX_PLOT_FREQ])
     ax2.legend(loc='upper right')
-    
-    plt.tight_layout()
-    
-    # Salvar imagem
-    output_file = os.path.join('data', 'fingerprint_visualization.png')
-    plt.savefig(output_file, dpi=150, bbox_inches='tight')
+    fig.tight_layout()
+
+def _source_key(path, grid, max_seconds):
+    """Identifica o arquivo (caminho, tamanho, mtime) e a configuração do gráfico de um PlotData salvo."""
+    st = os.stat(path)
+    return repr((os.path.abspath(path), st.st_size, st.st_mtime_ns, tuple(grid), max_seconds, MAX_PLOT_FREQ,
+                 cache.params_tag()))
+
+def load_plot_data(data_file, key):
+    """PlotData salvo por save_plot_data com a mesma chave, ou None."""
+    try:
+        with np.load(data_file) as saved:
+            if str(saved['key']) != key:
+                return None
+            return PlotData(saved['image'], tuple(saved['extent']), saved['peak_times'], saved['peak_freqs'],
+                            int(saved['n_peaks']), int(saved['n_hashes']), float(saved['seconds']),
+                            str(saved['source']))
+    except (OSError, KeyError, ValueError):
+        return None
+
+def save_plot_data(data_file, key, data):
+    # Escreve em arquivo temporário e troca: outro processo nunca lê um arquivo pela metade
+    tmp = f'{data_file}.{os.getpid()}.tmp.npz'
+    np.savez(tmp, key=key, **data._asdict())
+    os.replace(tmp, data_file)
+
+def render_file(path, output_file=OUTPUT_FILE, max_seconds=None, fp_cache=None):
+    """
+    Gera a imagem do fingerprinting de um arquivo em output_file.
+
+    Os dados do gráfico (espectrograma já reduzido e picos) ficam ao lado da
+    imagem (output_file + '.npz'): renderizar de novo o mesmo arquivo, sem
+    mudanças, não lê o áudio. Retorna 'computed', 'cache' (só o espectrograma
+    calculado), 'reused' (nada calculado) ou None (erro).
+    """
+    fig, axes, grid = new_figure()
+    try:
+        data_file = f'{output_file}.npz'
+        key = _source_key(path, grid, max_seconds)
+        data = load_plot_data(data_file, key)
+        status = 'reused'
+        if data is None:
+            data = analyze_for_plot(path, grid, max_seconds, fp_cache)
+            if data is None:
+                return None
+            os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+            save_plot_data(data_file, key, data)
+            status = data.source
+        draw(fig, axes, data)
+        # Sem bbox_inches='tight' (desenharia a figura duas vezes): tight_layout já ajustou as margens.
+        # Compressão PNG leve: o espectrograma é ruidoso e a compressão padrão custa mais que o desenho
+        fig.savefig(output_file, dpi=DPI, pil_kwargs={'compress_level': 1})
+        return status
+    except OSError as e:
+        print(f"Erro ao gerar {output_file}: {e}")
+        return None
+    finally:
+        plt.close(fig)
+
+def visualize_fingerprinting(audio_file, duration_seconds=None, output_file=OUTPUT_FILE, fp_cache=None):
+    """
+    Visualização do fingerprinting: espectrograma e constellation map da música
+    inteira (ou dos primeiros duration_seconds segundos).
+    """
+    print(f"Processando {audio_file}" + (f" (primeiros {duration_seconds}s)..." if duration_seconds else "..."))
+    status = render_file(audio_file, output_file, duration_seconds, fp_cache)
+    if status is None:
+        print("Erro ao gerar a visualização.")
+        return
+    if status == 'reused':
+        print("Espectrograma e picos reaproveitados da última visualização deste arquivo.")
+    elif status == 'cache':
+        print("Picos e fingerprints lidos do cache.")
     print(f"\n✅ Visualização salva em: {output_file}")
-    plt.close()
+
+def report_path(path, base, output_dir):
+    """Imagem do relatório de 'path': o caminho relativo a 'base', com '__' no lugar das barras."""
+    name = os.path.relpath(path, base).replace(os.sep, '__')
+    return os.path.join(output_dir, os.path.splitext(name)[0] + '.png')
+
+# Configuração do relatório em lote, recebida uma vez por worker
+_report_options = {}
+
+def _init_worker(options):
+    global _report_options
+    _report_options = options
+
+def _render_report(job):
+    """Executado nos processos do pool. Retorna (caminho, imagem, status); status 'skipped' = já atualizada."""
+    path, output_file = job
+    options = _report_options
+    try:
+        if not options['force'] and os.path.getmtime(output_file) >= os.path.getmtime(path):
+            return path, output_file, 'skipped'
+    except OSError:
+        pass
+    return path, output_file, render_file(path, output_file, options['max_seconds'], options['fp_cache'])
+
+def render_directory(source, output_dir=REPORTS_DIR, workers=None, max_seconds=None, force=False, fp_cache=None):
+    """
+    Relatórios (uma imagem por arquivo) de um diretório ou manifesto, em um pool
+    de processos. Imagens mais novas que o áudio são puladas (a não ser com force);
+    as demais reaproveitam os dados salvos ao lado da imagem e os picos do cache.
+
+    Retorna um dicionário com as contagens (computed, cache, reused, skipped, failed).
+    """
+    paths = ingest.find_audio_files(source)
+    stats = {'computed': 0, 'cache': 0, 'reused': 0, 'skipped': 0, 'failed': 0}
+    if not paths:
+        return stats
+    base = source if os.path.isdir(source) else os.path.commonpath([os.path.dirname(p) for p in paths])
+    jobs = [(path, report_path(path, base, output_dir)) for path in paths]
+    os.makedirs(output_dir, exist_ok=True)
+
+    options = {'max_seconds': max_seconds, 'force': force, 'fp_cache': fp_cache}
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(options,)) as pool:
+        for i, (path, output_file, status) in enumerate(pool.imap_unordered(_render_report, jobs), 1):
+            stats[status or 'failed'] += 1
+            print(f"[{i}/{len(jobs)}] {os.path.basename(path)}: {status or 'falhou'}")
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description='Visualização do fingerprinting (espectrograma + constellation map)')
+    parser.add_argument('source', help='Arquivo de áudio (ou, com --batch, diretório/manifesto)')
+    parser.add_argument('duration', nargs='?', type=float, default=None,
+                        help='Usar só os primeiros N segundos (padrão: a música inteira)')
+    parser.add_argument('--batch', action='store_true', help='Um relatório por arquivo do diretório/manifesto')
+    parser.add_argument('--output', default=None,
+                        help=f'Imagem de saída (padrão: {OUTPUT_FILE}) ou, com --batch, diretório '
+                             f'(padrão: {REPORTS_DIR})')
+    parser.add_argument('--workers', type=int, default=None, help='Processos do --batch (padrão: nº de CPUs)')
+    parser.add_argument('--force', action='store_true', help='Com --batch, refaz também as imagens já atualizadas')
+    parser.add_argument('--no-cache', action='store_true', help='Não usar o cache de picos e fingerprints')
+    args = parser.parse_args()
+
+    fp_cache = None if args.no_cache else cache.FingerprintCache()
+    if args.batch:
+        output_dir = args.output or REPORTS_DIR
+        stats = render_directory(args.source, output_dir, args.workers, args.duration, args.force, fp_cache)
+        print(f"\n--> {stats['computed']} gerados, {stats['cache']} com picos do cache, "
+              f"{stats['reused']} reaproveitados, {stats['skipped']} já atualizados, {stats['failed']} com erro. Relatórios em {output_dir}")
+    else:
+        visualize_fingerprinting(args.source, args.duration, args.output or OUTPUT_FILE, fp_cache)
 
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print("Uso: python visualize_fingerprinting.py <caminho_audio.wav> [duração_em_segundos]")
-        print("\nExemplo: python visualize_fingerprinting.py data/Rihanna-Don_t-Stop-The-Music-RihannaVEVO.wav 10")
-        sys.exit(1)
-    
-    audio_file = sys.argv[1]
-    duration = int(sys.argv[2]) if len(sys.argv) > 2 else 10
-    
-    visualize_fingerprinting(audio_file, duration)
+    main()